@@ -46,6 +46,8 @@ function _chalk_flags {
         --report-cache-file
         --time
         --no-time
+        --profile
+        --no-profile
         --use-embedded-config
         --no-use-embedded-config
         --use-external-config
@@ -37,6 +37,7 @@ when isMainModule:
   recursionCheck()         # norecurse.nim
   setupManagedTemp()       # utils/files.nim
   limitFDCacheSize(attrGet[int]("cache_fd_limit"))
+  limitFDCacheMemory(int(attrGet[Con4mSize]("cache_fd_max_memory")))
 
   # Wait for this warning until after configs load.
   if not canSelfInject:
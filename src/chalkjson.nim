@@ -29,6 +29,7 @@ import "."/[
   types,
   utils/json,
   utils/strings,
+  utils/tables,
 ]
 export json
 export nimutils
@@ -429,49 +430,338 @@ proc chalkParseJson*(s: Stream): ChalkJsonNode =
   # in case any space after the end of the element has semantic value
   # of some sort.
 
+# Buffer based parser.
+#
+# The stream parser above goes through a virtual Stream call per byte
+# and builds an intermediate ChalkJsonNode tree, which is then converted
+# to Box values. Marks embedding SBOMs or SAST results can be several MB
+# so extraction uses this parser instead, which works directly on a
+# string/mmap slice with index arithmetic and produces Box values in
+# one pass.
+#
+# Parsing can start before the whole mark is available: when input is
+# not final and the parser runs off the end of the buffer, it raises
+# CJsonNeedMore, and the caller retries with a bigger buffer.
+
+const
+  eUnexpectedEnd      = "Unexpected end of JSON input"
+  chalkJsonChunkSize* = 64 * 1024
+
+type
+  CJsonNeedMore = ref object of CJsonError
+
+  ChalkJsonCursor = object
+    pos:   int
+    final: bool   ## input ends at the end of the buffer
+
+proc needMore(): CJsonNeedMore {.inline.} = CJsonNeedMore(msg: eUnexpectedEnd)
+
+proc peekAt(c: ChalkJsonCursor, s: openArray[char]): char {.inline.} =
+  if c.pos < len(s):
+    return s[c.pos]
+  if c.final:
+    return '\x00'
+  raise needMore()
+
+proc advance(c: var ChalkJsonCursor, s: openArray[char]): char {.inline.} =
+  result = c.peekAt(s)
+  c.pos += 1
+
+proc bufWS(c: var ChalkJsonCursor, s: openArray[char]) {.inline.} =
+  while c.peekAt(s) in jsonWSChars:
+    c.pos += 1
+
+proc bufValue(c: var ChalkJsonCursor, s: openArray[char]): Box
+
+proc bufLiteral(c: var ChalkJsonCursor, s: openArray[char], lit: static string) =
+  const msg: string = eBadLiteral & lit
+  for i in 0 .. (len(lit) - 1):
+    if c.advance(s) != lit[i]:
+      raise parseError(msg)
+
+proc bufDigits(c: var ChalkJsonCursor, s: openArray[char]) {.inline.} =
+  while c.peekAt(s) in {'0' .. '9'}:
+    c.pos += 1
+
+proc bufNumber(c: var ChalkJsonCursor, s: openArray[char]): Box =
+  # Same grammar as jsonNumber(), but it only validates the span and
+  # lets parseutils convert it in place without copying into a buffer.
+  let start = c.pos
+  var gotNeg = false
+
+  while c.peekAt(s) == '-':
+    if gotNeg:
+      raise parseError(eDoubleNeg)
+    gotNeg = true
+    c.pos += 1
+
+  case c.advance(s)
+  of '0':        discard
+  of '1' .. '9': c.bufDigits(s)
+  else:          raise parseError(eBadNumber)
+
+  var isFloat = false
+  if c.peekAt(s) == '.':
+    isFloat = true
+    c.pos += 1
+    c.bufDigits(s)
+
+  if c.peekAt(s) in {'E', 'e'}:
+    isFloat = true
+    c.pos += 1
+    case c.advance(s)
+    of '-', '+':
+      if c.advance(s) notin {'0' .. '9'}:
+        raise parseError(eNoExponent)
+    of '0' .. '9':
+      discard
+    else:
+      raise parseError(eNoExponent)
+    c.bufDigits(s)
+
+  if isFloat:
+    var f: BiggestFloat
+    discard parseBiggestFloat(s.toOpenArray(start, c.pos - 1), f)
+    return pack(float(f))
+  else:
+    var i: BiggestInt
+    discard parseBiggestInt(s.toOpenArray(start, c.pos - 1), i)
+    return pack(int64(i))
+
+proc bufStringRaw(c: var ChalkJsonCursor, s: openArray[char]): string =
+  c.pos += 1 # opening quote
+
+  while true:
+    # copy runs of plain bytes in bulk; only escapes go byte by byte
+    let start = c.pos
+    while c.pos < len(s) and s[c.pos] notin {'"', '\\', '\x00'}:
+      c.pos += 1
+    let n = c.pos - start
+    if n > 0:
+      let prev = len(result)
+      result.setLen(prev + n)
+      copyMem(addr result[prev], unsafeAddr s[start], n)
+
+    case c.advance(s)
+    of '"':
+      break
+    of '\\':
+      case c.advance(s)
+      of '"':  result.add('"')
+      of '\\': result.add('\\')
+      of '/':  result.add('/')
+      of 'b':  result.add('\b')
+      of 'f':  result.add('\f')
+      of 'n':  result.add('\n')
+      of 'r':  result.add('\r')
+      of 't':  result.add('\t')
+      of 'u':
+        var codepoint: int32
+        for _ in 0 .. 3:
+          let ch = c.advance(s)
+          codepoint = codepoint shl 4
+          case ch
+          of '0' .. '9':
+            codepoint = codepoint or (cast[int32](ch) - cast[int32]('0'))
+          of 'a' .. 'f':
+            codepoint = codepoint or (cast[int32](ch) - cast[int32]('a') + 0xa)
+          of 'A' .. 'F':
+            codepoint = codepoint or (cast[int32](ch) - cast[int32]('A') + 0xa)
+          else:
+            raise parseError(eBadUniEscape)
+        result.add($cast[Rune](codepoint))
+      else:
+        raise parseError(eBadEscape)
+    else:
+      # NUL byte, either literal or end of final input
+      raise parseError(eEOFInStr)
+
+  if result.validateUtf8() != -1:
+    raise parseError(eBadUTF8)
+
+proc bufArray(c: var ChalkJsonCursor, s: openArray[char]): Box =
+  c.pos += 1
+  c.bufWS(s)
+  var items = newSeq[Box]()
+  if c.peekAt(s) == ']':
+    c.pos += 1
+    return pack(items)
+  while true:
+    items.add(c.bufValue(s))
+    c.bufWS(s)
+    case c.advance(s)
+    of ']':
+      return pack(items)
+    of ',':
+      c.bufWS(s)
+    else:
+      raise parseError(eBadArrayItem)
+
+proc bufObject(c: var ChalkJsonCursor, s: openArray[char]): Box =
+  c.pos += 1
+  c.bufWS(s)
+  let dict = ChalkDict()
+  case c.peekAt(s)
+  of '}':
+    c.pos += 1
+    return pack(dict)
+  of '"':
+    discard
+  else:
+    raise parseError(eBadObject)
+
+  while true:
+    if c.peekAt(s) != '"':
+      raise parseError(eBadObject)
+    let k = c.bufStringRaw(s)
+    c.bufWS(s)
+    if c.advance(s) != ':':
+      raise parseError(eNoColon)
+    c.bufWS(s)
+    # duplicate keys: last one wins, same as the stream parser
+    dict[k] = c.bufValue(s)
+    c.bufWS(s)
+    let ch = c.advance(s)
+    case ch
+    of '}': return pack(dict)
+    of ',': c.bufWS(s)
+    else:
+      raise parseError("Invalid JSON obj, expected ',' or }, got: '" & $ch & "'")
+
+proc bufValue(c: var ChalkJsonCursor, s: openArray[char]): Box =
+  case c.peekAt(s)
+  of '{':           return c.bufObject(s)
+  of '[':           return c.bufArray(s)
+  of '"':           return pack(c.bufStringRaw(s))
+  of '0'..'9', '-': return c.bufNumber(s)
+  of 't':
+    c.bufLiteral(s, jTrueStr)
+    return pack(true)
+  of 'f':
+    c.bufLiteral(s, jFalseStr)
+    return pack(false)
+  of 'n':
+    c.bufLiteral(s, jNullStr)
+    return Box(kind: MkObj)
+  else:
+    raise parseError("Bad JSON at position: " & $(c.pos))
+
+proc parseChalkJsonBox*(s:      openArray[char],
+                        endPos: var int,
+                        start   = 0,
+                        final   = true,
+                        ): Box =
+  ## Parses one JSON value starting at `start` (skipping leading white
+  ## space) directly into a Box. `endPos` is set to the index just past
+  ## the value. As with chalkParseJson(), trailing white space is not
+  ## consumed.
+  var c = ChalkJsonCursor(pos: start, final: final)
+  c.bufWS(s)
+  result = c.bufValue(s)
+  endPos = c.pos
+
+proc extractOneChalkJson*(data:   openArray[char],
+                          path:   string,
+                          endPos: var int,
+                          start   = 0,
+                          ): ChalkDict =
+  return unpack[ChalkDict](data.parseChalkJsonBox(endPos, start = start))
+
 proc extractOneChalkJson*(stream: Stream, path: string): ChalkDict =
-  return unpack[ChalkDict](valueFromJson(stream.chalkParseJson(), path))
+  ## Reads the mark in blocks rather than byte by byte. The stream is
+  ## left positioned just past the mark.
+  let start = stream.getPosition()
+  var
+    buf   = ""
+    chunk = chalkJsonChunkSize
+  while true:
+    let
+      want = chunk - len(buf)
+      more = stream.readStr(want)
+      eof  = len(more) < want
+    buf.add(more)
+    try:
+      var endPos: int
+      result = unpack[ChalkDict](buf.parseChalkJsonBox(endPos, final = eof))
+      stream.setPosition(start + endPos)
+      return
+    except CJsonNeedMore:
+      chunk *= 2
 
 proc extractOneChalkJson*(chalkData: string, path: string): ChalkDict =
-  let mark = newStringStream(chalkData)
-  try:
-    result = extractOneChalkJson(mark, path)
-  finally:
-    mark.close()
+  var endPos: int
+  return chalkData.extractOneChalkJson(path, endPos)
 
 # Output ordering for keys.
+#
+# Key order depends only on the template and the keyspecs. Templates do
+# get keys forced into them at runtime, but only their `use` fields, so
+# orders only change when a config layer is loaded, which drops the plans
+# (see loadLocalStructs). Looking them up goes through con4m attribute
+# resolution though. Reports over thousands of artifacts did that for
+# every key of every object, so each template is compiled once into a
+# plan holding its explicit orders, and keyspec orders are memoized as
+# keys are seen.
+
+type
+  TemplatePlan = ref object
+    order: Table[string, int] ## key -> explicit order in the template
+
+var
+  templatePlans: Table[string, TemplatePlan]
+  keyspecOrders: Table[string, int]
+
+proc clearTemplatePlans*() =
+  ## Forget compiled template plans, for when the config changes.
+  templatePlans.clear()
+  keyspecOrders.clear()
+
+proc getTemplatePlan(tplate: string): TemplatePlan =
+  if tplate in templatePlans:
+    return templatePlans[tplate]
+  result = TemplatePlan()
+  let section = tplate & ".key"
+  if tplate != "" and sectionExists(section):
+    for k in getChalkSubsections(section):
+      let orderOpt = attrGetOpt[int](section & "." & k & ".order")
+      if orderOpt.isSome():
+        result.order[k] = orderOpt.get()
+  templatePlans[tplate] = result
+
+proc getKeyspecOrder(key: string): int =
+  if key in keyspecOrders:
+    return keyspecOrders[key]
+  result = attrGet[int]("keyspec." & key & ".normalized_order")
+  keyspecOrders[key] = result
+
 proc orderKeys*(dict: ChalkDict,
                 tplate: string): seq[string] =
-  var tmp: seq[(int, string, string)] = @[]
+  let plan = getTemplatePlan(tplate)
+  var tmp  = newSeqOfCap[(int, string, string)](len(dict))
   for k, _ in dict:
-    var
-      kk = k.removePrefix(objectStorePrefix) # object store objects are not expected to be defined as keyspec
-      order = attrGet[int]("keyspec." & kk & ".normalized_order")
-    if tplate != "" and sectionExists(tplate & ".key." & kk):
-      let orderOpt = attrGetOpt[int](tplate & ".key." & kk & ".order")
-      if orderOpt.isSome():
-        order = orderOpt.get()
-    tmp.add((order, kk, k))
+    let kk = k.removePrefix(objectStorePrefix) # object store objects are not expected to be defined as keyspec
+    tmp.add((plan.order.getOrDefault(kk, getKeyspecOrder(kk)), kk, k))
 
   tmp.sort()
-  result = @[]
+  result = newSeqOfCap[string](len(tmp))
   for (_, _, key) in tmp:
     result.add(key)
 
-proc toJson*(dict: ChalkDict, tplate: string): string =
-  result    = ""
-  var comma = ""
-  let keys = dict.orderKeys(tplate)
-
-  for fullKey in keys:
-    let
-      keyJson = $(%* fullKey)
-      valJson = boxToJson(dict[fullKey])
-
-    result = result & comma & keyJson & " : " & valJson
-    comma  = ", "
+proc toJson*(dict: ChalkDict, tplate: string, into: var string) =
+  ## Appends the JSON for `dict` to `into`, keys ordered per `tplate`.
+  into.add("{ ")
+  var first = true
+  for fullKey in dict.orderKeys(tplate):
+    if not first:
+      into.add(", ")
+    first = false
+    into.add($(%* fullKey))
+    into.add(" : ")
+    into.add(boxToJson(dict[fullKey]))
+  into.add(" }")
 
-  result = "{ " & result & " }"
+proc toJson*(dict: ChalkDict, tplate: string): string =
+  dict.toJson(tplate, result)
 
 proc toJson*(dict: ChalkDict): string =
   return dict.toJson("")
@@ -99,6 +99,26 @@ extern chalk_gguf_status_t chalk_gguf_set_chalk(chalk_gguf_t *g,
                                                 const char   *mark,
                                                 size_t        mark_length);
 
+/**
+ * @brief Like chalk_gguf_set_chalk(), but pads the mark so it can be
+ *        rewritten in place.
+ *
+ * The `chalk.mark` value is followed by spaces so that the tensor data
+ * section keeps its offset whenever the new pair fits in the room the
+ * old one (plus alignment padding) took; then only the bytes before
+ * the data section change.  When it does not fit, `reserve` spaces are
+ * added, leaving room for later marks.  Trailing spaces are not
+ * returned by chalk_gguf_get_payload() and, being part of the pair,
+ * do not change the unchalked hash.
+ *
+ * @param reserve  Spaces to add when the data section has to move.
+ * @return CHALK_GGUF_OK or CHALK_GGUF_ERR_*.
+ */
+extern chalk_gguf_status_t chalk_gguf_set_chalk_padded(chalk_gguf_t *g,
+                                                       const char   *mark,
+                                                       size_t        mark_length,
+                                                       size_t        reserve);
+
 /**
  * @brief Remove the `chalk.mark` KV pair (and recompute padding).
  *
@@ -113,6 +133,15 @@ extern chalk_gguf_status_t chalk_gguf_remove_chalk(chalk_gguf_t *g);
  */
 extern const uint8_t *chalk_gguf_get_buffer(chalk_gguf_t *g, size_t *out_size);
 
+/**
+ * @brief Offset of the (aligned) tensor data section.
+ *
+ * Everything before it is the part a mark changes; when it is the same
+ * as in the file on disk only those bytes need to be written back.
+ * 0 for a NULL handle.
+ */
+extern size_t chalk_gguf_data_offset(chalk_gguf_t *g);
+
 // ============================================================================
 // Unchalked hash
 // ============================================================================
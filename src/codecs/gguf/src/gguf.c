@@ -9,6 +9,10 @@
  * and the alignment padding recomputed for the new layout — adding a
  * KV pair shifts the data section start by a non-aligned amount, so
  * leaving the original padding in place would break tensor offsets.
+ *
+ * The `chalk.mark` value may be followed by trailing spaces reserving
+ * room for later marks (see chalk_gguf_set_chalk_padded); they are
+ * not part of the payload.
  */
 #include "gguf.h"
 
@@ -365,6 +369,10 @@ extern const char *chalk_gguf_get_payload(chalk_gguf_t *g, size_t *out_size) {
     if (off + val_len < off || off + val_len > g->length) {
         return NULL;
     }
+    // Trailing spaces are reserved room, not part of the mark.
+    while (val_len > 0 && g->bytes[off + val_len - 1] == ' ') {
+        val_len--;
+    }
     if (out_size) {
         *out_size = (size_t)val_len;
     }
@@ -383,10 +391,12 @@ extern const char *chalk_gguf_get_payload(chalk_gguf_t *g, size_t *out_size) {
 //
 // `chalk_payload` may be NULL/0 to omit; otherwise a string KV pair
 // for chalk.mark is appended at the end of the KV section (after
-// other existing pairs) before tensor info.
+// other existing pairs) before tensor info, with its value followed
+// by `value_pad` spaces.
 static chalk_gguf_status_t rebuild(chalk_gguf_t *g,
                                    const char   *chalk_payload,
-                                   size_t        chalk_payload_len) {
+                                   size_t        chalk_payload_len,
+                                   size_t        value_pad) {
     // --- KV section (existing minus current chalk pair) ---
     size_t  src_kv_off  = g->kv_section_off;
     size_t  src_kv_end  = g->kv_section_end;
@@ -399,7 +409,8 @@ static chalk_gguf_status_t rebuild(chalk_gguf_t *g,
     size_t  new_kv_pair_len = 0;
     if (chalk_payload != NULL) {
         // [u64 key_len][key][u32 type][u64 val_len][val]
-        new_kv_pair_len = 8 + CHALK_KV_KEY_LEN + 4 + 8 + chalk_payload_len;
+        new_kv_pair_len = 8 + CHALK_KV_KEY_LEN + 4 + 8
+                          + chalk_payload_len + value_pad;
     }
 
     uint64_t new_kv_count = g->kv_count
@@ -455,12 +466,16 @@ static chalk_gguf_status_t rebuild(chalk_gguf_t *g,
         op += CHALK_KV_KEY_LEN;
         w_u32(out + op, GGUF_TYPE_STRING);
         op += 4;
-        w_u64(out + op, (uint64_t)chalk_payload_len);
+        w_u64(out + op, (uint64_t)(chalk_payload_len + value_pad));
         op += 8;
         if (chalk_payload_len) {
             memcpy(out + op, chalk_payload, chalk_payload_len);
             op += chalk_payload_len;
         }
+        if (value_pad) {
+            memset(out + op, ' ', value_pad);
+            op += value_pad;
+        }
     }
 
     // Tensor info.
@@ -513,7 +528,26 @@ extern chalk_gguf_status_t chalk_gguf_set_chalk(chalk_gguf_t *g,
     if (!g || !mark) {
         return CHALK_GGUF_ERR_NULL;
     }
-    return rebuild(g, mark, mark_length);
+    return rebuild(g, mark, mark_length, 0);
+}
+
+extern chalk_gguf_status_t chalk_gguf_set_chalk_padded(chalk_gguf_t *g,
+                                                       const char   *mark,
+                                                       size_t        mark_length,
+                                                       size_t        reserve) {
+    if (!g || !mark) {
+        return CHALK_GGUF_ERR_NULL;
+    }
+    // Smallest tensor info end with the new pair.  If the data section
+    // can stay where it is, pad the value up to it so nothing after
+    // the tensor info moves.
+    size_t old_pair_len = g->has_chalk ? g->chalk_kv_size : 0;
+    size_t new_pair_len = 8 + CHALK_KV_KEY_LEN + 4 + 8 + mark_length;
+    size_t min_ti_end   = g->tensor_info_end - old_pair_len + new_pair_len;
+    size_t value_pad    = min_ti_end <= g->data_off
+                          ? g->data_off - min_ti_end
+                          : reserve;
+    return rebuild(g, mark, mark_length, value_pad);
 }
 
 extern chalk_gguf_status_t chalk_gguf_remove_chalk(chalk_gguf_t *g) {
@@ -523,7 +557,14 @@ extern chalk_gguf_status_t chalk_gguf_remove_chalk(chalk_gguf_t *g) {
     if (!g->has_chalk) {
         return CHALK_GGUF_ERR_NO_CHALK;
     }
-    return rebuild(g, NULL, 0);
+    return rebuild(g, NULL, 0, 0);
+}
+
+extern size_t chalk_gguf_data_offset(chalk_gguf_t *g) {
+    if (!g) {
+        return 0;
+    }
+    return g->data_off;
 }
 
 extern const uint8_t *chalk_gguf_get_buffer(chalk_gguf_t *g, size_t *out_size) {
@@ -98,6 +98,27 @@ extern chalk_st_status_t chalk_st_set_chalk(chalk_st_t    *st,
                                             const char    *mark,
                                             size_t         mark_length);
 
+/**
+ * @brief Like chalk_st_set_chalk(), but pads the header so the mark
+ *        can be rewritten in place.
+ *
+ * Whitespace is inserted right after the chalk value so that
+ * `header_size` stays the same whenever the new header fits in the
+ * current one; the tensor data then does not move and only the header
+ * bytes need to be written back.  When it does not fit, the header
+ * grows to the new size plus `reserve` bytes (rounded up so the data
+ * section stays 8-byte aligned), leaving room for later marks.  The
+ * pad is part of the chalk pair's span, so it does not change the
+ * unchalked hash.
+ *
+ * @param reserve  Slack to add when the header has to grow.
+ * @return CHALK_ST_OK or CHALK_ST_ERR_*.
+ */
+extern chalk_st_status_t chalk_st_set_chalk_padded(chalk_st_t *st,
+                                                   const char *mark,
+                                                   size_t      mark_length,
+                                                   size_t      reserve);
+
 /**
  * @brief Remove the chalk mark, leaving `__metadata__` itself in
  *        place (possibly empty).
@@ -114,6 +135,15 @@ extern chalk_st_status_t chalk_st_remove_chalk(chalk_st_t *st);
  */
 extern const uint8_t *chalk_st_get_buffer(chalk_st_t *st, size_t *out_size);
 
+/**
+ * @brief Offset of the tensor data section, i.e. `8 + header_size`.
+ *
+ * Everything before it is the part a mark changes; when it is the same
+ * as in the file on disk only those bytes need to be written back.
+ * 0 for a NULL handle.
+ */
+extern size_t chalk_st_data_offset(chalk_st_t *st);
+
 // ============================================================================
 // Unchalked hash
 // ============================================================================
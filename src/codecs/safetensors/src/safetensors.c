@@ -222,7 +222,8 @@ static const char *skip_value(const char *p, const char *end) {
 //                    otherwise points at the key quote)
 //   *removable_hi  — trailing offset of the span to remove (covers a
 //                    trailing comma if the pair has one; otherwise
-//                    equals value_end after stripping trailing ws)
+//                    the whitespace after the value, up to the
+//                    closing brace)
 // Returns true if found.
 // =============================================================================
 
@@ -286,19 +287,22 @@ static bool find_pair(const char  *obj_start,
             // Removable span:
             // - If a trailing comma exists: [key_quote, after_v+1)
             //   so the next key takes the position naturally.
-            // - Else if a leading comma exists: [prev_comma, vend) but
-            //   trim trailing ws back so we don't strand whitespace
-            //   before the closing brace.
-            // - Else (sole pair, no commas): [key_quote, vend).
+            // - Else if a leading comma exists: [prev_comma, after_v),
+            //   i.e. up to the closing brace.
+            // - Else (sole pair, no commas): [key_quote, after_v).
+            // Whitespace after the value is always part of the span;
+            // that is where chalk_st_set_chalk_padded() reserves room
+            // for later marks, so the pad never reaches the canonical
+            // form.
             if (has_trailing_comma) {
                 *removable_lo = this_key;
                 *removable_hi = after_v + 1;
             } else if (prev_comma) {
                 *removable_lo = prev_comma;
-                *removable_hi = vend;
+                *removable_hi = after_v;
             } else {
                 *removable_lo = this_key;
-                *removable_hi = vend;
+                *removable_hi = after_v;
             }
             return true;
         }
@@ -553,9 +557,35 @@ static chalk_st_status_t replace_header(chalk_st_t *st,
     return CHALK_ST_OK;
 }
 
-extern chalk_st_status_t chalk_st_set_chalk(chalk_st_t *st,
-                                            const char *mark,
-                                            size_t      mark_length) {
+// Install a header built by set_chalk().  With `padded`, whitespace is
+// inserted at `pad_at` (right after the chalk value) so the header
+// keeps its current size when the new one fits, or otherwise grows by
+// `reserve` bytes of slack, rounded so the data section stays 8-byte
+// aligned.  `out` must have room for the pad.
+static chalk_st_status_t finish_header(chalk_st_t *st,
+                                       char       *out,
+                                       size_t      len,
+                                       size_t      pad_at,
+                                       bool        padded,
+                                       size_t      reserve) {
+    if (padded) {
+        size_t hdr_len = (size_t)st->header_size;
+        size_t target  = len <= hdr_len ? hdr_len
+                                        : (len + reserve + 7) / 8 * 8;
+        size_t pad     = target - len;
+        memmove(out + pad_at + pad, out + pad_at, len - pad_at);
+        memset(out + pad_at, ' ', pad);
+        len = target;
+    }
+    return replace_header(st, out, len);
+}
+
+// Shared body of chalk_st_set_chalk() and chalk_st_set_chalk_padded().
+static chalk_st_status_t set_chalk(chalk_st_t *st,
+                                   const char *mark,
+                                   size_t      mark_length,
+                                   bool        padded,
+                                   size_t      reserve) {
     if (!st || !mark) {
         return CHALK_ST_ERR_NULL;
     }
@@ -572,14 +602,15 @@ extern chalk_st_status_t chalk_st_set_chalk(chalk_st_t *st,
 
     // Worst-case new header size: existing + the new pair (key+value+
     // separator) + a few bytes of slack for braces/comma when adding
-    // __metadata__.
-    size_t worst = hdr_len + escaped_len + 64;
+    // __metadata__ + the requested reserve and its alignment.
+    size_t worst = hdr_len + escaped_len + 64 + (padded ? reserve + 8 : 0);
     char  *out   = malloc(worst);
     if (!out) {
         free(escaped);
         return CHALK_ST_ERR_INTERNAL;
     }
     size_t op = 0;
+    size_t pad_at;  // one past the closing quote of the new value
 
     // 1. Existing chalk → replace the value in place.
     const char *cv_start, *cv_end, *crm_lo, *crm_hi;
@@ -591,11 +622,14 @@ extern chalk_st_status_t chalk_st_set_chalk(chalk_st_t *st,
         memcpy(out + op, escaped, escaped_len);
         op += escaped_len;
         out[op++] = '"';
-        size_t suffix_off = (size_t)(cv_end - hdr);
+        pad_at = op;
+        // Drop whatever pad the previous mark left behind.
+        size_t suffix_off = (size_t)(skip_ws(cv_end, hdr_end) - hdr);
         memcpy(out + op, hdr + suffix_off, hdr_len - suffix_off);
         op += hdr_len - suffix_off;
         free(escaped);
-        chalk_st_status_t st_ = replace_header(st, out, op);
+        chalk_st_status_t st_ = finish_header(st, out, op, pad_at,
+                                              padded, reserve);
         free(out);
         return st_;
     }
@@ -639,6 +673,7 @@ extern chalk_st_status_t chalk_st_set_chalk(chalk_st_t *st,
         memcpy(out + op, escaped, escaped_len);
         op += escaped_len;
         out[op++] = '"';
+        pad_at = op;
         // Copy from the closing '}' of __metadata__ to end of header.
         size_t suffix_off = (size_t)(mv_end - 1 - hdr);
         memcpy(out + op, hdr + suffix_off, hdr_len - suffix_off);
@@ -666,6 +701,7 @@ extern chalk_st_status_t chalk_st_set_chalk(chalk_st_t *st,
         memcpy(out + op, escaped, escaped_len);
         op += escaped_len;
         out[op++] = '"';
+        pad_at = op;
         out[op++] = '}';
         if (!empty_root) {
             out[op++] = ',';
@@ -676,11 +712,24 @@ extern chalk_st_status_t chalk_st_set_chalk(chalk_st_t *st,
     }
 
     free(escaped);
-    chalk_st_status_t r = replace_header(st, out, op);
+    chalk_st_status_t r = finish_header(st, out, op, pad_at, padded, reserve);
     free(out);
     return r;
 }
 
+extern chalk_st_status_t chalk_st_set_chalk(chalk_st_t *st,
+                                            const char *mark,
+                                            size_t      mark_length) {
+    return set_chalk(st, mark, mark_length, false, 0);
+}
+
+extern chalk_st_status_t chalk_st_set_chalk_padded(chalk_st_t *st,
+                                                   const char *mark,
+                                                   size_t      mark_length,
+                                                   size_t      reserve) {
+    return set_chalk(st, mark, mark_length, true, reserve);
+}
+
 extern chalk_st_status_t chalk_st_remove_chalk(chalk_st_t *st) {
     if (!st) {
         return CHALK_ST_ERR_NULL;
@@ -705,6 +754,13 @@ extern chalk_st_status_t chalk_st_remove_chalk(chalk_st_t *st) {
     return r;
 }
 
+extern size_t chalk_st_data_offset(chalk_st_t *st) {
+    if (!st) {
+        return 0;
+    }
+    return 8 + (size_t)st->header_size;
+}
+
 extern const uint8_t *chalk_st_get_buffer(chalk_st_t *st, size_t *out_size) {
     if (!st) {
         return NULL;
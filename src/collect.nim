@@ -15,6 +15,7 @@ import "."/[
   run_management,
   types,
   utils/files,
+  utils/perf,
 ]
 
 proc hasSubscribedKey(p: Plugin, keys: seq[string], dict: ChalkDict): bool =
@@ -66,6 +67,59 @@ proc canWrite(plugin: Plugin,
   error("Plugin '" & plugin.name & "' can't write " & phase & " system key: '" & key & "'")
   return false
 
+proc produce(producer:   KeyProducer,
+             plugin:     Plugin,
+             obj:        ChalkObj,
+             objs:       seq[ChalkObj],
+             isChalking: bool,
+             ): Box =
+  case producer.kind
+  of kpChalkTimeHost:     producer.ctHost(plugin)
+  of kpChalkTimeArtifact: producer.ctArt(plugin, obj)
+  of kpRunTimeArtifact:   producer.rtArt(plugin, obj, isChalking)
+  of kpRunTimeHost:       producer.rtHost(plugin, objs)
+
+proc collectFromKeyProducers(plugin:     Plugin,
+                             kind:       KeyProducerKind,
+                             dict:       ChalkDict,
+                             decls:      seq[string],
+                             phase:      string,
+                             obj        = ChalkObj(nil),
+                             objs       = newSeq[ChalkObj](),
+                             isChalking = false,
+                             override   = false,
+                             ) =
+  # Only evaluate producers for keys which some active template
+  # references and which a higher priority plugin has not already
+  # provided. Cheap producers go first.
+  if not plugin.enabled:
+    return
+  let overrides = attrGet[seq[string]]("plugin." & plugin.name & ".overrides")
+  for producer in plugin.getKeyProducers(kind):
+    let k = producer.key
+    if not isSubscribedKey(k):
+      continue
+    if k in dict and k notin overrides and not plugin.isSystem and not override:
+      trace(plugin.name & ": " & k & " already collected. skipping producer")
+      continue
+    if not plugin.canWrite(k, decls, phase):
+      trace(plugin.name & ": cannot write " & k & ". skipping")
+      continue
+    trace(plugin.name & ": producing " & k & " (" & $producer.cost & ")")
+    try:
+      withPerfTiming("key", k):
+        dict.setIfNotEmpty(k, producer.produce(plugin, obj, objs, isChalking))
+    except:
+      let msg = getCurrentExceptionMsg()
+      trace(plugin.name & ": could not produce " & k & " due to: " & msg)
+      dumpExOnDebug()
+      addFailedKey(
+        k,
+        code        = "KEY_COLLECTION_ERROR",
+        error       = msg,
+        description = "Exception raised while collecting key " & k,
+      )
+
 proc registerKeys(templ: string) =
   let section = templ & ".key"
   if sectionExists(section):
@@ -90,7 +144,14 @@ proc collectChalkTimeHostInfo*() =
       continue
     try:
       trace(plugin.name & ": running plugin")
-      let dict = plugin.callGetChalkTimeHostInfo()
+      if plugin.hasKeyProducers(kpChalkTimeHost):
+        plugin.collectFromKeyProducers(kpChalkTimeHost, hostInfo, subscribed,
+                                       "chalk time host")
+      if plugin.getChalkTimeHostInfo == nil:
+        continue
+      var dict: ChalkDict
+      withPerfTiming("plugin", plugin.name & ".chalk_time_host"):
+        dict = plugin.callGetChalkTimeHostInfo()
       if dict == nil or len(dict) == 0:
         continue
 
@@ -171,13 +232,22 @@ proc collectRunTimeArtifactInfo*(artifact: ChalkObj, isChalking = none(bool)) =
         trace(plugin.name & ": skipped as its not the chalk codec " & artifact.myCodec.name)
         continue
 
-      if plugin.getRunTimeArtifactInfo == nil:
+      if plugin.getRunTimeArtifactInfo == nil and not plugin.hasKeyProducers(kpRunTimeArtifact):
         trace(plugin.name & ": skipping plugin; no run time artifact info collection")
         continue
 
       trace(plugin.name & ": running plugin")
       try:
-        let dict = plugin.callGetRunTimeArtifactInfo(artifact, isChalking.get(isChalkingOp()))
+        if plugin.hasKeyProducers(kpRunTimeArtifact):
+          plugin.collectFromKeyProducers(kpRunTimeArtifact, data, subscribed,
+                                         "run time artifact",
+                                         obj        = artifact,
+                                         isChalking = isChalking.get(isChalkingOp()))
+        if plugin.getRunTimeArtifactInfo == nil:
+          continue
+        var dict: ChalkDict
+        withPerfTiming("plugin", plugin.name & ".run_time_artifact"):
+          dict = plugin.callGetRunTimeArtifactInfo(artifact, isChalking.get(isChalkingOp()))
         if dict == nil or len(dict) == 0:
           continue
         for k, v in dict:
@@ -235,13 +305,22 @@ proc collectChalkTimeArtifactInfo*(obj: ChalkObj, override = false) =
         trace(plugin.name & ": skipping plugin; its metadata wouldn't be used.")
         continue
 
-      if plugin.getChalkTimeArtifactInfo == nil:
+      if plugin.getChalkTimeArtifactInfo == nil and not plugin.hasKeyProducers(kpChalkTimeArtifact):
         trace(plugin.name & ": skipping plugin; no chalk time artifact info collection")
         continue
 
       trace(plugin.name & ": running plugin")
       try:
-        let dict = plugin.callGetChalkTimeArtifactInfo(obj)
+        if plugin.hasKeyProducers(kpChalkTimeArtifact):
+          plugin.collectFromKeyProducers(kpChalkTimeArtifact, data, subscribed,
+                                         "chalk time artifact",
+                                         obj      = obj,
+                                         override = override)
+        if plugin.getChalkTimeArtifactInfo == nil:
+          continue
+        var dict: ChalkDict
+        withPerfTiming("plugin", plugin.name & ".chalk_time_artifact"):
+          dict = plugin.callGetChalkTimeArtifactInfo(obj)
         if dict == nil or len(dict) == 0:
           trace(plugin.name & ": plugin produced no keys to use.")
           continue
@@ -282,7 +361,15 @@ proc collectRunTimeHostInfo*() =
 
     trace(plugin.name & ": running plugin")
     try:
-      let dict = plugin.callGetRunTimeHostInfo(getAllChalks())
+      if plugin.hasKeyProducers(kpRunTimeHost):
+        plugin.collectFromKeyProducers(kpRunTimeHost, hostInfo, subscribed,
+                                       "run time host",
+                                       objs = getAllChalks())
+      if plugin.getRunTimeHostInfo == nil:
+        continue
+      var dict: ChalkDict
+      withPerfTiming("plugin", plugin.name & ".run_time_host"):
+        dict = plugin.callGetRunTimeHostInfo(getAllChalks())
       if dict == nil or len(dict) == 0: continue
 
       for k, v in dict:
@@ -435,11 +522,17 @@ iterator artifacts*(argv:     seq[string],
         if getBaseCommandName() in ["insert", "docker"]:
           obj.persistInternalValues()
 
-        yield obj
-
-        if not inSubscan() and not obj.forceIgnore and
-           obj.name notin getUnmarked():
-          obj.collectRunTimeArtifactInfo()
+        # the file is read again for hashing and writing so keep the
+        # stream the scan opened instead of it being evicted meanwhile
+        pinFileStream(path)
+        try:
+          yield obj
+
+          if not inSubscan() and not obj.forceIgnore and
+             obj.name notin getUnmarked():
+            obj.collectRunTimeArtifactInfo()
+        finally:
+          unpinFileStream(path)
 
   if not inSubscan():
     if getBaseCommandName() != "extract":
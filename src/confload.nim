@@ -18,6 +18,7 @@
 
 import std/macros except error
 import "."/[
+  chalkjson,
   con4mfuncs,
   config,
   plugin_load,
@@ -93,6 +94,8 @@ proc findOptionalConf(state: ConfigState): Option[string] =
         trace(fname & ": No configuration file found.")
 
 proc loadLocalStructs*(state: ConfigState) =
+  # each config layer can change templates and keyspec orders
+  clearTemplatePlans()
   if attrGetOpt[bool]("color").isSome(): setShowColor(attrGet[bool]("color"))
   setLogLevel(attrGet[string]("log_level"))
   var configPath: seq[string] = @[]
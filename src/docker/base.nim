@@ -14,6 +14,7 @@ import ".."/[
   types,
   utils/exec,
   utils/files,
+  utils/perf,
   utils/subproc,
 ]
 import "."/[
@@ -26,6 +27,9 @@ proc dockerFailsafe*(ctx: DockerInvocation) {.noreturn.} =
   # If our mundged docker invocation fails, then we conservatively
   # assume we made some big mistake, and run Docker the way it
   # was originally called.
+  # Whatever we probed about docker might be outdated so dont
+  # trust cached capabilities next time either.
+  invalidateCapabilityCache()
   var exitCode = 1
   try:
     let
@@ -76,7 +80,8 @@ proc runMungedDockerInvocation*(ctx: DockerInvocation): int =
   trace("docker: " & exe & " " & args.join(" "))
   if stdin != "":
     trace("docker: stdin: \n" & stdin)
-  result = runCmdNoOutputCapture(exe, args, stdin)
+  withPerfTiming("docker", ctx.cmdName & ".docker"):
+    result = runCmdNoOutputCapture(exe, args, stdin)
 
 proc getUsableDockerContexts*(ctx: DockerInvocation): seq[string] =
   ## Returns local folders that chalk plugins can scan for metadata.
@@ -21,6 +21,7 @@ import ".."/[
   utils/exec,
   utils/files,
   utils/json,
+  utils/perf,
 ]
 import "."/[
   base,
@@ -434,6 +435,24 @@ proc collectBaseImage(chalk: ChalkObj, ctx: DockerInvocation, section: DockerFil
   except:
     trace("docker: unable to scan base image due to: " & getCurrentExceptionMsg())
 
+proc prefetchBaseImages(ctx: DockerInvocation) =
+  ## base images are collected one (section, platform) at a time
+  ## as collection merges into shared chalk state. Fetch all of their
+  ## registry metadata concurrently beforehand so that collection mostly
+  ## hits the registry cache
+  var images: seq[tuple[image: DockerImage, platforms: seq[DockerPlatform]]]
+  for section in ctx.getBasesDockerSections():
+    if section.image.digest == "":
+      continue
+    var platforms: seq[DockerPlatform]
+    for platform in ctx.platforms:
+      let p = section.platformOrDefault(platform)
+      if p notin platforms:
+        platforms.add(p)
+    images.add((section.image, platforms))
+  if len(images) > 0:
+    prefetchManifests(images)
+
 proc collectBaseImages(chalk: ChalkObj, ctx: DockerInvocation) =
   for section in ctx.getBasesDockerSections():
     chalk.collectBaseImage(ctx, section)
@@ -585,12 +604,14 @@ proc dockerBuild*(ctx: DockerInvocation): int =
     subscanCodecs  = attrGet[seq[string]]("docker.scan_context.codecs")
 
   trace("docker: processing build CLI args")
-  ctx.processGitContext()
-  let contexts = ctx.getUsableDockerContexts()
-  setContextDirectories(contexts)
-  ctx.processDockerFile()
-  ctx.processCmdLine()
-  ctx.evalAndExtractDockerfile(ctx.getAllBuildArgs())
+  var contexts: seq[string]
+  withPerfTiming("docker", "build.parse"):
+    ctx.processGitContext()
+    contexts = ctx.getUsableDockerContexts()
+    setContextDirectories(contexts)
+    ctx.processDockerFile()
+    ctx.processCmdLine()
+    ctx.evalAndExtractDockerfile(ctx.getAllBuildArgs())
 
   forceReportKeys(["_REPO_TAGS", "_REPO_DIGESTS", "_REPO_BUILD_CONTEXTS"])
   # force DOCKER_PLATFORM to be included in chalk normalization
@@ -599,16 +620,19 @@ proc dockerBuild*(ctx: DockerInvocation): int =
 
   # login to any registries before any collection
   # as auth provided by auth might be required
-  loginToRegistries()
+  withPerfTiming("docker", "build.login"):
+    loginToRegistries()
 
   trace("docker: collecting pre-build metadata")
-  initCollection()
+  withPerfTiming("docker", "build.init_collection"):
+    initCollection()
   if dockerSubchalk:
     try:
       info("docker: starting chalking of context directories.")
-      let
+      var subchalkBox: Box
+      withPerfTiming("docker", "build.subchalk"):
         subchalkBox = ctx.launchDockerSubchalk(contexts)
-        unpacked     = unpack[seq[Box]](subchalkBox)
+      let unpacked = unpack[seq[Box]](subchalkBox)
       baseChalk.collectedData.setIfNeeded("EMBEDDED_CHALK", unpacked)
       info("docker: context directories chalking finished.")
     except:
@@ -618,17 +642,19 @@ proc dockerBuild*(ctx: DockerInvocation): int =
     try:
       withOnlyCodecs(getPluginsByName(subscanCodecs)):
         info("docker: starting sub-scan of context directories.")
-        for chalk in ctx.launchDockerSubscan(contexts):
-          # as its a subscan, artifact info is not collected hence needs to be manually triggered
-          chalk.collectRunTimeArtifactInfo()
-          addToAllArtifacts(chalk)
+        withPerfTiming("docker", "build.subscan"):
+          for chalk in ctx.launchDockerSubscan(contexts):
+            # as its a subscan, artifact info is not collected hence needs to be manually triggered
+            chalk.collectRunTimeArtifactInfo()
+            addToAllArtifacts(chalk)
         info("docker: context directories subscan finished.")
     except:
       error("docker: could not subchalk due to: " & getCurrentExceptionMsg())
       dumpExOnDebug()
 
   ctx.processPlatforms()
-  ctx.pinBuildSectionBaseImages()
+  withPerfTiming("docker", "build.pin_base_images"):
+    ctx.pinBuildSectionBaseImages()
 
   cleanBuildContextCache()
   # Upload context blobs / create local tarballs on baseChalk before
@@ -638,16 +664,17 @@ proc dockerBuild*(ctx: DockerInvocation): int =
     localTarPaths: seq[string]
   for config in baseChalk.iterContextUploadRepos():
     try:
-      baseChalk.collectedData.merge(
-        uploadBuildContextsAtBuildTime(
-          chalk         = baseChalk,
-          ctx           = ctx,
-          config        = config,
-          uploadedBlobs = uploadedBlobs,
-          localTarPaths = localTarPaths,
-        ),
-        deep = true,
-      )
+      withPerfTiming("docker", "build.context_upload"):
+        baseChalk.collectedData.merge(
+          uploadBuildContextsAtBuildTime(
+            chalk         = baseChalk,
+            ctx           = ctx,
+            config        = config,
+            uploadedBlobs = uploadedBlobs,
+            localTarPaths = localTarPaths,
+          ),
+          deep = true,
+        )
     except:
       error("docker: build context upload failed: " & getCurrentExceptionMsg())
       dumpExOnDebug()
@@ -655,13 +682,17 @@ proc dockerBuild*(ctx: DockerInvocation): int =
   trace("docker: preparing chalk marks for build")
   var oneChalk         = baseChalk
   let chalksByPlatform = baseChalk.copyPerPlatform(ctx.platforms)
+  withPerfTiming("docker", "build.prefetch_base_images"):
+    ctx.prefetchBaseImages()
   # chalk time artifact info determines metadata id/etc
   # so has to be done by platform
   for _, chalk in chalksByPlatform:
     chalk.withErrorContext():
       # collect any additional keys which might need to be included in chalkmark
-      chalk.collectBeforeChalkTime(ctx)
-      chalk.collectChalkTimeArtifactInfo()
+      withPerfTiming("docker", "build.base_images"):
+        chalk.collectBeforeChalkTime(ctx)
+      withPerfTiming("docker", "build.chalk_time_collection"):
+        chalk.collectChalkTimeArtifactInfo()
       oneChalk = chalk
 
   if wrapVirtual:
@@ -735,7 +766,7 @@ proc dockerBuild*(ctx: DockerInvocation): int =
       ctx.revertDockerignoreFile()
     for i in imagesToPrune:
       try:
-        discard runDockerGetEverything(@["rmi", i])
+        removeDockerImage(i)
       except:
         discard
 
@@ -766,7 +797,8 @@ proc dockerBuild*(ctx: DockerInvocation): int =
   else:
     trace("docker: collecting built image metadata")
     try:
-      ctx.collectAfterBuild(chalksByPlatform)
+      withPerfTiming("docker", "build.inspect"):
+        ctx.collectAfterBuild(chalksByPlatform)
       # if there is an iidFile we explicitly collect image metadata above
       # from either from local or buildx
       # hence we disable subsequent collection of docker codec below
@@ -783,20 +815,22 @@ proc dockerBuild*(ctx: DockerInvocation): int =
     for _, chalk in chalksByPlatform:
       chalk.withErrorContext():
         try:
-          chalk.collectedData.merge(chalk.completeBuildContextUploads(
-            source = chalk.collectedData,
-          ))
+          withPerfTiming("docker", "build.context_attestation"):
+            chalk.collectedData.merge(chalk.completeBuildContextUploads(
+              source = chalk.collectedData,
+            ))
         except:
           error("docker: build context attestation failed: " & getCurrentExceptionMsg())
           dumpExOnDebug()
 
   trace("docker: collecting post-build runtime data")
-  withSuspendChalkCollectionFor(suspendPlugins):
-    for _, chalk in chalksByPlatform:
-      chalk.withErrorContext():
-        chalk.collectedData["_OP_ARTIFACT_CONTEXT"] = pack("build")
-        chalk.collectRunTimeArtifactInfo()
-  collectRunTimeHostInfo()
+  withPerfTiming("docker", "build.run_time_collection"):
+    withSuspendChalkCollectionFor(suspendPlugins):
+      for _, chalk in chalksByPlatform:
+        chalk.withErrorContext():
+          chalk.collectedData["_OP_ARTIFACT_CONTEXT"] = pack("build")
+          chalk.collectRunTimeArtifactInfo()
+    collectRunTimeHostInfo()
   flushAttestationTags()
 
   if wrapVirtual and result == 0:
@@ -0,0 +1,123 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Persistent cache of docker capability probes.
+##
+## Figuring out what the local docker supports (client, buildx and
+## buildkit versions, dockerfile frontend version, default
+## build platforms) takes a handful of docker CLI invocations, one of
+## them an actual `docker build`. The answers only change when docker
+## itself changes so they are kept in a small json file across chalk
+## runs. Values are grouped by scope, a string describing everything the
+## probe depends on (docker CLI and buildx binaries, context, daemon ID
+## and version, builder name). Upgrading docker or pointing it at a
+## different daemon or builder therefore simply misses the cache.
+## Values also expire after `docker.capability_cache_ttl`.
+
+import std/[
+  os,
+  times,
+]
+import ".."/[
+  types,
+  utils/json,
+]
+
+var capabilities: JsonNode
+
+proc capabilityCachePath(): string =
+  return attrGet[string]("docker.capability_cache_path").resolvePath()
+
+proc capabilityCacheTtl(): Duration =
+  # Duration is stored as microseconds in con4m
+  return initDuration(microseconds = int(attrGet[Con4mDuration]("docker.capability_cache_ttl")))
+
+proc isEnabled(scope: string): bool =
+  return scope != "" and capabilityCacheTtl() > DurationZero
+
+proc isExpired(entry: JsonNode, now: Time, ttl: Duration): bool =
+  return (
+    entry == nil or
+    entry.kind != JObject or
+    now - fromUnix(entry{"at"}.getBiggestInt(0)) > ttl
+  )
+
+proc loadCapabilities(): JsonNode =
+  if capabilities != nil:
+    return capabilities
+  capabilities = newJObject()
+  let path = capabilityCachePath()
+  try:
+    let data = tryToLoadFile(path)
+    if data != "":
+      capabilities = parseJson(data).assertIs(JObject, "bad docker capability cache")
+  except:
+    trace("docker: ignoring unreadable capability cache " & path & ": " & getCurrentExceptionMsg())
+  return capabilities
+
+proc saveCapabilities() =
+  let
+    path = capabilityCachePath()
+    now  = getTime()
+    ttl  = capabilityCacheTtl()
+    kept = newJObject()
+  # drop whatever expired so stale scopes (e.g. previous docker versions)
+  # dont accumulate
+  for scope, values in loadCapabilities().pairs():
+    if values.kind != JObject:
+      continue
+    let fresh = newJObject()
+    for name, entry in values.pairs():
+      if not entry.isExpired(now, ttl):
+        fresh[name] = entry
+    if len(fresh) > 0:
+      kept[scope] = fresh
+  capabilities = kept
+  try:
+    createDir(path.parentDir())
+    # rename so concurrent chalk runs never see a partial file
+    let tmp = path & "." & $getCurrentProcessId() & ".tmp"
+    if not tryToWriteFile(tmp, $kept):
+      raise newException(IOError, "could not write " & tmp)
+    moveFile(tmp, path)
+  except:
+    trace("docker: could not save capability cache " & path & ": " & getCurrentExceptionMsg())
+
+proc getCachedCapability*(scope: string, name: string): Option[string] =
+  ## cached probe result, if its still fresh.
+  ## empty scope means the probe is not cacheable
+  if not scope.isEnabled():
+    return none(string)
+  let entry = loadCapabilities(){scope}{name}
+  if entry.isExpired(getTime(), capabilityCacheTtl()):
+    return none(string)
+  trace("docker: using cached " & name)
+  return some(entry{"value"}.getStr())
+
+proc setCachedCapability*(scope: string, name: string, value: string) =
+  if not scope.isEnabled():
+    return
+  let root = loadCapabilities()
+  if root{scope} == nil or root{scope}.kind != JObject:
+    root[scope] = newJObject()
+  root[scope][name] = %*{
+    "value": value,
+    "at":    getTime().toUnix(),
+  }
+  saveCapabilities()
+
+proc invalidateCapabilityCache*() =
+  ## forget all cached probes, e.g. when a chalk-wrapped docker
+  ## command failed and stale capabilities could be the culprit
+  capabilities = newJObject()
+  let path = capabilityCachePath()
+  try:
+    if fileExists(path):
+      removeFile(path)
+      trace("docker: removed capability cache " & path)
+  except:
+    trace("docker: could not remove capability cache " & path & ": " & getCurrentExceptionMsg())
@@ -9,6 +9,7 @@
 ## See docs/design-docker-registry.md for the full design.
 
 import std/[
+  algorithm,
   json,
   os,
   times,
@@ -34,6 +35,10 @@ const
   CONTEXT_CONFIG_TYPE*     = "application/vnd.oci.empty.v1+json"
   CONTEXT_CACHE_SUBDIR     = "chalk-build-contexts"
   CONTEXT_CACHE_DIR_FMT    = "yyyy-MM-dd'T'HH-mm-ss"
+  CONTEXT_CACHE_ARCHIVES   = "archives"
+  CONTEXT_CACHE_INDEXES    = "indexes"
+  CONTEXT_CACHE_SNAPSHOTS  = "snapshots"
+  CONTEXT_FINGERPRINT_V    = "chalk-context-v1"
   ANNOTATION_CREATED       = "org.opencontainers.image.created"
   ANNOTATION_CONTEXT_NAME* = "dev.crashoverride.chalk.build-context.name"
 
@@ -74,25 +79,48 @@ proc skippedFilesToJson(files: seq[SkippedFile]): JsonNode =
   for f in files:
     result[f.path] = %*{"hash": f.hash, "size": f.size}
 
+proc skippedFilesFromJson(node: JsonNode): seq[SkippedFile] =
+  if node == nil or node.kind != JObject:
+    return
+  for path, f in node.pairs:
+    result.add((path: path, size: f{"size"}.getBiggestInt(0), hash: f{"hash"}.getStr("")))
+
 proc contextCacheDir*(): string =
   return getTempDir() / CONTEXT_CACHE_SUBDIR
 
+proc archiveMetaPath(tarPath: string): string =
+  return tarPath & ".json"
+
+proc removeArchive(tarPath: string) =
+  removeFile(tarPath)
+  removeFile(tarPath.archiveMetaPath())
+  trace("docker: evicted build context archive: " & tarPath)
+
 proc cleanBuildContextCache*() =
-  ## Remove datetime-stamped subdirectories older than build_context_cache_max_age.
+  ## Evict cached context archives.  Archives not used within
+  ## build_context_cache_max_age are removed, then the least recently used
+  ## ones until the cache fits in build_context_cache_max_size.  Either
+  ## limit is disabled when set to 0.
   let dir = contextCacheDir()
   if not dirExists(dir):
     return
   # Duration is stored as microseconds in con4m
-  let maxAgeUsec = int(attrGet[Con4mDuration]("docker.build_context_cache_max_age"))
-  if maxAgeUsec == 0:
-    return
-  let cutoff = getTime() - initDuration(microseconds = maxAgeUsec)
+  let
+    maxAgeUsec = int(attrGet[Con4mDuration]("docker.build_context_cache_max_age"))
+    maxSize    = int64(attrGet[Con4mSize]("docker.build_context_cache_max_size"))
+    cutoff     = getTime() - initDuration(microseconds = maxAgeUsec)
+    expired    = proc (t: Time): bool = maxAgeUsec != 0 and t < cutoff
+
+  # datetime-stamped subdirectories from before archives were content
+  # addressed
   for kind, path in walkDir(dir):
-    if kind != pcDir:
+    if kind != pcDir or lastPathPart(path) in [CONTEXT_CACHE_ARCHIVES,
+                                               CONTEXT_CACHE_INDEXES,
+                                               CONTEXT_CACHE_SNAPSHOTS]:
       continue
     try:
       let dt = parse(lastPathPart(path), CONTEXT_CACHE_DIR_FMT, utc())
-      if dt.toTime() < cutoff:
+      if expired(dt.toTime()):
         removeDir(path)
         trace("docker: cleaned old build context cache: " & path)
     except:
@@ -100,59 +128,125 @@ proc cleanBuildContextCache*() =
             getCurrentExceptionMsg())
       dumpExOnDebug()
 
-proc readDockerignorePatterns(
-    contextPath:    string,
-    dockerfilePath: string = "",
-): seq[string] =
-  ## Read ignore patterns from the appropriate ignore file.
-  ## Docker priority: <dockerfileDir>/<basename(dockerfile)>.dockerignore >
-  ## <contextRoot>/.dockerignore.
-  ## The Dockerfile-specific file lives next to the Dockerfile, not in the
-  ## context root.  Reference:
-  ## https://docs.docker.com/build/concepts/context/#dockerignore-files
-  var ignorePath = ""
-  if dockerfilePath != "" and dockerfilePath != stdinIndicator:
-    let candidate = parentDir(dockerfilePath) / (lastPathPart(dockerfilePath) & ".dockerignore")
-    if fileExists(candidate):
-      ignorePath = candidate
-  if ignorePath == "":
-    let candidate = contextPath / ".dockerignore"
-    if fileExists(candidate):
-      ignorePath = candidate
-  if ignorePath == "":
-    return @[]
-  result = @[]
-  for line in tryToLoadFile(ignorePath).splitLines():
-    let p = line.strip()
-    if p.len == 0 or p.startsWith('#'):
-      continue
-    if p.startsWith('!'):
-      result.add('!' & p[1 .. ^1].removePrefix('/'))
-    else:
-      result.add(p.removePrefix('/'))
-
-proc contextNameSlug(name: string): string =
-  ## Produce a human-readable filename-safe slug from a context name.
-  ## "." (the primary build context) becomes "main"; other characters
-  ## outside [a-zA-Z0-9_-] are replaced with "_".
-  ## Use alongside contextNameHash for a collision-free identifier.
-  if name == ".":
-    return "main"
-  result = ""
-  for c in name:
-    if c in {'a' .. 'z', 'A' .. 'Z', '0' .. '9', '-', '_'}:
-      result.add(c)
-    else:
-      result.add('_')
-
-proc contextNameHash(name: string): string =
-  ## Return the first 8 hex characters of the SHA-256 of `name`.
-  ## Used as a suffix to disambiguate slugs that collide after sanitisation
-  ## (e.g. "." and "main" both slug to "main").
-  name.sha256Hex()[0 ..< 8]
+  try:
+    for kind, path in walkDir(dir / CONTEXT_CACHE_INDEXES):
+      if kind == pcFile and expired(getLastModificationTime(path)):
+        removeFile(path)
+
+    # snapshot links share the archive inode and so its mtime. They go
+    # first so an archive whose last link expired is evicted below
+    for kind, path in walkDir(dir / CONTEXT_CACHE_SNAPSHOTS):
+      if kind == pcFile and expired(getLastModificationTime(path)):
+        removeFile(path)
+        trace("docker: evicted build context snapshot: " & path)
+
+    # archives are touched on every reuse, so mtime is the last use
+    var archives: seq[(Time, string, int64)]
+    for kind, path in walkDir(dir / CONTEXT_CACHE_ARCHIVES):
+      if kind != pcFile:
+        continue
+      if path.endsWith(".tar.gz"):
+        archives.add((getLastModificationTime(path), path, getFileSize(path)))
+      elif path.endsWith(".json") and not fileExists(path[0 ..< ^len(".json")]):
+        removeFile(path)
+      elif path.endsWith(".tmp") and expired(getLastModificationTime(path)):
+        # left behind by a build that was killed while archiving
+        removeFile(path)
+    archives.sort(Descending)
+    var total = int64(0)
+    for i, (mtime, path, size) in archives:
+      total += size
+      # a pending local snapshot still links to it, and removing it would
+      # not free any space anyway
+      if getFileInfo(path).linkCount > 1:
+        continue
+      # never evict the most recently used one on size alone
+      if expired(mtime) or (maxSize != 0 and total > maxSize and i > 0):
+        removeArchive(path)
+        total -= size
+  except:
+    trace("docker: error evicting build context archives: " & getCurrentExceptionMsg())
+    dumpExOnDebug()
+
+proc contextIndexPath(contextPath: string): string =
+  return (
+    contextCacheDir() / CONTEXT_CACHE_INDEXES /
+    (contextPath.absolutePath().sha256Hex()[0 ..< 16] & ".json")
+  )
+
+proc contextFingerprint(
+    contextPath: string,
+    entries:     seq[ContextEntry],
+    patterns:    seq[string],
+    maxFileSize: int64,
+): string =
+  ## Content address of the archive contextPath would produce: a hash over
+  ## per-entry digests of (kind, path, size, mtime, content hash or symlink
+  ## target), plus the settings that change the archive.  Tar headers use
+  ## fixed modes, so file modes do not take part.
+  ##
+  ## Content hashes are kept in a per-context index and reused while a
+  ## file's size and mtime are unchanged, so an unchanged context only
+  ## costs a walk and a stat per file.
+  let indexPath = contextIndexPath(contextPath)
+  var previous  = newJObject()
+  if fileExists(indexPath):
+    try:
+      previous = parseJson(tryToLoadFile(indexPath))
+    except:
+      dumpExOnDebug()
+  var
+    index = newJObject()
+    root  = CONTEXT_FINGERPRINT_V & "\0" & $maxFileSize & "\0" & patterns.join("\0") & "\0"
+  for e in entries:
+    var content = e.target
+    if e.kind == pcFile:
+      let prev = previous{e.path}
+      if (prev != nil and prev.kind == JArray and len(prev) == 4 and
+          prev[0].getBiggestInt() == e.size and prev[1].getBiggestInt() == e.mtime and
+          prev[2].getBiggestInt() == e.mtimeNs):
+        content = prev[3].getStr()
+      else:
+        content = newFileStringStream(e.full).sha256Hex()
+      index[e.path] = %*[e.size, e.mtime, e.mtimeNs, content]
+    root.add(($e.kind & "\0" & e.path & "\0" & $e.size & "\0" & $e.mtime & "\0" & content).sha256Hex())
+  try:
+    createDir(parentDir(indexPath))
+    discard tryToWriteFile(indexPath, $index)
+  except:
+    dumpExOnDebug()
+  return root.sha256Hex()
+
+proc archiveHash(tarPath: string): string =
+  ## sha256 of the archive, recorded when it was written.
+  try:
+    result = parseJson(tryToLoadFile(tarPath.archiveMetaPath())){"sha256"}.getStr("")
+  except:
+    dumpExOnDebug()
+  if result == "":
+    result = newFileStringStream(tarPath).sha256Hex()
+
+proc snapshotArchive(tarPath: string): string =
+  ## Per-build reference to a cached archive, recorded as the local
+  ## strategy's tar_path.  It is a hard link to the archive, so evicting
+  ## the shared archive never removes a tarball a pending push still needs,
+  ## and cleaning up after a failed build only removes this build's link.
+  let
+    dir  = contextCacheDir() / CONTEXT_CACHE_SNAPSHOTS
+    name = lastPathPart(tarPath)[0 ..< ^len(".tar.gz")]
+  createDir(dir)
+  result = dir / (name & "-" & $getCurrentProcessId() & "-" &
+                  $getTime().toUnix() & ".tar.gz")
+  if fileExists(result):
+    return
+  try:
+    createHardlink(tarPath, result)
+  except:
+    # filesystems without hard links get a private copy instead
+    trace("docker: could not link " & tarPath & ", copying it: " & getCurrentExceptionMsg())
+    copyFile(tarPath, result)
 
 proc contextToTarGz*(
-    chalk:                  ChalkObj,
     contextName:            string,
     contextPath:            string,
     additionalDockerignore: seq[string],
@@ -160,37 +254,64 @@ proc contextToTarGz*(
     maxFileSize:            int64  = 0,
     sizeThreshold:          int64  = 0,
     dockerfilePath:         string = "",
-    registryName:           string = "",
-    pushName:               string = "",
 ): (string, seq[SkippedFile]) =
-  ## Archive a context directory to a temp .tar.gz and return its path along
-  ## with the list of files skipped due to maxFileSize.
+  ## Archive a context directory to a cached .tar.gz and return its path
+  ## along with the list of files skipped due to maxFileSize.
+  ## Archives are content addressed (see contextFingerprint), so when the
+  ## filtered context is unchanged since a previous build the existing
+  ## archive is returned without re-compressing anything.
   ## Raises ContextTooLargeError immediately when the compressed output
   ## exceeds sizeThreshold, cleaning up the partial file before raising.
-  let
-    chalkId     = unpack[string](chalk.lookupCollectedKey("CHALK_ID").get(pack("")))
-    contextSlug = contextNameSlug(contextName)
-    contextHash = contextNameHash(contextName)
-    configSlug  = contextNameSlug(registryName) & "-" & contextNameSlug(pushName)
-    dateDir     = contextCacheDir() / now().utc.format(CONTEXT_CACHE_DIR_FMT)
-  createDir(dateDir)
   var patterns: seq[string]
   if honorDockerignore:
     patterns.add(readDockerignorePatterns(contextPath, dockerfilePath))
   patterns.add(additionalDockerignore)
-  let outPath = dateDir / (chalkId & "-" & configSlug & "-" & contextSlug & "-" & contextHash & ".tar.gz")
+  let
+    archiveDir  = contextCacheDir() / CONTEXT_CACHE_ARCHIVES
+    entries     = listContext(contextPath, patterns)
+    fingerprint = contextFingerprint(contextPath, entries, patterns, maxFileSize)
+    outPath     = archiveDir / (fingerprint & ".tar.gz")
+    metaPath    = outPath.archiveMetaPath()
+  createDir(archiveDir)
+
+  if fileExists(outPath) and fileExists(metaPath):
+    if sizeThreshold > 0 and getFileSize(outPath) > sizeThreshold:
+      raise newException(
+        ContextTooLargeError,
+        "archive exceeded size_threshold of " & $sizeThreshold & " bytes",
+      )
+    try:
+      let meta = parseJson(tryToLoadFile(metaPath))
+      setLastModificationTime(outPath, getTime())
+      trace("docker: context '" & contextName & "' unchanged; reusing " & outPath)
+      return (outPath, skippedFilesFromJson(meta{"skipped_files"}))
+    except:
+      trace("docker: could not reuse cached context archive " & outPath & ": " &
+            getCurrentExceptionMsg())
+      dumpExOnDebug()
+
+  # write under a private name and rename, so concurrent builds of the
+  # same context never see a partial archive
+  let tmpPath = outPath & "." & $getCurrentProcessId() & ".tmp"
   try:
     let skippedFiles = writeTarGz(
-      outPath       = outPath,
-      contextPath   = contextPath,
-      patterns      = patterns,
+      outPath       = tmpPath,
+      entries       = entries,
       maxFileSize   = maxFileSize,
       sizeThreshold = sizeThreshold,
     )
+    let meta = %*{
+      "context_name":  contextName,
+      "sha256":        newFileStringStream(tmpPath).sha256Hex(),
+      "skipped_files": skippedFilesToJson(skippedFiles),
+    }
+    moveFile(tmpPath, outPath)
+    if not tryToWriteFile(metaPath, $meta):
+      warn("docker: could not write build context cache metadata: " & metaPath)
     return (outPath, skippedFiles)
   except:
-    if fileExists(outPath):
-      removeFile(outPath)
+    if fileExists(tmpPath):
+      removeFile(tmpPath)
     dumpExOnDebug()
     if getCurrentException() of TarSizeLimitError:
       raise newException(ContextTooLargeError, getCurrentExceptionMsg())
@@ -235,6 +356,8 @@ proc cleanupUploadedBlobs*(blobs: seq[DockerImage]) =
 proc cleanupLocalTars*(paths: seq[string]) =
   try:
     var deleted = 0
+    # these are this build's snapshot links; the shared archives stay
+    # cached for other builds
     for path in paths:
       try:
         removeFile(path)
@@ -247,6 +370,44 @@ proc cleanupLocalTars*(paths: seq[string]) =
     error("docker: failed to clean up local tars: " & getCurrentExceptionMsg())
     dumpExOnDebug()
 
+proc preuploadContexts(
+    repoImage:     DockerImage,
+    contexts:      TableRef[string, string],
+    config:        DockerContextUploadConfig,
+    dockerfile:    string,
+    uploadedBlobs: var seq[DockerImage],
+) =
+  ## Upload the archives of several contexts concurrently ahead of the
+  ## per-context loop, which then finds them already in the registry.
+  ## Failures are left for that loop to retry and report.
+  var layers: seq[DockerManifest]
+  for contextName, contextPath in contexts:
+    try:
+      let
+        (tarPath, _) = contextToTarGz(
+          contextName            = contextName,
+          contextPath            = contextPath,
+          additionalDockerignore = config.additionalDockerignore,
+          honorDockerignore      = config.honorDockerignore,
+          maxFileSize            = int64(config.maxFileSize),
+          sizeThreshold          = int64(config.sizeThreshold),
+          dockerfilePath         = dockerfile,
+        )
+        blob = repoImage.withDigest(archiveHash(tarPath))
+      if not blob.layerExists():
+        layers.add(DockerManifest(
+          kind:       DockerManifestType.layer,
+          name:       blob,
+          mediaType:  CONTEXT_LAYER_TYPE,
+          fileStream: newFileStringStream(tarPath),
+        ))
+    except:
+      dumpExOnDebug()
+  putLayers(layers)
+  for layer in layers:
+    if layer.isFetched:
+      uploadedBlobs.add(layer.asImage())
+
 proc uploadBuildContextsAtBuildTime*(
     chalk:         ChalkObj,
     ctx:           DockerInvocation,
@@ -268,6 +429,8 @@ proc uploadBuildContextsAtBuildTime*(
   let
     repoImage = parseImage(config.registryUri & "/" & config.repoPath)
     registry  = repoImage.registry
+  if config.strategy == "registry" and len(contexts) > 1:
+    preuploadContexts(repoImage, contexts, config, ctx.dockerFileLoc, uploadedBlobs)
   var snapshots = newJObject()
   for contextName, contextPath in contexts:
     var entry: ContextSnapshotEntry = nil
@@ -277,19 +440,31 @@ proc uploadBuildContextsAtBuildTime*(
         # Upload blob now so it is present in the registry at push time.
         trace("docker: uploading build context blob for '" & contextName &
               "' to " & $repoImage & " (registry strategy)")
-        let (tarPath, skippedFiles) = contextToTarGz(
-          chalk                  = chalk,
-          contextName            = contextName,
-          contextPath            = contextPath,
-          additionalDockerignore = config.additionalDockerignore,
-          honorDockerignore      = config.honorDockerignore,
-          maxFileSize            = int64(config.maxFileSize),
-          sizeThreshold          = int64(config.sizeThreshold),
-          dockerfilePath         = ctx.dockerFileLoc,
-          registryName           = config.registryName,
-          pushName               = config.pushName,
-        )
-        try:
+        let
+          (tarPath, skippedFiles) = contextToTarGz(
+            contextName            = contextName,
+            contextPath            = contextPath,
+            additionalDockerignore = config.additionalDockerignore,
+            honorDockerignore      = config.honorDockerignore,
+            maxFileSize            = int64(config.maxFileSize),
+            sizeThreshold          = int64(config.sizeThreshold),
+            dockerfilePath         = ctx.dockerFileLoc,
+          )
+          digest = archiveHash(tarPath)
+        # The blob digest is the archive hash, so an unchanged context that
+        # is already in the repo is not uploaded again: either it was
+        # uploaded by preuploadContexts(), which tracks it in uploadedBlobs,
+        # or by an earlier build, which makes it not ours to delete if this
+        # build fails.
+        if repoImage.withDigest(digest).layerExists():
+          entry = %*{
+            "strategy":      "registry",
+            "blob_digest":   digest,
+            "blob_size":     getFileSize(tarPath),
+            "skipped_files": skippedFilesToJson(skippedFiles),
+          }
+          trace("docker: build context blob already uploaded: sha256:" & digest)
+        else:
           let layer = DockerManifest(
             kind:       DockerManifestType.layer,
             name:       repoImage,
@@ -305,31 +480,28 @@ proc uploadBuildContextsAtBuildTime*(
             "skipped_files": skippedFilesToJson(skippedFiles),
           }
           trace("docker: build context blob uploaded: sha256:" & entry["blob_digest"].getStr())
-        finally:
-          removeFile(tarPath)
 
       of "local":
         # Save tarball for upload at push time.
-        let (tarPath, skippedFiles) = contextToTarGz(
-          chalk                  = chalk,
-          contextName            = contextName,
-          contextPath            = contextPath,
-          additionalDockerignore = config.additionalDockerignore,
-          honorDockerignore      = config.honorDockerignore,
-          maxFileSize            = int64(config.maxFileSize),
-          sizeThreshold          = int64(config.sizeThreshold),
-          dockerfilePath         = ctx.dockerFileLoc,
-          registryName           = config.registryName,
-          pushName               = config.pushName,
-        )
-        localTarPaths.add(tarPath)
+        let
+          (tarPath, skippedFiles) = contextToTarGz(
+            contextName            = contextName,
+            contextPath            = contextPath,
+            additionalDockerignore = config.additionalDockerignore,
+            honorDockerignore      = config.honorDockerignore,
+            maxFileSize            = int64(config.maxFileSize),
+            sizeThreshold          = int64(config.sizeThreshold),
+            dockerfilePath         = ctx.dockerFileLoc,
+          )
+          snapshotPath = snapshotArchive(tarPath)
+        localTarPaths.add(snapshotPath)
         entry = %*{
           "strategy":      "local",
-          "tar_path":      tarPath,
-          "tar_hash":      newFileStringStream(tarPath).sha256Hex(),
+          "tar_path":      snapshotPath,
+          "tar_hash":      archiveHash(tarPath),
           "skipped_files": skippedFilesToJson(skippedFiles),
         }
-        trace("docker: build context tarball cached at: " & tarPath)
+        trace("docker: build context tarball cached at: " & snapshotPath)
 
       of "disk":
         # Record the context path; push time will read from disk.
@@ -483,10 +655,7 @@ proc completeBuildContextUpload(
       honorDockerignore      = snapshot{"honor_dockerignore"}.getBool(true)
       maxFileSize            = int64(snapshot{"max_file_size"}.getInt(0))
       dockerfilePath         = snapshot{"dockerfile_path"}.getStr("")
-      snapshotRegistryName   = snapshot{"registry_name"}.getStr("")
-      snapshotPushName       = snapshot{"push_name"}.getStr("")
       (tarPath, skippedFiles) = contextToTarGz(
-        chalk                  = chalk,
         contextName            = contextName,
         contextPath            = contextPath,
         additionalDockerignore = additionalDockerignore,
@@ -494,27 +663,21 @@ proc completeBuildContextUpload(
         maxFileSize            = maxFileSize,
         sizeThreshold          = int64(sizeThreshold),
         dockerfilePath         = dockerfilePath,
-        registryName           = snapshotRegistryName,
-        pushName               = snapshotPushName,
       )
-    try:
-      let
-        tarSize = getFileSize(tarPath)
-        layer   = DockerManifest(
-          kind:       DockerManifestType.layer,
-          mediaType:  CONTEXT_LAYER_TYPE,
-          fileStream: newFileStringStream(tarPath),
-        )
-        ctxManifest = newContextManifest(
-          image       = image,
-          subject     = subject,
-          layer       = layer,
-          contextName = contextName,
-        )
-      image.addAttestation(ctxManifest)
-      return (ctxManifest.digest.extractDockerHash(), tarSize, skippedFiles)
-    finally:
-      removeFile(tarPath)
+      tarSize = getFileSize(tarPath)
+      layer   = DockerManifest(
+        kind:       DockerManifestType.layer,
+        mediaType:  CONTEXT_LAYER_TYPE,
+        fileStream: newFileStringStream(tarPath),
+      )
+      ctxManifest = newContextManifest(
+        image       = image,
+        subject     = subject,
+        layer       = layer,
+        contextName = contextName,
+      )
+    image.addAttestation(ctxManifest)
+    return (ctxManifest.digest.extractDockerHash(), tarSize, skippedFiles)
 
   else:
     raise newException(
@@ -539,6 +702,28 @@ proc completeBuildContextUploads*(
     buildContexts  = ContextResults()
     sizeResults    = SizeResults()
     skippedResults = newJObject()
+    tarballs:        seq[DockerManifest]
+
+  # tarballs of the local strategy go up concurrently first; the loop below
+  # then only verifies them and pushes the manifests
+  for image in chalk.repos.manifests:
+    if image.registry notin snapshots:
+      continue
+    for repoPath, contexts in snapshots[image.registry].pairs:
+      if repoPath != image.name:
+        continue
+      for _, snapshot in contexts.pairs:
+        let
+          tarPath = snapshot{"tar_path"}.getStr("")
+          tarHash = snapshot{"tar_hash"}.getStr("")
+        if snapshot{"strategy"}.getStr("") == "local" and tarHash != "" and fileExists(tarPath):
+          tarballs.add(DockerManifest(
+            kind:       DockerManifestType.layer,
+            name:       image.withBare().withDigest(tarHash),
+            mediaType:  CONTEXT_LAYER_TYPE,
+            fileStream: newFileStringStream(tarPath),
+          ))
+  putLayers(tarballs)
 
   for image in chalk.repos.manifests:
     if image.registry notin snapshots:
@@ -167,13 +167,59 @@ method repr(x: CopyInfo, ctx: DockerParse): string =
     result &= " (error: " & x.error & ")"
   result &= "\n"
 
-proc lexOneLineTok(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var int): LineToken
+# The lexer works on bytes of the UTF-8 line and slices words out of it
+# rather than converting lines to runes. All syntax characters are ASCII
+# so only whitespace, identifier characters and a (non-ASCII) escape
+# character need decoding, and only when a non-ASCII byte is seen.
+# Token and var sub offsets are byte offsets.
+
+const nonWordChars = {'$', '"', '\'', '#', '=', '{', '}', ':', '@'}
+
+proc charAt(s: string, i: int): char {.inline.} =
+  if i < len(s):
+    return s[i]
+  return '\0'
+
+proc runeSize(s: string, i: int): int {.inline.} =
+  if ord(s[i]) < 0x80:
+    return 1
+  return min(s.runeLenAt(i), len(s) - i)
+
+proc whiteSpaceLen(s: string, i: int): int {.inline.} =
+  ## byte length of whitespace character at i or 0
+  let c = s[i]
+  if c in {' ', '\t', '\n', '\v', '\f', '\r'}:
+    return 1
+  if ord(c) >= 0x80 and s.runeAt(i).isWhiteSpace():
+    return s.runeSize(i)
+  return 0
 
-proc lexVarSub(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var int): VarSub =
+proc idContinueLen(s: string, i: int): int {.inline.} =
+  let c = s[i]
+  if c in {'a'..'z', 'A'..'Z', '0'..'9', '_'}:
+    return 1
+  if ord(c) >= 0x80 and s.runeAt(i).isIdContinue():
+    return s.runeSize(i)
+  return 0
+
+proc escapeLen(ctx: DockerParse, s: string, i: int): int {.inline.} =
+  ## byte length of escape character at i or 0
+  if i >= len(s):
+    return 0
+  let esc = int(ctx.currentEscape)
+  if esc < 0x80:
+    return (if ord(s[i]) == esc: 1 else: 0)
+  if ord(s[i]) >= 0x80 and s.runeAt(i) == ctx.currentEscape:
+    return s.runeSize(i)
+  return 0
+
+proc lexOneLineTok(ctx: DockerParse, d: DockerStatement, s: string, i: var int): LineToken
+
+proc lexVarSub(ctx: DockerParse, d: DockerStatement, s: string, i: var int): VarSub =
   result = VarSub(startix: i)
 
   i += 1
-  if s[i] == Rune('{'):
+  if s.charAt(i) == '{':
     result.brace = true
     i += 1
   else:
@@ -181,26 +227,29 @@ proc lexVarSub(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var int):
 
   let nameStart = i
 
-  while i < s.len() and s[i].isIdContinue():
-    i += 1
+  while i < len(s):
+    let n = s.idContinueLen(i)
+    if n == 0:
+      break
+    i += n
 
-  result.name = $(s[nameStart ..< i])
+  result.name = s[nameStart ..< i]
 
   if result.brace == false:
     result.endix = i
     return
-  case s[i]
-  of Rune('}'):
+  case s.charAt(i)
+  of '}':
     i += 1
     result.endix = i
     return
-  of Rune(':'):
+  of ':':
     i += 1
-    case s[i]
-    of Rune('+'):
+    case s.charAt(i)
+    of '+':
       result.plus = true
       # Drops down below
-    of Rune('-'):
+    of '-':
       result.minus = true
       # Drops down below
     else:
@@ -213,65 +262,90 @@ proc lexVarSub(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var int):
     return
 
   i += 1
-  result.default = some(ctx.lexOneLineTok(d, s, i))
-  if s[i] != Rune('}'):
+  if i < len(s):
+    result.default = some(ctx.lexOneLineTok(d, s, i))
+  else:
+    result.default = some(LineToken(kind:     ltWord,
+                                    startix:  i,
+                                    endix:    i,
+                                    contents: @[""],
+                                    line:     d.startLine))
+  if s.charAt(i) != '}':
     result.error = "Unterminated ${"
   else:
     i += 1
 
-proc lexQuoted(ctx: DockerParse, d: DockerStatement, s: seq[Rune], q: Rune, i: var int):
+proc lexQuoted(ctx: DockerParse, d: DockerStatement, s: string, q: char, i: var int):
               LineToken =
   result = LineToken(kind:      ltQuoted,
-                     quoteType: some(q),
+                     quoteType: some(Rune(ord(q))),
                      startix:   i,
                      line:      d.startLine)
-  var val = ""
-  while i < s.len():
-    if s[i] == ctx.currentEscape:
+  var
+    val   = ""
+    start = i
+  while i < len(s):
+    let esc = ctx.escapeLen(s, i)
+    if esc > 0:
+      val &= s[start ..< i]
       result.usedEscape = true
-      i += 1
-      case s[i]
-      of Rune('n'):
-        val &= "\n"
-      of Rune('t'):
-        val &= "\t"
-      else:
-        val &= $(s[i])
-      i += 1
+      i += esc
+      if i < len(s):
+        case s[i]
+        of 'n':
+          val &= "\n"
+          i += 1
+        of 't':
+          val &= "\t"
+          i += 1
+        else:
+          let n = s.runeSize(i)
+          val &= s[i ..< i + n]
+          i += n
+      start = i
       continue
     if s[i] == q:
+      val &= s[start ..< i]
       i += 1
       result.contents.add(val)
       result.endix = i
       return
-    if s[i] == Rune('$'):
+    if s[i] == '$':
+      val &= s[start ..< i]
       result.contents.add(val)
       val = ""
       result.varSubs.add(ctx.lexVarSub(d, s, i))
+      start = i
       continue
-    val &= $(s[i])
-    i += 1
+    i += s.runeSize(i)
 
+  val &= s[start ..< i]
   result.endix = i
   result.error = "Unterminated string"
   result.contents.add(val)
 
-const nonWordRunes = [Rune('$'), Rune('"'), Rune('\''), Rune('#'), Rune('='),
-                      Rune('{'), Rune('}'), Rune(':'), Rune('@')]
-
-proc lexWord(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var int): LineToken =
+proc lexWord(ctx: DockerParse, d: DockerStatement, s: string, i: var int): LineToken =
   result = LineToken(kind:      ltWord,
                      startix:   i,
                      line:      d.startLine)
-  var val = ""
-
-  while i < s.len():
-    if s[i] == ctx.currentEscape:
-      i += 1
-      val &= $(s[i])
-      i += 1
+  var
+    val   = ""
+    start = i
+
+  while i < len(s):
+    let esc = ctx.escapeLen(s, i)
+    if esc > 0:
+      val &= s[start ..< i]
+      i += esc
+      if i < len(s):
+        let n = s.runeSize(i)
+        val &= s[i ..< i + n]
+        i += n
+      start = i
       continue
-    if s[i] == Rune('$'):
+    let c = s[i]
+    if c == '$':
+      val &= s[start ..< i]
       let varsub = ctx.lexVarSub(d, s, i)
       result.contents.add(val)
       val = ""
@@ -279,39 +353,44 @@ proc lexWord(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var int): Li
       if not varsub.brace:
         result.endix = i
         return
+      start = i
       continue
-    elif not s[i].isWhiteSpace() and s[i] notin nonWordRunes:
-      val &= $(s[i])
-      i = i + 1
+    elif c notin nonWordChars and s.whiteSpaceLen(i) == 0:
+      i += s.runeSize(i)
       continue
     else:
       break
 
+  val &= s[start ..< i]
   result.contents.add(val)
   result.endix = i
   return
 
-proc lexWhiteSpace(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var int): LineToken =
+proc lexWhiteSpace(ctx: DockerParse, d: DockerStatement, s: string, i: var int): LineToken =
   result = LineToken(kind:      ltSpace,
                      startix:   i,
                      line:      d.startLine)
 
-  while i < s.len() and s[i].isWhiteSpace():  i += 1
+  while i < len(s):
+    let n = s.whiteSpaceLen(i)
+    if n == 0:
+      break
+    i += n
   result.endix    = i
-  result.contents = @[$(s[result.startix ..< result.endix])]
+  result.contents = @[s[result.startix ..< result.endix]]
 
-proc lexOneLineTok(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var int): LineToken =
+proc lexOneLineTok(ctx: DockerParse, d: DockerStatement, s: string, i: var int): LineToken =
   let c = s[i]
   case c
-  of Rune('"'), Rune('\''):
+  of '"', '\'':
     i += 1
     return ctx.lexQuoted(d, s, c, i)
-  of Rune('$'):
+  of '$':
     return ctx.lexWord(d, s, i)
   else:
-    if c.isWhiteSpace():
+    if s.whiteSpaceLen(i) > 0:
       return ctx.lexWhiteSpace(d, s, i)
-    if c == ctx.currentEscape or c notin nonWordRunes:
+    if ctx.escapeLen(s, i) > 0 or c notin nonWordChars:
       return ctx.lexWord(d, s, i)
     i += 1
     result = LineToken(kind:      ltOther,
@@ -319,10 +398,16 @@ proc lexOneLineTok(ctx: DockerParse, d: DockerStatement, s: seq[Rune], i: var in
                        line:      d.startLine)
 
 proc lexSubableLine(ctx: DockerParse, d: DockerStatement, s: string): seq[LineToken] =
-  let all = s.toRunes()
-  var i   = 0
-  while i < len(all):
-    result.add(ctx.lexOneLineTok(d, all, i))
+  var i = 0
+  while i < len(s):
+    result.add(ctx.lexOneLineTok(d, s, i))
+
+proc lexCommand(ctx: DockerParse, t: DockerCommand): seq[LineToken] =
+  ## tokens of the command argument. Lexed once per command as the same
+  ## (cached) parse can be evaluated multiple times
+  if t.lexed.isNone():
+    t.lexed = some(ctx.lexSubableLine(t, t.rawArg))
+  return t.lexed.get()
 
 proc skipWhiteSpace(toks: seq[LineToken], i: var int) {.inline.} =
   if i < len(toks) and toks[i].kind == ltSpace:
@@ -478,7 +563,7 @@ proc parseEnvWithEq(ctx: DockerParse, toks: seq[LineToken]): seq[string] =
 
 # Returns any errors.
 proc parseEnv(ctx: DockerParse, t: DockerCommand): seq[string] =
-  let toks = ctx.lexSubableLine(t, t.rawArg)
+  let toks = ctx.lexCommand(t)
 
   if len(toks) == 0:
     return @["No argument to ENV given."]
@@ -496,7 +581,7 @@ proc parseEnv(ctx: DockerParse, t: DockerCommand): seq[string] =
     return @["Expected the 3rd token to be a = or a space"]
 
 proc parseAddOrCopy[T: InfoBase](ctx: DockerParse, t: DockerCommand): T =
-  let toks = ctx.lexSubableLine(t, t.rawArg)
+  let toks = ctx.lexCommand(t)
   var i    = 0
   var args: seq[string]
   var errs: seq[string]
@@ -525,7 +610,7 @@ proc parseAddOrCopy[T: InfoBase](ctx: DockerParse, t: DockerCommand): T =
     result.error = errs.join("\n")
 
 proc parseFrom(ctx: DockerParse, t: DockerCommand): FromInfo =
-  let toks = ctx.lexSubableLine(t, t.rawArg)
+  let toks = ctx.lexCommand(t)
   var i    = 0
 
   result       = FromInfo(startLine: t.startLine, endLine: t.endLine)
@@ -565,7 +650,7 @@ proc parseFrom(ctx: DockerParse, t: DockerCommand): FromInfo =
 
 proc parseLabel(ctx: DockerParse, t: DockerCommand): LabelInfo =
   result   = LabelInfo(startLine: t.startLine, endLine: t.endLine)
-  let toks = ctx.lexSubableLine(t, t.rawArg)
+  let toks = ctx.lexCommand(t)
   var
     i      = 0
     errs: seq[string]
@@ -711,32 +796,23 @@ proc parseHashLine(ctx: DockerParse, line: string) =
   ctx.directives[name] = tok.directive
 
 proc topLevelCmdParse(s: string): (string, string) =
-  let asRunes = s.toRunes()
-  var name: string
-  var rest: string
-  var started  = false
-  var haveName = false
-
-  for i, item in asRunes:
-    if not started:
-       if item.isWhiteSpace(): continue
-       name = $(item)
-       started = true
-       continue
-    elif not haveName:
-      if item.isWhiteSpace():
-        haveName = true
-      else:
-        name &= $(item)
-      continue
-
-    # skip any additional whitespace between command name and arguments
-    if rest.len == 0 and item.isWhiteSpace():
-      continue
-
-    rest &= $(item)
+  var i = 0
+  template skipSpace() =
+    while i < len(s):
+      let n = s.whiteSpaceLen(i)
+      if n == 0:
+        break
+      i += n
+
+  skipSpace()
+  let nameStart = i
+  while i < len(s) and s.whiteSpaceLen(i) == 0:
+    i += s.runeSize(i)
+  let name = s[nameStart ..< i]
+  # skip any additional whitespace between command name and arguments
+  skipSpace()
 
-  return (name.toUpperAscii(), rest)
+  return (name.toUpperAscii(), s[i .. ^1])
 
 proc parseCommandLine(ctx: DockerParse) =
   var cmd: DockerCommand
@@ -781,12 +857,31 @@ proc topLevelLex(ctx: DockerParse) =
       ctx.expectContinuation = false
       ctx.parseHashLine(line)
 
+# Lexing only depends on the Dockerfile contents, so parses are kept by
+# content hash and every evaluation (with whichever build args) of the
+# same Dockerfile reuses the same tokens.
+var parseCache = initTable[string, DockerParse]()
+
 proc baseDockerParse(s: Stream): DockerParse =
-  result = DockerParse(stream: s, sourceLines: s.readAll().splitLines(),
-                       currentEscape: Rune('\\'))
+  let
+    data = s.readAll()
+    key  = data.sha256Hex()
+  if key in parseCache:
+    trace("docker: reusing parsed Dockerfile " & key)
+    result = parseCache[key]
+    # only one evaluation of a parse happens at a time so its
+    # evaluation state can simply be reset
+    result.args   = initTable[string, string]()
+    result.envs   = initTable[string, string]()
+    result.inArgs = initTable[string, string]()
+    result.errors = @[]
+  else:
+    result = DockerParse(sourceLines: data.splitLines(), currentEscape: Rune('\\'))
+    result.topLevelLex()
+    parseCache[key] = result
+  result.stream = s
   for k, v in envPairs():
     result.envs[k] = v
-  result.topLevelLex()
 
 template firstFromCheck() =
   if not gotFirstFrom:
@@ -0,0 +1,408 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## .dockerignore handling: reading ignore files, glob matching and a
+## matcher compiled once per pattern list.
+##
+## Matching a path against the raw pattern list costs a glob match per
+## pattern for the path and each of its ancestors. The compiled matcher
+## uses the fact that '*', '?' and character classes never match '/': a
+## pattern without '**' can only match the one ancestor (or the path
+## itself) with as many components as the pattern. Patterns without any
+## glob syntax, which are most of a typical .dockerignore, are found with
+## one hash lookup per path component. Since the last matching pattern
+## wins, the remaining patterns are tried from the end and evaluation
+## stops at the first hit.
+
+import std/[
+  os,
+  strutils,
+  tables,
+]
+import ".."/[
+  types,
+  utils/files,
+]
+
+## ---------------------------------------------------------------------------
+## Glob pattern matching
+
+proc matchOneChar(
+    path:    openArray[char],
+    pattern: string,
+    si, pi:  int,
+): tuple[matched: bool, newPi: int] =
+  ## Match path[si] against the pattern element starting at pi.
+  ## Returns (matched, newPi). Does not handle '*' -- caller manages wildcards.
+  if si >= path.len or pi >= pattern.len:
+    return (false, pi)
+  case pattern[pi]
+  of '?':
+    if path[si] == '/':
+      return (false, pi)
+    return (true, pi + 1)
+  of '[':
+    var p = pi + 1
+    let negate = p < pattern.len and (pattern[p] == '!' or pattern[p] == '^')
+    if negate:
+      inc p
+    var classMatched = false
+    var first = true
+    while p < pattern.len and (first or pattern[p] != ']'):
+      first = false
+      if pattern[p] == '\\' and p + 1 < pattern.len:
+        inc p
+        if path[si] == pattern[p]:
+          classMatched = true
+        inc p
+      elif p + 2 < pattern.len and pattern[p + 1] == '-' and pattern[p + 2] != ']':
+        if path[si] >= pattern[p] and path[si] <= pattern[p + 2]:
+          classMatched = true
+        p += 3
+      else:
+        if path[si] == pattern[p]:
+          classMatched = true
+        inc p
+    if p >= pattern.len:
+      return (false, pi)  ## unterminated '[': no match
+    inc p  ## skip ']'
+    let classHit = if negate: not classMatched else: classMatched
+    if path[si] == '/' or not classHit:
+      return (false, pi)
+    return (true, p)
+  of '\\':
+    if pi + 1 < pattern.len and path[si] == pattern[pi + 1]:
+      return (true, pi + 2)
+    return (false, pi)
+  else:
+    if path[si] == pattern[pi]:
+      return (true, pi + 1)
+    return (false, pi)
+
+proc globMatch*(path: openArray[char], pattern: string): bool =
+  ## Match path against a glob pattern.
+  ## * matches any run of non-separator characters.
+  ## ? matches any single non-separator character.
+  ## ** matches any run of characters including path separators.
+  ## [abc], [a-z], [!a-z] match character classes (/ never matches inside []).
+  ## \x matches the literal character x.
+  ##
+  ## Uses an iterative anchor-stack approach: one saved (si, pi) entry per
+  ## '**' encountered, O(k) space where k = number of '**' segments.
+  type DStarAnchor = tuple[pi: int, si: int, hadSlash: bool]
+  var
+    si     = 0
+    pi     = 0
+    starPi = -1
+    starSi = -1
+    dstars: seq[DStarAnchor]
+
+  while true:
+    ## Consume wildcards at current pattern position.
+    if pi < pattern.len and pattern[pi] == '*':
+      if pi + 1 < pattern.len and pattern[pi + 1] == '*':
+        ## Double star: save anchor and skip past '**[/]'.
+        var dpi = pi + 2
+        ## Consume the '/' after '**' if present.  When a slash was
+        ## consumed the remaining sub-pattern must start on a path-
+        ## component boundary (e.g. '**/.foo' must not match 'bar.foo').
+        ## Without a slash (e.g. '**file') any position is valid.
+        let hadSlash = dpi < pattern.len and pattern[dpi] == '/'
+        if hadSlash:
+          inc dpi
+        if dpi >= pattern.len:
+          return true  ## '**' at end of pattern matches everything remaining
+        dstars.add((pi: dpi, si: si, hadSlash: hadSlash))
+        pi = dpi
+        starPi = -1
+        starSi = -1
+      else:
+        ## Single star: save anchor and skip past '*'.
+        starPi = pi + 1
+        starSi = si
+        inc pi
+      continue
+
+    ## Try to match one path character against the current pattern element.
+    if si < path.len:
+      let (matched, newPi) = matchOneChar(path, pattern, si, pi)
+      if matched:
+        pi = newPi
+        inc si
+        continue
+
+    ## Check whether both pattern and path are exhausted.
+    ## Trailing lone '*'s (not '**') are allowed to match empty.
+    block checkComplete:
+      var pp = pi
+      while pp < pattern.len and pattern[pp] == '*' and
+            (pp + 1 >= pattern.len or pattern[pp + 1] != '*'):
+        inc pp
+      if pp == pattern.len and si == path.len:
+        return true
+
+    ## Mismatch: backtrack.
+    ## 1. Single-star anchor: advance one non-'/' path character and retry.
+    if starPi >= 0 and starSi < path.len and path[starSi] != '/':
+      inc starSi
+      si = starSi
+      pi = starPi
+      continue
+
+    ## 2. Double-star stack: advance the most-recent anchor to the next
+    ##    valid path position and retry.  For hadSlash anchors only
+    ##    component boundaries (si == 0 or path[si-1] == '/') are valid.
+    block tryDstar:
+      while dstars.len > 0:
+        inc dstars[^1].si
+        if dstars[^1].si > path.len:
+          dstars.setLen(dstars.len - 1)
+          starPi = -1
+          starSi = -1
+          continue
+        if dstars[^1].hadSlash and
+           dstars[^1].si > 0 and
+           path[dstars[^1].si - 1] != '/':
+          continue  ## not a component boundary; try next position
+        si = dstars[^1].si
+        pi = dstars[^1].pi
+        starPi = -1
+        starSi = -1
+        break tryDstar
+      return false
+
+proc isValidPattern*(pattern: string): bool =
+  ## Returns true if pattern is a syntactically valid glob pattern.
+  ## Mirrors the two error cases in Go's filepath.Match (ErrBadPattern):
+  ##   - unclosed '[' character class
+  ##   - trailing '\' escape at end of pattern
+  ## Leading '!' and trailing '/' are stripped before validation.
+  let p = (if pattern.startsWith('!'): pattern[1 .. ^1] else: pattern).strip(chars = {'/'})
+  var i = 0
+  while i < p.len:
+    case p[i]
+    of '[':
+      inc i
+      if i < p.len and p[i] in {'!', '^'}:
+        inc i
+      var
+        closed = false
+        first  = true
+      while i < p.len:
+        if not first and p[i] == ']':
+          closed = true
+          inc i
+          break
+        first = false
+        if p[i] == '\\':
+          inc i
+          if i >= p.len:
+            return false
+        inc i
+      if not closed:
+        return false
+    of '\\':
+      inc i
+      if i >= p.len:
+        return false
+      inc i
+    else:
+      inc i
+  return true
+
+## ---------------------------------------------------------------------------
+## Compiled matcher
+
+type
+  IgnoreKind = enum
+    ikLiteral   ## no glob syntax, compared by hash lookup
+    ikSegments  ## no '**', matched against one prefix of the path
+    ikGeneric   ## '**', escapes or classes, matched like moby does
+
+  IgnorePattern = object
+    text:   string
+    negate: bool
+    kind:   IgnoreKind
+    depth:  int  ## number of '/' in text
+
+  NegationPattern = object
+    text:       string
+    hasSlash:   bool
+    doubleStar: bool
+    prefixes:   seq[string]  ## text up to its 1st, 2nd, ... '/'
+
+  DockerignoreMatcher* = ref object
+    patterns:  seq[IgnorePattern]
+    literals:  seq[Table[string, int]]  ## by depth: text -> last index
+    globs:     seq[int]                 ## indexes of non literal patterns
+    negations: seq[NegationPattern]
+
+proc compileDockerignore*(patterns: seq[string]): DockerignoreMatcher =
+  ## Compile an ordered pattern list (as read by readDockerignorePatterns)
+  ## for repeated isExcluded()/hasNegationForDir() checks.
+  result = DockerignoreMatcher()
+  for pat in patterns:
+    let
+      negate = pat.startsWith('!')
+      text   = (if negate: pat[1 .. ^1] else: pat).strip(chars = {'/'})
+    if text.len == 0:
+      continue
+    var p = IgnorePattern(text: text, negate: negate, depth: text.count('/'))
+    p.kind =
+      if "**" in text or '[' in text or '\\' in text: ikGeneric
+      elif '*' in text or '?' in text:                ikSegments
+      else:                                           ikLiteral
+    let i = len(result.patterns)
+    result.patterns.add(p)
+    if p.kind == ikLiteral:
+      while len(result.literals) <= p.depth:
+        result.literals.add(initTable[string, int]())
+      result.literals[p.depth][text] = i
+    else:
+      result.globs.add(i)
+    if negate:
+      var n = NegationPattern(
+        text:       text,
+        hasSlash:   '/' in text,
+        doubleStar: "**" in text,
+      )
+      for j, c in text:
+        if c == '/':
+          n.prefixes.add(text[0 ..< j])
+      result.negations.add(n)
+
+proc matches(p: IgnorePattern, norm: string, slashes: seq[int]): bool =
+  ## Whether p matches norm or one of its ancestors.  `slashes` holds the
+  ## positions of '/' in norm.
+  case p.kind
+  of ikLiteral, ikSegments:
+    if p.depth > len(slashes):
+      return false
+    let last = (if p.depth < len(slashes): slashes[p.depth] else: len(norm)) - 1
+    return globMatch(norm.toOpenArray(0, last), p.text)
+  of ikGeneric:
+    if globMatch(norm, p.text):
+      return true
+    for slash in slashes:
+      if globMatch(norm.toOpenArray(0, slash - 1), p.text):
+        return true
+    return false
+
+proc isExcluded*(self: DockerignoreMatcher, relPath: string): bool =
+  ## Returns true if relPath should be excluded given the ordered pattern list.
+  ## Implements the same semantics as moby's patternmatcher.MatchesOrParentMatches
+  ## (github.com/moby/patternmatcher). Rules:
+  ## - Patterns are processed in order; the last match wins.
+  ## - A leading '!' negates the pattern (re-includes a previously excluded path).
+  ## - Trailing '/' is stripped before matching (it only signals directory intent).
+  ## - All patterns -- with or without '/' -- are matched against the FULL
+  ##   relative path. '*' never crosses '/'. So '*.log' only excludes root-level
+  ##   '*.log' files, not 'subdir/foo.log'.
+  ## - A path also matches if any of its ancestor directories matches the pattern
+  ##   via a FULL-PATH match (e.g. pattern 'logs' excludes 'logs/debug.log'
+  ##   because ancestor 'logs' == 'logs', but does NOT exclude 'a/logs/debug.log'
+  ##   because ancestor 'a/logs' != 'logs').
+  let norm = relPath.replace('\\', '/')
+  var slashes: seq[int]
+  for i, c in norm:
+    if c == '/':
+      slashes.add(i)
+  var best = -1
+  if len(slashes) > 0 and slashes[0] == 0:
+    # moby does not treat a leading '/' as an ancestor boundary, so only
+    # the full path is matched. Such paths never come from a walk.
+    for i in countdown(len(self.patterns) - 1, 0):
+      if globMatch(norm, self.patterns[i].text):
+        best = i
+        break
+  else:
+    for depth in 0 .. min(len(slashes), len(self.literals) - 1):
+      if len(self.literals[depth]) > 0:
+        let last = if depth < len(slashes): slashes[depth] else: len(norm)
+        best = max(best, self.literals[depth].getOrDefault(norm[0 ..< last], -1))
+    for j in countdown(len(self.globs) - 1, 0):
+      let i = self.globs[j]
+      if i <= best:
+        break
+      if self.patterns[i].matches(norm, slashes):
+        best = i
+        break
+  return best >= 0 and not self.patterns[best].negate
+
+proc hasNegationForDir*(self: DockerignoreMatcher, norm: string): bool =
+  ## Returns true if any negation pattern in `patterns` could re-include
+  ## files inside the directory at `norm`, meaning recursion must not be pruned.
+  ##
+  ## Under Docker .dockerignore semantics a negation pattern can reach inside
+  ## `norm` when:
+  ##   - it has no '/' and glob-matches norm itself (meaning norm would be
+  ##     re-included, so its children must be visited too), or
+  ##   - it contains '**' (can cross directory boundaries), or
+  ##   - it is a slash pattern whose directory prefix at the same depth as
+  ##     `norm` glob-matches `norm` (e.g. `!logs_*/f` reaches inside
+  ##     `logs_app/`).
+  if len(self.negations) == 0:
+    return false
+  let normDepth = norm.count('/') + 1
+  for n in self.negations:
+    if not n.hasSlash:
+      ## A no-slash negation can re-include files inside norm/ only
+      ## when the pattern matches norm itself -- all descendants would
+      ## then be re-included via the ancestor check in isExcluded.
+      if globMatch(norm, n.text):
+        return true
+    elif n.doubleStar:
+      return true
+    ## Check if the prefix of the pattern at the same directory depth as
+    ## `norm` glob-matches `norm`.  This handles wildcarded slash patterns
+    ## such as `!logs_*/important.log` that can re-include files inside
+    ## `logs_app/`.
+    if normDepth <= len(n.prefixes) and globMatch(norm, n.prefixes[normDepth - 1]):
+      return true
+  return false
+
+proc isExcluded*(relPath: string, patterns: seq[string]): bool =
+  ## Single path convenience over compileDockerignore(); compile the
+  ## patterns once when checking many paths.
+  return compileDockerignore(patterns).isExcluded(relPath)
+
+proc hasNegationForDir*(norm: string, patterns: seq[string]): bool =
+  return compileDockerignore(patterns).hasNegationForDir(norm)
+
+## ---------------------------------------------------------------------------
+## Ignore files
+
+proc readDockerignorePatterns*(
+    contextPath:    string,
+    dockerfilePath: string = "",
+): seq[string] =
+  ## Read ignore patterns from the appropriate ignore file.
+  ## Docker priority: <dockerfileDir>/<basename(dockerfile)>.dockerignore >
+  ## <contextRoot>/.dockerignore.
+  ## The Dockerfile-specific file lives next to the Dockerfile, not in the
+  ## context root.  Reference:
+  ## https://docs.docker.com/build/concepts/context/#dockerignore-files
+  var ignorePath = ""
+  if dockerfilePath != "" and dockerfilePath != stdinIndicator:
+    let candidate = parentDir(dockerfilePath) / (lastPathPart(dockerfilePath) & ".dockerignore")
+    if fileExists(candidate):
+      ignorePath = candidate
+  if ignorePath == "":
+    let candidate = contextPath / ".dockerignore"
+    if fileExists(candidate):
+      ignorePath = candidate
+  if ignorePath == "":
+    return @[]
+  result = @[]
+  for line in tryToLoadFile(ignorePath).splitLines():
+    let p = line.strip()
+    if p.len == 0 or p.startsWith('#'):
+      continue
+    if p.startsWith('!'):
+      result.add('!' & p[1 .. ^1].removePrefix('/'))
+    else:
+      result.add(p.removePrefix('/'))
@@ -0,0 +1,256 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Minimal Docker Engine API client.
+##
+## Speaks HTTP/1.1 to the daemon over its unix socket and keeps a single
+## connection open for the whole chalk run, so the small daemon queries
+## done around a docker command (version, info, image/container inspect,
+## tag, rmi) don't each spawn a docker CLI process. Only unix sockets are
+## supported. Remote daemons, docker contexts and anything buildx related
+## stay with the CLI (see exe.nim which decides which one to use).
+
+import std/[
+  nativesockets,
+  net,
+]
+import ".."/[
+  types,
+  utils/json,
+  utils/perf,
+  utils/strings,
+]
+
+type
+  EngineResponseError* = object of ValueError
+
+  EngineResponse* = object
+    code*: int
+    body*: string
+
+  DockerEngine* = ref object
+    path:   string
+    socket: Socket
+
+const
+  engineHost      = "docker"
+  engineReadChunk = 64 * 1024
+
+proc newDockerEngine*(path: string): DockerEngine =
+  ## does not connect until the first request
+  return DockerEngine(path: path)
+
+proc close*(self: DockerEngine) =
+  if self.socket != nil:
+    try:
+      self.socket.close()
+    except:
+      discard
+    self.socket = nil
+
+proc connect(self: DockerEngine) =
+  if self.socket != nil:
+    return
+  let socket = newSocket(AF_UNIX, SOCK_STREAM, IPPROTO_IP)
+  try:
+    socket.connectUnix(self.path)
+  except:
+    socket.close()
+    raise
+  self.socket = socket
+
+proc escapePath(value: string): string =
+  ## image refs and container names are used as is in the API path
+  ## (registry:port/repo:tag@sha256:...) so only escape what would
+  ## otherwise break the request line
+  for c in value:
+    if c in {'a'..'z', 'A'..'Z', '0'..'9', '-', '.', '_', '~', '/', ':', '@'}:
+      result.add(c)
+    else:
+      result.add('%' & toHex(ord(c), 2))
+
+proc escapeQuery(value: string): string =
+  for c in value:
+    if c in {'a'..'z', 'A'..'Z', '0'..'9', '-', '.', '_', '~'}:
+      result.add(c)
+    else:
+      result.add('%' & toHex(ord(c), 2))
+
+proc splitRepoTag*(name: string): tuple[repo: string, tag: string] =
+  ## split image name into repo and tag as expected by the tag API.
+  ## colon in the registry port is not a tag separator
+  let
+    slash = name.rfind('/')
+    colon = name.rfind(':')
+  if colon > slash:
+    return (name[0 ..< colon], name[colon + 1 .. ^1])
+  return (name, "")
+
+proc recvExactly(self: DockerEngine, size: int): string =
+  result = newStringOfCap(size)
+  while len(result) < size:
+    let data = self.socket.recv(min(size - len(result), engineReadChunk))
+    if data == "":
+      raise newException(IOError, "docker engine closed connection mid-response")
+    result.add(data)
+
+proc recvHttpLine(self: DockerEngine): string =
+  result = self.socket.recvLine()
+  if result == "":
+    raise newException(IOError, "docker engine closed connection")
+  if result == "\r\n":
+    result = ""
+
+proc readChunked(self: DockerEngine): string =
+  while true:
+    let
+      line = self.recvHttpLine()
+      size = parseHexInt(line.split(';')[0].strip())
+    if size == 0:
+      # trailers until empty line
+      while self.recvHttpLine() != "":
+        discard
+      return
+    result.add(self.recvExactly(size))
+    discard self.recvHttpLine()
+
+proc readUntilClose(self: DockerEngine): string =
+  while true:
+    let data = self.socket.recv(engineReadChunk)
+    if data == "":
+      return
+    result.add(data)
+
+proc readResponse(self: DockerEngine, meth: string): tuple[response: EngineResponse, keepAlive: bool] =
+  let
+    status = self.recvHttpLine()
+    parts  = status.split(' ', maxsplit = 2)
+  if len(parts) < 2 or not parts[0].startsWith("HTTP/"):
+    raise newException(IOError, "docker engine sent invalid status line: " & status)
+  result.response.code = parseInt(parts[1])
+  result.keepAlive     = parts[0] != "HTTP/1.0"
+
+  var
+    length  = -1
+    chunked = false
+  while true:
+    let line = self.recvHttpLine()
+    if line == "":
+      break
+    let (key, value) = line.splitBy(":")
+    case key.strip().toLower()
+    of "content-length":
+      length = parseInt(value.strip())
+    of "transfer-encoding":
+      chunked = "chunked" in value.toLower()
+    of "connection":
+      let v = value.strip().toLower()
+      if v == "close":
+        result.keepAlive = false
+      elif v == "keep-alive":
+        result.keepAlive = true
+    else:
+      discard
+
+  let code = result.response.code
+  if meth == "HEAD" or code in 100 .. 199 or code == 204 or code == 304:
+    return
+  if chunked:
+    result.response.body = self.readChunked()
+  elif length >= 0:
+    result.response.body = self.recvExactly(length)
+  else:
+    result.response.body = self.readUntilClose()
+    result.keepAlive     = false
+
+proc request*(self: DockerEngine,
+              meth: string,
+              path: string,
+              body = "",
+              contentType = "application/json"): EngineResponse =
+  ## send request to the daemon and return its response regardless of
+  ## the status code. Transport errors raise IOError/OSError.
+  ## A kept-alive connection which the daemon closed in the meantime
+  ## is transparently reopened once.
+  var request = (
+    meth & " " & path & " HTTP/1.1\r\n" &
+    "Host: " & engineHost & "\r\n" &
+    "User-Agent: chalk\r\n"
+  )
+  if body != "" or meth in ["POST", "PUT"]:
+    request &= "Content-Type: " & contentType & "\r\n"
+    request &= "Content-Length: " & $len(body) & "\r\n"
+  request &= "\r\n" & body
+
+  withPerfTiming("docker", "engine." & meth):
+    for attempt in 0 .. 1:
+      let reused = self.socket != nil
+      self.connect()
+      try:
+        self.socket.send(request)
+        let (response, keepAlive) = self.readResponse(meth)
+        if not keepAlive:
+          self.close()
+        return response
+      except IOError, OSError:
+        self.close()
+        if not reused or attempt > 0:
+          raise
+        trace("docker: engine connection was closed. reconnecting")
+
+proc errorMessage(self: EngineResponse): string =
+  try:
+    result = parseJson(self.body){"message"}.getStr()
+  except:
+    discard
+  if result == "":
+    result = self.body.strip()
+  return "HTTP " & $self.code & " " & result
+
+proc check(self: EngineResponse, what: string): EngineResponse {.discardable.} =
+  if self.code notin 200 .. 299:
+    raise newException(EngineResponseError, what & ": " & self.errorMessage())
+  return self
+
+proc getJson(self: DockerEngine, path: string, what: string): JsonNode =
+  return parseJson(self.request("GET", path).check(what).body)
+
+proc version*(self: DockerEngine): JsonNode =
+  return self.getJson("/version", "could not get docker version")
+
+proc info*(self: DockerEngine): JsonNode =
+  return self.getJson("/info", "could not get docker info")
+
+proc inspect*(self: DockerEngine, what: string, name: string): JsonNode =
+  ## what is either "image" or "container"
+  ## returns same json object as `docker <what> inspect` minus
+  ## the outer array
+  return self.getJson(
+    "/" & what & "s/" & name.escapePath() & "/json",
+    "cannot inspect " & what & " " & name,
+  )
+
+proc listIds*(self: DockerEngine, what: string): seq[string] =
+  ## ids of all images or running containers, same as
+  ## `docker images` and `docker ps`
+  for item in self.getJson("/" & what & "s/json", "could not list " & what & "s").items():
+    let id = item{"Id"}.getStr()
+    if id != "":
+      result.add(id)
+
+proc tag*(self: DockerEngine, source: string, target: string) =
+  let
+    (repo, tag) = target.splitRepoTag()
+    path        = (
+      "/images/" & source.escapePath() & "/tag" &
+      "?repo=" & repo.escapeQuery() &
+      "&tag=" & tag.escapeQuery()
+    )
+  self.request("POST", path).check("could not tag " & source & " as " & target)
+
+proc removeImage*(self: DockerEngine, name: string) =
+  self.request("DELETE", "/images/" & name.escapePath()).check("could not remove image " & name)
@@ -7,6 +7,7 @@
 
 import std/[
   os,
+  times,
 ]
 import ".."/[
   types,
@@ -17,9 +18,14 @@ import ".."/[
   utils/strings,
 ]
 import "."/[
+  capabilities,
+  engine,
   ids,
 ]
 
+export capabilities
+export engine
+
 var
   dockerExeLocation   = ""
   dockerClientVersion = parseVersion("0")
@@ -59,6 +65,126 @@ proc runDockerGetEverything*(args: seq[string],
     raise newException(ValueError, msg & " - exited with non-zero " & $result.exitCode)
   return result
 
+var dockerAuth: Option[JsonNode]
+proc getDockerAuthConfig*(): JsonNode =
+  if dockerAuth.isNone():
+    dockerAuth = some(newJObject())
+    let path = "~/.docker/config.json"
+    try:
+      let data = tryToLoadFile(path.resolvePath())
+      if data != "":
+        dockerAuth = some(parseJson(data).assertIs(JObject, "bad docker runner config type"))
+      else:
+        trace("docker: no auth config file at " & path)
+    except:
+      trace("docker: could not read docker auth config file " & path & " due to: " & getCurrentExceptionMsg())
+  return dockerAuth.get()
+
+proc resetDockerAuthConfig*() =
+  dockerAuth = none(JsonNode)
+
+proc getDockerContextEnvName(): string =
+  ## context selected via env/config without asking the CLI.
+  ## empty when default context is used
+  return getEnv("DOCKER_CONTEXT", getDockerAuthConfig(){"currentContext"}.getStr())
+
+var dockerEngine: DockerEngine
+proc getDockerEngineSocketPath(): string =
+  let host = getEnv("DOCKER_HOST")
+  if host != "":
+    if not host.startsWith("unix://"):
+      trace("docker: DOCKER_HOST is not a unix socket. using docker CLI for daemon queries")
+      return ""
+    return host[len("unix://") .. ^1]
+  # non-default contexts can point anywhere (ssh, tcp, rootless socket)
+  # so leave resolving them to the CLI
+  let context = getDockerContextEnvName()
+  if context notin ["", "default"]:
+    trace("docker: using docker CLI for daemon queries in docker context " & context)
+    return ""
+  return "/var/run/docker.sock"
+
+proc getDockerEngine*(): DockerEngine =
+  ## Docker Engine API client for the local daemon or nil when daemon
+  ## should only be queried via the docker CLI
+  once:
+    if not attrGet[bool]("docker.use_engine_api"):
+      return dockerEngine
+    let path = getDockerEngineSocketPath()
+    if path == "":
+      return dockerEngine
+    if not fileExists(path):
+      trace("docker: no daemon socket at " & path & ". using docker CLI for daemon queries")
+      return dockerEngine
+    trace("docker: using docker engine API via " & path)
+    dockerEngine = newDockerEngine(path)
+  return dockerEngine
+
+proc disableDockerEngine(msg: string) =
+  ## daemon is not reachable over the socket (e.g. permissions)
+  ## so stop trying and let the CLI deal with it from now on
+  trace("docker: engine API failed, using docker CLI from now on: " & msg)
+  if dockerEngine != nil:
+    dockerEngine.close()
+    dockerEngine = nil
+
+template withDockerEngine*(engine: untyped, body: untyped) =
+  ## run body with engine client when its available.
+  ## API errors (e.g. 404) propagate as EngineResponseError
+  ## whereas connection issues disable the API so that
+  ## the code after the block can fallback to the CLI
+  let engine = getDockerEngine()
+  if engine != nil:
+    try:
+      body
+    except EngineResponseError:
+      raise
+    except:
+      disableDockerEngine(getCurrentExceptionMsg())
+
+proc fileIdentity(path: string): string =
+  try:
+    let info = getFileInfo(path)
+    return path & ":" & $info.size & ":" & $info.lastWriteTime.toUnix()
+  except:
+    return ""
+
+var dockerClientScope = ""
+proc getDockerClientScope(): string =
+  ## capability cache scope for things which only depend on the
+  ## docker CLI and its buildx plugin
+  once:
+    let exe = getDockerExeLocation()
+    if exe == "":
+      return dockerClientScope
+    var parts = @["client=" & exe.fileIdentity()]
+    # https://docs.docker.com/engine/extend/cli_plugins/
+    for dir in @[
+      getEnv("DOCKER_CONFIG", "~/.docker").resolvePath() / "cli-plugins",
+      "/usr/local/lib/docker/cli-plugins",
+      "/usr/local/libexec/docker/cli-plugins",
+      "/usr/lib/docker/cli-plugins",
+      "/usr/libexec/docker/cli-plugins",
+    ]:
+      let buildx = (dir / "docker-buildx").fileIdentity()
+      if buildx != "":
+        parts.add("buildx=" & buildx)
+    parts.add("context=" & getEnv("DOCKER_HOST") & ":" & getDockerContextEnvName())
+    dockerClientScope = parts.join("|")
+  return dockerClientScope
+
+proc runDockerCached(scope: string, args: seq[string], silent = true, name = ""): ExecOutput =
+  ## runDockerGetEverything for capability probes.
+  ## successful output is remembered in the persistent capability cache
+  ## under name, which defaults to the command line
+  let name = if name == "": args.join(" ") else: name
+  let cached = getCachedCapability(scope, name)
+  if cached.isSome():
+    return ExecOutput(stdout: cached.get(), exitCode: 0)
+  result = runDockerGetEverything(args, silent = silent)
+  if result.exitCode == 0:
+    setCachedCapability(scope, name, result.stdout)
+
 proc getBuildXVersion*(): Version =
   once:
     if getDockerExeLocation() == "":
@@ -71,7 +197,7 @@ proc getBuildXVersion*(): Version =
     # examples:
     # github.com/docker/buildx v0.10.2 00ed17df6d20f3ca4553d45789264cdb78506e5f
     # github.com/docker/buildx 0.11.2 9872040b6626fb7d87ef7296fd5b832e8cc2ad17
-    let version = runDockerGetEverything(@["buildx", "version"])
+    let version = runDockerCached(getDockerClientScope(), @["buildx", "version"])
     if version.exitCode == 0:
       try:
         buildXVersion = getVersionFromLine(version.stdout)
@@ -88,7 +214,7 @@ proc getDockerClientVersion*(): Version =
     # Docker version 1.13.0, build 49bf474
     # Docker version 23.0.0, build e92dd87
     # Docker version 24.0.6, build ed223bc820
-    let version = runDockerGetEverything(@["--version"])
+    let version = runDockerCached(getDockerClientScope(), @["--version"])
     if version.exitCode == 0:
       try:
         dockerClientVersion = getVersionFromLine(version.stdout)
@@ -101,6 +227,13 @@ proc getDockerServerVersion*(): Version =
   once:
     if getDockerExeLocation() == "":
       return dockerServerVersion
+    try:
+      withDockerEngine(engine):
+        dockerServerVersion = parseVersion(engine.version(){"Version"}.getStr())
+        trace("docker: server version: " & $(dockerServerVersion))
+        return dockerServerVersion
+    except:
+      dumpExOnDebug()
     let version = runDockerGetEverything(@["version"])
     if version.exitCode == 0:
       try:
@@ -129,7 +262,53 @@ proc getDockerInfo*(): string =
       dockerInfo = output.getStdout()
   return dockerInfo
 
+var dockerInfoJson = newJObject()
+proc getDockerInfoJson(): JsonNode =
+  ## structured `docker info` from the engine API.
+  ## empty object when API is not available
+  once:
+    try:
+      withDockerEngine(engine):
+        dockerInfoJson = engine.info()
+    except:
+      trace("docker: " & getCurrentExceptionMsg())
+  return dockerInfoJson
+
+var dockerDaemonScope = ""
+proc getDockerDaemonScope*(): string =
+  ## capability cache scope for things which depend on the daemon
+  ## as well (builders, frontends, build platforms).
+  ## empty when daemon cannot be identified which disables caching
+  once:
+    let client = getDockerClientScope()
+    if client == "":
+      return dockerDaemonScope
+    let info = getDockerInfoJson()
+    var daemon = ""
+    if info{"ID"}.getStr() != "":
+      daemon = info{"ID"}.getStr() & ":" & info{"ServerVersion"}.getStr()
+    else:
+      # without engine API only version is cheaply known
+      daemon = getDockerServerVersion().normalize()
+    if daemon == "":
+      trace("docker: could not identify docker daemon. not caching its capabilities")
+      return dockerDaemonScope
+    dockerDaemonScope = client & "|daemon=" & daemon
+  return dockerDaemonScope
+
+proc getDockerBuilderScope*(): string =
+  ## daemon scope plus currently selected buildx builder
+  ## (via env or `docker buildx use`)
+  let daemon = getDockerDaemonScope()
+  if daemon == "":
+    return ""
+  let current = getEnv("DOCKER_CONFIG", "~/.docker").resolvePath() / "buildx" / "current"
+  return daemon & "|builder=" & getEnv("BUILDX_BUILDER") & ":" & current.fileIdentity()
+
 proc isDockerOverlayFS*(): bool =
+  let info = getDockerInfoJson()
+  if "Driver" in info:
+    return info{"Driver"}.getStr() == "overlayfs"
   for line in getDockerInfo().splitLines():
     if line.strip().startsWith("Storage Driver:"):
       let (_, driver) = line.splitBy(":", "overlay2")
@@ -155,6 +334,24 @@ proc getDockerInfoSubList*(key: string): seq[string] =
       break
     result.add(line.strip())
 
+proc getDockerInsecureRegistries*(): seq[string] =
+  let registryConfig = getDockerInfoJson(){"RegistryConfig"}
+  if registryConfig == nil:
+    return getDockerInfoSubList("insecure registries:")
+  let indexes = registryConfig{"IndexConfigs"}
+  if indexes != nil and indexes.kind == JObject:
+    for name, index in indexes.pairs():
+      if not index{"Secure"}.getBool(true):
+        result.add(name)
+  for cidr in registryConfig{"InsecureRegistryCIDRs"}.getStrElems():
+    result.add(cidr)
+
+proc getDockerRegistryMirrors*(): seq[string] =
+  let registryConfig = getDockerInfoJson(){"RegistryConfig"}
+  if registryConfig == nil:
+    return getDockerInfoSubList("registry mirrors:")
+  return registryConfig{"Mirrors"}.getStrElems()
+
 var isContainer: bool
 proc isInContainer*(): bool =
   result = isContainer
@@ -221,7 +418,7 @@ proc getContextName(): string =
     # https://docs.docker.com/engine/release-notes/19.03/#19030
     let minimum = parseVersion("19.03")
     if getDockerServerVersion() >= minimum and getDockerClientVersion() >= minimum:
-      let output = runDockerGetEverything(@["context", "inspect", "--format", "{{json .}}"])
+      let output = runDockerCached(getDockerClientScope(), @["context", "inspect", "--format", "{{json .}}"])
       if output.exitCode == 0:
         try:
           let
@@ -250,6 +447,8 @@ proc getBuilderInfo*(ctx: DockerInvocation): string =
       var args = @["buildx", "inspect", "--bootstrap"]
       if name != "":
         args.add(name)
+      # not cached: --bootstrap starts the builder and the builder status
+      # and platforms it reports are live state
       let output = runDockerGetEverything(args, silent = false)
       if output.exitCode != 0:
         trace("docker: could not get buildx builder information: " & output.getStderr())
@@ -258,6 +457,13 @@ proc getBuilderInfo*(ctx: DockerInvocation): string =
 
 proc getBuildKitVersion*(ctx: DockerInvocation): Version =
   once:
+    let
+      scope  = getDockerBuilderScope()
+      name   = "buildkit version " & ctx.getBuilderName()
+      cached = getCachedCapability(scope, name)
+    if cached.isSome():
+      buildKitVersion = parseVersion(cached.get())
+      return buildKitVersion
     let info = ctx.getBuilderInfo().toLower()
     if info != "":
       try:
@@ -266,10 +472,23 @@ proc getBuildKitVersion*(ctx: DockerInvocation): Version =
           contains = "buildkit",
         )
         trace("docker: buildkit version: " & $(buildKitVersion))
+        setCachedCapability(scope, name, $buildKitVersion)
       except:
         dumpExOnDebug()
   return buildKitVersion
 
+proc getLocalImageId(name: string): string =
+  ## id of the image the daemon has under name, which is what
+  ## `docker run` uses without pulling, or empty when it has none
+  try:
+    withDockerEngine(engine):
+      return engine.inspect("image", name){"Id"}.getStr()
+  except:
+    return ""
+  let output = runDockerGetEverything(@["image", "inspect", "--format", "{{.Id}}", name])
+  if output.exitCode == 0:
+    return output.getStdout().strip()
+
 proc getFrontendVersion*(ctx: DockerInvocation): Option[Version] =
   ## get buildkit frontend version
   ## * returns none if frontend is not specified
@@ -288,13 +507,21 @@ proc getFrontendVersion*(ctx: DockerInvocation): Option[Version] =
       return
     try:
       let
-        image  = parseImage(syntax)
-        output = runDockerGetEverything(@[
+        image = parseImage(syntax)
+        id    = getLocalImageId($image)
+        args  = @[
           "run",
           "--rm",
           $image,
           "-version",
-        ])
+        ]
+        # tags move so only what a specific image reported is cached.
+        # without a local image the run pulls whatever the tag is now
+        output =
+          if id != "":
+            runDockerCached(getDockerDaemonScope(), args, name = "frontend " & id & " -version")
+          else:
+            runDockerGetEverything(args)
       if output.exitCode != 0:
         trace("docker: could not get buildkint frontend versioni " & output.getStderr())
         frontendVersion = some(parseVersion("0"))
@@ -308,24 +535,6 @@ proc getFrontendVersion*(ctx: DockerInvocation): Option[Version] =
       frontendVersion = some(parseVersion("0"))
   return frontendVersion
 
-var dockerAuth: Option[JsonNode]
-proc getDockerAuthConfig*(): JsonNode =
-  if dockerAuth.isNone():
-    dockerAuth = some(newJObject())
-    let path = "~/.docker/config.json"
-    try:
-      let data = tryToLoadFile(path.resolvePath())
-      if data != "":
-        dockerAuth = some(parseJson(data).assertIs(JObject, "bad docker runner config type"))
-      else:
-        trace("docker: no auth config file at " & path)
-    except:
-      trace("docker: could not read docker auth config file " & path & " due to: " & getCurrentExceptionMsg())
-  return dockerAuth.get()
-
-proc resetDockerAuthConfig*() =
-  dockerAuth = none(JsonNode)
-
 proc supportsBuildContextFlag*(ctx: DockerInvocation): bool =
   # https://github.com/docker/buildx/releases/tag/v0.8.0
   # which requires dockerfile syntax >=1.4
@@ -389,3 +598,19 @@ proc installBinFmt*() =
       ])
     if output.exitCode != 0:
       raise newException(ValueError, "could not install binfmt " & output.getStderr())
+
+proc tagDockerImage*(source: string, target: string) =
+  withDockerEngine(engine):
+    engine.tag(source, target)
+    return
+  let output = runDockerGetEverything(@["tag", source, target])
+  if output.exitCode != 0:
+    raise newException(ValueError, "could not tag " & source & " as " & target & ": " & output.getStderr())
+
+proc removeDockerImage*(name: string) =
+  withDockerEngine(engine):
+    engine.removeImage(name)
+    return
+  let output = runDockerGetEverything(@["rmi", name])
+  if output.exitCode != 0:
+    raise newException(ValueError, "could not remove image " & name & ": " & output.getStderr())
@@ -44,6 +44,16 @@ proc inspectHistoryCommands*(name: string): seq[string] =
 proc inspectJson(name: string, what: string): JsonNode =
   ## utility function for getting docker inspect json
   trace("docker: inspecting " & what & " " & name)
+  try:
+    withDockerEngine(engine):
+      result = engine.inspect(what, name)
+      when defined(debug):
+        trace(result.pretty())
+      return result
+  except EngineResponseError:
+    let msg = getCurrentExceptionMsg()
+    trace("docker: " & msg)
+    raise newException(ValueError, msg)
   var
     args   = @[what, "inspect", name]
   if supportsInspectJsonFlag():
@@ -104,23 +114,35 @@ proc inspectContainerJson*(name: string): JsonNode =
   ## fetch container json from local docker daemon (if present)
   return inspectJson(name, "container")
 
-iterator allIDs(what: string, cmd: string): string =
+iterator allIDs(what: string, kind: string, cmd: string): string =
   ## utility function for getting all docker ids in local system (container or image)
-  let
-    output = runDockerGetEverything(@[cmd, "--no-trunc", "--format", "{{.ID}}"])
-    stdout = output.getStdout().strip()
-    stderr = output.getStderr().strip()
-
-  if output.getExit() != 0 or stdout == "":
-    error("docker: could not find any " & what & ": " & stdout & " " & stderr)
+  var fromEngine = none(seq[string])
+  try:
+    withDockerEngine(engine):
+      fromEngine = some(engine.listIds(kind))
+  except:
+    trace("docker: " & getCurrentExceptionMsg())
+  if fromEngine.isSome():
+    if len(fromEngine.get()) == 0:
+      error("docker: could not find any " & what)
+    for id in fromEngine.get():
+      yield id
   else:
-    for line in stdout.splitLines():
-      yield line
+    let
+      output = runDockerGetEverything(@[cmd, "--no-trunc", "--format", "{{.ID}}"])
+      stdout = output.getStdout().strip()
+      stderr = output.getStderr().strip()
+
+    if output.getExit() != 0 or stdout == "":
+      error("docker: could not find any " & what & ": " & stdout & " " & stderr)
+    else:
+      for line in stdout.splitLines():
+        yield line
 
 iterator allImageIDs*(): string =
-  for id in allIDs("images", "images"):
+  for id in allIDs("images", "image", "images"):
     yield id
 
 iterator allContainerIDs*(): string =
-  for id in allIDs("containers", "ps"):
+  for id in allIDs("containers", "container", "ps"):
     yield id
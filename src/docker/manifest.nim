@@ -671,6 +671,77 @@ proc fetchListOrImageManifest*(name:            DockerImage,
   else:
     return fetchListManifest(name, platforms)
 
+proc prefetchManifests*(images: openArray[tuple[image: DockerImage, platforms: seq[DockerPlatform]]]) =
+  ## Fetch manifests, platform manifests and configs of several pinned
+  ## images concurrently, one level at a time, so that fetchManifest()
+  ## and friends for them afterwards are served from the registry cache.
+  ## Only platforms asked for are followed in manifest lists.
+  var
+    fetches:   seq[BlobFetch]
+    platforms: seq[seq[DockerPlatform]]
+    seen:      seq[string]
+  for (image, imagePlatforms) in images:
+    if image.digest == "" or image.digest in seen:
+      continue
+    seen.add(image.digest)
+    fetches.add((image, "manifests", MANIFEST_ACCEPT))
+    platforms.add(imagePlatforms)
+  while len(fetches) > 0:
+    let bodies = fetchBlobsConcurrently(fetches)
+    var
+      next:          seq[BlobFetch]
+      nextPlatforms: seq[seq[DockerPlatform]]
+    template follow(item: JsonNode, kind: string, source: DockerImage, wanted: seq[DockerPlatform]) =
+      let digest = item{"digest"}.getStr().extractDockerHash()
+      if digest != "" and digest notin seen:
+        seen.add(digest)
+        next.add((source.withDigest(digest), kind, item{"mediaType"}.getStr()))
+        nextPlatforms.add(wanted)
+    for i, body in bodies:
+      let current = fetches[i]
+      if body == "" or current.kind != "manifests":
+        continue
+      let json =
+        try:
+          parseJson(body)
+        except:
+          trace("docker: ignoring invalid manifest " & $current.image)
+          continue
+      for item in json{"manifests"}.getElems():
+        let platform = DockerPlatform(
+          os:           item{"platform"}{"os"}.getStr(),
+          architecture: item{"platform"}{"architecture"}.getStr(),
+          variant:      item{"platform"}{"variant"}.getStr(),
+        )
+        if platform.isKnown() and platform in platforms[i]:
+          follow(item, "manifests", current.image, platforms[i])
+      if json{"config"} != nil:
+        follow(json{"config"}, "blobs", current.image, platforms[i])
+    fetches   = next
+    platforms = nextPlatforms
+
+proc putLayers*(layers: seq[DockerManifest]) =
+  ## Upload the file backed blobs of independent layers concurrently.
+  ## Layers which fail are left as is, so their put() retries them one at
+  ## a time and reports the error in context.
+  var
+    pending: seq[DockerManifest]
+    uploads: seq[BlobUpload]
+  for layer in layers:
+    if layer.kind == DockerManifestType.layer and layer.fileStream != nil and not layer.isFetched:
+      pending.add(layer)
+      uploads.add((
+        layer:       layer.name,
+        contentType: layer.mediaType,
+        fileStream:  layer.fileStream,
+      ))
+  if len(pending) < 2:
+    return
+  for i, uploaded in layerPutFileStreams(uploads):
+    if uploaded != nil:
+      pending[i].setJson(uploaded, check = false)
+      pending[i].isFetched = true
+
 proc put*(self: DockerManifest) =
   if self.isFetched:
     return
@@ -707,6 +778,7 @@ proc put*(self: DockerManifest) =
   of DockerManifestType.image:
     if self.config != nil:
       self.config.put()
+    putLayers(self.layers)
     for i in self.layers:
       i.put()
     self.setJson(
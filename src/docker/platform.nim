@@ -37,6 +37,22 @@ proc dockerProbeDefaultPlatforms*(): Table[string, DockerPlatform] =
   result = defaultPlatforms
 
   once:
+    let
+      cacheScope = getDockerBuilderScope()
+      cacheName  = "probe platforms " & getEnv("DOCKER_DEFAULT_PLATFORM")
+      cached     = getCachedCapability(cacheScope, cacheName)
+    if cached.isSome():
+      try:
+        var tmp = initTable[string, DockerPlatform]()
+        for k, v in parseJson(cached.get()).pairs():
+          tmp[k] = parseDockerPlatform(v.getStr())
+        if len(tmp) > 0:
+          defaultPlatforms = tmp
+          result           = tmp
+          return result
+      except:
+        trace("docker: ignoring cached build platforms: " & getCurrentExceptionMsg())
+
     trace("docker: probing for build platforms")
     let
       tmpTag     = chooseNewTag()
@@ -50,7 +66,7 @@ ENV TARGETPLATFORM=$TARGETPLATFORM
 """
     trace("docker: probing platform with: \n" & probeFile)
 
-    var data = ""
+    var probed: JsonNode
 
     try:
       withEnvRestore(envVars):
@@ -60,30 +76,26 @@ ENV TARGETPLATFORM=$TARGETPLATFORM
           warn("docker: could not probe build platforms: " & build.stderr)
           return result
 
-      let probe = runDockerGetEverything(@["image", "inspect", tmpTag])
-      if probe.getExit() != 0:
-        warn("docker: could not probe build platforms: " & probe.stderr)
+      try:
+        probed = inspectImageJson(tmpTag)
+      except:
+        warn("docker: could not probe build platforms: " & getCurrentExceptionMsg())
         return result
 
-      data = probe.stdout
-
     finally:
-      discard runDockerGetEverything(@["rmi", tmpTag])
+      try:
+        removeDockerImage(tmpTag)
+      except:
+        trace("docker: " & getCurrentExceptionMsg())
       trace("docker: done probing for build platforms")
 
-    if data == "":
-      warn("docker: could not probe build platforms. Got empty output")
-      return result
-
     try:
       let
-        inspected = (
-          parseJson(data)
-          .assertIs(JArray, "inspect result should be an array")
-          .assertHasLen("no inspect results")
+        config = (
+          probed
+          .assertIs(JObject, "inspected image should be an object"){"Config"}
+          .assertIs(JObject, "config should be an object")
         )
-        image  = inspected[0].assertIs(JObject, "inspected image should be an object")
-        config = image{"Config"}.assertIs(JObject, "config should be an object")
         envs   = config{"Env"}.assertIs(JArray, "env should be an array")
       var tmp  = initTable[string, DockerPlatform]()
       for env in envs:
@@ -97,6 +109,10 @@ ENV TARGETPLATFORM=$TARGETPLATFORM
       if len(tmp) > 0:
         defaultPlatforms = tmp
         result           = tmp
+        let toCache = newJObject()
+        for k, v in tmp:
+          toCache[k] = %($v)
+        setCachedCapability(cacheScope, cacheName, $toCache)
       else:
         warn("docker: could not probe docker build platforms. all args were empty")
     except:
@@ -63,12 +63,10 @@ proc dockerPush*(ctx: DockerInvocation): int =
       for image in chalk.iterPushTags():
         trace("docker: pushing to - " & image)
         try:
-          let retag = runDockerGetEverything(@["tag", chalk.name, image])
-          if retag.exitCode != 0:
-            error("docker: could not tag as " & image & ". ignoring error - " & retag.stderr)
-            continue
+          tagDockerImage(chalk.name, image)
           imagesToPrune.add(image)
         except:
+          error("docker: could not tag as " & image & ". ignoring error - " & getCurrentExceptionMsg())
           continue
         try:
           discard runCmdNoOutputCapture(getDockerExeLocation(), @["push", image])
@@ -91,6 +89,6 @@ proc dockerPush*(ctx: DockerInvocation): int =
     finally:
       for i in imagesToPrune:
         try:
-          discard runDockerGetEverything(@["rmi", i])
+          removeDockerImage(i)
         except:
           discard
@@ -13,9 +13,12 @@
 ## https://github.com/opencontainers/distribution-spec/blob/main/spec.md
 
 import std/[
+  httpclient,
+  locks,
   nativesockets,
   net,
   strscans,
+  typedthreads,
   uri,
 ]
 import pkg/[
@@ -38,6 +41,7 @@ import "."/[
   ids,
   json,
   nodes,
+  registry_cache,
 ]
 
 type
@@ -80,6 +84,13 @@ const
     "application/octet-stream": DockerManifestType.layer,
   }.toTable()
   MEGABYTE = 1 shl 20
+  MANIFEST_ACCEPT* = (
+    "application/vnd.docker.distribution.manifest.v2+json, " &
+    "application/vnd.docker.distribution.manifest.list.v2+json, " &
+    "application/vnd.oci.image.manifest.v1+json, " &
+    "application/vnd.oci.image.index.v1+json, " &
+    "*/*"
+  )
 
 proc uses(useCase: RegistryUseCase): seq[RegistryUseCase] =
   ## which uses lookups are applicable for the registry use
@@ -179,7 +190,7 @@ proc iterDaemonSpecificRegistryConfigs(self:         DockerImage,
   )
 
   result.add(proc: seq[RegistryConfig] =
-    for i in getDockerInfoSubList("insecure registries:"):
+    for i in getDockerInsecureRegistries():
       if self.registry == i or self.domain == i:
         trace("docker: " & i & " is configured as an insecure registry in docker daemon")
         trace("docker: " & self.registry & " will attempt TLS without verifying server cert")
@@ -256,7 +267,7 @@ proc iterDaemonRegistryConfigs(self: DockerImage,
   # docker daemon only suports docker hub mirror
   if useCase == RegistryUseCase.ReadOnly and self.isDockerHub():
     result.add(proc (): seq[() -> seq[RegistryConfig]] =
-      for mirror in getDockerInfoSubList("registry mirrors:"):
+      for mirror in getDockerRegistryMirrors():
         trace("docker: attempting to use docker hub mirror: " & mirror)
         let
           mirrorUri = parseUri(mirror)
@@ -516,6 +527,7 @@ proc request(self:              DockerImage,
              size               = 0,
              timeout            = TIMEOUT,
              acceptStatusCodes: openArray[Slice[int]] = @[200..299],
+             ifNoneMatch        = "",
              ): (string, Response) =
   let cacheKey = (self, httpMethod, path, useCase)
   if cacheKey in jsonCache:
@@ -547,6 +559,8 @@ proc request(self:              DockerImage,
         var headers = newHttpHeaders()
         if accept != "":
           headers["Accept"] = accept
+        if ifNoneMatch != "":
+          headers["If-None-Match"] = ifNoneMatch
         if body != "":
           if contentType != "":
             headers["Content-Type"] = contentType
@@ -592,7 +606,9 @@ proc request(self:              DockerImage,
         for u in useCase.uses():
           discard configByRegistry.hasKeyOrPut((u, normalized.registry), config)
           discard configByRegistry.hasKeyOrPut((u, self.registry), config)
-        if isGet:
+        # only cache hits, so a HEAD probing for a blob which is uploaded
+        # right after does not keep reporting it as missing
+        if isGet and response.code().is2xx():
           jsonCache[cacheKey] = (msg, response)
         return (msg, response)
       except ValueError:
@@ -640,18 +656,23 @@ proc validateDigest(digest: string): string =
 proc manifestHead*(image:    DockerImage,
                    useCase = RegistryUseCase.ReadOnly,
                    ): DockerDigestedJson =
+  # digest cannot change what it points to so once repo is known to have
+  # it, no need to ask again. Pushes (ReadWrite) always check the registry
+  if useCase == RegistryUseCase.ReadOnly and image.digest != "":
+    let cached = getCachedManifestHead(image.repo, image.digest)
+    if cached.isSome():
+      return newDockerDigestedJson(
+        data      = JsonNode(nil),
+        digest    = image.digest,
+        mediaType = cached.get().mediaType,
+        size      = cached.get().size,
+      )
   let
     (_, response) = image.request(
       useCase    = useCase,
       httpMethod = HttpHead,
       path       = "/manifests/" & image.imageRef,
-      accept     = (
-        "application/vnd.docker.distribution.manifest.v2+json, " &
-        "application/vnd.docker.distribution.manifest.list.v2+json, " &
-        "application/vnd.oci.image.manifest.v1+json, " &
-        "application/vnd.oci.image.index.v1+json, " &
-        "*/*"
-      ),
+      accept     = MANIFEST_ACCEPT,
     )
     contentType = response.headers.mustGet("Content-Type", "registry HEAD response missing Content-Type header")
     digest      = validateDigest(response.headers.mustGet("Docker-Content-Digest", "registry HEAD response missing Docker-Content-Digest header"))
@@ -661,6 +682,10 @@ proc manifestHead*(image:    DockerImage,
     "Content-Length",
     "registry HEAD response missing Content-Length header",
   )
+  # only what read flows saw is remembered for them. HEADs made while
+  # pushing probe state which the push is about to change
+  if useCase == RegistryUseCase.ReadOnly:
+    cacheManifestHead(image.repo, digest, contentType, size)
   return newDockerDigestedJson(
     data      = JsonNode(nil),
     digest    = digest,
@@ -672,6 +697,14 @@ proc manifestGet*(image:    DockerImage,
                   accept:   string,
                   useCase = RegistryUseCase.ReadOnly,
                   ): DockerDigestedJson =
+  if useCase == RegistryUseCase.ReadOnly and image.digest != "":
+    let cached = getCachedBlob(image.digest)
+    if cached.isSome():
+      return newDockerDigestedJson(
+        data      = cached.get(),
+        digest    = image.digest,
+        mediaType = accept,
+      )
   let (_, response) = image.request(
     useCase    = useCase,
     httpMethod = HttpGet,
@@ -680,9 +713,11 @@ proc manifestGet*(image:    DockerImage,
   )
   # GET normally doesnt return referrers header but checking just in-case
   checkReferrersSupport(image, response)
+  let body = response.body()
+  cacheBlob(body)
   return newDockerDigestedJson(
-    data      = response.body(),
-    digest    = response.body().sha256Hex(),
+    data      = body,
+    digest    = body.sha256Hex(),
     mediaType = accept,
   )
 
@@ -703,13 +738,16 @@ proc layerGetJson*(layer:    DockerImage,
                    accept:   string,
                    useCase = RegistryUseCase.ReadOnly,
                    ): DigestedJson =
-  return parseAndDigestJson(
-    layer.layerGetString(
-      useCase = useCase,
-      accept  = accept,
-    ),
-    digest = layer.imageRef,
+  if useCase == RegistryUseCase.ReadOnly and layer.digest != "":
+    let cached = getCachedBlob(layer.digest)
+    if cached.isSome():
+      return parseAndDigestJson(cached.get(), digest = layer.imageRef)
+  let data = layer.layerGetString(
+    useCase = useCase,
+    accept  = accept,
   )
+  cacheBlob(data)
+  return parseAndDigestJson(data, digest = layer.imageRef)
 
 proc layerGetFileString*(layer:    DockerImage,
                          name:     string,
@@ -892,6 +930,20 @@ proc chunkUploadTarget(
   else:
     (HttpPatch, location)
 
+proc existingBlob(layer: DockerImage, response: Response): DockerDigestedJson =
+  ## blob as the registry reported it in the HEAD response
+  trace("docker: layer already exists. nothing to upload")
+  let existingSize = response.headers.mustGetInt(
+    "Content-Length",
+    "registry HEAD response missing Content-Length header",
+  )
+  return newDockerDigestedJson(
+    data      = JsonNode(nil),
+    digest    = layer.digest,
+    mediaType = response.headers.mustGet("Content-Type", "registry HEAD response missing Content-Type header"),
+    size      = existingSize,
+  )
+
 proc layerPutFileStream*(
     layer:       DockerImage,
     contentType: string,
@@ -911,17 +963,7 @@ proc layerPutFileStream*(
       path        = "/blobs/" & layer.imageRef,
       accept      = contentType,
     )
-    trace("docker: layer already exists. nothing to upload")
-    let existingSize = response.headers.mustGetInt(
-      "Content-Length",
-      "registry HEAD response missing Content-Length header",
-    )
-    return newDockerDigestedJson(
-      data      = JsonNode(nil),
-      digest    = layer.digest,
-      mediaType = response.headers.mustGet("Content-Type", "registry HEAD response missing Content-Type header"),
-      size      = existingSize,
-    )
+    return layer.existingBlob(response)
   except RegistryResponseError:
     trace("docker: layer doesnt exist. uploading " & $layer)
     if size == 0:
@@ -980,6 +1022,436 @@ proc layerPutFileStream*(
       size      = len(fileStream),
     )
 
+## ---------------------------------------------------------------------------
+## Concurrent blob uploads
+##
+## Chunks of one blob have to be sent in order, but independent blobs can
+## go up at the same time. Everything that touches registry configs, auth
+## and logging (existence check, upload session start) is done on the main
+## thread. Worker threads then only stream the chunks of a session with
+## their own keep-alive HttpClient, reusing it across chunks and blobs.
+## As workers cannot re-authenticate, sessions rejected with 401 (token
+## expired mid upload) are started again on the main thread, which
+## elicits a fresh token, and uploaded once more.
+
+type
+  BlobUpload* = tuple
+    layer:       DockerImage
+    contentType: string
+    fileStream:  FileStringStream
+
+  HeaderPairs = seq[tuple[key: string, val: string]]
+
+  BlobUploadJob = object
+    layer:      DockerImage
+    location:   Uri                    ## absolute upload session url
+    headers:    HeaderPairs            ## auth headers for the session
+    path:       string                 ## file to read the blob from, or
+    data:       string                 ## the blob itself
+    size:       int
+    chunkSize:  int
+    timeout:    int
+    verifyMode: SslCVerifyMode
+    pinnedCert: string
+    digest:     string                 ## registry reported digest
+    error:      string
+    expired:    bool                   ## rejected with 401
+    log:        seq[string]            ## traced by the main thread
+
+  BlobUploadQueue = object
+    lock: Lock
+    jobs: ptr UncheckedArray[BlobUploadJob]
+    len:  int
+    next: int
+
+proc newBlobUploadJob(upload: BlobUpload, chunkSize: int, timeout: int): BlobUploadJob =
+  let
+    layer                    = upload.layer
+    (location, minChunkSize) = layer.layerPutStart()
+    config                   = configByRegistry.getOrDefault((RegistryUseCase.ReadWrite, layer.registry))
+  if config == nil:
+    raise newException(ValueError, "no registry config for " & layer.registry)
+  let
+    normalized = layer.withRegistry(config.registry).withProject(config.project)
+    base       = normalized.uri(scheme = config.scheme, prefix = config.prefix, path = "")
+    headers    = config.authHeadersFor(normalized)
+  if normalized.repo in config.wwwAuth and false in config.wwwAuth[normalized.repo]:
+    discard headers.update(config.wwwAuth[normalized.repo][false])
+  result = BlobUploadJob(
+    layer:      layer,
+    location:   combine(base, location),
+    size:       len(upload.fileStream),
+    chunkSize:  max(chunkSize, minChunkSize),
+    timeout:    timeout,
+    verifyMode: config.verifyMode,
+    pinnedCert: config.pinnedCert,
+  )
+  for k, v in headers.pairs():
+    result.headers.add((k, v))
+  if upload.fileStream.isUnmodifiedFile():
+    result.path = upload.fileStream.path
+  else:
+    result.data = upload.fileStream.readAll()
+
+proc newBlobUploadClient(job: BlobUploadJob): HttpClient =
+  let context =
+    if job.pinnedCert != "":
+      newContext(verifyMode = job.verifyMode, caFile = job.pinnedCert)
+    else:
+      newContext(verifyMode = job.verifyMode)
+  return newHttpClient(timeout = job.timeout, sslContext = context)
+
+proc readChunk(job: BlobUploadJob, f: File, a, b: int): string =
+  if job.path == "":
+    return job.data[a .. b]
+  result = newString(b - a + 1)
+  f.setFilePos(a)
+  if f.readBuffer(addr result[0], len(result)) != len(result):
+    raise newException(IOError, "short read from " & job.path)
+
+proc uploadChunks(job: var BlobUploadJob, client: HttpClient) =
+  ## Same chunk protocol as layerPutFileStream(), including the handling
+  ## of registries which report stale Range headers.
+  var f: File
+  if job.path != "" and not f.open(job.path):
+    raise newException(IOError, "could not open " & job.path)
+  defer:
+    if job.path != "":
+      f.close()
+  var
+    location          = job.location
+    startAt           = 0
+    attempts          = 1
+    trustSentPosition = false
+    response:           Response
+  while startAt < job.size:
+    let
+      endAt                    = min(startAt + job.chunkSize, job.size) - 1
+      isFinal                  = endAt == job.size - 1
+      (httpMethod, requestUrl) = chunkUploadTarget(location, job.layer, isFinal)
+      body                     = job.readChunk(f, startAt, endAt)
+      headers                  = newHttpHeaders(job.headers)
+    headers["Content-Type"]   = "application/octet-stream"
+    headers["Content-Length"] = $len(body)
+    # see request() for why monolithic uploads omit Content-Range
+    if endAt - startAt + 1 != job.size:
+      headers["Content-Range"] = $startAt & "-" & $endAt
+    job.log.add($httpMethod & " " & $requestUrl & " " & $startAt & "-" & $endAt)
+    response = client.request(requestUrl, httpMethod, body = body, headers = headers)
+    if response.code() == Http401:
+      job.expired = true
+    if not (response.code().is2xx() or response.code() == Http416):
+      raise newException(
+        ValueError,
+        "could not upload layer due to: " & response.status & " " & response.body(),
+      )
+    let wasTrusting = trustSentPosition
+    (startAt, attempts, trustSentPosition) = response.nextChunkOffset(
+      startAt           = startAt,
+      endAt             = endAt,
+      attempts          = attempts,
+      trustSentPosition = trustSentPosition,
+    )
+    if trustSentPosition and not wasTrusting:
+      job.log.add("Range not advancing, switching to sent-position tracking")
+    if response.headers.hasKey("Location"):
+      location = combine(job.location, parseUri(response.headers["Location"]))
+  job.digest = response.finalizeBlobDigest(job.layer)
+
+proc blobUploadWorker(queue: ptr BlobUploadQueue) {.thread.} =
+  # jobs are owned by one worker at a time and the main thread does not
+  # touch them until all workers are joined
+  {.cast(gcsafe).}:
+    var
+      client: HttpClient = nil
+      clientFor          = ("", CVerifyPeer, 0)
+    while true:
+      acquire(queue.lock)
+      let i = queue.next
+      queue.next += 1
+      release(queue.lock)
+      if i >= queue.len:
+        break
+      let job = addr queue.jobs[i]
+      try:
+        if client == nil or clientFor != (job.pinnedCert, job.verifyMode, job.timeout):
+          if client != nil:
+            client.close()
+          client    = newBlobUploadClient(job[])
+          clientFor = (job.pinnedCert, job.verifyMode, job.timeout)
+        job[].uploadChunks(client)
+      except:
+        job.error = getCurrentExceptionMsg()
+        # the connection may be in any state after a failure
+        if client != nil:
+          client.close()
+          client = nil
+    if client != nil:
+      client.close()
+
+proc layerPutFileStreams*(uploads: openArray[BlobUpload]): seq[DockerDigestedJson] =
+  ## Uploads independent blobs concurrently, at most
+  ## docker.registry_upload_parallelism at a time.  Returns the uploaded
+  ## blob for each item, in order, or nil for the ones that failed (the
+  ## error is traced).  Blobs already in the registry are not uploaded.
+  let
+    parallelism    = attrGet[int]("docker.registry_upload_parallelism")
+    chunkSize      = int(attrGet[Con4mSize]("docker.registry_layer_chunk_size"))
+    layerTimeoutMs = int(attrGet[Con4mDuration]("docker.registry_layer_upload_timeout")) div 1000
+  result = newSeq[DockerDigestedJson](len(uploads))
+  if parallelism <= 1 or len(uploads) <= 1:
+    for i, upload in uploads:
+      try:
+        result[i] = upload.layer.layerPutFileStream(upload.contentType, upload.fileStream)
+      except:
+        trace("docker: could not upload " & $upload.layer & ": " & getCurrentExceptionMsg())
+    return
+
+  var
+    prepared: seq[BlobUpload]
+    jobs:     seq[BlobUploadJob]
+    jobItem:  seq[int]
+  for i, item in uploads:
+    var upload = item
+    if upload.layer.digest == "":
+      upload.layer = upload.layer.withDigest(upload.fileStream.sha256Hex())
+    prepared.add(upload)
+    try:
+      let (_, response) = upload.layer.request(
+        useCase           = RegistryUseCase.ReadWrite,
+        httpMethod        = HttpHead,
+        path              = "/blobs/" & upload.layer.imageRef,
+        accept            = upload.contentType,
+        acceptStatusCodes = @[200..299, 404..404],
+      )
+      if response.code().is2xx():
+        result[i] = upload.layer.existingBlob(response)
+        continue
+      if len(upload.fileStream) == 0:
+        raise newException(ValueError, "cannot upload zero-sized layer for " & $upload.layer)
+      jobs.add(newBlobUploadJob(upload, chunkSize, layerTimeoutMs))
+      jobItem.add(i)
+    except:
+      trace("docker: could not start upload of " & $upload.layer & ": " & getCurrentExceptionMsg())
+
+  var restarted = false
+  while len(jobs) > 0:
+    trace("docker: uploading " & $len(jobs) & " blob(s) with up to " &
+          $min(parallelism, len(jobs)) & " concurrent uploads")
+    var
+      queue   = BlobUploadQueue(
+        jobs: cast[ptr UncheckedArray[BlobUploadJob]](addr jobs[0]),
+        len:  len(jobs),
+      )
+      threads = newSeq[Thread[ptr BlobUploadQueue]](min(parallelism, len(jobs)))
+    initLock(queue.lock)
+    for t in threads.mitems():
+      createThread(t, blobUploadWorker, addr queue)
+    joinThreads(threads)
+    deinitLock(queue.lock)
+
+    var
+      expired:     seq[BlobUploadJob]
+      expiredItem: seq[int]
+    for j, job in jobs:
+      for line in job.log:
+        trace("docker: " & $job.layer & ": " & line)
+      let i = jobItem[j]
+      if job.expired and not restarted:
+        # new session from the main thread re-authenticates
+        trace("docker: " & $job.layer & ": upload no longer authorized. restarting it")
+        try:
+          expired.add(newBlobUploadJob(prepared[i], chunkSize, layerTimeoutMs))
+          expiredItem.add(i)
+        except:
+          trace("docker: could not restart upload of " & $job.layer & ": " & getCurrentExceptionMsg())
+        continue
+      if job.error != "":
+        trace("docker: could not upload " & $job.layer & ": " & job.error)
+        continue
+      result[i] = newDockerDigestedJson(
+        data      = JsonNode(nil),
+        digest    = job.digest,
+        mediaType = uploads[i].contentType,
+        size      = job.size,
+      )
+    jobs      = expired
+    jobItem   = expiredItem
+    restarted = true
+
+## ---------------------------------------------------------------------------
+## Concurrent manifest/blob fetches
+##
+## Used to warm up the registry cache before several images are collected
+## one after another. Same split as uploads above: registry configs and
+## auth tokens are resolved on the main thread by the first request to a
+## repo, worker threads then only GET digest-addressed content reusing
+## those auth headers, with one keep-alive HttpClient per registry.
+## Anything a worker could not fetch is simply left for the regular
+## (serial) request to fetch again.
+
+type
+  BlobFetch* = tuple
+    image:  DockerImage ## pinned to a digest
+    kind:   string      ## "manifests" or "blobs"
+    accept: string
+
+  BlobFetchJob = object
+    image:      DockerImage
+    url:        Uri
+    headers:    HeaderPairs
+    timeout:    int
+    verifyMode: SslCVerifyMode
+    pinnedCert: string
+    body:       string
+    error:      string
+
+  BlobFetchQueue = object
+    lock: Lock
+    jobs: ptr UncheckedArray[BlobFetchJob]
+    len:  int
+    next: int
+
+proc fetchConfig(fetch: BlobFetch): RegistryConfig =
+  ## registry config usable by workers for the fetch, or nil
+  ## if the repo was not talked to yet
+  result = configByRegistry.getOrDefault((RegistryUseCase.ReadOnly, fetch.image.registry))
+  if result == nil or not result.usesWwwAuth():
+    return
+  let repo = fetch.image.withRegistry(result.registry).withProject(result.project).repo
+  if (
+    repo notin result.wwwAuth or
+    true notin result.wwwAuth[repo] or
+    len(result.wwwAuth[repo][true]) == 0
+  ):
+    return nil
+
+proc newBlobFetchJob(fetch: BlobFetch, config: RegistryConfig, timeout: int): BlobFetchJob =
+  let
+    normalized = fetch.image.withRegistry(config.registry).withProject(config.project)
+    headers    = config.authHeadersFor(normalized)
+  if normalized.repo in config.wwwAuth and true in config.wwwAuth[normalized.repo]:
+    discard headers.update(config.wwwAuth[normalized.repo][true])
+  headers["Accept"] = fetch.accept
+  result = BlobFetchJob(
+    image:      fetch.image,
+    url:        normalized.uri(
+      scheme = config.scheme,
+      prefix = config.prefix,
+      path   = "/" & fetch.kind & "/" & fetch.image.imageRef,
+    ),
+    timeout:    timeout,
+    verifyMode: config.verifyMode,
+    pinnedCert: config.pinnedCert,
+  )
+  for k, v in headers.pairs():
+    result.headers.add((k, v))
+
+proc newBlobFetchClient(job: BlobFetchJob): HttpClient =
+  let context =
+    if job.pinnedCert != "":
+      newContext(verifyMode = job.verifyMode, caFile = job.pinnedCert)
+    else:
+      newContext(verifyMode = job.verifyMode)
+  return newHttpClient(timeout = job.timeout, sslContext = context)
+
+proc blobFetchWorker(queue: ptr BlobFetchQueue) {.thread.} =
+  # see blobUploadWorker() for job ownership
+  {.cast(gcsafe).}:
+    # keep-alive connection per registry
+    var clients = initTable[(string, string, SslCVerifyMode, int), HttpClient]()
+    while true:
+      acquire(queue.lock)
+      let i = queue.next
+      queue.next += 1
+      release(queue.lock)
+      if i >= queue.len:
+        break
+      let
+        job = addr queue.jobs[i]
+        key = (job.url.hostname & ":" & job.url.port, job.pinnedCert, job.verifyMode, job.timeout)
+      try:
+        if key notin clients:
+          clients[key] = newBlobFetchClient(job[])
+        let response = clients[key].request(job.url, HttpGet, headers = newHttpHeaders(job.headers))
+        if not response.code().is2xx():
+          raise newException(ValueError, response.status)
+        job.body = response.body()
+      except:
+        job.error = getCurrentExceptionMsg()
+        # the connection may be in any state after a failure
+        if key in clients:
+          clients[key].close()
+          clients.del(key)
+    for client in clients.values():
+      client.close()
+
+proc fetchBlobsConcurrently*(fetches: openArray[BlobFetch]): seq[string] =
+  ## Fetches digest-addressed manifests/blobs, at most
+  ## docker.registry_fetch_parallelism at a time, and stores them in the
+  ## registry cache. Returns the content for each item, in order, or an
+  ## empty string for the ones that could not be fetched (the error is
+  ## traced). Never raises.
+  let parallelism = attrGet[int]("docker.registry_fetch_parallelism")
+  result = newSeq[string](len(fetches))
+
+  var
+    jobs:    seq[BlobFetchJob]
+    jobItem: seq[int]
+  for i, fetch in fetches:
+    let cached = getCachedBlob(fetch.image.digest)
+    if cached.isSome():
+      result[i] = cached.get()
+      continue
+    let config = fetch.fetchConfig()
+    if config != nil and parallelism > 1:
+      jobs.add(newBlobFetchJob(fetch, config, TIMEOUT))
+      jobItem.add(i)
+      continue
+    # first request to the repo figures out registry config and auth
+    try:
+      let
+        (_, response) = fetch.image.request(
+          httpMethod = HttpGet,
+          path       = "/" & fetch.kind & "/" & fetch.image.imageRef,
+          accept     = fetch.accept,
+        )
+        body          = response.body()
+      if body.sha256Hex() != fetch.image.digest:
+        trace("docker: " & $fetch.image & " content does not match its digest. ignoring")
+        continue
+      result[i] = body
+      cacheBlob(body)
+    except:
+      trace("docker: could not fetch " & $fetch.image & ": " & getCurrentExceptionMsg())
+  if len(jobs) == 0:
+    return
+
+  trace("docker: fetching " & $len(jobs) & " manifest(s)/blob(s) with up to " &
+        $min(parallelism, len(jobs)) & " concurrent requests")
+  var
+    queue   = BlobFetchQueue(
+      jobs: cast[ptr UncheckedArray[BlobFetchJob]](addr jobs[0]),
+      len:  len(jobs),
+    )
+    threads = newSeq[Thread[ptr BlobFetchQueue]](min(parallelism, len(jobs)))
+  initLock(queue.lock)
+  for t in threads.mitems():
+    createThread(t, blobFetchWorker, addr queue)
+  joinThreads(threads)
+  deinitLock(queue.lock)
+
+  for j, job in jobs:
+    trace("docker: GET " & $job.url)
+    if job.error != "":
+      trace("docker: could not fetch " & $job.image & ": " & job.error)
+      continue
+    if job.body.sha256Hex() != job.image.digest:
+      trace("docker: " & $job.image & " content does not match its digest. ignoring")
+      continue
+    result[jobItem[j]] = job.body
+    cacheBlob(job.body)
+
 proc layerPutString*(layer:       DockerImage,
                      contentType: string,
                      body:        string,
@@ -1014,6 +1486,20 @@ proc layerDelete*(layer: DockerImage): bool =
     dumpExOnDebug()
     return false
 
+proc layerExists*(layer: DockerImage): bool =
+  ## Whether the blob is (still) present in the registry.
+  try:
+    let (_, response) = layer.request(
+      useCase           = RegistryUseCase.ReadWrite,
+      httpMethod        = HttpHead,
+      path              = "/blobs/" & layer.imageRef,
+      acceptStatusCodes = @[200..299, 404..404],
+    )
+    return response.code().is2xx()
+  except:
+    dumpExOnDebug()
+    return false
+
 proc manifestPut*(image:       DockerImage,
                   contentType: string,
                   data:        JsonNode,
@@ -1061,19 +1547,33 @@ proc referrersGet*(image:        DockerImage,
       "/referrers/" & image.imageRef & "?artifactType=" & encodeUrl(artifactType, usePlus = false)
     else:
       "/referrers/" & image.imageRef
+  # new referrers can show up any time so revalidate
+  # whatever is cached with its etag
+  let
+    cacheKey = image.asRepoDigest() & " " & artifactType
+    cached   = getCachedReferrers(cacheKey)
   try:
     let (_, response) = image.request(
       useCase           = RegistryUseCase.ReadOnly,
       httpMethod        = HttpGet,
       path              = path,
       accept            = "application/vnd.oci.image.index.v1+json",
-      acceptStatusCodes = @[200..299, 404..404],
+      acceptStatusCodes = @[200..299, 304..304, 404..404],
+      ifNoneMatch       = if cached.isSome(): cached.get().etag else: "",
     )
-    if not response.code().is2xx():
+    var body = ""
+    if response.code() == Http304 and cached.isSome():
+      trace("docker: referrers for " & $image & " not modified. using cached response")
+      body = cached.get().body
+    elif response.code().is2xx():
+      body = response.body()
+      if response.headers.hasKey("ETag"):
+        cacheReferrers(cacheKey, response.headers["ETag"], body)
+    else:
       return nil
     return newDockerDigestedJson(
-      data      = response.body(),
-      digest    = response.body().sha256Hex(),
+      data      = body,
+      digest    = body.sha256Hex(),
       mediaType = "application/vnd.oci.image.index.v1+json",
     )
   except:
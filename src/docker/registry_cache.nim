@@ -0,0 +1,238 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Persistent cache of registry responses.
+##
+## Manifests and JSON blobs (image configs, attestations) are content
+## addressed, so once fetched they never change and are served from disk
+## forever when asked for by digest. Tag lookups still go to the registry
+## but only as a HEAD which resolves the tag to its current digest (and
+## on Docker Hub does not count towards pull rate limits); the GET of that
+## digest then comes from the cache. Referrers indexes do change as
+## attestations are added, so they are revalidated with the ETag the
+## registry returned for them.
+##
+## Layout under `docker.registry_cache_path`:
+##
+## * `blobs/<hex>`          - content, checked against its digest on read
+## * `blobs/<hex>.json`     - manifest media type, size and repos it was seen in
+## * `referrers/<key>.json` - ETag and body of a referrers response
+##
+## Everything is touched on use and the least recently used files are
+## evicted once the cache exceeds `docker.registry_cache_max_size`.
+##
+## Blobs are also kept in memory for the rest of the chalk run, even when
+## the disk cache is disabled, so prefetched manifests and configs (see
+## `fetchBlobsConcurrently` in registry.nim) are not fetched again.
+
+import std/[
+  algorithm,
+  os,
+  times,
+]
+import ".."/[
+  types,
+  utils/json,
+]
+
+const
+  REGISTRY_CACHE_BLOBS     = "blobs"
+  REGISTRY_CACHE_REFERRERS = "referrers"
+  # large (e.g. SBOM) blobs are not worth keeping around
+  REGISTRY_CACHE_MAX_ITEM  = 16 * 1024 * 1024
+
+var memoryBlobs = initTable[string, string]()
+
+proc registryCacheDir(): string =
+  return attrGet[string]("docker.registry_cache_path").resolvePath()
+
+proc registryCacheMaxSize(): int64 =
+  return int64(attrGet[Con4mSize]("docker.registry_cache_max_size"))
+
+proc isRegistryCacheEnabled(): bool =
+  return registryCacheMaxSize() > 0
+
+proc digestHex(digest: string): string =
+  ## hex part of a sha256 digest or empty string if its not one
+  let hex =
+    if digest.startsWith("sha256:"):
+      digest[len("sha256:") .. ^1]
+    else:
+      digest
+  if len(hex) != 64:
+    return ""
+  for c in hex:
+    if c notin {'0' .. '9', 'a' .. 'f'}:
+      return ""
+  return hex
+
+proc blobPath(hex: string): string =
+  return registryCacheDir() / REGISTRY_CACHE_BLOBS / hex
+
+proc blobMetaPath(hex: string): string =
+  return hex.blobPath() & ".json"
+
+proc referrersPath(key: string): string =
+  return registryCacheDir() / REGISTRY_CACHE_REFERRERS / (key.sha256Hex() & ".json")
+
+proc touch(path: string) =
+  try:
+    setLastModificationTime(path, getTime())
+  except:
+    discard
+
+proc cleanRegistryCache*() =
+  ## evict least recently used entries until the cache fits
+  ## in docker.registry_cache_max_size
+  let
+    dir     = registryCacheDir()
+    maxSize = registryCacheMaxSize()
+  if maxSize <= 0 or not dirExists(dir):
+    return
+  try:
+    var
+      entries: seq[(Time, string, int64)]
+      total   = int64(0)
+    for sub in [REGISTRY_CACHE_BLOBS, REGISTRY_CACHE_REFERRERS]:
+      for kind, path in walkDir(dir / sub):
+        if kind != pcFile:
+          continue
+        let
+          mtime = getLastModificationTime(path)
+          size  = getFileSize(path)
+        # left behind by a killed chalk
+        if path.endsWith(".tmp") and getTime() - mtime > initDuration(hours = 1):
+          removeFile(path)
+          continue
+        entries.add((mtime, path, size))
+        total += size
+    if total <= maxSize:
+      return
+    entries.sort()
+    for (_, path, size) in entries:
+      if total <= maxSize:
+        break
+      removeFile(path)
+      total -= size
+    trace("docker: evicted registry cache down to " & $total & " bytes")
+  except:
+    trace("docker: error evicting registry cache: " & getCurrentExceptionMsg())
+
+proc writeCacheFile(path: string, data: string) =
+  once:
+    cleanRegistryCache()
+  try:
+    createDir(path.parentDir())
+    # rename so concurrent chalk runs never see a partial file
+    let tmp = path & "." & $getCurrentProcessId() & ".tmp"
+    if not tryToWriteFile(tmp, data):
+      raise newException(IOError, "could not write " & tmp)
+    moveFile(tmp, path)
+  except:
+    trace("docker: could not write registry cache " & path & ": " & getCurrentExceptionMsg())
+
+proc readBlobMeta(hex: string): JsonNode =
+  try:
+    let data = tryToLoadFile(hex.blobMetaPath())
+    if data != "":
+      return parseJson(data).assertIs(JObject, "bad registry cache meta")
+  except:
+    trace("docker: ignoring registry cache meta for sha256:" & hex & ": " & getCurrentExceptionMsg())
+  return newJObject()
+
+proc getCachedBlob*(digest: string): Option[string] =
+  ## content of manifest/blob with the digest if its cached
+  let hex = digest.digestHex()
+  if hex == "":
+    return none(string)
+  if hex in memoryBlobs:
+    return some(memoryBlobs[hex])
+  if not isRegistryCacheEnabled():
+    return none(string)
+  let
+    path = hex.blobPath()
+    data = tryToLoadFile(path)
+  if data == "":
+    return none(string)
+  if data.sha256Hex() != hex:
+    trace("docker: registry cache entry is corrupted. removing " & path)
+    discard tryRemoveFile(path)
+    return none(string)
+  path.touch()
+  trace("docker: registry cache hit for sha256:" & hex)
+  memoryBlobs[hex] = data
+  return some(data)
+
+proc cacheBlob*(data: string) =
+  ## store content under its digest
+  if len(data) == 0 or len(data) > REGISTRY_CACHE_MAX_ITEM:
+    return
+  let hex = data.sha256Hex()
+  memoryBlobs[hex] = data
+  if not isRegistryCacheEnabled():
+    return
+  let path = hex.blobPath()
+  if fileExists(path):
+    path.touch()
+    return
+  path.writeCacheFile(data)
+
+proc getCachedManifestHead*(repo: string, digest: string): Option[tuple[mediaType: string, size: int]] =
+  ## media type and size of manifest if it was already seen in repo
+  let hex = digest.digestHex()
+  if hex == "" or not isRegistryCacheEnabled():
+    return none(tuple[mediaType: string, size: int])
+  let
+    meta      = hex.readBlobMeta()
+    mediaType = meta{"mediaType"}.getStr()
+    size      = meta{"size"}.getInt()
+  if mediaType == "" or size <= 0 or repo notin meta{"repos"}.getStrElems():
+    return none(tuple[mediaType: string, size: int])
+  hex.blobMetaPath().touch()
+  trace("docker: registry cache hit for " & repo & "@sha256:" & hex)
+  return some((mediaType, size))
+
+proc cacheManifestHead*(repo: string, digest: string, mediaType: string, size: int) =
+  let hex = digest.digestHex()
+  if hex == "" or mediaType == "" or size <= 0 or not isRegistryCacheEnabled():
+    return
+  let meta = hex.readBlobMeta()
+  var repos = meta{"repos"}.getStrElems()
+  if repo in repos and meta{"mediaType"}.getStr() == mediaType and meta{"size"}.getInt() == size:
+    hex.blobMetaPath().touch()
+    return
+  if repo notin repos:
+    repos.add(repo)
+  meta["mediaType"] = %mediaType
+  meta["size"]      = %size
+  meta["repos"]     = %repos
+  hex.blobMetaPath().writeCacheFile($meta)
+
+proc getCachedReferrers*(key: string): Option[tuple[etag: string, body: string]] =
+  if not isRegistryCacheEnabled():
+    return none(tuple[etag: string, body: string])
+  let path = key.referrersPath()
+  try:
+    let data = tryToLoadFile(path)
+    if data != "":
+      let
+        cached = parseJson(data)
+        etag   = cached{"etag"}.getStr()
+      if etag != "":
+        path.touch()
+        return some((etag, cached{"body"}.getStr()))
+  except:
+    trace("docker: ignoring registry cache referrers for " & key & ": " & getCurrentExceptionMsg())
+  return none(tuple[etag: string, body: string])
+
+proc cacheReferrers*(key: string, etag: string, body: string) =
+  if etag == "" or len(body) > REGISTRY_CACHE_MAX_ITEM or not isRegistryCacheEnabled():
+    return
+  key.referrersPath().writeCacheFile($(%*{
+    "etag": etag,
+    "body": body,
+  }))
@@ -15,7 +15,6 @@
 import std/[
   algorithm,
   sequtils,
-  streams,
 ]
 import "."/[
   types,
@@ -25,52 +24,49 @@ iterator sortedPairs(d: ChalkDict): tuple[key: string, value: Box] =
   for key in d.keys().toSeq().sorted():
     yield (key, d[key])
 
-proc u32ToStr(i: uint32): string =
-  result = newStringOfCap(sizeof(uint32)+1)
-  let arr = cast[array[4, char]](i)
+# Everything is appended to one growing buffer; the format is the
+# same as when this went through a StringStream.
 
-  for ch in arr: result.add(ch)
+proc addU32(s: var string, i: uint32) =
+  let arr = cast[array[4, char]](i)
+  for ch in arr:
+    s.add(ch)
 
-proc u64ToStr(i: uint64): string =
-  result = newStringOfCap(sizeof(uint64)+1)
+proc addU64(s: var string, i: uint64) =
   let arr = cast[array[8, char]](i)
-
   for ch in arr:
-    result.add(ch)
-
-proc floatToStr(f: float): string =
-  result = newStringOfCap(sizeof(float)+1)
+    s.add(ch)
 
-proc binEncodeItem(s: Stream, self: Box)
+proc binEncodeItem(s: var string, self: Box)
 
-proc binEncodeStr(t: Stream, s: string) =
-  t.write("\x01")
-  t.write(u32ToStr(uint32(len(s))))
-  t.write(s)
+proc binEncodeStr(t: var string, s: string) =
+  t.add("\x01")
+  t.addU32(uint32(len(s)))
+  t.add(s)
 
-proc binEncodeInt(s: Stream, i: uint64) =
-  s.write("\x02")
-  s.write(u64ToStr(i))
+proc binEncodeInt(s: var string, i: uint64) =
+  s.add("\x02")
+  s.addU64(i)
 
-proc binEncodeBool(s: Stream, b: bool) =
+proc binEncodeBool(s: var string, b: bool) =
   if b:
-    s.write("\x03\x01")
+    s.add("\x03\x01")
   else:
-    s.write("\x03\x00")
+    s.add("\x03\x00")
 
-proc binEncodeArr(s: Stream, arr: seq[Box]) =
-  s.write("\x04")
-  s.write(u32ToStr(uint32(len(arr))))
+proc binEncodeArr(s: var string, arr: seq[Box]) =
+  s.add("\x04")
+  s.addU32(uint32(len(arr)))
   for item in arr:
     s.binEncodeItem(item)
 
-proc binEncodeTable(s: Stream, self: ChalkDict, ignore: seq[string] = @[]) =
+proc binEncodeTable(s: var string, self: ChalkDict, ignore: seq[string] = @[]) =
   # we dont know the count ahead of time as we need to account for ignores
-  # so we can write 0 for now and then replace the stream content with updated count
+  # so we write 0 for now and then patch the count in place
   var count = 0
-  s.write("\x05")
-  let countPosition = s.getPosition()
-  s.write(u32ToStr(uint32(count)))
+  s.add("\x05")
+  let countPosition = len(s)
+  s.addU32(uint32(count))
   # It's important to write everything out in a canonical order for
   # signing.  The keys are written in the order we spec, and user-defined
   # keys are in lexigraphical order.
@@ -83,24 +79,22 @@ proc binEncodeTable(s: Stream, self: ChalkDict, ignore: seq[string] = @[]) =
     s.binEncodeStr(k)
     s.binEncodeItem(v)
     count += 1
-  let endPosition = s.getPosition()
-  s.setPosition(countPosition)
-  # replace the count in the stream
-  s.write(u32ToStr(uint32(count)))
-  s.setPosition(endPosition)
+  let arr = cast[array[4, char]](uint32(count))
+  for i, ch in arr:
+    s[countPosition + i] = ch
 
-proc binEncodeFloat(s: Stream, f: float) =
-  s.write("\X06")
-  s.write(floatToStr(f))
+proc binEncodeFloat(s: var string, f: float) =
+  # Historically the value itself was never written, only the tag.
+  s.add("\X06")
 
-proc binEncodeObj(s: Stream, self: Box) =
+proc binEncodeObj(s: var string, self: Box) =
   if self.o == nil:
-    s.write("\x07")
+    s.add("\x07")
   else:
     error("non-null objects cannot be normalized")
     unreachable
 
-proc binEncodeItem(s: Stream, self: Box) =
+proc binEncodeItem(s: var string, self: Box) =
   case self.kind
   of MkBool:  s.binEncodeBool(unpack[bool](self))
   of MkInt:   s.binEncodeInt(unpack[uint64](self))
@@ -111,18 +105,11 @@ proc binEncodeItem(s: Stream, self: Box) =
   of MkObj:   s.binEncodeObj(self)
 
 proc binEncodeItem*(self: Box): string =
-  let s = newStringStream()
-  s.binEncodeItem(self)
-  s.setPosition(0)
-  result = s.readAll()
+  result.binEncodeItem(self)
 
 proc normalizeChalk*(dict: ChalkDict): string =
   # Currently, this is only called for the METADATA_ID field, which only
   # signs things actually being written out.  We skip MAGIC, SIGNATURE
   # and SIGN_PARAMS.
-  let
-    ignoreList = attrGet[seq[string]]("ignore_when_normalizing")
-    s          = newStringStream()
-  s.binEncodeTable(dict, ignoreList)
-  s.setPosition(0)
-  result = s.readAll()
+  let ignoreList = attrGet[seq[string]]("ignore_when_normalizing")
+  result.binEncodeTable(dict, ignoreList)
@@ -21,6 +21,10 @@ import "."/[
   types,
   utils/strings,
   utils/files,
+  utils/magic,
+  utils/perf,
+  utils/sniff,
+  utils/tool_cache,
 ]
 
 # These things don't check for null pointers, because they should only
@@ -82,6 +86,62 @@ proc callGetRunTimeHostInfo*(plugin: Plugin, objs: seq[ChalkObj]):
   else:
     result = cb(plugin, objs)
 
+proc addKeyProducer(plugin: Plugin, producer: KeyProducer): Plugin =
+  # plugin can be nil when its disabled via config
+  # in which case registering producers is a no-op
+  if plugin == nil:
+    return plugin
+  for existing in plugin.keyProducers:
+    if existing.key == producer.key and existing.kind == producer.kind:
+      error("Plugin " & plugin.name & ": duplicate producer for key " & producer.key)
+      return plugin
+  plugin.keyProducers.add(producer)
+  return plugin
+
+proc produceKey*(plugin: Plugin,
+                 key:    string,
+                 cb:     ChalkTimeHostKeyCb,
+                 cost    = kcModerate,
+                 ): Plugin {.discardable.} =
+  ## Register a lazy chalk-time host key producer. It is only called
+  ## when the key is subscribed and not already collected.
+  plugin.addKeyProducer(KeyProducer(key: key, cost: cost, kind: kpChalkTimeHost, ctHost: cb))
+
+proc produceKey*(plugin: Plugin,
+                 key:    string,
+                 cb:     ChalkTimeArtifactKeyCb,
+                 cost    = kcModerate,
+                 ): Plugin {.discardable.} =
+  plugin.addKeyProducer(KeyProducer(key: key, cost: cost, kind: kpChalkTimeArtifact, ctArt: cb))
+
+proc produceKey*(plugin: Plugin,
+                 key:    string,
+                 cb:     RunTimeArtifactKeyCb,
+                 cost    = kcModerate,
+                 ): Plugin {.discardable.} =
+  plugin.addKeyProducer(KeyProducer(key: key, cost: cost, kind: kpRunTimeArtifact, rtArt: cb))
+
+proc produceKey*(plugin: Plugin,
+                 key:    string,
+                 cb:     RunTimeHostKeyCb,
+                 cost    = kcModerate,
+                 ): Plugin {.discardable.} =
+  plugin.addKeyProducer(KeyProducer(key: key, cost: cost, kind: kpRunTimeHost, rtHost: cb))
+
+proc getKeyProducers*(plugin: Plugin, kind: KeyProducerKind): seq[KeyProducer] =
+  ## Producers for a collection phase, cheapest first. Registration
+  ## order is preserved between producers of the same cost.
+  for cost in KeyCost:
+    for producer in plugin.keyProducers:
+      if producer.kind == kind and producer.cost == cost:
+        result.add(producer)
+
+proc hasKeyProducers*(plugin: Plugin, kind: KeyProducerKind): bool =
+  for producer in plugin.keyProducers:
+    if producer.kind == kind:
+      return true
+  return false
+
 proc callScan*(plugin: Plugin, s: string): Option[ChalkObj] =
   let cb = plugin.scan
   if cb != nil:
@@ -106,7 +166,8 @@ proc callGetUnchalkedHash*(obj: ChalkObj): Option[string] =
   let
     plugin = obj.myCodec
     cb     = plugin.getUnchalkedHash
-  result = cb(plugin, obj)
+  withPerfTiming("codec", plugin.name & ".unchalked_hash"):
+    result = cb(plugin, obj)
   if result.isSome():
     obj.cachedUnchalkedHash = result.get()
 
@@ -116,7 +177,8 @@ proc callGetPrechalkingHash*(obj: ChalkObj): Option[string] =
   let
     plugin = obj.myCodec
     cb     = plugin.getPrechalkingHash
-  result = cb(plugin, obj)
+  withPerfTiming("codec", plugin.name & ".prechalking_hash"):
+    result = cb(plugin, obj)
   if result.isSome():
     obj.cachedEndingHash = result.get()
 
@@ -126,7 +188,8 @@ proc callGetEndingHash*(obj: ChalkObj): Option[string] =
   let
     plugin = obj.myCodec
     cb     = plugin.getEndingHash
-  result = cb(plugin, obj)
+  withPerfTiming("codec", plugin.name & ".ending_hash"):
+    result = cb(plugin, obj)
   if result.isSome():
     obj.cachedEndingHash = result.get()
 
@@ -140,7 +203,12 @@ proc callHandleWrite*(obj: ChalkObj, toWrite: Option[string]) =
   let
     plugin = obj.myCodec
     cb     = plugin.handleWrite
-  cb(plugin, obj, toWrite)
+  withPerfTiming("codec", plugin.name & ".write"):
+    cb(plugin, obj, toWrite)
+  # tools which scan a tree containing the artifact must not reuse a
+  # digest of the tree from before it was written
+  if obj.fsRef != "":
+    forgetTreeDigests(obj.fsRef)
 
 proc findFirstValidChalkMark*(s:            string,
                               artifactPath: string,
@@ -156,37 +224,32 @@ proc findFirstValidChalkMark*(s:            string,
   # generally the file won't have changed, so if there's any logging
   # that happens, it should only happen on the first scan, rather than
   # being duplicated.
-  var
-    asStream        = newStringStream(s)
-    curIx           = -1
+  var curIx = -1
 
   while true:
     # The previous loop will have curIx pointing to the start of a
     # mark.  If we don't advance this by one somewhere, we'd keep
     # getting the same mark back (forever).
-    curIx = s.find(magicUTF8, curIx + 1)
+    curIx = s.findMagic(curIx + 1)
 
     if curIx == -1:
       return (-1, -1, nil)
-    asStream.setPosition(curIx)
-    if not asStream.findJsonStart():
-      if quiet:
-        continue
-      error(artifactPath & ": At byte " & $(curIx) &
-            ", chalk mark is present, but was not embedded in valid " &
-            "chalk JSON. Searching for another mark.")
+
+    # We don't want to change curIx in case we need to search for the
+    # next mark.  If this mark *is* valid, then we actually will want
+    # to return the start of the JSON, which represents the true start
+    # of the mark.  That's what we're expected to be returning, not the
+    # location of the magic value.
+    let curPos = s.findJsonStart(curIx)
+    if curPos == -1:
+      if not quiet:
+        error(artifactPath & ": At byte " & $(curIx) &
+              ", chalk mark is present, but was not embedded in valid " &
+              "chalk JSON. Searching for another mark.")
+      continue
     try:
-      let
-        # The stream pointer is backed up from curIx, but we don't
-        # want to change curIx in case we need to search for the next
-        # mark.  If this mark *is* valid, then we actually will want
-        # to return this position, which represents the true start of
-        # the mark, being the start of the JSON.  That's what we're
-        # expected to be returning, not the location of the magic value.
-        curPos   = asStream.getPosition()
-        contents = asStream.extractOneChalkJson(artifactPath)
-      let endPos = asStream.getPosition()
-      asStream.close()
+      var endPos: int
+      let contents = s.extractOneChalkJson(artifactPath, endPos, start = curPos)
       return (curPos, endPos, contents)
     except:
       if quiet:
@@ -233,14 +296,16 @@ proc loadChalkFromFStream*(codec:  Plugin,
 
 proc scanLocation(self: Plugin, loc: string): Option[ChalkObj] =
   try:
-    result = callScan(self, loc)
+    withPerfTiming("codec", self.name & ".scan"):
+      result = callScan(self, loc)
   except:
     error(loc & ": Scan canceled: " & getCurrentExceptionMsg())
     dumpExOnDebug()
 
 proc searchLocation(self: Plugin, loc: string): seq[ChalkObj] =
   try:
-    return callSearch(self, loc)
+    withPerfTiming("codec", self.name & ".search"):
+      return callSearch(self, loc)
   except:
     error(loc & ": Search canceled: " & getCurrentExceptionMsg())
     dumpExOnDebug()
@@ -327,7 +392,15 @@ iterator scanArtifactLocationsWith*(state:  ArtifactIterationInfo,
         trace(i.name & ": was already previously scanned. ignoring")
         continue
 
+      # read the start of the file once and only offer it to
+      # codecs which handle files which look like it
+      var kinds: set[SniffKind]
+      withPerfTiming("codec", "sniff"):
+        kinds = i.name.sniffFile()
+
       for codec in codecs:
+        if not codec.handlesSniffed(kinds):
+          continue
         var found = false
         trace(i.name & ": scanning file with " & codec.name)
         let opt = codec.scanLocation(i.name)
@@ -412,19 +485,14 @@ proc defaultRtArtInfo*(self: Plugin, chalk: ChalkObj, ins: bool):
 proc defaultCodecWrite*(s:     Plugin,
                         chalk: ChalkObj,
                         enc:   Option[string]) {.cdecl.} =
-  var
-    pre:  string
-    post: string
-
-  withFileStream(chalk.fsRef, mode = fmRead, strict = true):
-    pre = stream.readStr(chalk.startOffset)
-
-    if chalk.endOffset > chalk.startOffset:
-      stream.setPosition(chalk.endOffset)
-      post = stream.readAll()
-
-  let contents = pre & enc.getOrElse("") & post
-  if not chalk.fsRef.replaceFileContents(contents):
+  # only the mark is new; the rest is copied from the file itself
+  var segments = @[
+    fileRange(0, chalk.startOffset),
+    fileBytes(enc.getOrElse("")),
+  ]
+  if chalk.endOffset > chalk.startOffset:
+    segments.add(fileRange(chalk.endOffset))
+  if not chalk.fsRef.replaceFileSegments(segments):
     chalk.opFailed = true
 
 var codecs: seq[Plugin] = @[]
@@ -547,6 +615,7 @@ proc newCodec*(
   nativeObjPlatforms: seq[string]         =  @[],
   cache:              RootRef             = RootRef(nil),
   commentStart:       string              = "#",
+  sniffKinds:         set[SniffKind]      = {},
   enabled:            bool                = true):
     Plugin {.discardable, cdecl.} =
 
@@ -566,6 +635,7 @@ proc newCodec*(
                   nativeObjPlatforms:       nativeObjPlatforms,
                   internalState:            cache,
                   commentStart:             commentStart,
+                  sniffKinds:               sniffKinds,
                   enabled:                  enabled,
                   isCodec:                  true)
 
@@ -122,8 +122,7 @@ proc elfHandleWrite*(codec: Plugin,
   # as its no longer a scan... but a chalking operation
   elf.fileData.load()
   # compute unchalked hash before the file is mutated
-  # as otherwise to compute after the fact will need to modify
-  # file stream again hence more memory usage
+  # as it is derived from the headers parsed during the scan
   discard chalk.callGetUnchalkedHash()
   try:
     let success =
@@ -155,4 +154,5 @@ proc loadCodecElf*() =
          handleWrite        = HandleWriteCb(elfHandleWrite),
          getUnchalkedHash   = UnchalkedHashCb(elfGetUnchalkedHash),
          ctArtCallback      = ChalkTimeArtifactCb(elfGetChalkTimeArtifactInfo),
-         rtArtCallback      = RunTimeArtifactCb(elfGetRunTimeArtifactInfo))
+         rtArtCallback      = RunTimeArtifactCb(elfGetRunTimeArtifactInfo),
+         sniffKinds         = {skElf})
@@ -32,6 +32,7 @@ import ".."/[
   run_management,
   types,
   utils/files,
+  utils/magic,
 ]
 
 const
@@ -76,13 +77,9 @@ proc extractKeyMetadata(codec: Plugin, stream: FileStream, loc: string):
       swap(addr(shStLoc), addr(rawBytes))
       shStart = if is64Bit: int(raw64) else: int(raw32)
 
-  stream.setPosition(int(shStart))
-  let
-    secHdr = stream.readAll()
-    offset1 = secHdr.find(magicUTF8)
+  offset = loc.findMagicInFile(start = int(shStart))
 
-  if offset1 != -1:
-    offset = int(shStart) + offset1
+  if offset != -1:
     stream.setPosition(offset)
     result = codec.loadChalkFromFStream(stream, loc)
   else:
@@ -90,7 +87,7 @@ proc extractKeyMetadata(codec: Plugin, stream: FileStream, loc: string):
                       fsRef        = loc,
                       codec        = codec,
                       resourceType = {ResourceFile})
-    result.startOffset = stream.getPosition()
+    result.startOffset = int(getFileSize(loc))
 
 proc fbScan*(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
   withFileStream(loc, mode = fmRead, strict = false):
@@ -128,4 +125,5 @@ proc loadCodecFallbackElf*() =
          scan               = ScanCb(fbScan),
          getUnchalkedHash   = UnchalkedHashCb(fbGetUnchalkedHash),
          ctArtCallback      = ChalkTimeArtifactCb(fbGetChalkTimeArtifactInfo),
-         rtArtCallback      = RunTimeArtifactCb(fbGetRunTimeArtifactInfo))
+         rtArtCallback      = RunTimeArtifactCb(fbGetRunTimeArtifactInfo),
+         sniffKinds         = {skElf})
@@ -28,11 +28,18 @@ import ".."/[
   types,
   utils/files,
   utils/gguf,
+  utils/magic,
 ]
 
 type
   GgufCache = ref object of RootRef
-    parsed: ParsedGguf
+    parsed:     ParsedGguf
+    dataOffset: int  # of the tensor data in the file on disk
+
+const
+  # slack added when a mark does not fit in the existing header so that
+  # re-marks, which are about the same size, are written in place
+  markReserve = 4096
 
 # ---------------------------------------------------------------------------
 # scan
@@ -64,12 +71,12 @@ proc ggufScan*(self: Plugin, path: string): Option[ChalkObj] {.cdecl.} =
     trace(path & ": GGUF parse failed; deferring to fallback codec")
     return none(ChalkObj)
 
-  let cache = GgufCache(parsed: parsed)
+  let cache = GgufCache(parsed: parsed, dataOffset: parsed.dataOffset())
   var dict: ChalkDict
 
   let existing = parsed.getChalkPayload()
   if existing != "":
-    if existing.find(magicUTF8) == -1:
+    if existing.findMagic() == -1:
       warn(path & ": chalk.mark KV present but missing magic; " &
            "treating as unmarked")
     else:
@@ -123,7 +130,7 @@ proc ggufHandleWrite*(self: Plugin, chalk: ChalkObj,
 
   let st =
     if enc.isSome() and enc.get().len > 0:
-      cache.parsed.setChalk(enc.get())
+      cache.parsed.setChalkPadded(enc.get(), markReserve)
     else:
       let r = cache.parsed.removeChalk()
       if r == cgNoChalk:
@@ -136,15 +143,19 @@ proc ggufHandleWrite*(self: Plugin, chalk: ChalkObj,
     chalk.opFailed = true
     return
 
-  let mutated = cache.parsed.getMutatedBytes()
-  if mutated.len == 0:
-    error(chalk.name & ": empty mutated bytes")
+  # only the metadata changes; when it kept its size this is a single
+  # write at the start of the file and tensor data is never touched
+  let header = cache.parsed.getHeaderBytes()
+  if header.len == 0:
+    error(chalk.name & ": empty mutated metadata")
     chalk.opFailed = true
     return
 
-  if not chalk.fsRef.replaceFileContents(mutated):
-    error(chalk.name & ": replaceFileContents failed")
+  if not chalk.fsRef.replaceFilePrefix(header, cache.dataOffset):
+    error(chalk.name & ": replaceFilePrefix failed")
     chalk.opFailed = true
+    return
+  cache.dataOffset = header.len
 
 # ---------------------------------------------------------------------------
 # Metadata callbacks
@@ -172,4 +183,5 @@ proc loadCodecGguf*() =
     getUnchalkedHash = UnchalkedHashCb(ggufGetUnchalkedHash),
     ctArtCallback    = ChalkTimeArtifactCb(ggufGetChalkTimeArtifactInfo),
     rtArtCallback    = RunTimeArtifactCb(ggufGetRunTimeArtifactInfo),
+    sniffKinds       = {skGguf},
   )
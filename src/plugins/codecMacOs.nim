@@ -16,6 +16,7 @@ import ".."/[
   types,
   utils/base64,
   utils/files,
+  utils/magic,
 ]
 
 let prefix = """
@@ -158,18 +159,18 @@ proc macScan*(self: Plugin, path: string): Option[ChalkObj] {.cdecl.} =
         trace("Postfix lines don't match")
         return none(ChalkObj)
 
-    let
-      s     = lines[^1]
-      sstrm = newStringStream(s)
+    let s = lines[^1]
 
-    var dict: ChalkDict
+    var
+      dict:   ChalkDict
+      endPos: int
 
-    if s.find(magicUTF8) == -1:
+    if s.findMagic() == -1:
       warn("Wrapper not valid; no chalk magic.")
       dict = ChalkDict(nil)
     else:
-      dict = sstrm.extractOneChalkJson(fullpath)
-      if sstrm.getPosition() != len(s):
+      dict = s.extractOneChalkJson(fullpath, endPos)
+      if endPos != len(s):
         trace("Wrapper not valid; extra bits after mark")
         return none(ChalkObj)
 
@@ -279,4 +280,6 @@ proc loadCodecMacOs*() =
          getUnchalkedHash   = UnchalkedHashCb(macGetUnchalkedHash),
          ctArtCallback      = ChalkTimeArtifactCb(macGetChalkTimeArtifactInfo),
          rtArtCallback      = RunTimeArtifactCb(macGetRunTimeArtifactInfo),
-         handleWrite        = HandleWriteCb(macHandleWrite))
+         handleWrite        = HandleWriteCb(macHandleWrite),
+         # the binary itself or the script wrapping a chalked one
+         sniffKinds         = {skMacho, skShebang})
@@ -35,6 +35,7 @@ import ".."/[
   utils/fd_cache,
   utils/files,
   utils/macho,
+  utils/magic,
 ]
 
 type
@@ -142,7 +143,7 @@ proc machoScan*(self: Plugin, path: string): Option[ChalkObj] {.cdecl.} =
 
   let sigKind = parsed.signatureKind()
   let existing = parsed.getChalkPayload()
-  let hasChalkNote = existing != "" and existing.find(magicUTF8) != -1
+  let hasChalkNote = existing != "" and existing.findMagic() != -1
 
   # For real-cert / malformed signatures we can't safely re-sign
   # after mutation, so we refuse handleWrite.  But if a chalk LC_NOTE
@@ -361,4 +362,5 @@ proc loadCodecMacho*() =
     getUnchalkedHash   = UnchalkedHashCb(machoGetUnchalkedHash),
     ctArtCallback      = ChalkTimeArtifactCb(machoGetChalkTimeArtifactInfo),
     rtArtCallback      = RunTimeArtifactCb(machoGetRunTimeArtifactInfo),
+    sniffKinds         = {skMacho},
   )
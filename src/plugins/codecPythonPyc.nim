@@ -13,6 +13,7 @@ import ".."/[
   run_management,
   types,
   utils/files,
+  utils/magic,
 ]
 
 proc pycScan*(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
@@ -30,9 +31,7 @@ proc pycScan*(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
     if stream == nil:
       return none(ChalkObj)
 
-    let
-      byte_blob = stream.readAll()
-      ix        = byte_blob.find(magicUTF8)
+    let ix = loc.findMagicInFile()
 
     if ix == -1:
       # No magic == no existing chalk, new chalk created
@@ -40,7 +39,7 @@ proc pycScan*(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
         name        = loc,
         fsRef       = loc,
         codec       =  self,
-        startOffset = len(byte_blob),
+        startOffset = int(getFileSize(loc)),
       )
 
     else: # Existing chalk, just reflect whats found
@@ -51,28 +50,21 @@ proc pycScan*(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
 
 proc pycHandleWrite*(self: Plugin, chalk: ChalkObj, encoded: Option[string])
                      {.cdecl.} =
-  var
-    pre:     string
-    post:    string
-    toWrite: string
+  var post: string
 
   withFileStream(chalk.fsRef, mode = fmRead, strict = true):
-    #Read up to previously set offset indicating where magic began
-    pre  = stream.readStr(chalk.startOffset)
-    #Move past
+    #Move past the previous mark, if any
     if chalk.endOffset > chalk.startOffset:
       stream.setPosition(chalk.endOffset)
-    #Read entire rest of file
+    #Read rest of file, which follows the mark
       post = stream.readAll()
 
-  #Build up a 'toWrite' string that will replace entire file
+  #Everything up to where magic began is copied from the file as-is
+  var segments = @[fileRange(0, chalk.startOffset)]
   if encoded.isSome():
-    toWrite = pre
-    toWrite &= encoded.get() & post.strip(chars = {' ', '\n'}, trailing = false)
-  else:
-    toWrite = pre
+    segments.add(fileBytes(encoded.get() & post.strip(chars = {' ', '\n'}, trailing = false)))
 
-  if not chalk.fsRef.replaceFileContents(toWrite):
+  if not chalk.fsRef.replaceFileSegments(segments):
     chalk.opFailed = true
 
 
@@ -27,13 +27,20 @@ import ".."/[
   run_management,
   types,
   utils/files,
+  utils/magic,
   utils/safetensors,
 ]
 
 type
   StCache = ref object of RootRef
     ## Per-artifact state held across scan → handleWrite calls.
-    parsed: ParsedSafetensors
+    parsed:     ParsedSafetensors
+    dataOffset: int  # of the tensor data in the file on disk
+
+const
+  # slack added when a mark does not fit in the existing header so that
+  # re-marks, which are about the same size, are written in place
+  markReserve = 4096
 
 # ---------------------------------------------------------------------------
 # scan
@@ -60,12 +67,12 @@ proc stScan*(self: Plugin, path: string): Option[ChalkObj] {.cdecl.} =
     trace(path & ": SafeTensors parse failed; deferring to fallback codec")
     return none(ChalkObj)
 
-  let cache = StCache(parsed: parsed)
+  let cache = StCache(parsed: parsed, dataOffset: parsed.dataOffset())
   var dict: ChalkDict
 
   let existing = parsed.getChalkPayload()
   if existing != "":
-    if existing.find(magicUTF8) == -1:
+    if existing.findMagic() == -1:
       warn(path & ": __metadata__.chalk present but missing magic; " &
            "treating as unmarked")
     else:
@@ -120,7 +127,7 @@ proc stHandleWrite*(self: Plugin, chalk: ChalkObj,
 
   let st =
     if enc.isSome() and enc.get().len > 0:
-      cache.parsed.setChalk(enc.get())
+      cache.parsed.setChalkPadded(enc.get(), markReserve)
     else:
       let r = cache.parsed.removeChalk()
       if r == cstNoChalk:
@@ -133,15 +140,19 @@ proc stHandleWrite*(self: Plugin, chalk: ChalkObj,
     chalk.opFailed = true
     return
 
-  let mutated = cache.parsed.getMutatedBytes()
-  if mutated.len == 0:
-    error(chalk.name & ": empty mutated bytes")
+  # only the header changes; when it kept its size this is a single
+  # write at the start of the file and tensor data is never touched
+  let header = cache.parsed.getHeaderBytes()
+  if header.len == 0:
+    error(chalk.name & ": empty mutated header")
     chalk.opFailed = true
     return
 
-  if not chalk.fsRef.replaceFileContents(mutated):
-    error(chalk.name & ": replaceFileContents failed")
+  if not chalk.fsRef.replaceFilePrefix(header, cache.dataOffset):
+    error(chalk.name & ": replaceFilePrefix failed")
     chalk.opFailed = true
+    return
+  cache.dataOffset = header.len
 
 # ---------------------------------------------------------------------------
 # Metadata callbacks
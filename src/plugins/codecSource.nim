@@ -395,4 +395,5 @@ proc loadCodecSource*() =
            ctArtCallback    = ChalkTimeArtifactCb(sourceGetChalkTimeArtifactInfo),
            rtArtCallback    = RunTimeArtifactCb(sourceGetRunTimeArtifactInfo),
            handleWrite      = HandleWriteCb(scriptWriteMark),
-           getUnchalkedHash = UnchalkedHashCb(getUnchalkedHash))
+           getUnchalkedHash = UnchalkedHashCb(getUnchalkedHash),
+           sniffKinds       = {skShebang, skText})
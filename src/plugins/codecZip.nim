@@ -7,6 +7,11 @@
 
 ## Handle JAR, WAR and other ZIP-based formats.  Works fine w/ JAR
 ## signing, because it only signs what's in the manifest.
+##
+## Re-marking copies the compressed records of every file that did not
+## change since extraction straight from the original archive and only
+## compresses the chalk mark and files touched by subscans; see
+## utils/zip.
 
 import std/[
   algorithm,
@@ -24,6 +29,7 @@ import ".."/[
   types,
   utils/exe,
   utils/files,
+  utils/zip,
 ]
 
 const zipChalkFile = "chalk.json"
@@ -36,6 +42,25 @@ type
     origD:         string
     hashD:         string
     embeddedChalk: Option[Box]
+    stamps:        Table[string, string]
+
+  # what scanning an archive found before any of it was modified
+  ZipScanned = object
+    stamp:         string
+    cache:         ZipCache
+    extract:       ChalkDict
+    marked:        bool
+    unchalkedHash: string
+
+# Archives scanned by an "extract" subscan. The base command subscan of
+# the enclosing archive goes over the same, still untouched, directory
+# right after and takes these over instead of extracting and unchalking
+# each nested archive again. Without it, every level of nesting repeated
+# all the work of the levels below it.
+var
+  scannedZips  = initTable[string, ZipScanned]()
+  # only while an extract subscan is followed by a command pass
+  rememberZips = false
 
 proc artifactType(obj: ChalkObj): string =
   let extension = obj.fsRef.splitFile().ext.toLowerAscii()
@@ -48,15 +73,16 @@ proc artifactType(obj: ChalkObj): string =
     of ".keras":        artTypeKerasModel
     else:               artTypeZip
 
+proc zipPaths(path: string): seq[string] =
+  for i in path.getAllFileNames(fileLinks = Yield):
+    result.add(i.name)
+  result.sort()
+
 proc hashZipPath(path: string): string =
   var
     sha   = initSha256()
-    paths = newSeq[string]()
+    paths = path.zipPaths()
 
-  for i in path.getAllFileNames(fileLinks = Yield):
-    paths.add(i.name)
-
-  paths.sort()
   sha.update($len(paths))
 
   for i in paths:
@@ -71,6 +97,25 @@ proc hashZipPath(path: string): string =
 
   result = sha.finalHex()
 
+proc zipStamp(path: string): string =
+  try:
+    let info = getFileInfo(path)
+    return $info.id.device & ":" & $info.id.file & ":" & $info.size & ":" &
+           $info.lastWriteTime.toUnix() & "." & $info.lastWriteTime.nanosecond
+  except:
+    return ""
+
+proc stampExtracted(cache: ZipCache) =
+  ## remember extracted files as they are in the archive
+  ## so that only files changed afterwards are recompressed
+  for dir in [cache.origD, cache.hashD]:
+    for i in dir.getAllFileNames(fileLinks = Yield):
+      cache.stamps[i.name] = i.name.zipStamp()
+
+proc isUnchanged(cache: ZipCache, path: string): bool =
+  let stamp = cache.stamps.getOrDefault(path)
+  return stamp != "" and stamp == path.zipStamp()
+
 template tryOrBail(code: untyped) =
   try:
     code
@@ -109,12 +154,55 @@ proc extractChalkMark(chalk: ChalkObj) =
     except:
       chalk.marked  = false
 
-proc subscan(chalk: ChalkObj) =
+proc rememberScannedZip(chalk: ChalkObj) =
+  if not rememberZips or not inSubscan():
+    return
+  let stamp = chalk.fsRef.zipStamp()
+  if stamp == "":
+    return
+  scannedZips[chalk.fsRef] = ZipScanned(
+    stamp:         stamp,
+    cache:         ZipCache(chalk.cache),
+    extract:       chalk.extract,
+    marked:        chalk.marked,
+    unchalkedHash: chalk.cachedUnchalkedHash,
+  )
+
+proc takeScannedZip(loc: string): Option[ZipScanned] =
+  ## scan results of the archive from the "extract" subscan, each
+  ## of which can be used once as the command modifies its contents
+  if getBaseCommandName() == "extract" or loc notin scannedZips:
+    return none(ZipScanned)
+  let scanned = scannedZips[loc]
+  scannedZips.del(loc)
+  if scanned.stamp != loc.zipStamp():
+    return none(ZipScanned)
+  return some(scanned)
+
+proc subscanCommand(chalk: ChalkObj) =
   let
     cache = ZipCache(chalk.cache)
     cmd   = getBaseCommandName()
+  if cmd != "extract":
+    let collectionCtx = runChalkSubScan(@[cache.origD], cmd, baseChalk = chalk)
+    cache.embeddedChalk = some(collectionCtx.report)
+    # the outermost pass is over, whatever it did not take is stale
+    if not inSubscan():
+      scannedZips.clear()
+
+proc subscan(chalk: ChalkObj) =
+  let cache = ZipCache(chalk.cache)
   if isSubscribedKey("EMBEDDED_CHALK"):
-    let extractCtx = runChalkSubScan(@[cache.origD], "extract")
+    # nested archives are only worth remembering when a command pass
+    # follows, i.e. unless the command itself is extract. Subscans of
+    # nested archives run as extract but keep what the outermost decided
+    let saved    = rememberZips
+    rememberZips = saved or getBaseCommandName() != "extract"
+    var extractCtx: CollectionCtx
+    try:
+      extractCtx = runChalkSubScan(@[cache.origD], "extract")
+    finally:
+      rememberZips = saved
     if extractCtx.report.kind == MkSeq:
       if len(unpack[seq[Box]](extractCtx.report)) != 0:
         if chalk.extract == nil:
@@ -122,9 +210,7 @@ proc subscan(chalk: ChalkObj) =
                "itself chalked.")
           chalk.extract = ChalkDict()
         chalk.extract.setIfNeeded("EMBEDDED_CHALK", extractCtx.report)
-  if cmd != "extract":
-    let collectionCtx = runChalkSubScan(@[cache.origD], cmd, baseChalk = chalk)
-    cache.embeddedChalk = some(collectionCtx.report)
+  chalk.subscanCommand()
 
 proc zipScan(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
   var ext = loc.splitFile().ext.strip()
@@ -143,8 +229,26 @@ proc zipScan(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
       if buf[0] != 'P' or buf[1] != 'K':
         return none(ChalkObj)
 
+  let subscans = attrGet[bool]("chalk_contained_items")
+  let scanned  = loc.takeScannedZip()
+  if scanned.isSome():
+    let
+      found = scanned.get()
+      chalk = newChalk(
+        name    = loc,
+        cache   = found.cache,
+        fsRef   = loc,
+        codec   = self,
+        extract = if found.extract == nil: ChalkDict(nil) else: found.extract.copy(),
+      )
+    trace(loc & ": reusing extraction in " & found.cache.tmpDir & " from extract subscan")
+    chalk.marked              = found.marked
+    chalk.cachedUnchalkedHash = found.unchalkedHash
+    if subscans:
+      chalk.subscanCommand()
+    return some(chalk)
+
   let
-    subscans = attrGet[bool]("chalk_contained_items")
     debug    = attrGet[bool]("chalk_debug")
     tmpDir   = getNewTempDir()
     origD    = tmpDir.joinPath("contents")
@@ -154,6 +258,7 @@ proc zipScan(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
       tmpDir: tmpDir,
       origD:  origD,
       hashD:  hashD,
+      stamps: initTable[string, string](),
     )
     chalk    = newChalk(
       name   = loc,
@@ -166,11 +271,13 @@ proc zipScan(self: Plugin, loc: string): Option[ChalkObj] {.cdecl.} =
   tryOrBail:
     extractAll(chalk.fsRef, origD)
     extractAll(chalk.fsRef, hashD)
+    cache.stampExtracted()
     chalk.extractChalkMark()
     chalk.unchalkHashD()
 
   if subscans:
     chalk.subscan()
+  chalk.rememberScannedZip()
 
   return some(chalk)
 
@@ -197,6 +304,86 @@ proc insertChalkBinaryIntoZip(chalk: ChalkObj) =
     raise newException(ValueError, "failed to add chalk binary to zip directory")
 
 
+proc rewriteZip(chalk: ChalkObj, zip: ZipDirectory, dir: string): string =
+  ## write the archive of `dir` over the original, copying records of
+  ## unchanged files and compressing the rest, and return its hash as
+  ## hashZipPath(dir) would. Falls back to recreating the archive
+  ## when the result would need zip64
+  let
+    cache = ZipCache(chalk.cache)
+    paths = dir.zipPaths()
+  var
+    sha          = initSha256()
+    kept         = initTable[string, bool]()
+    records      = initOrderedTable[string, tuple[local: string, central: string]]()
+    recompressed = 0
+
+  for entry in zip.entries:
+    kept[entry.name] = false
+
+  sha.update($len(paths))
+  for i in paths:
+    let
+      name      = i.removePrefix(dir)
+      entryName = name[1 .. ^1]
+    sha.update($(len(name)))
+    sha.update(name)
+    if entryName in kept and entryName notin [zipChalkFile, chalkBinary] and
+       cache.isUnchanged(i):
+      let stream = newFileStringStream(i)
+      sha.update($(len(stream)))
+      for c in stream.chunks(0..^1, 4096):
+        sha.update(c)
+      kept[entryName] = true
+    else:
+      let data = tryToLoadFile(i)
+      sha.update($(len(data)))
+      sha.update(data)
+      records[entryName] = newZipRecord(entryName, data,
+                                        getFilePermissions(i),
+                                        getLastModificationTime(i))
+  result       = sha.finalHex()
+  recompressed = len(records)
+
+  var
+    segments = newSeq[FileSegment]()
+    central  = ""
+    count    = 0
+    offset   = 0
+  for entry in zip.entries:
+    if entry.name in records:
+      let record = records[entry.name]
+      segments.add(fileBytes(record.local))
+      central &= ZipEntry(central: record.central).withOffset(offset)
+      offset  += len(record.local)
+      records.del(entry.name)
+    elif kept.getOrDefault(entry.name) or
+         (entry.name.endsWith("/") and dirExists(dir / entry.name)):
+      segments.add(fileRange(entry.offset, entry.recordLen))
+      central &= entry.withOffset(offset)
+      offset  += entry.recordLen
+    else:
+      continue
+    count += 1
+  # new files such as the chalk mark go after the existing ones
+  for record in records.values():
+    segments.add(fileBytes(record.local))
+    central &= ZipEntry(central: record.central).withOffset(offset)
+    offset  += len(record.local)
+    count   += 1
+
+  if not fitsZip32(count, offset + len(central)):
+    trace(chalk.fsRef & ": zip needs zip64, recreating archive")
+    createZipArchive(dir & "/", chalk.fsRef)
+    return
+  segments.add(fileBytes(central & zipEndOfCentralDirectory(count,
+                                                            len(central),
+                                                            offset,
+                                                            zip.comment)))
+  if not chalk.fsRef.replaceFileSegments(segments):
+    raise newException(IOError, "could not write zip")
+  trace(chalk.fsRef & ": rewrote zip, recompressed " & $recompressed & " files")
+
 proc doZipWrite(chalk: ChalkObj, encoded: Option[string], virtual: bool) =
   let
     cache     = ZipCache(chalk.cache)
@@ -214,11 +401,17 @@ proc doZipWrite(chalk: ChalkObj, encoded: Option[string], virtual: bool) =
     else:
       dirToUse = cache.hashD
 
-    # Create new archive by reading the directory
-    if not virtual:
+    if virtual:
+      chalk.cachedEndingHash = cache.origD.hashZipPath()
+      return
+    let zip = readZipDirectory(chalk.fsRef)
+    if zip.isSome():
+      chalk.cachedEndingHash = chalk.rewriteZip(zip.get(), dirToUse)
+    else:
+      # Create new archive by reading the directory
+      trace(chalk.fsRef & ": cannot copy zip records, recreating archive")
       createZipArchive(dirToUse & "/", chalk.fsRef)
-    # Re-read to calculate hash
-    chalk.cachedEndingHash = cache.origD.hashZipPath()
+      chalk.cachedEndingHash = dirToUse.hashZipPath()
   except:
     error(chalkFile & ": " & getCurrentExceptionMsg())
     dumpExOnDebug()
@@ -304,7 +497,8 @@ proc loadCodecZip*() =
            handleWrite   = HandleWriteCb(zipHandleWrite),
            getEndingHash = EndingHashCb(zipGetEndingHash),
            ctArtCallback = ChalkTimeArtifactCb(zipGetChalkTimeArtifactInfo),
-           rtArtCallback = RunTimeArtifactCb(zipGetRunTimeArtifactInfo))
+           rtArtCallback = RunTimeArtifactCb(zipGetRunTimeArtifactInfo),
+           sniffKinds    = {skZip})
 
   newPlugin("zippeditem",
             ctArtCallback = ChalkTimeArtifactCb(zitemGetChalkTimeArtifactInfo))
@@ -211,13 +211,30 @@ type
     align*:                  ElfIntValue[uint64]
     entrySize*:              ElfIntValue[uint64]
 
-  IntervalTable              = TableRef[uint64, ref seq[RootRef]]
+  ElfInterval                = tuple
+    start:                   uint64
+    stop:                    uint64
+    item:                    RootRef
+
+  # intervals sorted by start so intersections are found by binary search
   Intersector                = ref object of RootRef
-    starts:                  IntervalTable
-    stops:                   IntervalTable
-    keys:                    ref seq[uint64]
+    intervals:               seq[ElfInterval]
+    longest:                 uint64
     sorted:                  bool
 
+  ElfPatch                   = tuple
+    whence:                  uint64
+    value:                   string
+
+  # an edit of the file computed from the parsed headers without touching
+  # fileData: original bytes before truncate with patches applied followed
+  # by tail, which contains the chalk section data at chalkOffset
+  ElfEdit                    = ref object of RootRef
+    truncate:                uint64
+    patches:                 seq[ElfPatch]
+    tail:                    string
+    chalkOffset:             uint64
+
   ElfElement                 = ref object of RootRef
     name:                    string
 
@@ -263,34 +280,13 @@ proc showItem*(item: RootRef, prefix: string="") =
     var element = ElfElement(item)
     echo prefix & element.name
 
-proc insert(self: IntervalTable, whence: uint64, item: RootRef): bool =
-  var intervals: ref seq[RootRef]
-  result = self.hasKey(whence)
-  if result:
-    intervals = self[whence]
-  else:
-    intervals    = new seq[RootRef]
-    self[whence] = intervals
-  intervals[].add(item)
-  return result
-
 proc NewIntersector*(): Intersector =
-  return Intersector(starts: newTable[uint64, ref seq[RootRef]](),
-                     stops:  newTable[uint64, ref seq[RootRef]](),
-                     keys:   new seq[uint64],
-                     sorted: true)
+  return Intersector(sorted: true)
 
 proc insert*(self: Intersector, whence: uint64, size: uint64, item: RootRef) =
-  var starts = self.starts
-  var stops  = self.stops
-  var keys   = self.keys
-  var key    = whence
-  if not starts.insert(key, item) and not stops.hasKey(key):
-    keys[].add(key)
-  key += size
-  if not stops.insert(key, item) and not starts.hasKey(key):
-    keys[].add(key)
-  self.sorted = false
+  self.intervals.add((start: whence, stop: whence + size, item: item))
+  self.longest = max(self.longest, size)
+  self.sorted  = false
 
 proc insertString*(self: Intersector, whence: uint64, size: uint64, s: string) =
   let name = s & " 0x" & whence.toHex() & " 0x" & size.toHex()
@@ -298,68 +294,81 @@ proc insertString*(self: Intersector, whence: uint64, size: uint64, s: string) =
 
 proc sort*(self: Intersector) =
   if not self.sorted:
-    sort[uint64](self.keys[])
+    # stable so items starting at the same offset keep insertion order
+    self.intervals.sort(proc(a, b: ElfInterval): int = cmp(a.start, b.start))
     self.sorted = true
 
 proc highest*(self: Intersector): uint64 =
-  if len(self.keys[]) == 0:
-    return 0
-  self.sort()
-  return self.keys[][^1]
+  for interval in self.intervals:
+    result = max(result, interval.stop)
 
-# NOTE on room for improvement: intersection is really only used as a count
-# right now, it might make sense to add a function which returns a count
-# instead of an array
+proc cmpStart(interval: ElfInterval, whence: uint64): int =
+  return cmp(interval.start, whence)
 
 proc intersect*(self: Intersector, whence: uint64, size: uint64): seq[RootRef] =
-  var starts     = self.starts
-  var stops      = self.stops
-  var beginIndex = whence
-  var endIndex   = beginIndex + size
-  var state:       seq[RootRef]
+  ## items overlapping whence ..< whence + size in order of their offsets
   self.sort()
-  for key in self.keys[]:
-    if key >= endIndex:
-      break
-    if key <= beginIndex and stops.hasKey(key):
-      for removal in stops[key][]:
-        for index in low(state) .. high(state):
-          if state[index] == removal:
-            state.delete(index)
-            break
-    if starts.hasKey(key):
-      for addition in starts[key][]:
-        state.add(addition)
-  return state
+  let
+    stop  = whence + size
+    # nothing starting before floor is long enough to reach whence
+    floor =
+      if whence > self.longest:
+        whence - self.longest
+      else:
+        0'u64
+    first = self.intervals.lowerBound(floor, cmpStart)
+    last  = self.intervals.lowerBound(stop,  cmpStart)
+  for index in first ..< last:
+    let interval = self.intervals[index]
+    if interval.stop > whence:
+      result.add(interval.item)
 
 proc show*(self: Intersector) =
-  var starts     = self.starts
-  var stops      = self.stops
-  var depth      = 0
+  var
+    depth  = 0
+    events = newSeq[(uint64, int, int)]()
   self.sort()
-  for key in self.keys[]:
-    if stops.hasKey(key):
-      var endPoints = stops[key][]
-      for index in countdown(high(endPoints), 0):
-        var elfObject = endPoints[index]
-        showItem(elfObject, LOG_END_RANGE & align("", depth, '-'))
-        depth -= 2
-    if starts.hasKey(key):
-      for elfObject in starts[key][]:
-        depth += 2
-        showItem(elfObject, LOG_BEGIN_RANGE & align("", depth, '-'))
-
-proc addElfIntValue[T](self:       ElfFile,
-                       elfValue:   var ElfIntValue[T],
-                       addend:     T) =
-  elfValue.value += addend
-  setInt[T](self.fileData, elfValue.whence, elfValue.value)
+  # at the same offset ranges end before others begin and
+  # end in the reverse order of how they began
+  for index, interval in self.intervals:
+    events.add((interval.stop,  0, -index))
+    events.add((interval.start, 1, index))
+  events.sort()
+  for (_, kind, index) in events:
+    if kind == 0:
+      showItem(self.intervals[-index].item, LOG_END_RANGE & align("", depth, '-'))
+      depth -= 2
+    else:
+      depth += 2
+      showItem(self.intervals[index].item, LOG_BEGIN_RANGE & align("", depth, '-'))
 
-proc setElfIntValue[T](self:       ElfFile,
-                       elfValue:   var ElfIntValue[T],
+proc setElfIntValue[T](edit:       ElfEdit,
+                       elfValue:   ElfIntValue[T],
                        newValue:   T) =
-  elfValue.value = newValue
-  setInt[T](self.fileData, elfValue.whence, newValue)
+  var value = newString(sizeof(T))
+  setInt[T](value, 0, newValue)
+  edit.patches.add((whence: elfValue.whence, value: value))
+
+proc addElfIntValue[T](edit:       ElfEdit,
+                       elfValue:   ElfIntValue[T],
+                       addend:     T) =
+  edit.setElfIntValue(elfValue, elfValue.value + addend)
+
+proc overlay(data: var string, start: uint64, patches: seq[ElfPatch]) =
+  # apply patches to data read from start of the original file
+  let stop = start + uint64(len(data))
+  for (whence, value) in patches:
+    for index, c in value:
+      let at = whence + uint64(index)
+      if at >= start and at < stop:
+        data[int(at - start)] = c
+
+proc read(self: ElfFile, edit: ElfEdit, start: uint64, stop: uint64): string =
+  # original bytes in start ..< stop with the patches made so far
+  if stop <= start:
+    return ""
+  result = self.fileData[start ..< stop]
+  result.overlay(start, edit.patches)
 
 proc getValue[T](data: FileStringStream, whence: uint64): ElfIntValue[T] =
   return ElfIntValue[T](whence: whence, value: getInt[T](data, int(whence)))
@@ -614,17 +623,15 @@ proc parse*(self: ElfFile): bool =
   else:
     self.showErrors()
 
-proc setChalkSection*(self: ElfFile, name, data: string): bool =
+proc planSetChalkSection(self: ElfFile, name, data: string): ElfEdit =
   # NOTE!
   # this function should only be called from a parsed state, where there is
-  # a properly formed and named chalk section, and no insertions or
-  # modifications have been made (as of time of writing this, the range
-  # tracking isn't updated by modifications), and the order of the end of the
-  # file is: chalk section + strtab section + sh table
+  # a properly formed and named chalk section, and the order of the end of
+  # the file is: chalk section + strtab section + sh table
   let chalkHeader = self.chalkSectionHeader
   if chalkHeader == nil:
     self.errors.add(ERR_SETCHALK_MISSING_CHALK)
-    return false
+    return nil
 
   # for now just support the case of uniform length chalk section names,
   # this can be updated in the future for others but it's not needed now
@@ -632,7 +639,7 @@ proc setChalkSection*(self: ElfFile, name, data: string): bool =
   # function
   if len(chalkHeader.name) != len(name):
     self.errors.add(ERR_SETCHALK_INVALID_NAME)
-    return false
+    return nil
 
   let eof                    = uint64(len(self.fileData))
   let chalkSectionOffset     = chalkHeader.offset.value
@@ -655,15 +662,19 @@ proc setChalkSection*(self: ElfFile, name, data: string): bool =
     # marks are inserted--tl;dr this should be a rare (or never) case, and if
     # we find we need to support it we can revisit this
     self.errors.add(ERR_SETCHALK_INTERSECT)
-    return false
+    return nil
+
+  # everything from the chalk section onwards is rewritten
+  let edit = ElfEdit(truncate:    chalkSectionOffset,
+                     chalkOffset: chalkSectionOffset)
 
   # update the chalk header
   var dataLen = uint64(len(data))
-  self.setElfIntValue(chalkHeader.size, dataLen)
+  edit.setElfIntValue(chalkHeader.size, dataLen)
 
   # record the string table data at existing offset
-  var stringTableData = self.fileData[stringTableOffset ..<
-                                      stringTableOffset + stringTableSize]
+  var stringTableData = self.read(edit, stringTableOffset,
+                                  stringTableOffset + stringTableSize)
 
   # go ahead and change the chalk section name
   # IMPORTANT this relies on a check earlier in the function which compared
@@ -682,10 +693,10 @@ proc setChalkSection*(self: ElfFile, name, data: string): bool =
                               NULLBYTE)
 
   # set the string table's new offset into its header in section table
-  self.setElfIntValue(self.nameSectionHeader.offset, stringTableOffset)
+  edit.setElfIntValue(self.nameSectionHeader.offset, stringTableOffset)
 
   # collect the section table data now because we'll move it around
-  var sectionTableData = self.fileData[sectionTableOffset .. ^1]
+  var sectionTableData = self.read(edit, sectionTableOffset, eof)
 
   # calculate new section table offset
   sectionTableOffset = stringTableOffset + stringTableSize
@@ -694,15 +705,15 @@ proc setChalkSection*(self: ElfFile, name, data: string): bool =
                              uint64(len(sectionTableData)) + alignmentNeeded,
                              NULLBYTE)
   sectionTableOffset += alignmentNeeded
-  self.setElfIntValue(self.header.sectionTable, sectionTableOffset)
-  self.fileData[chalkSectionOffset] = (
+  edit.setElfIntValue(self.header.sectionTable, sectionTableOffset)
+  edit.tail = (
     data &
     stringTableData &
     sectionTableData
   )
-  return self.parse()
+  return edit
 
-proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
+proc planInsertChalkSection(self: ElfFile, name: string, data: string): ElfEdit =
   let elfHeader          = self.header
   let eof                = uint64(len(self.fileData))
   let dataLen            = uint64(len(data))
@@ -720,7 +731,7 @@ proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
     # for now we don't support this: it's in a segment and we don't know
     # what the program requirements are for "knowing" about it
     self.errors.add(ERR_SHSTRTAB_ADDRESS)
-    return false
+    return nil
 
   # We shouldn't increment the section count if it's >= SHN_LORESERVE-1,
   # because once the section count hits SHN_LORESERVE, the section count
@@ -730,7 +741,7 @@ proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
   # can be added if we begin encountering it
   if sectionCount >= SHN_LORESERVE - 1:
     self.errors.add(ERR_SECTION_COUNT_LIMIT)
-    return false
+    return nil
 
   let sectionTableIntersections = ranges.intersect(sectionTableOffset,
                                                    eof - sectionTableOffset)
@@ -761,11 +772,13 @@ proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
   var alignmentNeeded    = pad8(truncateOffset)
   var chalkSectionData   = align(data, dataLen + alignmentNeeded, NULLBYTE)
   let chalkSectionOffset = truncateOffset + alignmentNeeded
+  let edit               = ElfEdit(truncate:    truncateOffset,
+                                   chalkOffset: chalkSectionOffset)
 
   # next setup the string table string table
   # first store the original string data
-  var stringTableData    = self.fileData[stringTableOffset ..<
-                                         stringTableOffset + stringTableSize]
+  var stringTableData    = self.read(edit, stringTableOffset,
+                                     stringTableOffset + stringTableSize)
 
   # save the old string table offset, which we'll need to use a few lines down,
   # the explanation for which is given when we use it
@@ -787,15 +800,15 @@ proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
   # increment the string section size
   stringTableSize     += nameLen
   # save this data in the string header: we haven't copied any of the
-  # section table data out of the filedata buffer yet, which is important
-  # because updating it now means it will be reflected when we do copy it
-  self.setElfIntValue(stringHeader.offset, stringTableOffset)
-  self.setElfIntValue(stringHeader.size,   stringTableSize)
+  # section table data yet, which is important because updating it now
+  # means it will be reflected when we do copy it
+  edit.setElfIntValue(stringHeader.offset, stringTableOffset)
+  edit.setElfIntValue(stringHeader.size,   stringTableSize)
 
   # Now that we have made any changes to existing headers in the section table,
   # we make a copy of the data and calculate the new offset + padding
-  var sectionTableData = self.fileData[sectionTableOffset ..<
-                                       sectionTableOffset + sectionTableSize]
+  var sectionTableData = self.read(edit, sectionTableOffset,
+                                   sectionTableOffset + sectionTableSize)
 
   # Before we calculate the new offset and padding, write back the original
   # string table offset to its original location: this is to leave the original
@@ -803,7 +816,7 @@ proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
   # (vs being the last section, which is most common but not always). The reason
   # is to avoid disrupting potentially jettisoned data which remains and impacts
   # the prechalked hash
-  self.setElfIntValue(stringHeader.offset, originalStringTableOffset)
+  edit.setElfIntValue(stringHeader.offset, originalStringTableOffset)
 
   sectionTableOffset   = stringTableOffset + stringTableSize
   alignmentNeeded      = pad8(sectionTableOffset)
@@ -814,9 +827,9 @@ proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
 
   # Now it's time to fix up the ELF header itself
   # Update where the section table is
-  self.setElfIntValue(elfHeader.sectionTable, sectionTableOffset)
+  edit.setElfIntValue(elfHeader.sectionTable, sectionTableOffset)
   # Update the count of sections
-  self.addElfIntValue(elfHeader.sectionCount, 1)
+  edit.addElfIntValue(elfHeader.sectionCount, 1)
   # Determine if we are inserting the chalk section header before the string
   # section header, in which case we will need to increment the string section
   # index
@@ -825,7 +838,7 @@ proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
     # the shstrtab is the last header, so we will insert right before it
     # note that the shstrtab header might not be the last of the headers
     # even though we ensure that the shstrtab itself is the last section
-    self.addElfIntValue(elfHeader.sectionStringIndex, 1)
+    edit.addElfIntValue(elfHeader.sectionStringIndex, 1)
     insertChalkSectionHeaderBeforeStringTable = true
 
   var sectionHeader = newString(ELF64_SECTION_HEADER_SIZE)
@@ -840,34 +853,78 @@ proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
   else:
     sectionTableData &= sectionHeader
 
-  self.fileData[truncateOffset] = (
+  edit.tail = (
     chalkSectionData &
     stringTableData &
     sectionTableData
   )
-  return self.parse()
+  return edit
 
-proc insertOrSetChalkSection*(self: ElfFile, name: string, data: string): bool =
+proc planChalkSection(self: ElfFile, name: string, data: string): ElfEdit =
+  if self.nameSectionHeader == nil:
+    # parse() did not succeed
+    return nil
   if self.chalkSectionHeader == nil:
-    result = self.insertChalkSection(name, data)
+    result = self.planInsertChalkSection(name, data)
   else:
-    result = self.setChalkSection(name, data)
-  if not result:
+    result = self.planSetChalkSection(name, data)
+  if result == nil:
     self.showErrors()
 
+proc apply(self: ElfFile, edit: ElfEdit): bool =
+  # write the edit and parse the result, both to validate it before it is
+  # written out and so the parsed headers describe the edited file
+  for (whence, value) in edit.patches:
+    for index, c in value:
+      let at = int(whence) + index
+      if at < int(edit.truncate):
+        self.fileData[at] = c
+  self.fileData[edit.truncate] = edit.tail
+  return self.parse()
+
+proc hashUnchalked(self: ElfFile, edit: ElfEdit): string =
+  # sha256 of the file as edited, skipping the chalk section data,
+  # computed from the original bytes without modifying them
+  var hash = initSha256()
+  if edit.truncate > 0:
+    for (step, c) in self.fileData.chunkPairs(0 ..< int(edit.truncate), 65536):
+      var chunk = c
+      chunk.overlay(uint64(step.a), edit.patches)
+      hash.update(@chunk)
+  let chalkAt = int(edit.chalkOffset - edit.truncate)
+  hash.update(@(edit.tail[0 ..< chalkAt]))
+  hash.update(@(edit.tail[chalkAt + SHA256_BYTE_LENGTH .. ^1]))
+  return hash.final()
+
+proc setChalkSection*(self: ElfFile, name, data: string): bool =
+  let edit = self.planSetChalkSection(name, data)
+  if edit == nil:
+    return false
+  return self.apply(edit)
+
+proc insertChalkSection*(self: ElfFile, name: string, data: string): bool =
+  let edit = self.planInsertChalkSection(name, data)
+  if edit == nil:
+    return false
+  return self.apply(edit)
+
+proc insertOrSetChalkSection*(self: ElfFile, name: string, data: string): bool =
+  let edit = self.planChalkSection(name, data)
+  if edit == nil:
+    return false
+  return self.apply(edit)
+
 proc unchalk*(self: ElfFile): bool =
-  if not self.insertOrSetChalkSection(SH_NAME_CHALKFREE, newString(SHA256_BYTE_LENGTH)):
+  let edit = self.planChalkSection(SH_NAME_CHALKFREE,
+                                   newString(SHA256_BYTE_LENGTH))
+  if edit == nil:
     return false
   let
-    chalkOffset = self.chalkSectionHeader.offset.value
-    suffix      = self.fileData[chalkOffset + SHA256_BYTE_LENGTH .. ^1]
-  var hash = initSha256()
-  for c in self.fileData.chunks(0 ..< chalkOffset, 4096):
-    hash.update(@c)
-  hash.update(@suffix)
-  let sha256 = hash.final()
-  self.fileData[chalkOffset] = sha256 & suffix
-  return true
+    chalkAt = int(edit.chalkOffset - edit.truncate)
+    sha256  = self.hashUnchalked(edit)
+  for index, c in sha256:
+    edit.tail[chalkAt + index] = c
+  return self.apply(edit)
 
 proc getChalkSectionData*(self: ElfFile): (string, int, int) =
   let chalkHeader = self.chalkSectionHeader
@@ -879,16 +936,13 @@ proc getChalkSectionData*(self: ElfFile): (string, int, int) =
     data  = self.fileData[start .. done]
   return (data, int(start), int(done))
 
-proc copy*(self: ElfFile): ElfFile =
-  return ElfFile(
-    fileData: self.fileData.reset(),
-  )
-
 proc getUnchalkedHash*(self: ElfFile): string =
-  let copy = self.copy()
-  if copy.parse() and copy.unchalk():
-    let (data, _, _) = copy.getChalkSectionData()
-    return data.hex()
+  ## hash unchalk() would write into the chalk section, computed
+  ## from the parsed file without copying or modifying it
+  let edit = self.planChalkSection(SH_NAME_CHALKFREE,
+                                   newString(SHA256_BYTE_LENGTH))
+  if edit != nil:
+    return self.hashUnchalked(edit).hex()
   # there was an error parsing or unchalking elf
   # so we compute hash of the raw file
   return self.fileData.reset().sha256Hex()
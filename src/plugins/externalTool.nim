@@ -7,11 +7,16 @@
 
 ## This plugin uses information from the config file to set metadata
 ## keys.
+##
+## Tools which do not depend on each other run at the same time (see
+## `tool_parallelism`) and their results are shared with other chalk
+## runs via utils/tool_cache.
 
 import std/[
   algorithm,
+  os,
   sequtils,
-  uri,
+  tempfiles,
 ]
 import ".."/[
   chalkjson,
@@ -19,10 +24,10 @@ import ".."/[
   plugin_api,
   run_management,
   types,
-  utils/envvars,
-  utils/files,
   utils/sets,
+  utils/subproc,
   utils/times,
+  utils/tool_cache,
 ]
 import "."/[
   vctlGit,
@@ -41,13 +46,9 @@ proc ensureRunCallback[T](cb: CallbackObj, args: seq[Box]): T =
     raise newException(ValueError, "missing implementation of " & $(cb))
   return unpack[T](value.get())
 
-proc runTool*(tool: string, path: string, force = false): ChalkDict =
-  let key = tool & ":" & path
-  if not force and key in alreadyRan:
-    raise newException(AlreadyRanError, "")
-
-  trace("Running tool: " & tool & " - " & path)
-  result = ChalkDict()
+proc getToolCommand(tool: string, path: string): string =
+  ## command line to run the tool over the path,
+  ## or empty string if the tool is not available
   let args = @[pack(path)]
   let base = "tool." & tool
   var exe  = ensureRunCallback[string](attrGet[CallbackObj](base & ".get_tool_location"), args)
@@ -56,21 +57,20 @@ proc runTool*(tool: string, path: string, force = false): ChalkDict =
     let installed = ensureRunCallback[bool](attrGet[CallbackObj](base & ".attempt_install"), args)
     if not installed:
       trace(tool & ": could not be installed. skipping")
-      return
+      return ""
     exe = ensureRunCallback[string](attrGet[CallbackObj](base & ".get_tool_location"), args)
 
   if exe == "":
     trace(tool & ": could not be found. skipping")
-    return
+    return ""
 
-  let
-    argv = ensureRunCallback[string](attrGet[CallbackObj](base & ".get_command_args"), args)
-    cmd  = exe & " " & argv.strip()
-  trace(cmd)
-  let
-    outs = unpack[seq[Box]](c4mSystem(@[pack(cmd)]).get())
+  let argv = ensureRunCallback[string](attrGet[CallbackObj](base & ".get_command_args"), args)
+  return exe & " " & argv.strip()
 
-  let d = ensureRunCallback[ChalkDict](attrGet[CallbackObj](base & ".produce_keys"), outs)
+proc produceToolKeys(tool: string, outs: seq[Box]): ChalkDict =
+  ## keys from the output and exit code of the tool
+  result = ChalkDict()
+  let d = ensureRunCallback[ChalkDict](attrGet[CallbackObj]("tool." & tool & ".produce_keys"), outs)
   if len(d) == 0:
     trace(tool & ": produced no keys. skipping")
     return
@@ -85,51 +85,226 @@ proc runTool*(tool: string, path: string, force = false): ChalkDict =
     d.del("info")
 
   trace(tool & ": produced keys " & $(d.keys().toSeq()))
-  alreadyRan.incl(key)
   return d
 
-proc runOneTool(tool: string, path: string): ChalkDict =
-  # cache external tool results in GitHub Actions to avoid redundant executions
-  # within the same workflow job. This optimization only works on GitHub runners
-  # because they provide a job-specific RUNNER_TEMP directory that persists for
-  # the entire job but is cleaned up afterwards. This ensures cached data doesn't
-  # persist across jobs where repository content may have changed.
-  # See: https://docs.github.com/en/actions/reference/workflows-and-actions/variables
+proc loadCachedToolResult(tool: string, key: string, path: string): Option[ChalkDict] =
+  let cached = getCachedToolResult(key)
+  if cached.isNone():
+    return none(ChalkDict)
+  try:
+    result = some(cached.get().extractOneChalkJson(path))
+    trace(tool & ": using cached output for " & path)
+  except:
+    trace(tool & ": ignoring unreadable cached output: " & getCurrentExceptionMsg())
+    return none(ChalkDict)
+
+# Tools for a path run as chains. A chain runs its tools one after
+# another and is used for tools of a kind where one of them has
+# stop_on_success; every other tool is a chain of its own. Chains run
+# concurrently, at most tool_parallelism tool processes at a time.
+# Everything except the tool processes themselves (con4m callbacks,
+# tool cache) runs on the main thread as output is collected.
+
+type
+  ToolRun = ref object
+    tool:    string
+    cmd:     string
+    key:     string
+    lock:    cint
+    waitEnd: Time
+    waiting: bool
+    killAt:  Option[MonoTime]
+    shell:   ShellCmd
+    spool:   File
+    spoolAt: string
+    start:   MonoTime
+
+  ToolChain = ref object
+    tools:   seq[string]
+    force:   bool
+    next:    int
+    run:     ToolRun
+    done:    bool
+    results: seq[(string, ChalkDict, int64)]
+
+proc toolTimeout(tool: string): Duration =
+  # Duration is stored as microseconds in con4m
+  return initDuration(microseconds = int(attrGet[Con4mDuration]("tool." & tool & ".timeout")))
+
+proc toolMaxOutputSize(tool: string): int =
+  return int(attrGet[Con4mSize]("tool." & tool & ".max_output_size"))
+
+proc removeSpool(run: ToolRun) =
+  if run.spool != nil:
+    run.spool.close()
+    run.spool = nil
+    discard tryRemoveFile(run.spoolAt)
+
+proc finishTool(chain: ToolChain, data: ChalkDict) =
+  let run = chain.run
+  run.removeSpool()
+  unlockToolCache(run.lock)
+  chain.run = nil
+  chain.results.add((run.tool, data, (getMonoTime() - run.start).inMilliseconds()))
+  if attrGet[bool]("tool." & run.tool & ".stop_on_success"):
+    chain.done = true
+
+proc failTool(chain: ToolChain, msg: string) =
+  error(chain.run.tool & ": " & msg)
+  chain.run.removeSpool()
+  unlockToolCache(chain.run.lock)
+  chain.run = nil
+
+proc finishFromCache(chain: ToolChain, path: string): bool =
+  let cached = loadCachedToolResult(chain.run.tool, chain.run.key, path)
+  if cached.isNone():
+    return false
+  alreadyRan.incl(chain.run.tool & ":" & path)
+  chain.finishTool(cached.get())
+  return true
+
+proc launchTool(chain: ToolChain) =
+  let
+    run    = chain.run
+    budget = run.tool.toolTimeout()
+  trace(run.cmd)
+  try:
+    # output goes to disk so that memory does not grow with it
+    let (spool, spoolAt) = createTempFile("chalk-" & run.tool & "-", ".out")
+    run.spool   = spool
+    run.spoolAt = spoolAt
+    run.shell = startShellCmd(run.cmd, spool = run.spool)
+  except:
+    chain.failTool(getCurrentExceptionMsg())
+    return
+  if budget > DurationZero:
+    run.killAt = some(getMonoTime() + budget)
+
+proc tryLaunchTool(chain: ToolChain, path: string) =
+  ## launch the tool unless another chalk process is producing its output
+  let run = chain.run
+  if run.lock >= 0:
+    if not tryLockToolCache(run.lock):
+      if getTime() < run.waitEnd:
+        if not run.waiting:
+          trace(run.tool & ": waiting for another chalk to produce its output")
+          run.waiting = true
+        return
+      trace(run.tool & ": timed out waiting for another chalk to produce its output")
+      unlockToolCache(run.lock)
+      run.lock = -1
+    # another chalk might have produced it before we took the lock
+    elif chain.finishFromCache(path):
+      return
+  chain.launchTool()
+
+proc startNextTool(chain: ToolChain, path: string, canLaunch: bool) =
+  ## advance the chain until a tool is running or waiting,
+  ## either for a free slot or for another chalk process
+  while not chain.done:
+    if chain.run == nil:
+      if chain.next >= len(chain.tools):
+        chain.done = true
+        return
+      let tool = chain.tools[chain.next]
+      chain.next += 1
+      if not chain.force and tool & ":" & path in alreadyRan:
+        trace(tool & ": already ran for " & path & ". skipping")
+        continue
+      trace("Running tool: " & tool & " - " & path)
+      chain.run = ToolRun(tool: tool, lock: -1, start: getMonoTime())
+      try:
+        chain.run.cmd = getToolCommand(tool, path)
+        if chain.run.cmd == "":
+          chain.finishTool(ChalkDict())
+          continue
+        chain.run.key = getToolCacheKey(tool, chain.run.cmd, path)
+        if chain.finishFromCache(path):
+          continue
+        chain.run.lock    = openToolCacheLock(chain.run.key)
+        chain.run.waitEnd = getTime() + toolCacheLockTimeout()
+      except:
+        chain.failTool(getCurrentExceptionMsg())
+        continue
+    if chain.run.shell != nil or not canLaunch:
+      return
+    chain.tryLaunchTool(path)
+    if chain.run != nil:
+      return
+
+proc collectTool(chain: ToolChain, path: string) =
   let
-    CI          = getEnv("CI")
-    RUNNER_TEMP = getEnv("RUNNER_TEMP")
-    key         = tool & "-" & path.encodeUrl()
-    tmp         = RUNNER_TEMP.joinPath(key)
+    run     = chain.run
+    maxSize = run.tool.toolMaxOutputSize()
+  try:
+    if run.shell.error != "":
+      raise newException(IOError, run.shell.error)
+    if maxSize > 0 and run.shell.outputLen > maxSize:
+      let kept = keepToolOutput(run.tool, run.spoolAt)
+      warn(run.tool & ": output of " & $run.shell.outputLen & " bytes exceeds " &
+           "max_output_size of " & $maxSize & " bytes and is not added to the report. " &
+           (if kept != "": "It is kept in " & kept else: "Enable tool_cache_max_size to keep it"))
+      chain.finishTool(ChalkDict())
+      return
+    run.spool.close()
+    run.spool = nil
+    let output = tryToLoadFile(run.spoolAt)
+    discard tryRemoveFile(run.spoolAt)
+    let data = produceToolKeys(run.tool, @[pack(output), pack(run.shell.exitCode)])
+    if len(data) > 0:
+      alreadyRan.incl(run.tool & ":" & path)
+      setCachedToolResult(run.key, data.toJson())
+    chain.finishTool(data)
+  except:
+    chain.failTool(getCurrentExceptionMsg())
 
-  result = ChalkDict()
-  if CI == "" or RUNNER_TEMP == "":
-    return runTool(tool, path)
-  else:
-    try:
-      trace(tool & ": acquiring exlusive tmp file " & tmp)
-      discard acquireExclusiveFile(tmp)
-      result = runTool(tool, path)
-      discard tryToWriteFile(tmp, result.toJson())
-    except AlreadyExists:
-      # another build already ran external tool
-      let content = tryToLoadFile(tmp)
-      if content == "":
-        warn(
-          tool & ": exlusive tmp file is empty. " &
-          "Possible due to race condition as another " &
-          "parallel chalk process didnt write it yet"
-        )
-        raise newException(AlreadyRanError, "")
-      else:
-        try:
-          trace(tool & ": reading cached output from exlusive tmp file " & tmp)
-          result = content.extractOneChalkJson(tmp)
-        except:
-          error(tool & ": could not parse output from exclusive tmp file due to: " & getCurrentExceptionMsg())
-          raise newException(AlreadyRanError, "")
-    except:
-      error(tool & ": could not aquire exclusive tmp file due to " & getCurrentExceptionMsg())
-      return runTool(tool, path)
+proc runToolChains(chains: seq[ToolChain], path: string) =
+  let parallelism = max(1, attrGet[int]("tool_parallelism"))
+  while true:
+    var running: seq[ToolChain]
+    for chain in chains:
+      if chain.run != nil and chain.run.shell != nil:
+        running.add(chain)
+    var pending = false
+    for chain in chains:
+      if chain.done or (chain.run != nil and chain.run.shell != nil):
+        continue
+      chain.startNextTool(path, canLaunch = len(running) < parallelism)
+      if chain.run != nil and chain.run.shell != nil:
+        running.add(chain)
+      elif not chain.done:
+        pending = true
+    if len(running) == 0:
+      if not pending:
+        return
+      # only waiting on other chalk processes
+      sleep(200)
+      continue
+
+    let now = getMonoTime()
+    for chain in running:
+      let run = chain.run
+      if run.killAt.isSome() and now >= run.killAt.get():
+        error(run.tool & ": exceeded its timeout of " & $run.tool.toolTimeout() & ". killing it")
+        run.shell.killShellCmd()
+        run.killAt = none(MonoTime)
+    var shells: seq[ShellCmd]
+    for chain in running:
+      shells.add(chain.run.shell)
+    let finished = waitShellCmds(shells, 200)
+    for chain in running:
+      if chain.run.shell in finished:
+        trace(chain.run.tool & ": exited with " & $chain.run.shell.exitCode)
+        chain.collectTool(path)
+
+proc runTool*(tool: string, path: string, force = false): ChalkDict =
+  if not force and tool & ":" & path in alreadyRan:
+    raise newException(AlreadyRanError, "")
+  let chain = ToolChain(tools: @[tool], force: force)
+  @[chain].runToolChains(path)
+  for (_, data, _) in chain.results:
+    return data
+  return ChalkDict()
 
 proc toolBase(path: string): ChalkDict =
   let resolved = path.resolvePath()
@@ -161,30 +336,32 @@ proc toolBase(path: string): ChalkDict =
     else:
       toolInfo[kind].add(tool)
 
+  var chains: seq[ToolChain]
   for k, v in toolInfo:
-    for (ignore, tool) in v.sorted():
-      try:
-        withDuration():
-          let data = tool.runOneTool(resolved)
-        # merge multiple tools into a single structure
-        # for example first tool returns:
-        # { SBOM: { foo: {...} } }
-        # and second tool returns:
-        # { SBOM: { bar: {...} } }
-        # merged structure should be:
-        # { SBOM: { foo: {...}, bar: {...} } }
-        result.merge(data.nestWith(tool))
-        let timing = ChalkDict()
-        timing["EXTERNAL_TOOL_DURATION"] = pack(duration.inMilliseconds())
-        # add duration with structure:
-        # { 'EXTERNAL_TOOL_DURATION': {'<tool>': {'<path>': duration_ms}}}
-        result.merge(timing.nestWith(resolved).nestWith(tool), deep = true)
-        if len(data) >= 0 and attrGet[bool]("tool." & tool & ".stop_on_success"):
-          break
-      except AlreadyRanError:
-        trace(tool & ": already ran for " & resolved & ". skipping")
-      except:
-        error(tool & ": " & getCurrentExceptionMsg())
+    let tools = v.sorted().mapIt(it[1])
+    if tools.anyIt(attrGet[bool]("tool." & it & ".stop_on_success")):
+      chains.add(ToolChain(tools: tools))
+    else:
+      for tool in tools:
+        chains.add(ToolChain(tools: @[tool]))
+  chains.runToolChains(resolved)
+
+  # merged in config order regardless of which tool finished first
+  for chain in chains:
+    for (tool, data, durationMs) in chain.results:
+      # merge multiple tools into a single structure
+      # for example first tool returns:
+      # { SBOM: { foo: {...} } }
+      # and second tool returns:
+      # { SBOM: { bar: {...} } }
+      # merged structure should be:
+      # { SBOM: { foo: {...}, bar: {...} } }
+      result.merge(data.nestWith(tool))
+      let timing = ChalkDict()
+      timing["EXTERNAL_TOOL_DURATION"] = pack(durationMs)
+      # add duration with structure:
+      # { 'EXTERNAL_TOOL_DURATION': {'<tool>': {'<path>': duration_ms}}}
+      result.merge(timing.nestWith(resolved).nestWith(tool), deep = true)
 
 proc getToolPath(path: string): string =
   let
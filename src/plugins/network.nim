@@ -39,12 +39,11 @@ proc getTtlIps(): Box =
         data[dest] = route
   return pack(data)
 
-proc networkGetRunTimeHostInfo*(self: Plugin,
-                                objs: seq[ChalkObj]):
-                               ChalkDict {.cdecl.} =
-  result = ChalkDict()
-  result.setIfNeeded("_NETWORK_PARTIAL_TRACEROUTE_IPS", getTtlIps())
+proc networkTtlIps(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getTtlIps()
 
 proc loadNetwork*() =
-  newPlugin("network",
-            rtHostCallback = RunTimeHostCb(networkGetRunTimeHostInfo))
+  let plugin = newPlugin("network")
+  plugin.produceKey("_NETWORK_PARTIAL_TRACEROUTE_IPS",
+                    RunTimeHostKeyCb(networkTtlIps),
+                    kcExpensive)
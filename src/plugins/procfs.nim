@@ -35,19 +35,35 @@ proc getAncestorArgvs(): seq[seq[string]] =
     if len(argv) > 0:
       result.add(argv)
 
-proc procfsGetRunTimeHostInfo*(self: Plugin, objs: seq[ChalkObj]):
-       ChalkDict {.cdecl.} =
-  result = ChalkDict()
-  result.setIfNeeded("_OP_TCP_SOCKET_INFO", getTCPSockInfo().nimJsonToBox())
-  result.setIfNeeded("_OP_UDP_SOCKET_INFO", getUDPSockInfo().nimJsonToBox())
-  result.setIfNeeded("_OP_ARP_TABLE",       getArpTable().nimJsonToBox())
-  result.setIfNeeded("_OP_IPV4_ROUTES",     getIPv4Routes().nimJsonToBox())
-  result.setIfNeeded("_OP_IPV4_INTERFACES", getIPv4Interfaces())
-  result.setIfNeeded("_OP_IPV6_ROUTES",     getIPv6Routes().nimJsonToBox())
-  result.setIfNeeded("_OP_IPV6_INTERFACES", getIPv6Interfaces().nimJsonToBox())
-  result.setIfNeeded("_OP_ALL_PS_INFO",     getPsAllInfo().nimJsonToBox())
-  result.setIfNeeded("_OP_CPU_INFO",        getLoadInfo().nimJsonToBox())
-  result.setIfNeeded("_OP_ANCESTOR_ARGVS",  getAncestorArgvs())
+proc procfsTcpSockets(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getTCPSockInfo().nimJsonToBox()
+
+proc procfsUdpSockets(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getUDPSockInfo().nimJsonToBox()
+
+proc procfsArpTable(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getArpTable().nimJsonToBox()
+
+proc procfsIpv4Routes(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getIPv4Routes().nimJsonToBox()
+
+proc procfsIpv4Interfaces(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  pack(getIPv4Interfaces())
+
+proc procfsIpv6Routes(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getIPv6Routes().nimJsonToBox()
+
+proc procfsIpv6Interfaces(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getIPv6Interfaces().nimJsonToBox()
+
+proc procfsAllPsInfo(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getPsAllInfo().nimJsonToBox()
+
+proc procfsCpuInfo(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  getLoadInfo().nimJsonToBox()
+
+proc procfsAncestorArgvs(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  pack(getAncestorArgvs())
 
 proc procfsGetRunTimeArtifactInfo(self: Plugin, obj: ChalkObj, ins: bool):
                                  ChalkDict {.cdecl.} =
@@ -85,7 +101,16 @@ proc procfsGetRunTimeArtifactInfo(self: Plugin, obj: ChalkObj, ins: bool):
 
 proc loadProcFs*() =
   when hostOS == "linux":
-    newPlugin("procfs",
-              rtHostCallback = RunTimeHostCb(procfsGetRunTimeHostInfo),
-              rtArtCallback  = RunTimeArtifactCb(procfsGetRunTimeArtifactInfo),
-              )
+    let plugin = newPlugin("procfs",
+                           rtArtCallback = RunTimeArtifactCb(procfsGetRunTimeArtifactInfo),
+                           )
+    plugin.produceKey("_OP_CPU_INFO",        RunTimeHostKeyCb(procfsCpuInfo),        kcCheap)
+    plugin.produceKey("_OP_IPV4_INTERFACES", RunTimeHostKeyCb(procfsIpv4Interfaces), kcModerate)
+    plugin.produceKey("_OP_IPV6_INTERFACES", RunTimeHostKeyCb(procfsIpv6Interfaces), kcModerate)
+    plugin.produceKey("_OP_IPV4_ROUTES",     RunTimeHostKeyCb(procfsIpv4Routes),     kcModerate)
+    plugin.produceKey("_OP_IPV6_ROUTES",     RunTimeHostKeyCb(procfsIpv6Routes),     kcModerate)
+    plugin.produceKey("_OP_ARP_TABLE",       RunTimeHostKeyCb(procfsArpTable),       kcModerate)
+    plugin.produceKey("_OP_ANCESTOR_ARGVS",  RunTimeHostKeyCb(procfsAncestorArgvs),  kcModerate)
+    plugin.produceKey("_OP_TCP_SOCKET_INFO", RunTimeHostKeyCb(procfsTcpSockets),     kcExpensive)
+    plugin.produceKey("_OP_UDP_SOCKET_INFO", RunTimeHostKeyCb(procfsUdpSockets),     kcExpensive)
+    plugin.produceKey("_OP_ALL_PS_INFO",     RunTimeHostKeyCb(procfsAllPsInfo),      kcExpensive)
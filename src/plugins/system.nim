@@ -26,6 +26,7 @@ import ".."/[
   utils/envvars,
   utils/exec,
   utils/files,
+  utils/perf,
   utils/times,
 ]
 
@@ -328,6 +329,8 @@ proc metsysGetRunTimeHostInfo(self: Plugin, objs: seq[ChalkObj]):
   result.setIfNeeded("_OP_FAILED_KEYS", failedKeys)
   result.setIfNeeded("_CHALK_EXTERNAL_ACTION_AUDIT", externalActions)
 
+  result.setIfNeeded("_OP_PERF_TIMINGS", getPerfTimings())
+
   if isSubscribedKey("_CHALK_RUN_TIME"):
     let
       monoEndTime = getMonoTime()
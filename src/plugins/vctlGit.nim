@@ -17,6 +17,7 @@ import ".."/[
   types,
   utils/files,
   utils/git,
+  utils/git_cache,
 ]
 
 type GitInfo = ref object of RootRef
@@ -80,16 +81,37 @@ proc collectVcsData(cache: GitInfo, worktree: string): GitRepoInfo =
     refetch           = needTags and attrGet[bool]("git.refetch_lightweight_tags")
     connectTimeoutMs  = int(attrGet[Con4mDuration]("git.fetch_connect_timeout"))  div 1000
     transferTimeoutMs = int(attrGet[Con4mDuration]("git.fetch_transfer_timeout")) div 1000
+    cacheKey          = getGitCacheKey(worktree, collectTags = needTags, refetchTags = refetch)
+    cached            = getCachedGitRepoInfo(cacheKey)
+    needFresh         = needWorktree or needDiffStat or needDiffPatch
+
+  if cached.isSome() and not needFresh:
+    result = cached.get()
+    cache.collected[worktree] = result
+    return
+
+  # with cached commit/tag info only the worktree state is collected,
+  # skipping the tag walk and refetch
   result = gitCollect(
     repoRoot          = worktree,
     worktreeStatus    = needWorktree,
     diffStat          = needDiffStat,
     diffPatch         = needDiffPatch,
-    collectTags       = needTags,
-    refetchTags       = refetch,
+    collectTags       = needTags and cached.isNone(),
+    refetchTags       = refetch and cached.isNone(),
     connectTimeoutMs  = connectTimeoutMs,
     transferTimeoutMs = transferTimeoutMs,
   )
+  if cached.isSome():
+    let info = cached.get()
+    result.tag             = info.tag
+    result.tagger          = info.tagger
+    result.tagMessage      = info.tagMessage
+    result.dateTagged      = info.dateTagged
+    result.timestampTagged = info.timestampTagged
+    result.tagSigned       = info.tagSigned
+  elif result.errorCommit == "" and result.errorTag == "" and result.errorRefetch == "":
+    setCachedGitRepoInfo(cacheKey, result)
 
   if result.errorCommit != "":
     let msg = result.errorCommit
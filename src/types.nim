@@ -113,6 +113,46 @@ type
   ChalkIdCb*           = proc (a: Plugin, b: ChalkObj): string {.cdecl.}
   HandleWriteCb*       = proc (a: Plugin, b: ChalkObj, c: Option[string]) {.cdecl.}
 
+  # Per-key producers. Unlike the phase callbacks above, which return
+  # every key a plugin knows about, a producer computes exactly one key,
+  # so the collector only pays for keys that are subscribed and not
+  # already provided by a higher priority plugin.
+  ChalkTimeHostKeyCb*     = proc (a: Plugin): Box {.cdecl.}
+  ChalkTimeArtifactKeyCb* = proc (a: Plugin, b: ChalkObj): Box {.cdecl.}
+  RunTimeArtifactKeyCb*   = proc (a: Plugin, b: ChalkObj, c: bool): Box {.cdecl.}
+  RunTimeHostKeyCb*       = proc (a: Plugin, b: seq[ChalkObj]): Box {.cdecl.}
+
+  KeyCost* = enum
+    ## Rough cost of producing a key. Cheaper producers run first.
+    kcCheap     = "cheap"     ## in-memory data, env vars, etc
+    kcModerate  = "moderate"  ## a handful of small file reads (e.g. /proc/self)
+    kcExpensive = "expensive" ## full /proc sweeps, network probes, subprocesses
+
+  SniffKind* = enum
+    ## What the start of a file looks like, see utils/sniff.
+    skElf       = "elf"
+    skMacho     = "macho"
+    skZip       = "zip"
+    skGguf      = "gguf"
+    skShebang   = "shebang"
+    skText      = "text"    ## valid utf-8
+
+  KeyProducerKind* = enum
+    kpChalkTimeHost, kpChalkTimeArtifact, kpRunTimeArtifact, kpRunTimeHost
+
+  KeyProducer* = ref object
+    key*:  string
+    cost*: KeyCost
+    case kind*: KeyProducerKind
+    of kpChalkTimeHost:
+      ctHost*: ChalkTimeHostKeyCb
+    of kpChalkTimeArtifact:
+      ctArt*:  ChalkTimeArtifactKeyCb
+    of kpRunTimeArtifact:
+      rtArt*:  RunTimeArtifactKeyCb
+    of kpRunTimeHost:
+      rtHost*: RunTimeHostKeyCb
+
   Plugin* = ref object
     name*:                     string
     enabled*:                  bool
@@ -123,6 +163,7 @@ type
     getChalkTimeArtifactInfo*: ChalkTimeArtifactCb
     getRunTimeArtifactInfo*:   RunTimeArtifactCb
     getRunTimeHostInfo*:       RunTimeHostCb
+    keyProducers*:             seq[KeyProducer]
 
     # Codec-only bits
     nativeObjPlatforms*:       seq[string]
@@ -139,6 +180,9 @@ type
     # This is only used when using the default script chalking.
     commentStart*:             string
     resourceTypes*:            set[ResourceType]
+    # Files are only offered to scan/search when they sniff as one of
+    # these. Empty offers every file.
+    sniffKinds*:               set[SniffKind]
 
   GitRepoInfo* = ref object
     commitId*:           string
@@ -238,6 +282,7 @@ type
   DockerCommand* = ref object of DockerStatement
     continuationLines*: seq[int]  # line 's we continue onto.
     errors*:            seq[string]
+    lexed*:             Option[seq[LineToken]] # rawArg tokens, once lexed
 
   VarSub* = ref object
     brace*:   bool
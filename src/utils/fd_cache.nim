@@ -22,25 +22,47 @@
 ##             This should be used only in specific places where
 ##             FD needs to be explicitly closed such as when overwriting
 ##             a content of a file.
+## * pin     - keep file stream open while an artifact goes from
+##             being scanned to hashed to written even when it is not
+##             acquired in between.
 ##
 ## To fascilitate above operations, the cache is
 ## * limited to a specific size
+## * limited by the memory of stream buffers (`cache_fd_max_memory`)
 ## * it keeps track of all the users of a specific file stream
 ## * when cache reaches its limit size, it closes LRU file streams
+##   which are not used or pinned
+## * when streams are reopened after being evicted the cache doubles
+##   its size, up to half of the open files limit and at most 512
+## * hits/misses/evictions are traced at exit for tuning `cache_fd_limit`
 ##
 
 import std/[
-  enumerate,
   posix,
+  sets,
   streams,
 ]
 import pkg/[
   nimutils/file,
+  nimutils/logging,
 ]
 import "."/[
   tables,
 ]
 
+const
+  # stdio buffer of every stream. set explicitly so that cached
+  # streams can be accounted for against the memory limit. libc does
+  # not expose what it allocated so each stream counts as this much
+  fdBufferSize  = 8192
+  # select() cannot watch descriptors past FD_SETSIZE so the soft
+  # open files limit is raised at most up to it and the cache
+  # does not grow past half of it on its own
+  fdSelectLimit = 1024
+  # evicted paths remembered to count reopens. cleared past this
+  # so scans of huge trees do not keep every path around
+  fdEvictedLimit = 4096
+
 # copy of upstream shape which allows to access internal File reference
 # as otherwise its a private attribute
 type
@@ -50,15 +72,34 @@ type
 
 # ----------------------------------------------------------------------------
 
+var raisedOpenLimitFrom = 0
+
 proc getOpenLimit(): int =
+  ## soft limit of open files after raising it
+  ## towards the hard limit when possible
   var limit: RLimit
   let success = getrlimit(RLIMIT_NOFILE, limit)
   if success != 0:
     raise newException(OSError, "Could not determine open file limit")
+  # RLIM_INFINITY reads as negative
+  let target =
+    if limit.rlim_max < 0:
+      fdSelectLimit
+    else:
+      min(limit.rlim_max, fdSelectLimit)
+  if limit.rlim_cur >= 0 and limit.rlim_cur < target:
+    let soft = limit.rlim_cur
+    limit.rlim_cur = target
+    if setrlimit(RLIMIT_NOFILE, limit) == 0:
+      raisedOpenLimitFrom = soft
+    else:
+      limit.rlim_cur = soft
+  if limit.rlim_cur < 0:
+    return high(int)
   return limit.rlim_cur
 
 proc openFileStream(path: string, mode = fmRead): FileStream =
-  var stream = newFileStream(path, mode = mode)
+  var stream = newFileStream(path, mode = mode, bufSize = fdBufferSize)
   if stream == nil:
     raise newException(OSError, path & ": cannot open for FD cache")
   return stream
@@ -70,6 +111,8 @@ type FDStream = ref object
     stream:   FileStream
     mode:     FileMode
     refCount: int
+    pins:     int
+    bytes:    int # estimate of its buffer memory, see fdBufferSize
 
 proc newStream(path: string, mode = fmRead): FDStream =
   var path = path.resolvePath()
@@ -78,6 +121,7 @@ proc newStream(path: string, mode = fmRead): FDStream =
     stream:   openFileStream(path, mode = mode),
     mode:     mode,
     refCount: 0,
+    bytes:    fdBufferSize,
   )
 
 proc acquireStream(self: FDStream, seek = 0): FileStream =
@@ -97,12 +141,29 @@ proc closeStream(self: FDStream) =
 proc isUsed(self: FDStream): bool =
   return self.refCount > 0
 
+proc isPinned(self: FDStream): bool =
+  return self.pins > 0
+
 # ----------------------------------------------------------------------------
 
+type FDCacheStats = object
+    hits:      int
+    misses:    int
+    reopens:   int  # misses of streams which were evicted before
+    evictions: int
+    grown:     int
+    peakOpen:  int
+    peakBytes: int
+
 type FDCache = ref object
     size:     int
+    maxSize:  int # size grows up to this when evicted streams are reopened
+    maxBytes: int # limit of stream buffers memory, 0 for unlimited
+    bytes:    int
     byPath:   OrderedTable[string, FDStream]
     byStream: Table[FileStream, string]
+    evicted:  HashSet[string]
+    stats:    FDCacheStats
 
 proc `[]`(self: FDCache, path: string): FDStream =
   var path = path.resolvePath()
@@ -120,6 +181,9 @@ proc `[]=`(self: FDCache, path: string, stream: FDStream) =
   var path = path.resolvePath()
   self.byPath[path] = stream
   self.byStream[stream.stream] = path
+  self.bytes += stream.bytes
+  self.stats.peakOpen  = max(self.stats.peakOpen,  len(self.byPath))
+  self.stats.peakBytes = max(self.stats.peakBytes, self.bytes)
 
 proc contains(self: FDCache, path: string): bool =
   return path.resolvePath() in self.byPath
@@ -130,17 +194,30 @@ proc contains(self: FDCache, stream: FileStream): bool =
 proc del(self: FDCache, stream: FDStream) =
   self.byPath.del(stream.path)
   self.byStream.del(stream.stream)
+  self.bytes -= stream.bytes
 
 proc len(self: FDCache): int =
   return len(self.byPath)
 
-proc newFDCache(size: int): FDCache =
+proc newFDCache(size: int, maxSize = 0, maxBytes = 0): FDCache =
+  ## maxSize is the ceiling of size, also when growing, and
+  ## defaults to size
+  let maxSize = if maxSize > 0: maxSize else: size
   return FDCache(
-    size:     size,
+    size:     min(size, maxSize),
+    maxSize:  maxSize,
+    maxBytes: maxBytes,
     byPath:   initOrderedTable[string, FDStream](),
     byStream: initTable[FileStream, string](),
+    evicted:  initHashSet[string](),
   )
 
+proc capacity(self: FDCache): int =
+  ## how many streams can be open given both size and memory limits
+  result = self.size
+  if self.maxBytes > 0:
+    result = min(result, max(1, self.maxBytes div fdBufferSize))
+
 proc closeStream(self: FDCache, stream: FDStream) =
   stream.closeStream()
   self.del(stream)
@@ -155,54 +232,93 @@ proc closeFileStream(self: FDCache, path: string) =
     let stream = self[path]
     self.closeStream(stream)
 
-proc evictStream(self: FDCache, stream: FDStream) =
+proc closeUnusedStream(self: FDCache, stream: FDStream) =
   if stream.isUsed():
     raise newException(OSError, stream.path & ": is still being used and cannot be evicted from FD cache.")
   self.closeStream(stream)
 
+proc evictStream(self: FDCache, stream: FDStream) =
+  self.closeUnusedStream(stream)
+  if len(self.evicted) >= fdEvictedLimit:
+    self.evicted.clear()
+  self.evicted.incl(stream.path)
+  self.stats.evictions += 1
+
 proc maybeEvictLRUStreams(self: FDCache, n: int) =
-  let minToEvict = len(self) - self.size + 1
+  ## make room for n more streams
+  let minToEvict = len(self) - self.capacity() + n
   if minToEvict <= 0:
     return
   var toEvict: seq[FDStream] = @[]
-  for i, stream in enumerate(self.byPath.values()):
-    if i < minToEvict:
+  for stream in self.byPath.values():
+    if stream.isUsed():
+      # as we are evicting, evict everything not being used up
+      # to here to avoid lots of small evicts in favor of batch evicts
+      if len(toEvict) >= minToEvict:
+        break
+    elif not stream.isPinned():
       toEvict.add(stream)
-    else:
-      # as we are evicting, evict everything not being used
-      # to avoid lots of small evicts in favor of batch evicts
-      if not stream.isUsed():
-        toEvict.add(stream)
-      else:
+  # pins are only a hint so rather unpin than fail
+  if len(toEvict) < minToEvict:
+    for stream in self.byPath.values():
+      if len(toEvict) >= minToEvict:
         break
+      if stream.isPinned() and not stream.isUsed():
+        toEvict.add(stream)
+  if len(toEvict) < minToEvict:
+    raise newException(OSError, "FD cache is full of streams which are still being used")
   for stream in toEvict:
     self.evictStream(stream)
 
 proc limitSize(self: FDCache, size: int) =
-  self.size = size
+  self.size = min(size, self.maxSize)
   # if current size is already bigger, prune it
   self.maybeEvictLRUStreams(n = 0)
 
+proc limitMemory(self: FDCache, bytes: int) =
+  self.maxBytes = bytes
+  self.maybeEvictLRUStreams(n = 0)
+
+proc grow(self: FDCache) =
+  ## streams are being evicted only to be opened again
+  if self.size >= self.maxSize:
+    return
+  # memory is what limits the cache
+  if self.maxBytes > 0 and self.size >= self.maxBytes div fdBufferSize:
+    return
+  let old = self.size
+  self.size = min(self.maxSize, max(1, self.size * 2))
+  self.stats.grown += 1
+  trace("fd cache: reopening evicted files. growing from " & $old & " to " & $self.size)
+
 proc acquireFileStream(self:  FDCache,
                        path:  string,
                        seek   = 0,
                        mode   = fmRead,
                        strict = false,
                        ):     FileStream =
-  self.maybeEvictLRUStreams(n = 1)
+  let path = path.resolvePath()
   var stream: FDStream
 
-  if path in self and self[path].mode == mode:
-    stream = self[path]
-    # re-add to maintain LRU order
-    self.del(stream)
-
-  elif path in self:
-    # requested mode doesnt match mode in cache
-    # so close existing FD and create new one
-    self.evictStream(self[path])
+  if path in self.byPath:
+    stream = self.byPath[path]
+    if stream.mode == mode:
+      self.stats.hits += 1
+      # re-add to maintain LRU order
+      self.del(stream)
+    else:
+      # requested mode doesnt match mode in cache
+      # so close existing FD and create new one
+      self.closeUnusedStream(stream)
+      stream = nil
 
   if stream == nil:
+    self.stats.misses += 1
+    if path in self.evicted:
+      self.evicted.excl(path)
+      self.stats.reopens += 1
+      self.grow()
+    self.maybeEvictLRUStreams(n = 1)
     try:
       stream = newStream(path, mode = mode)
     except:
@@ -219,6 +335,34 @@ proc releaseFileStream(self: FDCache, fs: FileStream) =
     stream.releaseStream()
     stream.stream.setPosition(0)
 
+proc pinFileStream(self: FDCache, path: string) =
+  if path in self:
+    self[path].pins += 1
+
+proc unpinFileStream(self: FDCache, path: string) =
+  if path in self:
+    let stream = self[path]
+    stream.pins = max(0, stream.pins - 1)
+
+proc reportStats(self: FDCache) =
+  let
+    stats   = self.stats
+    lookups = stats.hits + stats.misses
+    ratio   =
+      if lookups == 0:
+        0
+      else:
+        stats.hits * 100 div lookups
+  trace("fd cache: " &
+        "hits="      & $stats.hits      & " (" & $ratio & "%) " &
+        "misses="    & $stats.misses    & " " &
+        "reopens="   & $stats.reopens   & " " &
+        "evictions=" & $stats.evictions & " " &
+        "size="      & $self.size       & "/" & $self.maxSize & " " &
+        "grown="     & $stats.grown     & " " &
+        "peak_open=" & $stats.peakOpen  & " " &
+        "peak_buffer_bytes=" & $stats.peakBytes)
+
 template withFileStream(self:   FDCache,
                         path:   string,
                         mode:   FileMode,
@@ -234,11 +378,16 @@ template withFileStream(self:   FDCache,
 
 # ----------------------------------------------------------------------------
 
+proc fdCacheLimit(openLimit: int): int =
+  ## dont use all FDs in the cache and allow other descriptors to be
+  ## opened in external libs/etc. select() users cannot watch
+  ## descriptors past FD_SETSIZE so stay under half of it as well,
+  ## even when the open files limit is much higher
+  return min(openLimit div 2, fdSelectLimit div 2)
+
 let
-  # dont use all FDs in the cache and allow other descriptors
-  # to be opened in external libs/etc
-  fdLimit = getOpenLimit() div 2
-  fdCache = newFDCache(size = fdLimit)
+  fdLimit = fdCacheLimit(getOpenLimit())
+  fdCache = newFDCache(size = fdLimit, maxSize = fdLimit)
 
 proc limitFDCacheSize*(size: int) =
   if size > fdLimit:
@@ -247,6 +396,10 @@ proc limitFDCacheSize*(size: int) =
                        " which is too large given system limit of " & $fdLimit)
   fdCache.limitSize(size)
 
+proc limitFDCacheMemory*(bytes: int) =
+  ## limit memory of buffers of cached streams, 0 for unlimited
+  fdCache.limitMemory(bytes)
+
 proc acquireFileStream*(path:  string,
                         seek   = 0,
                         strict = false,
@@ -266,6 +419,18 @@ proc closeFileStream*(fs: FileStream) =
 proc closeFileStream*(path: string) =
   fdCache.closeFileStream(path)
 
+proc pinFileStream*(path: string) =
+  ## keep the stream of path open, if it is, until unpinned
+  fdCache.pinFileStream(path)
+
+proc unpinFileStream*(path: string) =
+  fdCache.unpinFileStream(path)
+
+proc reportFDCacheStats*() =
+  if raisedOpenLimitFrom > 0:
+    trace("fd cache: raised open files limit from " & $raisedOpenLimitFrom)
+  fdCache.reportStats()
+
 template withFileStream*(path: string,
                          mode: FileMode,
                          strict: bool,
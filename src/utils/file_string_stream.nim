@@ -109,6 +109,11 @@ proc `[]=`*(self: FileStringStream, i: SomeInteger, d: string) =
     for j in toCleanUp:
       self.overrides.del(j)
 
+proc isUnmodifiedFile*(self: FileStringStream): bool =
+  ## Whether reading `path` directly yields the same bytes as the stream,
+  ## i.e. it is file backed and nothing was overridden.
+  return not self.loaded and not self.mutated and self.path != ""
+
 proc readInt*[T](self: FileStringStream, where: int): T =
   let value =
     if self.loaded:
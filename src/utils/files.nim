@@ -22,6 +22,7 @@ import ".."/[
 import "."/[
   fd_cache,
   file_string_stream,
+  perf,
   strings,
   times, # TODO remove
 ]
@@ -36,55 +37,187 @@ const
   tmpFilePrefix*      = "chalk-"
   tmpFileSuffix*      = "-file.tmp"
 
-proc replaceFileContents*(fsRef: string, contents: string): bool =
+type
+  FileSegmentKind* = enum
+    fsBytes, fsRange
+
+  FileSegment* = object
+    ## Piece of the new contents of a file for replaceFileSegments:
+    ## either literal bytes or a range of the file being replaced
+    case kind*: FileSegmentKind
+    of fsBytes:
+      data*:   string
+    of fsRange:
+      offset*: int
+      length*: int  # -1 for up to the end of the file
+
+proc fileBytes*(data: string): FileSegment =
+  return FileSegment(kind: fsBytes, data: data)
+
+proc fileRange*(offset: int, length = -1): FileSegment =
+  return FileSegment(kind: fsRange, offset: offset, length: length)
+
+when defined(linux):
+  proc copy_file_range(fdIn:  cint, offIn:  ptr int,
+                       fdOut: cint, offOut: ptr int,
+                       length: csize_t, flags: cuint): int {.importc, cdecl.}
+
+  type FileCloneRange = object
+    srcFd:      int64
+    srcOffset:  uint64
+    srcLength:  uint64
+    destOffset: uint64
+
+  const FICLONERANGE = 0x4020940D'u  # _IOW(0x94, 13, struct file_clone_range)
+
+proc writeAt(fd: cint, data: openArray[char], offset: int): bool =
+  var written = 0
+  while written < len(data):
+    let n = pwrite(fd, unsafeAddr data[written], len(data) - written,
+                   Off(offset + written))
+    if n <= 0:
+      return false
+    written += n
+  return true
+
+proc copyRange(src: cint, srcOffset: int,
+               dst: cint, dstOffset: int,
+               length: int,
+               blockSize = 0): bool =
+  ## copy bytes between files without going through userspace where
+  ## possible. on linux block aligned parts are cloned (FICLONERANGE),
+  ## which on btrfs/xfs shares the extents, and the rest is copied by
+  ## the kernel (copy_file_range). elsewhere, or when the kernel refuses
+  ## (e.g. across filesystems on old kernels), it goes through a buffer
+  var
+    srcOff = srcOffset
+    dstOff = dstOffset
+    left   = length
+  when defined(linux):
+    if blockSize > 0 and srcOff mod blockSize == 0 and dstOff mod blockSize == 0:
+      let aligned = left - left mod blockSize
+      var clone = FileCloneRange(
+        srcFd:      int64(src),
+        srcOffset:  uint64(srcOff),
+        srcLength:  uint64(aligned),
+        destOffset: uint64(dstOff),
+      )
+      if aligned > 0 and ioctl(dst, FICLONERANGE, addr clone) == 0:
+        srcOff += aligned
+        dstOff += aligned
+        left   -= aligned
+    while left > 0:
+      let n = copy_file_range(src, addr srcOff, dst, addr dstOff,
+                              csize_t(min(left, 1 shl 30)), 0)
+      if n <= 0:
+        break
+      left -= n
+  var buf = newString(min(left, 1 shl 20))
+  while left > 0:
+    let n = pread(src, addr buf[0], min(left, len(buf)), Off(srcOff))
+    if n <= 0:
+      return false
+    if not dst.writeAt(buf.toOpenArray(0, n - 1), dstOff):
+      return false
+    srcOff += n
+    dstOff += n
+    left   -= n
+  return true
+
+proc replaceFileSegments*(fsRef: string, segments: openArray[FileSegment]): bool =
+  ## Replace the file with the concatenation of `segments`, so that
+  ## unchanged parts of large files are copied by the kernel (see
+  ## copyRange) instead of being read into memory. The new file is
+  ## assembled next to the old one, keeping its mode, and renamed over
+  ## it so the file is never seen partially written.
   if fsRef == "":
-    error("replaceFileContents() called on an artifact that " &
+    error("replaceFileSegments() called on an artifact that " &
           "isn't associated with a file.")
     return false
 
   # Need to close in order to successfully replace.
   closeFileStream(fsRef)
 
-  result = true
-
   var
-    (f, path) = createTempFile(tmpFilePrefix, tmpFileSuffix)
-    oldPath   = path & ".old"
-    ctx       = newFileStream(f)
+    src  = posix.open(cstring(fsRef), O_RDONLY)
     info: Stat
-
+    path: string
   try:
-    ctx.write(contents)
+    if src >= 0 and fstat(src, info) != 0:
+      discard posix.close(src)
+      src = -1
+    # same directory so the copy can share extents and rename is atomic
+    let (f, tmp) = createTempFile(tmpFilePrefix, tmpFileSuffix, dir = fsRef.parentDir())
+    path = tmp
+    let dst = getOsFileHandle(f)
+    var
+      at = 0
+      ok = true
+    for segment in segments:
+      case segment.kind
+      of fsBytes:
+        ok = dst.writeAt(segment.data, at)
+        at += len(segment.data)
+      of fsRange:
+        if src < 0:
+          f.close()
+          raise newException(IOError, fsRef & ": " & osErrorMsg(osLastError()))
+        let length =
+          if segment.length < 0:
+            int(info.st_size) - segment.offset
+          else:
+            segment.length
+        if length < 0 or segment.offset + length > int(info.st_size):
+          f.close()
+          raise newException(IOError, fsRef & ": changed since it was scanned")
+        ok = copyRange(src, segment.offset, dst, at, length, int(info.st_blksize))
+        at += length
+      if not ok:
+        break
+    if ok and src >= 0:
+      discard fchmod(dst, info.st_mode)
+    f.close()
+    if not ok:
+      raise newException(IOError, path & ": " & osErrorMsg(osLastError()))
+    moveFile(path, fsRef)
+    return true
+  except:
+    error("file: " & getCurrentExceptionMsg())
+    if path != "":
+      discard tryRemoveFile(path)
+    dumpExOnDebug()
+    return false
   finally:
-    if ctx != nil:
-      try:
-        ctx.close()
-        # If we can successfully stat the file, we will try to
-        # re-apply the same mode bits via chmod after the move.
-        let statResult = stat(cstring(fsRef), info)
-        moveFile(fsRef, oldPath)
-        moveFile(path, fsRef)
-        if statResult == 0:
-          discard chmod(cstring(fsRef), info.st_mode)
-        try:
-          removeFile(oldPath)
-        except:
-          error(fsRef & ": could not remove old pre-wrapped backup file " & oldPath)
-      except:
-        error("file: " & getCurrentExceptionMsg())
-        removeFile(path)
-        if not fileExists(fsRef):
-          # We might have managed to move it but not copy the new guy in.
-          try:
-            moveFile(path & ".old", fsRef)
-          except:
-            error(fsRef & " was moved before copying in the new " &
-              "file, but the op failed, and the file could not be replaced. " &
-              " It currently is in: " & path & ".old")
-        else:
-            error(fsRef & ": Could not write - " & getCurrentExceptionMsg())
-        dumpExOnDebug()
-        return false
+    if src >= 0:
+      discard posix.close(src)
+
+proc replaceFileContents*(fsRef: string, contents: string): bool =
+  return fsRef.replaceFileSegments([fileBytes(contents)])
+
+proc replaceFilePrefix*(fsRef: string, prefix: string, oldPrefixLen: int): bool =
+  ## Replace the first `oldPrefixLen` bytes of the file with `prefix`,
+  ## keeping the rest, e.g. a model header in front of gigabytes of
+  ## tensors. A prefix of the same length is written in place.
+  if len(prefix) != oldPrefixLen:
+    return fsRef.replaceFileSegments([fileBytes(prefix), fileRange(oldPrefixLen)])
+
+  if fsRef == "":
+    error("replaceFilePrefix() called on an artifact that " &
+          "isn't associated with a file.")
+    return false
+
+  # Need to close in order to successfully replace.
+  closeFileStream(fsRef)
+
+  let fd = posix.open(cstring(fsRef), O_WRONLY)
+  if fd < 0:
+    error(fsRef & ": could not open for writing: " & osErrorMsg(osLastError()))
+    return false
+  let ok = fd.writeAt(prefix, 0)
+  if not ok:
+    error(fsRef & ": could not write: " & osErrorMsg(osLastError()))
+  discard posix.close(fd)
+  return ok
 
 proc canOpenFile*(path: string, mode: FileMode = FileMode.fmRead): bool =
   var canOpen = false
@@ -128,6 +261,8 @@ proc reportTmpFileExitState(files, dirs, errs: seq[string]) =
 
   # TODO move elsewhere as timing doesnt belong in tmp module
   reportTotalTime()
+  reportPerfTimings()
+  reportFDCacheStats()
 
 proc setupManagedTemp*() =
   let customTmpDirOpt = attrGetOpt[string]("default_tmp_dir")
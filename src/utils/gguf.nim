@@ -65,9 +65,17 @@ proc chalk_gguf_set_chalk(g: ChalkGgufHandle,
                           mark: cstring, markLen: csize_t): cint
   {.importc, cdecl, header: "gguf.h".}
 
+proc chalk_gguf_set_chalk_padded(g: ChalkGgufHandle,
+                                 mark: cstring, markLen: csize_t,
+                                 reserve: csize_t): cint
+  {.importc, cdecl, header: "gguf.h".}
+
 proc chalk_gguf_remove_chalk(g: ChalkGgufHandle): cint
   {.importc, cdecl, header: "gguf.h".}
 
+proc chalk_gguf_data_offset(g: ChalkGgufHandle): csize_t
+  {.importc, cdecl, header: "gguf.h".}
+
 proc chalk_gguf_get_buffer(g: ChalkGgufHandle,
                            outSize: ptr csize_t): pointer
   {.importc, cdecl, header: "gguf.h".}
@@ -135,6 +143,18 @@ proc setChalk*(self: ParsedGguf, mark: string): ChalkGgufStatus =
   result = ChalkGgufStatus(chalk_gguf_set_chalk(self.handle, mp,
                                                 mark.len.csize_t))
 
+proc setChalkPadded*(self: ParsedGguf, mark: string,
+                     reserve: int): ChalkGgufStatus =
+  ## Insert or replace `chalk.mark`, padding its value so the tensor
+  ## data keeps its offset when the mark fits and gets `reserve` bytes
+  ## of slack when it doesn't.  See dataOffset / getHeaderBytes.
+  if self == nil or self.handle == nil:
+    return cgNull
+  let mp = if mark.len == 0: cstring(nil) else: cstring(mark)
+  result = ChalkGgufStatus(chalk_gguf_set_chalk_padded(self.handle, mp,
+                                                       mark.len.csize_t,
+                                                       reserve.csize_t))
+
 proc removeChalk*(self: ParsedGguf): ChalkGgufStatus =
   ## Remove `chalk.mark` (and recompute padding).  cgNoChalk if absent.
   if self == nil or self.handle == nil:
@@ -152,6 +172,27 @@ proc getMutatedBytes*(self: ParsedGguf): string =
   result = newString(size.int)
   copyMem(addr result[0], p, size.int)
 
+proc dataOffset*(self: ParsedGguf): int =
+  ## Offset of the aligned tensor data, i.e. the length of the part of
+  ## the file a mark changes.  0 on error.
+  if self == nil or self.handle == nil:
+    return 0
+  result = chalk_gguf_data_offset(self.handle).int
+
+proc getHeaderBytes*(self: ParsedGguf): string =
+  ## The (possibly mutated) bytes before the tensor data, for writing
+  ## back without touching the tensors.  "" on error.
+  if self == nil or self.handle == nil:
+    return ""
+  var size: csize_t = 0
+  let
+    p      = chalk_gguf_get_buffer(self.handle, addr size)
+    length = self.dataOffset()
+  if p == nil or length == 0 or length > size.int:
+    return ""
+  result = newString(length)
+  copyMem(addr result[0], p, length)
+
 proc unchalkedHash*(self: ParsedGguf): string =
   ## SHA-256 hex of the canonical (chalk-removed) form.  Stable
   ## across re-marks.  "" on error.
@@ -0,0 +1,196 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Persistent cache of git collection results.
+##
+## In CI the same checkout is usually chalked by several chalk runs
+## (insert, docker build, push). Commit, branch, origin and tag info only
+## change when the repository does, so they are kept in a small json file
+## across runs, keyed by a fingerprint of the repo state:
+##
+## * worktree path
+## * HEAD and the commit it resolves to
+## * mtime and size of the index, `packed-refs`, `refs/tags` and `config`
+##
+## which is computed by reading a handful of files in the git dir without
+## opening the repo with libgit2. Worktree status and diffs depend on
+## files outside of the git dir so they are never cached.
+## Entries expire after `git.cache_ttl`.
+
+import std/[
+  os,
+  times,
+]
+import ".."/[
+  types,
+]
+import "."/[
+  json,
+]
+
+var gitCache: JsonNode
+
+proc gitCachePath(): string =
+  return attrGet[string]("git.cache_path").resolvePath()
+
+proc gitCacheTtl(): Duration =
+  # Duration is stored as microseconds in con4m
+  return initDuration(microseconds = int(attrGet[Con4mDuration]("git.cache_ttl")))
+
+proc gitDirsFor(worktree: string): tuple[gitDir: string, commonDir: string] =
+  ## git dir of the worktree and the dir with shared refs,
+  ## which differ for linked worktrees (git worktree add)
+  let dotGit = worktree / ".git"
+  var gitDir = dotGit
+  if fileExists(dotGit):
+    let data = tryToLoadFile(dotGit).strip()
+    if not data.startsWith("gitdir:"):
+      return ("", "")
+    gitDir = data["gitdir:".len .. ^1].strip()
+    if not gitDir.isAbsolute():
+      gitDir = worktree / gitDir
+  elif not dirExists(dotGit):
+    return ("", "")
+  var commonDir = gitDir
+  let common = tryToLoadFile(gitDir / "commondir").strip()
+  if common != "":
+    commonDir =
+      if common.isAbsolute():
+        common
+      else:
+        gitDir / common
+  return (gitDir.normalizedPath(), commonDir.normalizedPath())
+
+proc isOid(value: string): bool =
+  if len(value) notin [40, 64]:
+    return false
+  for c in value:
+    if c notin {'0' .. '9', 'a' .. 'f'}:
+      return false
+  return true
+
+proc resolveRef(gitDir: string, commonDir: string, name: string, depth = 0): string =
+  ## commit the ref points to, following symbolic refs,
+  ## or empty string if it cant be resolved from files
+  if depth > 5:
+    return ""
+  let
+    dir   = if name == "HEAD": gitDir else: commonDir
+    value = tryToLoadFile(dir / name).strip()
+  if value.startsWith("ref:"):
+    return resolveRef(gitDir, commonDir, value["ref:".len .. ^1].strip(), depth + 1)
+  if value.isOid():
+    return value
+  if value != "":
+    return ""
+  for line in tryToLoadFile(commonDir / "packed-refs").splitLines():
+    let parts = line.split(' ', maxsplit = 1)
+    if len(parts) == 2 and parts[1] == name and parts[0].isOid():
+      return parts[0]
+  return ""
+
+proc statPart(path: string): string =
+  try:
+    let info = getFileInfo(path)
+    return $info.lastWriteTime.toUnix() & "." & $info.lastWriteTime.nanosecond & ":" & $info.size
+  except:
+    return "-"
+
+proc getGitCacheKey*(worktree:    string,
+                     collectTags: bool,
+                     refetchTags: bool,
+                     ): string =
+  ## fingerprint of the repo state and of what is collected,
+  ## or empty string when the repo state cannot be fingerprinted
+  ## (e.g. unborn HEAD or reftable refs), which disables caching
+  if gitCacheTtl() <= DurationZero:
+    return ""
+  let (gitDir, commonDir) = worktree.gitDirsFor()
+  if gitDir == "":
+    return ""
+  let head = resolveRef(gitDir, commonDir, "HEAD")
+  if head == "":
+    return ""
+  return @[
+    worktree,
+    tryToLoadFile(gitDir / "HEAD").strip(),
+    head,
+    statPart(gitDir / "index"),
+    statPart(commonDir / "packed-refs"),
+    statPart(commonDir / "refs" / "tags"),
+    statPart(commonDir / "config"),
+    $collectTags,
+    $refetchTags,
+  ].join("\n").sha256Hex()
+
+proc loadGitCache(): JsonNode =
+  if gitCache != nil:
+    return gitCache
+  gitCache = newJObject()
+  let path = gitCachePath()
+  try:
+    let data = tryToLoadFile(path)
+    if data != "":
+      gitCache = parseJson(data).assertIs(JObject, "bad git cache")
+  except:
+    trace("git: ignoring unreadable git cache " & path & ": " & getCurrentExceptionMsg())
+  return gitCache
+
+proc saveGitCache() =
+  let
+    path = gitCachePath()
+    now  = getTime()
+    ttl  = gitCacheTtl()
+    kept = newJObject()
+  for key, entry in loadGitCache().pairs():
+    if now - fromUnix(entry{"at"}.getBiggestInt(0)) <= ttl:
+      kept[key] = entry
+  gitCache = kept
+  try:
+    createDir(path.parentDir())
+    # rename so concurrent chalk runs never see a partial file
+    let tmp = path & "." & $getCurrentProcessId() & ".tmp"
+    if not tryToWriteFile(tmp, $kept):
+      raise newException(IOError, "could not write " & tmp)
+    moveFile(tmp, path)
+  except:
+    trace("git: could not save git cache " & path & ": " & getCurrentExceptionMsg())
+
+proc getCachedGitRepoInfo*(key: string): Option[GitRepoInfo] =
+  if key == "":
+    return none(GitRepoInfo)
+  let entry = loadGitCache(){key}
+  if entry == nil or getTime() - fromUnix(entry{"at"}.getBiggestInt(0)) > gitCacheTtl():
+    return none(GitRepoInfo)
+  try:
+    result = some(entry{"info"}.to(GitRepoInfo))
+    trace("git: using cached git info for " & result.get().vcsDir)
+  except:
+    trace("git: ignoring invalid git cache entry: " & getCurrentExceptionMsg())
+    return none(GitRepoInfo)
+
+proc setCachedGitRepoInfo*(key: string, info: GitRepoInfo) =
+  ## cache commit and tag info. Worktree status and diffs are dropped
+  if key == "":
+    return
+  let stored = GitRepoInfo()
+  stored[] = info[]
+  stored.missingFiles       = @[]
+  stored.modifiedFiles      = @[]
+  stored.untrackedFiles     = @[]
+  stored.hasDiffStat        = false
+  stored.diffStatFiles      = 0
+  stored.diffStatInsertions = 0
+  stored.diffStatDeletions  = 0
+  stored.diffPatch          = ""
+  stored.errorStatus        = ""
+  stored.errorDiff          = ""
+  loadGitCache()[key] = %*{
+    "at":   getTime().toUnix(),
+    "info": %stored,
+  }
+  saveGitCache()
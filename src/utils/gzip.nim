@@ -0,0 +1,307 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Parallel gzip writer, along the lines of pigz.
+##
+## Input is cut into fixed size blocks which worker threads deflate
+## independently (each primed with the previous 32 KiB as a dictionary,
+## so the ratio stays close to a single stream). Every block but the
+## last ends with a sync flush, so the raw deflate outputs concatenate
+## into one valid stream, which is framed with a regular gzip header
+## and trailer. The output is a standard single-member .gz file.
+##
+## Blocks are written in order as soon as they are compressed, so
+## `written` tracks the compressed size without any flushing.
+
+import std/[
+  cpuinfo,
+  locks,
+  typedthreads,
+]
+
+## ---------------------------------------------------------------------------
+## zlib FFI
+
+type
+  ZStream {.importc: "z_stream", header: "<zlib.h>", bycopy.} = object
+    next_in:   ptr char
+    avail_in:  cuint
+    next_out:  ptr char
+    avail_out: cuint
+
+const
+  zOk          = 0
+  zStreamEnd   = 1
+  zSyncFlush   = 2
+  zFinish      = 4
+  zDeflated    = 8
+  zRawDeflate  = -15 ## negative window bits: no zlib/gzip framing
+  zMemLevel    = 8
+  zStrategy    = 0
+
+{.push header: "<zlib.h>".}
+proc deflateInit2(strm: ptr ZStream, level, meth, windowBits, memLevel,
+                  strategy: cint): cint {.importc: "deflateInit2".}
+proc deflate(strm: ptr ZStream, flush: cint): cint {.importc: "deflate".}
+proc deflateEnd(strm: ptr ZStream): cint {.importc: "deflateEnd".}
+proc deflateBound(strm: ptr ZStream, sourceLen: culong): culong
+                  {.importc: "deflateBound".}
+proc deflateSetDictionary(strm: ptr ZStream, dict: pointer, dictLength: cuint):
+                          cint {.importc: "deflateSetDictionary".}
+proc crc32(crc: culong, buf: pointer, len: cuint): culong {.importc: "crc32".}
+proc crc32Combine(crc1, crc2: culong, len2: clong): culong
+                  {.importc: "crc32_combine".}
+{.pop.}
+
+const
+  gzBlockSize* = 128 * 1024
+  gzDictSize   = 32 * 1024
+  gzHeader     = "\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03"
+
+type
+  GzJob = object
+    input:   ptr UncheckedArray[char]
+    inLen:   int
+    dict:    array[gzDictSize, char]
+    dictLen: int
+    last:    bool
+    output:  ptr UncheckedArray[char]
+    outLen:  int
+    crc:     culong
+    level:   cint
+    err:     cint
+    done:    bool
+    next:    ptr GzJob
+
+  GzPool = object
+    lock:      Lock
+    workCond:  Cond
+    doneCond:  Cond
+    head:      ptr GzJob
+    tail:      ptr GzJob
+    stop:      bool
+
+  ParallelGzWriter* = ref object
+    ## Only the thread that created the writer may call into it.
+    f:        File
+    level:    int
+    pool:     ptr GzPool
+    threads:  seq[Thread[ptr GzPool]]
+    inFlight: seq[ptr GzJob]   ## submitted, in output order
+    current:  ptr GzJob
+    tail:     string           ## last gzDictSize bytes of input so far
+    crc:      culong
+    inTotal:  int64
+    written*: int64            ## compressed bytes written so far
+    closed:   bool
+
+proc compress(job: ptr GzJob) =
+  var strm: ZStream
+  job.err = deflateInit2(addr strm, job.level, zDeflated, zRawDeflate,
+                         zMemLevel, zStrategy)
+  if job.err != zOk:
+    return
+  if job.dictLen > 0:
+    discard deflateSetDictionary(addr strm, addr job.dict[0], cuint(job.dictLen))
+
+  # room for the sync flush marker on top of the bound
+  var cap = int(deflateBound(addr strm, culong(job.inLen))) + 16
+  job.output = cast[ptr UncheckedArray[char]](allocShared(cap))
+  strm.next_in   = if job.inLen > 0: addr job.input[0] else: nil
+  strm.avail_in  = cuint(job.inLen)
+  strm.next_out  = addr job.output[0]
+  strm.avail_out = cuint(cap)
+
+  let flush = if job.last: zFinish else: zSyncFlush
+  while true:
+    let rc = deflate(addr strm, cint(flush))
+    if rc < 0:
+      job.err = rc
+      break
+    if job.last and rc == zStreamEnd:
+      break
+    if not job.last and strm.avail_out != 0:
+      break
+    let used = cap - int(strm.avail_out)
+    cap *= 2
+    job.output     = cast[ptr UncheckedArray[char]](reallocShared(job.output, cap))
+    strm.next_out  = addr job.output[used]
+    strm.avail_out = cuint(cap - used)
+  job.outLen = cap - int(strm.avail_out)
+  discard deflateEnd(addr strm)
+
+  job.crc = crc32(0, if job.inLen > 0: addr job.input[0] else: nil,
+                  cuint(job.inLen))
+
+proc worker(pool: ptr GzPool) {.thread.} =
+  acquire(pool.lock)
+  while true:
+    while pool.head == nil and not pool.stop:
+      wait(pool.workCond, pool.lock)
+    if pool.head == nil:
+      break
+    let job = pool.head
+    pool.head = job.next
+    if pool.head == nil:
+      pool.tail = nil
+    release(pool.lock)
+    compress(job)
+    acquire(pool.lock)
+    job.done = true
+    broadcast(pool.doneCond)
+  release(pool.lock)
+
+proc newJob(self: ParallelGzWriter): ptr GzJob =
+  result       = cast[ptr GzJob](allocShared0(sizeof(GzJob)))
+  result.input = cast[ptr UncheckedArray[char]](allocShared(gzBlockSize))
+  result.level = cint(self.level)
+  if len(self.tail) > 0:
+    result.dictLen = len(self.tail)
+    copyMem(addr result.dict[0], addr self.tail[0], len(self.tail))
+
+proc freeJob(job: ptr GzJob) =
+  deallocShared(job.input)
+  if job.output != nil:
+    deallocShared(job.output)
+  deallocShared(job)
+
+proc writeOut(self: ParallelGzWriter, data: pointer, n: int) =
+  if n > 0 and self.f.writeBuffer(data, n) != n:
+    raise newException(IOError, "gzip: short write")
+  self.written += int64(n)
+
+proc collect(self: ParallelGzWriter, keep: int) =
+  ## Writes out finished blocks in order, waiting as needed until at
+  ## most `keep` blocks are still in flight.
+  while len(self.inFlight) > 0:
+    let job = self.inFlight[0]
+    acquire(self.pool.lock)
+    while len(self.inFlight) > keep and not job.done:
+      wait(self.pool.doneCond, self.pool.lock)
+    let done = job.done
+    release(self.pool.lock)
+    if not done:
+      return
+    self.inFlight.delete(0)
+    try:
+      if job.err != zOk:
+        raise newException(IOError, "gzip: deflate failed: rc=" & $job.err)
+      self.writeOut(job.output, job.outLen)
+      self.crc = crc32Combine(self.crc, job.crc, clong(job.inLen))
+    finally:
+      freeJob(job)
+
+proc submit(self: ParallelGzWriter, last: bool) =
+  let job = self.current
+  job.last = last
+
+  # dictionary for the next block. Only the last block is ever short,
+  # and nothing follows it.
+  if not last:
+    self.tail.setLen(gzDictSize)
+    copyMem(addr self.tail[0], addr job.input[job.inLen - gzDictSize], gzDictSize)
+  self.inTotal += int64(job.inLen)
+  self.current = if last: nil else: self.newJob()
+
+  acquire(self.pool.lock)
+  if self.pool.tail == nil:
+    self.pool.head = job
+  else:
+    self.pool.tail.next = job
+  self.pool.tail = job
+  signal(self.pool.workCond)
+  release(self.pool.lock)
+  self.inFlight.add(job)
+
+  # bound memory: at most two blocks in flight per thread
+  self.collect(keep = 2 * len(self.threads))
+
+proc newParallelGzWriter*(path: string, level = 6, threads = 0): ParallelGzWriter =
+  ## `threads` <= 0 uses one thread per processor.
+  result = ParallelGzWriter(level: level)
+  if not result.f.open(path, fmWrite):
+    raise newException(IOError, "could not open " & path & " for gzip writing")
+  let n = if threads > 0: threads else: max(countProcessors(), 1)
+  result.pool = cast[ptr GzPool](allocShared0(sizeof(GzPool)))
+  initLock(result.pool.lock)
+  initCond(result.pool.workCond)
+  initCond(result.pool.doneCond)
+  result.threads = newSeq[Thread[ptr GzPool]](n)
+  for i in 0 ..< n:
+    createThread(result.threads[i], worker, result.pool)
+  result.current = result.newJob()
+  let header = gzHeader
+  result.writeOut(unsafeAddr header[0], len(header))
+
+proc write*(self: ParallelGzWriter, data: pointer, n: int) =
+  let src = cast[ptr UncheckedArray[char]](data)
+  var off = 0
+  while off < n:
+    let take = min(n - off, gzBlockSize - self.current.inLen)
+    copyMem(addr self.current.input[self.current.inLen], addr src[off], take)
+    self.current.inLen += take
+    off += take
+    if self.current.inLen == gzBlockSize:
+      self.submit(last = false)
+
+proc write*(self: ParallelGzWriter, data: string) =
+  if len(data) > 0:
+    self.write(unsafeAddr data[0], len(data))
+
+proc writeZeros*(self: ParallelGzWriter, n: int) =
+  if n > 0:
+    self.write(newString(n))
+
+proc flush*(self: ParallelGzWriter) =
+  ## Waits for every block submitted so far, so `written` is exact for
+  ## everything except the partially filled current block.
+  self.collect(keep = 0)
+
+proc shutdown(self: ParallelGzWriter) =
+  acquire(self.pool.lock)
+  self.pool.stop = true
+  broadcast(self.pool.workCond)
+  release(self.pool.lock)
+  joinThreads(self.threads)
+  for job in self.inFlight:
+    freeJob(job)
+  self.inFlight = @[]
+  if self.current != nil:
+    freeJob(self.current)
+    self.current = nil
+  deinitCond(self.pool.workCond)
+  deinitCond(self.pool.doneCond)
+  deinitLock(self.pool.lock)
+  deallocShared(self.pool)
+  self.pool = nil
+  self.f.close()
+  self.closed = true
+
+proc close*(self: ParallelGzWriter) =
+  ## Compresses the remaining input, writes the gzip trailer and stops
+  ## the worker threads.
+  if self.closed:
+    return
+  try:
+    self.submit(last = true)
+    self.collect(keep = 0)
+    var trailer: array[8, char]
+    let
+      crc   = uint32(self.crc)
+      isize = uint32(self.inTotal and 0xffffffff'i64)
+    for i in 0 .. 3:
+      trailer[i]     = char((crc shr (8 * i)) and 0xff)
+      trailer[i + 4] = char((isize shr (8 * i)) and 0xff)
+    self.writeOut(addr trailer[0], len(trailer))
+  finally:
+    self.shutdown()
+
+proc abort*(self: ParallelGzWriter) =
+  ## Stops the workers without finishing the stream, e.g. when
+  ## bailing out on an error. The output file is left incomplete.
+  if not self.closed:
+    self.shutdown()
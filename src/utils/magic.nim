@@ -0,0 +1,133 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Locating embedded chalk marks.
+##
+## Codecs that look for a mark inside arbitrary bytes (fallback ELF,
+## pyc, source files, model headers, ...) all need to find the magic
+## value and then back up to the `{` that starts the mark. The search
+## is a Boyer-Moore-Horspool scan specialized for the magic. Most bytes
+## of a binary are not in the magic's alphabet, so the scan only looks
+## at about one byte in sixteen. Files are memory mapped rather than
+## read, so ruling out a mark in a large file is bound by page-in
+## rather than by copying the file into a string.
+
+import std/[
+  memfiles,
+  os,
+]
+import ".."/[
+  types,
+]
+
+type
+  MagicSkipTable = array[char, int]
+
+proc buildSkipTable(needle: string): MagicSkipTable =
+  for c in low(char) .. high(char):
+    result[c] = len(needle)
+  for i in 0 ..< len(needle) - 1:
+    result[needle[i]] = len(needle) - 1 - i
+
+const
+  magicSkip      = buildSkipTable(magicUTF8)
+  magicLen       = len(magicUTF8)
+  magicLast      = magicUTF8[^1]
+  rawMagicKey    = "\"MAGIC"
+  # read size when a file cannot be mapped
+  magicChunkSize = 65536
+
+proc matchesAt(data: openArray[char], i: int, needle: static string): bool
+               {.inline.} =
+  for j in 0 ..< len(needle):
+    if data[i + j] != needle[j]:
+      return false
+  return true
+
+proc findMagic*(data: openArray[char], start = 0): int =
+  ## Returns the index of the first chalk magic value at or after
+  ## `start`, or -1.
+  var i = max(start, 0)
+  let last = len(data) - magicLen
+  while i <= last:
+    let c = data[i + magicLen - 1]
+    if c == magicLast and data.matchesAt(i, magicUTF8):
+      return i
+    i += magicSkip[c]
+  return -1
+
+proc findMagicInStream(path: string, start: int): int =
+  # for files which cannot be mapped; reads in chunks which overlap by
+  # less than the magic so a magic across a chunk boundary is found
+  let stream = newFileStream(path, fmRead)
+  if stream == nil:
+    raise newException(IOError, "cannot open " & path)
+  try:
+    stream.setPosition(start)
+    var carry = ""
+    while not stream.atEnd():
+      let
+        base = stream.getPosition() - len(carry)
+        data = carry & stream.readStr(magicChunkSize)
+        ix   = data.findMagic()
+      if ix != -1:
+        return base + ix
+      carry = data[max(0, len(data) - magicLen + 1) .. ^1]
+    return -1
+  finally:
+    stream.close()
+
+proc findMagicInFile*(path: string, start = 0): int =
+  ## Same as findMagic(), but over a memory mapping of `path`. Files
+  ## which cannot be mapped are read instead. Errors reading the file
+  ## are raised, as -1 would make codecs add a second mark.
+  let start = max(start, 0)
+  if getFileSize(path) < magicLen:
+    return -1
+  var mapped: MemFile
+  try:
+    mapped = memfiles.open(path, mode = fmRead)
+  except:
+    trace(path & ": cannot map file, reading it instead: " & getCurrentExceptionMsg())
+    return path.findMagicInStream(start)
+  try:
+    let data = cast[ptr UncheckedArray[char]](mapped.mem)
+    return data.toOpenArray(0, mapped.size - 1).findMagic(start)
+  finally:
+    mapped.close()
+
+proc findJsonStart*(data: openArray[char], magicIx: int): int =
+  ## Given the index of the magic value, returns the index of the `{`
+  ## that starts the mark, or -1 if the magic is not embedded in the
+  ## expected `{ "MAGIC" : "` prefix. Buffer counterpart of
+  ## findJsonStart() in chalkjson, which does the same over a stream.
+  var pos = magicIx - 1
+  if pos < 8 or data[pos] != '"':
+    return -1
+  pos -= 1
+  while data[pos] == ' ':
+    pos -= 1
+    if pos < 7:
+      return -1
+  if data[pos] != ':':
+    return -1
+  pos -= 1
+  while data[pos] == ' ':
+    pos -= 1
+    if pos < 6:
+      return -1
+  if data[pos] != '"':
+    return -1
+  pos -= len(rawMagicKey)
+  if pos < 0 or not data.matchesAt(pos, rawMagicKey):
+    return -1
+  pos -= 1
+  while pos >= 0 and data[pos] == ' ':
+    pos -= 1
+  if pos < 0 or data[pos] != '{':
+    return -1
+  return pos
@@ -0,0 +1,129 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Lightweight monotonic timings of chalk internals (plugin callbacks,
+## codec scans/hashes, sink publishes, docker phases).
+##
+## Timings are always recorded as the overhead is a couple of
+## clock_gettime() calls per measured block. They are reported via the
+## `_OP_PERF_TIMINGS` host key and dumped on exit with `--profile`.
+## Blocks can be measured from worker threads too as all access to the
+## timings is serialized by a lock.
+
+import std/[
+  algorithm,
+  locks,
+  strutils,
+]
+import pkg/[
+  nimutils,
+]
+import ".."/[
+  con4mwrap,
+]
+import "."/[
+  chalkdict,
+  tables,
+  times,
+]
+
+type
+  PerfTiming* = ref object
+    count*: int
+    total*: Duration
+    max*:   Duration
+
+var
+  perfTimings = initOrderedTable[string, OrderedTableRef[string, PerfTiming]]()
+  perfLock:     Lock
+
+initLock(perfLock)
+
+template withPerfLock(c: untyped) =
+  {.cast(gcsafe).}:
+    acquire(perfLock)
+    try:
+      c
+    finally:
+      release(perfLock)
+
+proc recordPerfTiming*(category: string, name: string, duration: Duration) =
+  withPerfLock:
+    if category notin perfTimings:
+      perfTimings[category] = newOrderedTable[string, PerfTiming]()
+    let byName = perfTimings[category]
+    if name notin byName:
+      byName[name] = PerfTiming()
+    let timing = byName[name]
+    timing.count += 1
+    timing.total += duration
+    if duration > timing.max:
+      timing.max = duration
+
+template withPerfTiming*(category: string, name: string, c: untyped) =
+  let perfStart = getMonoTime()
+  try:
+    c
+  finally:
+    recordPerfTiming(category, name, getMonoTime() - perfStart)
+
+proc getPerfTiming*(category: string, name: string): PerfTiming =
+  ## copy of the timing, or nil when it was never recorded
+  withPerfLock:
+    if category notin perfTimings:
+      return nil
+    let timing = perfTimings[category].getOrDefault(name, nil)
+    if timing == nil:
+      return nil
+    return PerfTiming(count: timing.count, total: timing.total, max: timing.max)
+
+proc clearPerfTimings*() =
+  withPerfLock:
+    perfTimings.clear()
+
+proc getPerfTimings*(): ChalkDict =
+  ## category -> name -> {count, total_us, max_us}
+  result = ChalkDict()
+  withPerfLock:
+    for category, byName in perfTimings:
+      let names = ChalkDict()
+      for name, timing in byName:
+        let entry = ChalkDict()
+        entry["count"]    = pack(timing.count)
+        entry["total_us"] = pack(timing.total.inMicroseconds())
+        entry["max_us"]   = pack(timing.max.inMicroseconds())
+        names[name] = pack(entry)
+      result[category] = pack(names)
+
+proc formatMs(d: Duration): string =
+  formatFloat(d.inMicroseconds().float / 1000, ffDecimal, 3) & "ms"
+
+proc reportPerfTimings*() =
+  if not attrGet[bool]("report_profile"):
+    return
+  var rows: seq[(Duration, string, string, PerfTiming)]
+  withPerfLock:
+    for category, byName in perfTimings:
+      for name, timing in byName:
+        rows.add((timing.total, category, name, PerfTiming(
+          count: timing.count,
+          total: timing.total,
+          max:   timing.max,
+        )))
+  rows.sort(proc (a, b: (Duration, string, string, PerfTiming)): int =
+    cmp(b[0], a[0]))
+  stderr.writeLine("chalk profile (slowest first):")
+  stderr.writeLine(
+    "  " & "category".alignLeft(8) & " " & "name".alignLeft(48) & " " &
+    "count".align(7) & " " & "total".align(14) & " " & "max".align(14)
+  )
+  for (_, category, name, timing) in rows:
+    stderr.writeLine(
+      "  " & category.alignLeft(8) & " " & name.alignLeft(48) & " " &
+      ($timing.count).align(7) & " " & timing.total.formatMs().align(14) & " " &
+      timing.max.formatMs().align(14)
+    )
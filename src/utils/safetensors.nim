@@ -73,9 +73,17 @@ proc chalk_st_set_chalk(st: ChalkStHandle,
                         mark: cstring, markLen: csize_t): cint
   {.importc, cdecl, header: "safetensors.h".}
 
+proc chalk_st_set_chalk_padded(st: ChalkStHandle,
+                               mark: cstring, markLen: csize_t,
+                               reserve: csize_t): cint
+  {.importc, cdecl, header: "safetensors.h".}
+
 proc chalk_st_remove_chalk(st: ChalkStHandle): cint
   {.importc, cdecl, header: "safetensors.h".}
 
+proc chalk_st_data_offset(st: ChalkStHandle): csize_t
+  {.importc, cdecl, header: "safetensors.h".}
+
 proc chalk_st_get_buffer(st: ChalkStHandle,
                          outSize: ptr csize_t): pointer
   {.importc, cdecl, header: "safetensors.h".}
@@ -153,6 +161,18 @@ proc setChalk*(self: ParsedSafetensors, mark: string): ChalkStStatus =
   result = ChalkStStatus(chalk_st_set_chalk(self.handle, mp,
                                             mark.len.csize_t))
 
+proc setChalkPadded*(self: ParsedSafetensors, mark: string,
+                     reserve: int): ChalkStStatus =
+  ## Insert or replace the chalk mark, padding the header so that it
+  ## keeps its size when the mark fits and grows by `reserve` bytes of
+  ## slack when it doesn't.  See dataOffset / getHeaderBytes.
+  if self == nil or self.handle == nil:
+    return cstNull
+  let mp = if mark.len == 0: cstring(nil) else: cstring(mark)
+  result = ChalkStStatus(chalk_st_set_chalk_padded(self.handle, mp,
+                                                   mark.len.csize_t,
+                                                   reserve.csize_t))
+
 proc removeChalk*(self: ParsedSafetensors): ChalkStStatus =
   ## Remove the chalk mark.  cstNoChalk if there is no mark to remove.
   if self == nil or self.handle == nil:
@@ -171,6 +191,27 @@ proc getMutatedBytes*(self: ParsedSafetensors): string =
   result = newString(size.int)
   copyMem(addr result[0], p, size.int)
 
+proc dataOffset*(self: ParsedSafetensors): int =
+  ## Offset of the tensor data, i.e. the length of the part of the
+  ## file a mark changes.  0 on error.
+  if self == nil or self.handle == nil:
+    return 0
+  result = chalk_st_data_offset(self.handle).int
+
+proc getHeaderBytes*(self: ParsedSafetensors): string =
+  ## The (possibly mutated) bytes before the tensor data, for writing
+  ## back without touching the tensors.  "" on error.
+  if self == nil or self.handle == nil:
+    return ""
+  var size: csize_t = 0
+  let
+    p      = chalk_st_get_buffer(self.handle, addr size)
+    length = self.dataOffset()
+  if p == nil or length == 0 or length > size.int:
+    return ""
+  result = newString(length)
+  copyMem(addr result[0], p, length)
+
 proc unchalkedHash*(self: ParsedSafetensors): string =
   ## SHA-256 hex of the canonical (chalk-pair-removed) form.  Stable
   ## across re-marks.  "" on error.
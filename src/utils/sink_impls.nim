@@ -49,6 +49,7 @@ import "."/[
   dns,
   http,
   json,
+  perf,
   substitutions,
 ]
 
@@ -340,41 +341,42 @@ proc s3SinkInit(cfg: SinkConfig): bool =
     return false
 
 proc s3SinkOut(msg: string, cfg: SinkConfig, t: Topic, ignored: StringTable) =
-  var
-    state  = S3SinkState(cfg.private)
-    client = if state.endpoint != "":
-               newS3Client((state.uid, state.secret, state.token),
-                           state.region, state.endpoint)
-             else:
-               newS3Client((state.uid, state.secret, state.token),
-                           state.region)
+  withPerfTiming("sink", cfg.name):
+    var
+      state  = S3SinkState(cfg.private)
+      client = if state.endpoint != "":
+                 newS3Client((state.uid, state.secret, state.token),
+                             state.region, state.endpoint)
+               else:
+                 newS3Client((state.uid, state.secret, state.token),
+                             state.region)
 
-  cfg.iolog(t, "Open")
+    cfg.iolog(t, "Open")
 
-  let
-      ts           = $(unixTimeInMS())
-      randVal      = base32vEncode(secureRand[array[16, char]]())
-  var
-      objParts: seq[string] = @[ts, randVal]
+    let
+        ts           = $(unixTimeInMS())
+        randVal      = base32vEncode(secureRand[array[16, char]]())
+    var
+        objParts: seq[string] = @[ts, randVal]
 
-  if state.extra != "": objParts.add(state.extra)
+    if state.extra != "": objParts.add(state.extra)
 
-  objParts.add(state.nameBase)
+    objParts.add(state.nameBase)
 
-  let
-    newTail = objParts.join("-")
-    rawPath = joinPath(state.objPath, newTail)
-    newPath = if rawPath.startsWith("/"): rawPath else: "/" & rawPath
-  try:
-    let response = client.put_object(state.bucket, newPath, msg)
-    resetSinkFailures(cfg)
-    cfg.iolog(t, "Post to: " & newPath & "; response = " & response.status)
-  except HttpStatusError as e:
-    dumpExOnDebug()
-    onSinkError(cfg, e, hard = isHardHttpError(e))
-  except:
-    dumpExOnDebug()
-    onSinkError(cfg, getCurrentException(), hard = false)
+    let
+      newTail = objParts.join("-")
+      rawPath = joinPath(state.objPath, newTail)
+      newPath = if rawPath.startsWith("/"): rawPath else: "/" & rawPath
+    try:
+      let response = client.put_object(state.bucket, newPath, msg)
+      resetSinkFailures(cfg)
+      cfg.iolog(t, "Post to: " & newPath & "; response = " & response.status)
+    except HttpStatusError as e:
+      dumpExOnDebug()
+      onSinkError(cfg, e, hard = isHardHttpError(e))
+    except:
+      dumpExOnDebug()
+      onSinkError(cfg, getCurrentException(), hard = false)
 
 proc httpHeaders(cfg: SinkConfig): HttpHeaders =
   var
@@ -434,96 +436,98 @@ proc httpParams(cfg: SinkConfig): tuple[
   return (uri, headers, timeout, disallowHttp, pinnedCert, preferBundledCerts)
 
 proc postSinkOut(msg: string, cfg: SinkConfig, t: Topic, ignored: StringTable) =
-  let
-    params  = cfg.httpParams()
-    headers = params.headers.addChalkCoreHeaders(body = msg)
-  try:
-    let response = safeRequest(
-      url                = params.uri,
-      timeout            = params.timeout,
-      headers            = headers,
-      disallowHttp       = params.disallowHttp,
-      pinnedCert         = params.pinnedCert,
-      preferBundledCerts = params.preferBundledCerts,
-      httpMethod         = HttpPost,
-      body               = msg,
-      retries            = 2,
-      firstRetryDelayMs  = 100,
-      acceptStatusCodes  = [200..299],
-      attemptHeader      = chalkAttemptHeader,
-    )
-    resetSinkFailures(cfg)
-    cfg.iolog(t, "Post " & response.status)
-  except HttpStatusError as e:
-    dumpExOnDebug()
-    onSinkError(cfg, e, hard = isHardHttpError(e))
-  except:
-    dumpExOnDebug()
-    onSinkError(cfg, getCurrentException(), hard = false)
+  withPerfTiming("sink", cfg.name):
+    let
+      params  = cfg.httpParams()
+      headers = params.headers.addChalkCoreHeaders(body = msg)
+    try:
+      let response = safeRequest(
+        url                = params.uri,
+        timeout            = params.timeout,
+        headers            = headers,
+        disallowHttp       = params.disallowHttp,
+        pinnedCert         = params.pinnedCert,
+        preferBundledCerts = params.preferBundledCerts,
+        httpMethod         = HttpPost,
+        body               = msg,
+        retries            = 2,
+        firstRetryDelayMs  = 100,
+        acceptStatusCodes  = [200..299],
+        attemptHeader      = chalkAttemptHeader,
+      )
+      resetSinkFailures(cfg)
+      cfg.iolog(t, "Post " & response.status)
+    except HttpStatusError as e:
+      dumpExOnDebug()
+      onSinkError(cfg, e, hard = isHardHttpError(e))
+    except:
+      dumpExOnDebug()
+      onSinkError(cfg, getCurrentException(), hard = false)
 
 proc presignSinkOut(msg: string, cfg: SinkConfig, t: Topic, ignored: StringTable) =
-  let
-    params      = cfg.httpParams()
-    signHeaders = params.headers.addChalkCoreHeaders(body = msg)
-  var signResponse: Response
-  try:
-    signResponse = safeRequest(
-      url                = params.uri,
-      timeout            = params.timeout,
-      headers            = signHeaders,
-      disallowHttp       = params.disallowHttp,
-      pinnedCert         = params.pinnedCert,
-      preferBundledCerts = params.preferBundledCerts,
-      httpMethod         = HttpPut,
-      retries            = 2,
-      firstRetryDelayMs  = 100,
-      maxRedirects       = 0,
-      acceptStatusCodes  = [302..302, 307..307],
-      attemptHeader      = chalkAttemptHeader,
-    )
-  except HttpStatusError as e:
-    dumpExOnDebug()
-    onSinkError(cfg, e, hard = isHardHttpError(e))
-  except:
-    dumpExOnDebug()
-    onSinkError(cfg, getCurrentException(), hard = false)
+  withPerfTiming("sink", cfg.name):
+    let
+      params      = cfg.httpParams()
+      signHeaders = params.headers.addChalkCoreHeaders(body = msg)
+    var signResponse: Response
+    try:
+      signResponse = safeRequest(
+        url                = params.uri,
+        timeout            = params.timeout,
+        headers            = signHeaders,
+        disallowHttp       = params.disallowHttp,
+        pinnedCert         = params.pinnedCert,
+        preferBundledCerts = params.preferBundledCerts,
+        httpMethod         = HttpPut,
+        retries            = 2,
+        firstRetryDelayMs  = 100,
+        maxRedirects       = 0,
+        acceptStatusCodes  = [302..302, 307..307],
+        attemptHeader      = chalkAttemptHeader,
+      )
+    except HttpStatusError as e:
+      dumpExOnDebug()
+      onSinkError(cfg, e, hard = isHardHttpError(e))
+    except:
+      dumpExOnDebug()
+      onSinkError(cfg, getCurrentException(), hard = false)
 
-  var uri: Uri
-  try:
-    if not signResponse.headers.hasKey("location"):
-      raise newException(ValueError, "Presign redirect Location header missing")
-    uri = parseUri(signResponse.headers["location"])
-    if uri.scheme == "":
-      raise newException(ValueError, "Presign redirect Location header needs to be absolute URL")
-  except:
-    dumpExOnDebug()
-    # A malformed redirect (missing or relative Location) can never yield a
-    # working upload URL, so treat it as a hard error and route it through the
-    # disable machinery like a 4xx sign response instead of raising past it.
-    onSinkError(cfg, getCurrentException(), hard = true)
+    var uri: Uri
+    try:
+      if not signResponse.headers.hasKey("location"):
+        raise newException(ValueError, "Presign redirect Location header missing")
+      uri = parseUri(signResponse.headers["location"])
+      if uri.scheme == "":
+        raise newException(ValueError, "Presign redirect Location header needs to be absolute URL")
+    except:
+      dumpExOnDebug()
+      # A malformed redirect (missing or relative Location) can never yield a
+      # working upload URL, so treat it as a hard error and route it through the
+      # disable machinery like a 4xx sign response instead of raising past it.
+      onSinkError(cfg, getCurrentException(), hard = true)
 
-  let uploadHeaders = newHttpHeaders().addForwardedHeaders(signResponse)
-  try:
-    let response = safeRequest(
-      url                = uri,
-      headers            = uploadHeaders,
-      timeout            = params.timeout,
-      disallowHttp       = params.disallowHttp,
-      pinnedCert         = params.pinnedCert,
-      preferBundledCerts = params.preferBundledCerts,
-      httpMethod         = HttpPut,
-      body               = msg,
-      retries            = 2,
-      firstRetryDelayMs  = 100,
-      acceptStatusCodes  = [200..299],
-      attemptHeader      = chalkAttemptHeader,
-    )
-    resetSinkFailures(cfg)
-    cfg.iolog(t, "Presign " & response.status)
-  except:
-    dumpExOnDebug()
-    # Upload errors are always soft: the presigned URL itself may be transient.
-    onSinkError(cfg, getCurrentException(), hard = false)
+    let uploadHeaders = newHttpHeaders().addForwardedHeaders(signResponse)
+    try:
+      let response = safeRequest(
+        url                = uri,
+        headers            = uploadHeaders,
+        timeout            = params.timeout,
+        disallowHttp       = params.disallowHttp,
+        pinnedCert         = params.pinnedCert,
+        preferBundledCerts = params.preferBundledCerts,
+        httpMethod         = HttpPut,
+        body               = msg,
+        retries            = 2,
+        firstRetryDelayMs  = 100,
+        acceptStatusCodes  = [200..299],
+        attemptHeader      = chalkAttemptHeader,
+      )
+      resetSinkFailures(cfg)
+      cfg.iolog(t, "Presign " & response.status)
+    except:
+      dumpExOnDebug()
+      # Upload errors are always soft: the presigned URL itself may be transient.
+      onSinkError(cfg, getCurrentException(), hard = false)
 
 proc addFileSink*() =
   var
@@ -655,66 +659,67 @@ proc dnsSinkLookup(
   return placeholder
 
 proc dnsSinkOut(msg: string, cfg: SinkConfig, t: Topic, ignored: StringTable) =
-  let
-    tmpl             = cfg.params.getOrDefault("domain_template", "")
-    placeholder      = cfg.params.getOrDefault("missing_key_placeholder", "x")
-    recordType       = cfg.params.getOrDefault("record_type", "A")
-    dnsServer        = cfg.params.getOrDefault("dns_server", "")
-    timeoutMs        = parseInt(cfg.params.getOrDefault("dns_timeout", "5000"))
-    requireChalkMark = cfg.params.getOrDefault("require_chalk_mark", "false") == "true"
-    qtype            = case recordType.toUpperAscii()
-                       of "AAAA": DnsQtype.AAAA
-                       of "ANY":  DnsQtype.ANY
-                       else:      DnsQtype.A
-
-  var
-    report: ChalkDict
-    chalks: seq[ChalkDict] = @[]
-  try:
-    let reportJson = parseJson(msg).assertIs(JArray).assertHasLen()[0].assertIs(JObject)
-    report = unpack[ChalkDict](nimJsonToBox(reportJson))
-    if "_CHALKS" in reportJson:
-      let chalksJson = reportJson["_CHALKS"].assertIs(JArray)
-      for i, chalkJson in enumerate(chalksJson.items()):
-        try:
-          chalks.add(unpack[ChalkDict](nimJsonToBox(chalkJson.assertIs(JObject))))
-        except:
-          dumpExOnDebug()
-          warn(
-            "dns sink '" & cfg.name & "': failed to extract _CHALKS[" & $i & "]: " &
-            getCurrentExceptionMsg(),
-          )
-  except:
-    dumpExOnDebug()
-    onSinkError(cfg, getCurrentException(), hard = true)
-
-  if chalks.len == 0:
-    if requireChalkMark:
-      return
-    # Fall back to a single lookup with report-level keys only.
-    chalks.add(ChalkDict())
+  withPerfTiming("sink", cfg.name):
+    let
+      tmpl             = cfg.params.getOrDefault("domain_template", "")
+      placeholder      = cfg.params.getOrDefault("missing_key_placeholder", "x")
+      recordType       = cfg.params.getOrDefault("record_type", "A")
+      dnsServer        = cfg.params.getOrDefault("dns_server", "")
+      timeoutMs        = parseInt(cfg.params.getOrDefault("dns_timeout", "5000"))
+      requireChalkMark = cfg.params.getOrDefault("require_chalk_mark", "false") == "true"
+      qtype            = case recordType.toUpperAscii()
+                         of "AAAA": DnsQtype.AAAA
+                         of "ANY":  DnsQtype.ANY
+                         else:      DnsQtype.A
 
-  for chalkEntry in chalks:
-    let chalk = chalkEntry
+    var
+      report: ChalkDict
+      chalks: seq[ChalkDict] = @[]
     try:
-      let domain = tmpl.applySubstitutions(
-        proc(key: string): string =
-          dnsSinkLookup(key, report, chalk, placeholder, cfg.name),
-      )
-      dnsLookup(
-        domain    = domain,
-        server    = dnsServer,
-        qtype     = qtype,
-        timeoutMs = timeoutMs,
-      )
-      resetSinkFailures(cfg)
-      cfg.iolog(t, "DNS: " & domain)
-    except ValueError:
-      dumpExOnDebug()
-      onSinkError(cfg, getCurrentException(), hard = true)
+      let reportJson = parseJson(msg).assertIs(JArray).assertHasLen()[0].assertIs(JObject)
+      report = unpack[ChalkDict](nimJsonToBox(reportJson))
+      if "_CHALKS" in reportJson:
+        let chalksJson = reportJson["_CHALKS"].assertIs(JArray)
+        for i, chalkJson in enumerate(chalksJson.items()):
+          try:
+            chalks.add(unpack[ChalkDict](nimJsonToBox(chalkJson.assertIs(JObject))))
+          except:
+            dumpExOnDebug()
+            warn(
+              "dns sink '" & cfg.name & "': failed to extract _CHALKS[" & $i & "]: " &
+              getCurrentExceptionMsg(),
+            )
     except:
       dumpExOnDebug()
-      onSinkError(cfg, getCurrentException(), hard = false)
+      onSinkError(cfg, getCurrentException(), hard = true)
+
+    if chalks.len == 0:
+      if requireChalkMark:
+        return
+      # Fall back to a single lookup with report-level keys only.
+      chalks.add(ChalkDict())
+
+    for chalkEntry in chalks:
+      let chalk = chalkEntry
+      try:
+        let domain = tmpl.applySubstitutions(
+          proc(key: string): string =
+            dnsSinkLookup(key, report, chalk, placeholder, cfg.name),
+        )
+        dnsLookup(
+          domain    = domain,
+          server    = dnsServer,
+          qtype     = qtype,
+          timeoutMs = timeoutMs,
+        )
+        resetSinkFailures(cfg)
+        cfg.iolog(t, "DNS: " & domain)
+      except ValueError:
+        dumpExOnDebug()
+        onSinkError(cfg, getCurrentException(), hard = true)
+      except:
+        dumpExOnDebug()
+        onSinkError(cfg, getCurrentException(), hard = false)
 
 proc addDnsSink*() =
   var
@@ -0,0 +1,68 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Classifying files before they are offered to codecs.
+##
+## Scans offer each file to every file codec in priority order and most
+## codecs open and peek the file only to reject it. Instead the start of
+## every file is read once and matched against a table of magic numbers.
+## Codecs declare the kinds of files they handle via `sniffKinds` in
+## newCodec() and are only offered files of those kinds. Codecs which
+## declare nothing (e.g. the ones which go by file extension) are
+## offered every file as before.
+
+import std/[
+  unicode,
+]
+import ".."/[
+  types,
+]
+import "."/[
+  fd_cache,
+]
+
+const
+  sniffSize     = 4096
+  # same prefix as seemsToBeUtf8() so nothing the source codec
+  # would mark is turned away
+  sniffTextSize = 256
+  sniffMagics   = [
+    ("\x7fELF",          skElf),
+    # ELF magic read as a 32bit int of the other endianness
+    ("FLE\x7f",          skElf),
+    ("\xca\xfe\xba\xbe", skMacho),
+    ("\xfe\xed\xfa\xce", skMacho),
+    ("\xce\xfa\xed\xfe", skMacho),
+    ("\xfe\xed\xfa\xcf", skMacho),
+    ("\xcf\xfa\xed\xfe", skMacho),
+    ("PK",               skZip),
+    ("GGUF",             skGguf),
+    ("#!",               skShebang),
+  ]
+
+proc sniffHead*(head: string): set[SniffKind] =
+  ## kinds of a file which starts with head
+  for (magic, kind) in sniffMagics:
+    if head.startsWith(magic):
+      result.incl(kind)
+  if head[0 ..< min(len(head), sniffTextSize)].validateUtf8() == -1:
+    result.incl(skText)
+
+proc sniffFile*(path: string): set[SniffKind] =
+  ## kinds of the file at path, or none when it cannot be read.
+  ## The stream stays in the fd cache for the codecs offered the file
+  withFileStream(path, mode = fmRead, strict = false):
+    if stream == nil:
+      return {}
+    try:
+      return stream.peekStr(sniffSize).sniffHead()
+    except:
+      return {}
+
+proc handlesSniffed*(codec: Plugin, kinds: set[SniffKind]): bool =
+  ## whether the codec should be offered a file of the sniffed kinds
+  return len(codec.sniffKinds) == 0 or len(codec.sniffKinds * kinds) > 0
@@ -5,6 +5,10 @@
 ## (see https://crashoverride.com/docs/chalk)
 ##
 
+import std/[
+  os,
+  posix,
+]
 import pkg/[
   nimutils,
 ]
@@ -18,3 +22,134 @@ proc runCmdNoOutputCapture*(exe:       string,
                                        passthrough = true,
                                        capture     = SPIoNone)
   result = execOutput.getExit()
+
+type
+  ShellCmd* = ref object
+    ## shell command running in the background, see startShellCmd
+    cmd*:       string
+    pid*:       Pid
+    fd:         cint
+    spool:      File
+    output*:    string ## unless spooled
+    outputLen*: int
+    exitCode*:  int
+    error*:     string ## when output could not be spooled
+    killed:     bool
+
+proc startShellCmd*(cmd: string, spool: File = nil): ShellCmd =
+  ## run `sh -c cmd` without waiting for it, capturing stdout and stderr
+  ## like con4m system() does. The command gets its own process group
+  ## so that killShellCmd also stops anything it started.
+  ## With `spool` output is written to that file instead of kept in memory
+  var fds: array[2, cint]
+  if pipe(fds) != 0:
+    raiseOSError(osLastError(), "could not create pipe")
+  for fd in fds:
+    discard fcntl(fd, F_SETFD, FD_CLOEXEC)
+  let devNull = open("/dev/null", O_RDONLY or O_CLOEXEC)
+  # child can only make async-signal-safe calls so prepare argv before fork
+  let argv = allocCStringArray(["sh", "-c", cmd])
+  defer:
+    deallocCStringArray(argv)
+  let pid = fork()
+  if pid == 0:
+    discard setpgid(0, 0)
+    if devNull >= 0:
+      discard dup2(devNull, 0)
+    discard dup2(fds[1], 1)
+    discard dup2(fds[1], 2)
+    discard execv("/bin/sh", argv)
+    exitnow(127)
+  let err = osLastError()
+  discard close(fds[1])
+  if devNull >= 0:
+    discard close(devNull)
+  if pid < 0:
+    discard close(fds[0])
+    raiseOSError(err, "could not fork")
+  discard setpgid(pid, pid)
+  discard fcntl(fds[0], F_SETFL, fcntl(fds[0], F_GETFL) or O_NONBLOCK)
+  return ShellCmd(cmd: cmd, pid: pid, fd: fds[0], spool: spool)
+
+proc readShellCmd(self: ShellCmd): bool =
+  ## read available output. false once the command closed its output
+  var buf: array[65536, char]
+  while true:
+    let n = read(self.fd, addr buf[0], len(buf))
+    if n > 0:
+      self.outputLen += n
+      if self.spool != nil:
+        if self.error == "" and self.spool.writeBuffer(addr buf[0], n) != n:
+          self.error = "could not write output: " & osErrorMsg(osLastError())
+        continue
+      let start = len(self.output)
+      self.output.setLen(start + n)
+      copyMem(addr self.output[start], addr buf[0], n)
+    elif n == 0:
+      return false
+    elif errno == EINTR:
+      continue
+    else:
+      return true
+
+proc closeShellCmd(self: ShellCmd, status: cint) =
+  discard close(self.fd)
+  self.fd = -1
+  if self.spool != nil:
+    self.spool.flushFile()
+  # same as shells report it
+  if WIFEXITED(status):
+    self.exitCode = int(WEXITSTATUS(status))
+  elif WIFSIGNALED(status):
+    self.exitCode = 128 + int(WTERMSIG(status))
+
+proc finishShellCmd(self: ShellCmd) =
+  var status: cint
+  while waitpid(self.pid, status, 0) < 0:
+    if errno != EINTR:
+      self.exitCode = -1
+      discard close(self.fd)
+      self.fd = -1
+      return
+  self.closeShellCmd(status)
+
+proc reapKilledShellCmd(self: ShellCmd): bool =
+  ## a descendant which left the process group can keep the output open
+  ## after the kill, so a killed command is done once sh is reaped
+  ## rather than once its output is closed
+  var status: cint
+  let pid = waitpid(self.pid, status, WNOHANG)
+  if pid == 0 or (pid < 0 and errno == EINTR):
+    return false
+  discard self.readShellCmd()
+  if pid < 0:
+    self.exitCode = -1
+    discard close(self.fd)
+    self.fd = -1
+    return true
+  self.closeShellCmd(status)
+  return true
+
+proc killShellCmd*(self: ShellCmd) =
+  if self.fd >= 0:
+    discard kill(-self.pid, SIGKILL)
+    self.killed = true
+
+proc waitShellCmds*(cmds: openArray[ShellCmd], timeout: int): seq[ShellCmd] =
+  ## wait up to `timeout` ms for output of the commands, collecting it,
+  ## and return the ones which finished (exitCode is then set)
+  if len(cmds) == 0:
+    sleep(timeout)
+    return
+  var fds = newSeq[TPollfd](len(cmds))
+  for i, cmd in cmds:
+    fds[i].fd     = cmd.fd
+    fds[i].events = POLLIN
+  if poll(addr fds[0], Tnfds(len(fds)), timeout) < 0 and errno != EINTR:
+    raiseOSError(osLastError(), "could not poll commands")
+  for i, cmd in cmds:
+    if fds[i].revents != 0 and not cmd.readShellCmd():
+      cmd.finishShellCmd()
+      result.add(cmd)
+    elif cmd.killed and cmd.reapKilledShellCmd():
+      result.add(cmd)
@@ -0,0 +1,382 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Persistent cache of external tool results.
+##
+## SBOM, SAST and secret scanners take from seconds to minutes and CI
+## usually runs chalk several times over the same tree. Results are kept
+## under `tool_cache_path`, keyed by:
+##
+## * tool name
+## * the exact command line, where binaries it references are identified
+##   by size and mtime and temporary files by their contents (tool configs
+##   write e.g. exclude lists into randomly named temp files)
+## * digest of the contents of the scanned path. `.git` is represented by
+##   its refs only as its objects are reachable from them. Content hashes
+##   are reused while a file's size, mtime and inode are unchanged, so an
+##   unchanged tree costs a walk and a stat per file
+##
+## Layout under `tool_cache_path`:
+##
+## * `results/<key>.json`      - chalk json produced by the tool
+## * `outputs/<tool>-<sha>.gz` - raw output too large to embed in reports,
+##                               see keepToolOutput
+## * `indexes/<sha>.json`      - stamps and content hashes of the files of
+##                               a scanned path
+## * `locks/<key>.lock`        - flock()ed while a chalk process runs the tool
+##
+## Processes which need a result which is being produced poll the lock
+## for up to `tool_cache_lock_timeout`. Locks are released by the kernel
+## when the producer dies so waiters never wait for a dead process.
+## Results are touched on use (their access time, their modification
+## time is when the tool produced them) and the least recently used ones
+## are evicted once the cache exceeds `tool_cache_max_size`. Results
+## older than `tool_cache_max_age` are not used, as tools pulling rules
+## or verifying secrets over the network can give different results
+## over the very same tree.
+
+import std/[
+  algorithm,
+  json,
+  os,
+  posix,
+  times,
+]
+import ".."/[
+  types,
+]
+import "."/[
+  file_string_stream,
+  gzip,
+]
+
+const
+  TOOL_CACHE_RESULTS = "results"
+  TOOL_CACHE_OUTPUTS = "outputs"
+  TOOL_CACHE_LOCKS   = "locks"
+  TOOL_CACHE_INDEXES = "indexes"
+  # temp files referenced in commands larger than this are not hashed
+  TOOL_CACHE_MAX_ARG = 1024 * 1024
+
+const
+  LOCK_EX = cint(2)
+  LOCK_NB = cint(4)
+  LOCK_UN = cint(8)
+
+proc flock(fd: cint, operation: cint): cint {.importc, header: "<sys/file.h>".}
+
+var
+  C_AT_FDCWD   {.importc: "AT_FDCWD",   header: "<fcntl.h>".}:    cint
+  C_UTIME_NOW  {.importc: "UTIME_NOW",  header: "<sys/stat.h>".}: clong
+  C_UTIME_OMIT {.importc: "UTIME_OMIT", header: "<sys/stat.h>".}: clong
+
+proc c_utimensat(dirfd: cint, path: cstring, times: ptr array[2, Timespec], flags: cint): cint
+  {.importc: "utimensat", header: "<sys/stat.h>".}
+
+var
+  treeDigests = initTable[string, string]()
+  cleaned     = false
+
+proc toolCacheDir(): string =
+  return attrGet[string]("tool_cache_path").resolvePath()
+
+proc toolCacheMaxSize(): int64 =
+  return int64(attrGet[Con4mSize]("tool_cache_max_size"))
+
+proc toolCacheMaxAge(): Duration =
+  # Duration is stored as microseconds in con4m
+  return initDuration(microseconds = int(attrGet[Con4mDuration]("tool_cache_max_age")))
+
+proc isExpired(info: FileInfo): bool =
+  let maxAge = toolCacheMaxAge()
+  return maxAge > DurationZero and getTime() - info.lastWriteTime > maxAge
+
+proc lastUsed(info: FileInfo): Time =
+  return max(info.lastAccessTime, info.lastWriteTime)
+
+proc touch(path: string) =
+  ## mark as used without changing when it was produced
+  var times = [Timespec(tv_nsec: C_UTIME_NOW), Timespec(tv_nsec: C_UTIME_OMIT)]
+  discard c_utimensat(C_AT_FDCWD, cstring(path), addr times, 0)
+
+proc toolCacheLockTimeout*(): Duration =
+  # Duration is stored as microseconds in con4m
+  return initDuration(microseconds = int(attrGet[Con4mDuration]("tool_cache_lock_timeout")))
+
+proc resultPath(key: string): string =
+  return toolCacheDir() / TOOL_CACHE_RESULTS / (key & ".json")
+
+proc lockPath(key: string): string =
+  return toolCacheDir() / TOOL_CACHE_LOCKS / (key & ".lock")
+
+proc treeIndexPath(path: string): string =
+  return toolCacheDir() / TOOL_CACHE_INDEXES / (path.sha256Hex()[0 ..< 16] & ".json")
+
+proc addTree(entries: var seq[string], root: string, rel: string) =
+  for kind, name in walkDir(root / rel, relative = true, skipSpecial = true):
+    let sub =
+      if rel == "":
+        name
+      else:
+        rel / name
+    if kind == pcDir:
+      if sub == ".git":
+        for gitFile in ["HEAD", "packed-refs"]:
+          entries.add(sub / gitFile)
+        for path in walkDirRec(root / sub / "refs", relative = true):
+          entries.add(sub / "refs" / path)
+      else:
+        entries.addTree(root, sub)
+    else:
+      entries.add(sub)
+
+proc fileStamp(info: FileInfo): JsonNode =
+  return %*[
+    info.size,
+    info.lastWriteTime.toUnix(),
+    info.lastWriteTime.nanosecond,
+    int64(info.id.file),
+  ]
+
+proc hashTree*(path: string, indexPath = ""): string =
+  ## digest of the contents of a file or of all files under a directory
+  ## along with their relative paths. Content hashes of files whose
+  ## stamp in the index at indexPath is unchanged are not recomputed.
+  ##
+  ## The digest is memoized for the rest of the run, until a file under
+  ## path is written (see forgetTreeDigests)
+  if path in treeDigests:
+    return treeDigests[path]
+  var
+    sha      = initSha256()
+    entries  = newSeq[string]()
+    previous = newJObject()
+    index    = newJObject()
+  if indexPath != "" and fileExists(indexPath):
+    try:
+      previous = parseJson(tryToLoadFile(indexPath))
+    except:
+      discard
+  if dirExists(path):
+    entries.addTree(path, "")
+    entries.sort()
+  else:
+    entries.add("")
+  sha.update($len(entries))
+  for rel in entries:
+    let full =
+      if rel == "":
+        path
+      else:
+        path / rel
+    sha.update($len(rel))
+    sha.update(rel)
+    if symlinkExists(full):
+      let target = expandSymlink(full)
+      sha.update("->" & $len(target))
+      sha.update(target)
+    elif fileExists(full):
+      let
+        info  = getFileInfo(full)
+        stamp = info.fileStamp()
+        prev  = previous{rel}
+      var content: string
+      if prev != nil and prev.kind == JArray and len(prev) == 2 and prev[0] == stamp:
+        content = prev[1].getStr()
+      else:
+        content = newFileStringStream(full).sha256Hex()
+      index[rel] = %*[stamp, content]
+      sha.update($info.size)
+      sha.update(content)
+    else:
+      sha.update("-")
+  result = sha.finalHex()
+  treeDigests[path] = result
+  if indexPath != "":
+    try:
+      createDir(indexPath.parentDir())
+      discard tryToWriteFile(indexPath, $index)
+    except:
+      discard
+
+proc forgetTreeDigests*(written: string) =
+  ## drop memoized digests of the trees containing a file chalk wrote,
+  ## so tools which run after it see its new contents
+  let written = written.absolutePath()
+  var stale: seq[string]
+  for path in treeDigests.keys():
+    let tree = path.absolutePath()
+    if written == tree or written.isRelativeTo(tree):
+      stale.add(path)
+  for path in stale:
+    treeDigests.del(path)
+
+proc argIdentity(arg: string): string =
+  ## how an argument of the tool command is represented in the cache key
+  let path = arg.strip(chars = {'"', '\''})
+  if not path.isAbsolute() or not fileExists(path):
+    return arg
+  try:
+    let info = getFileInfo(path)
+    if path.startsWith(getTempDir()) and info.size <= TOOL_CACHE_MAX_ARG:
+      return "tmp:" & tryToLoadFile(path).sha256Hex()
+    return arg & "@" & $info.size & ":" & $info.lastWriteTime.toUnix() &
+           "." & $info.lastWriteTime.nanosecond
+  except:
+    return arg
+
+proc getToolCacheKey*(tool: string, cmd: string, path: string): string =
+  ## cache key of running `cmd` over `path`, or empty string
+  ## when the cache is disabled or the path cannot be hashed
+  if toolCacheMaxSize() <= 0 or not (fileExists(path) or dirExists(path)):
+    return ""
+  try:
+    var parts = @[tool, path, path.hashTree(indexPath = path.absolutePath().treeIndexPath())]
+    for arg in cmd.splitWhitespace():
+      parts.add(arg.argIdentity())
+    return parts.join("\n").sha256Hex()
+  except:
+    trace(tool & ": cannot compute tool cache key for " & path & ": " & getCurrentExceptionMsg())
+    return ""
+
+proc cleanToolCache*() =
+  ## evict least recently used results until the cache fits
+  ## in tool_cache_max_size
+  let
+    dir     = toolCacheDir()
+    maxSize = toolCacheMaxSize()
+  if maxSize <= 0 or not dirExists(dir):
+    return
+  try:
+    var
+      entries: seq[(Time, string, int64)]
+      total   = int64(0)
+    for sub in [TOOL_CACHE_RESULTS, TOOL_CACHE_OUTPUTS, TOOL_CACHE_INDEXES]:
+      for kind, path in walkDir(dir / sub):
+        if kind != pcFile:
+          continue
+        let
+          info  = getFileInfo(path)
+          mtime = info.lastWriteTime
+          size  = info.size
+        # left behind by a killed chalk
+        if path.endsWith(".tmp") and getTime() - mtime > initDuration(hours = 1):
+          removeFile(path)
+          continue
+        # would not be used anymore
+        if sub == TOOL_CACHE_RESULTS and info.isExpired():
+          removeFile(path)
+          continue
+        entries.add((info.lastUsed(), path, size))
+        total += size
+    for kind, path in walkDir(dir / TOOL_CACHE_LOCKS):
+      if kind != pcFile or getTime() - getLastModificationTime(path) < initDuration(days = 1):
+        continue
+      # only locks nobody holds
+      let fd = open(cstring(path), O_RDWR or O_CLOEXEC)
+      if fd >= 0:
+        if flock(fd, LOCK_EX or LOCK_NB) == 0:
+          discard tryRemoveFile(path)
+        discard close(fd)
+    if total <= maxSize:
+      return
+    entries.sort()
+    for (_, path, size) in entries:
+      if total <= maxSize:
+        break
+      removeFile(path)
+      total -= size
+    trace("tool: evicted tool cache down to " & $total & " bytes")
+  except:
+    trace("tool: error evicting tool cache: " & getCurrentExceptionMsg())
+
+proc cleanToolCacheOnce() =
+  if not cleaned:
+    cleaned = true
+    cleanToolCache()
+
+proc getCachedToolResult*(key: string): Option[string] =
+  if key == "":
+    return none(string)
+  let path = key.resultPath()
+  try:
+    if getFileInfo(path).isExpired():
+      trace("tool: cached result " & path & " is older than tool_cache_max_age")
+      return none(string)
+  except:
+    return none(string)
+  let data = tryToLoadFile(path)
+  if data == "":
+    return none(string)
+  path.touch()
+  return some(data)
+
+proc setCachedToolResult*(key: string, data: string) =
+  if key == "" or data == "":
+    return
+  cleanToolCacheOnce()
+  let path = key.resultPath()
+  try:
+    createDir(path.parentDir())
+    # rename so concurrent chalk runs never see a partial file
+    let tmp = path & "." & $getCurrentProcessId() & ".tmp"
+    if not tryToWriteFile(tmp, data):
+      raise newException(IOError, "could not write " & tmp)
+    moveFile(tmp, path)
+  except:
+    trace("tool: could not write tool cache " & path & ": " & getCurrentExceptionMsg())
+
+proc keepToolOutput*(tool: string, path: string): string =
+  ## gzip tool output which is too large to be parsed into the report
+  ## into the cache and return where it is kept, or empty string when
+  ## the cache is disabled. The output is streamed and never loaded
+  if toolCacheMaxSize() <= 0:
+    return ""
+  cleanToolCacheOnce()
+  let dir = toolCacheDir() / TOOL_CACHE_OUTPUTS
+  createDir(dir)
+  let tmp = dir / (tool & "." & $getCurrentProcessId() & ".tmp")
+  var
+    sha    = initSha256()
+    writer = newParallelGzWriter(tmp)
+  try:
+    for c in newFileStringStream(path).chunks(0..^1, gzBlockSize):
+      sha.update(c)
+      writer.write(c)
+    writer.close()
+  except:
+    writer.abort()
+    discard tryRemoveFile(tmp)
+    raise
+  result = dir / (tool & "-" & sha.finalHex() & ".gz")
+  moveFile(tmp, result)
+
+proc openToolCacheLock*(key: string): cint =
+  ## open the lock file of the key without taking the lock, or -1
+  ## when the cache is disabled or the lock file cannot be opened,
+  ## in which case the caller goes ahead without locking
+  if key == "":
+    return -1
+  let path = key.lockPath()
+  try:
+    createDir(path.parentDir())
+  except:
+    return -1
+  result = open(cstring(path), O_CREAT or O_RDWR or O_CLOEXEC, S_IRUSR or S_IWUSR)
+  if result < 0:
+    trace("tool: could not open tool cache lock " & path)
+
+proc tryLockToolCache*(fd: cint): bool =
+  ## take the lock unless another process holds it
+  return fd >= 0 and flock(fd, LOCK_EX or LOCK_NB) == 0
+
+proc unlockToolCache*(fd: cint) =
+  ## release and close the lock
+  if fd < 0:
+    return
+  discard flock(fd, LOCK_UN)
+  discard close(fd)
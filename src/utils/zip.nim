@@ -0,0 +1,249 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Raw ZIP records for re-marking archives without recompressing them.
+##
+## Every entry of a ZIP archive is a local header followed by its
+## compressed data (and possibly a data descriptor); the central
+## directory at the end lists the entries and where their local headers
+## are. An archive with a new chalk mark is therefore the old entries
+## copied byte for byte, new records for whatever changed and a new
+## central directory pointing at them. This module reads the central
+## directory of an existing archive and builds the new records; the zip
+## codec decides what to copy and writes the result via
+## replaceFileSegments.
+##
+## Only plain single disk archives starting with their first entry are
+## handled. Anything else (zip64, encryption, self extracting stubs,
+## overlapping entries) makes readZipDirectory return none and the
+## caller recreates the archive from scratch.
+
+import std/[
+  algorithm,
+  options,
+  os,
+  streams,
+  tables,
+  times,
+]
+import pkg/[
+  zippy,
+  zippy/crc,
+]
+
+const
+  zipLocalSig   = 0x04034b50'u32
+  zipCentralSig = 0x02014b50'u32
+  zipEndSig     = 0x06054b50'u32
+  zip64LocSig   = 0x07064b50'u32
+  zipLocalLen   = 30
+  zipCentralLen = 46
+  zipEndLen     = 22
+  zipMaxComment = 0xffff
+  zipEncrypted  = 0x0001'u16
+  zipUtf8       = 0x0800'u16
+
+type
+  ZipEntry* = object
+    name*:      string
+    offset*:    int    ## of the local header
+    recordLen*: int    ## local header, data and data descriptor
+    central*:   string ## raw central directory record
+
+  ZipDirectory* = object
+    entries*: seq[ZipEntry]
+    comment*: string
+
+proc u16(s: string, i: int): uint16 =
+  return uint16(byte(s[i])) or (uint16(byte(s[i + 1])) shl 8)
+
+proc u32(s: string, i: int): uint32 =
+  return uint32(u16(s, i)) or (uint32(u16(s, i + 2)) shl 16)
+
+proc putU16(s: var string, i: int, v: uint16) =
+  s[i]     = char(v and 0xff)
+  s[i + 1] = char(v shr 8)
+
+proc putU32(s: var string, i: int, v: uint32) =
+  s.putU16(i, uint16(v and 0xffff))
+  s.putU16(i + 2, uint16(v shr 16))
+
+proc readAt(stream: Stream, offset: int, length: int): string =
+  stream.setPosition(offset)
+  result = stream.readStr(length)
+  if len(result) != length:
+    raise newException(IOError, "zip: truncated archive")
+
+proc readZipDirectory*(path: string): Option[ZipDirectory] =
+  ## entries of the archive in central directory order, or none if the
+  ## archive cannot be re-marked in place
+  let stream = newFileStream(path, fmRead)
+  if stream == nil:
+    return none(ZipDirectory)
+  try:
+    let
+      size = int(getFileSize(path))
+      tail = stream.readAt(max(0, size - zipEndLen - zipMaxComment),
+                           min(size, zipEndLen + zipMaxComment))
+    var at = len(tail) - zipEndLen
+    while at >= 0:
+      if tail.u32(at) == zipEndSig and at + zipEndLen + int(tail.u16(at + 20)) == len(tail):
+        break
+      at -= 1
+    if at < 0:
+      return none(ZipDirectory)
+    let
+      disk     = tail.u16(at + 4)
+      cdDisk   = tail.u16(at + 6)
+      count    = int(tail.u16(at + 10))
+      cdSize   = int(tail.u32(at + 12))
+      cdOffset = int(tail.u32(at + 16))
+      endAt    = size - len(tail) + at
+    if disk != 0 or cdDisk != 0 or count != int(tail.u16(at + 8)):
+      return none(ZipDirectory)
+    # zip64 archives keep the real values in extra records
+    if count == 0xffff or cdSize == 0xffffffff or cdOffset == 0xffffffff:
+      return none(ZipDirectory)
+    if at >= 20 and tail.u32(at - 20) == zip64LocSig:
+      return none(ZipDirectory)
+    if cdOffset + cdSize > endAt:
+      return none(ZipDirectory)
+
+    var
+      dir   = ZipDirectory(comment: tail[at + zipEndLen .. ^1])
+      names = initTable[string, bool]()
+    let cd = stream.readAt(cdOffset, cdSize)
+    var pos = 0
+    for _ in 0 ..< count:
+      if pos + zipCentralLen > len(cd) or cd.u32(pos) != zipCentralSig:
+        return none(ZipDirectory)
+      let
+        flags   = cd.u16(pos + 8)
+        nameLen = int(cd.u16(pos + 28))
+        recLen  = zipCentralLen + nameLen + int(cd.u16(pos + 30)) + int(cd.u16(pos + 32))
+        offset  = cd.u32(pos + 42)
+      if pos + recLen > len(cd) or (flags and zipEncrypted) != 0 or offset == 0xffffffff'u32:
+        return none(ZipDirectory)
+      let name = cd[pos + zipCentralLen ..< pos + zipCentralLen + nameLen]
+      if name in names:
+        return none(ZipDirectory)
+      names[name] = true
+      dir.entries.add(ZipEntry(
+        name:    name,
+        offset:  int(offset),
+        central: cd[pos ..< pos + recLen],
+      ))
+      pos += recLen
+    if pos != len(cd):
+      return none(ZipDirectory)
+
+    # entries are laid out back to back, so each record runs up to the
+    # next one, which covers data descriptors of any shape
+    var byOffset = dir.entries
+    byOffset.sort(proc(a, b: ZipEntry): int = cmp(a.offset, b.offset))
+    var lengths = initTable[string, int]()
+    for i, entry in byOffset:
+      let next =
+        if i + 1 < len(byOffset):
+          byOffset[i + 1].offset
+        else:
+          cdOffset
+      if (i == 0 and entry.offset != 0) or next - entry.offset < zipLocalLen:
+        return none(ZipDirectory)
+      if stream.readAt(entry.offset, 4).u32(0) != zipLocalSig:
+        return none(ZipDirectory)
+      lengths[entry.name] = next - entry.offset
+    for entry in dir.entries.mitems():
+      entry.recordLen = lengths[entry.name]
+    return some(dir)
+  except:
+    return none(ZipDirectory)
+  finally:
+    stream.close()
+
+proc withOffset*(entry: ZipEntry, offset: int): string =
+  ## central directory record of the entry once its local header is
+  ## moved to `offset`
+  result = entry.central
+  result.putU32(42, uint32(offset))
+
+proc dosDateTime(t: Time): tuple[time: uint16, date: uint16] =
+  let dt = t.local()
+  if dt.year < 1980:
+    return (0'u16, uint16((1 shl 5) or 1))
+  return (
+    uint16((dt.hour shl 11) or (dt.minute shl 5) or (dt.second div 2)),
+    uint16(((dt.year - 1980) shl 9) or (ord(dt.month) shl 5) or int(dt.monthday)),
+  )
+
+proc newZipRecord*(name:     string,
+                   data:     string,
+                   mode:     set[FilePermission],
+                   mtime:    Time,
+                   ): tuple[local: string, central: string] =
+  ## local record (header and deflated data) of a new entry and its
+  ## central directory record, with the local header at offset 0;
+  ## see withOffset
+  let
+    compressed = compress(data, DefaultCompression, dfDeflate)
+    checksum   = crc32(data)
+    (t, d)     = mtime.dosDateTime()
+  var header = newString(zipLocalLen)
+  header.putU32(0,  zipLocalSig)
+  header.putU16(4,  20)
+  header.putU16(6,  zipUtf8)
+  header.putU16(8,  8)
+  header.putU16(10, t)
+  header.putU16(12, d)
+  header.putU32(14, checksum)
+  header.putU32(18, uint32(len(compressed)))
+  header.putU32(22, uint32(len(data)))
+  header.putU16(26, uint16(len(name)))
+  header.putU16(28, 0)
+  result.local = header & name & compressed
+
+  var unixMode = 0o100000'u32
+  for perm, bit in [
+    fpOthersExec, fpOthersWrite, fpOthersRead,
+    fpGroupExec,  fpGroupWrite,  fpGroupRead,
+    fpUserExec,   fpUserWrite,   fpUserRead,
+  ]:
+    if bit in mode:
+      unixMode = unixMode or (1'u32 shl perm)
+  var central = newString(zipCentralLen)
+  central.putU32(0,  zipCentralSig)
+  central.putU16(4,  (3 shl 8) or 20) # made by unix
+  central.putU16(6,  20)
+  central.putU16(8,  zipUtf8)
+  central.putU16(10, 8)
+  central.putU16(12, t)
+  central.putU16(14, d)
+  central.putU32(16, checksum)
+  central.putU32(20, uint32(len(compressed)))
+  central.putU32(24, uint32(len(data)))
+  central.putU16(28, uint16(len(name)))
+  central.putU32(38, unixMode shl 16)
+  result.central = central & name
+
+proc zipEndOfCentralDirectory*(count:   int,
+                               size:    int,
+                               offset:  int,
+                               comment: string,
+                               ): string =
+  result = newString(zipEndLen)
+  result.putU32(0,  zipEndSig)
+  result.putU16(8,  uint16(count))
+  result.putU16(10, uint16(count))
+  result.putU32(12, uint32(size))
+  result.putU32(16, uint32(offset))
+  result.putU16(20, uint16(len(comment)))
+  result &= comment
+
+proc fitsZip32*(count: int, size: int): bool =
+  ## whether an archive with `count` entries and `size` bytes can be
+  ## written without zip64 records
+  return count < 0xffff and size < 0xffffffff
@@ -0,0 +1,56 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Compares the stream and buffer chalk mark parsers on a mark with an
+## embedded SBOM-sized report. Run with `make benchmarks`.
+
+import std/[
+  monotimes,
+  streams,
+  strutils,
+  times,
+]
+import ../../src/chalkjson {.all.}
+
+const iterations = 5
+
+proc makeMark(components: int): string =
+  var parts: seq[string]
+  for i in 0 ..< components:
+    parts.add("""{"type": "library", "name": "pkg-""" & $i &
+              """", "version": "1.""" & $i & """.0", "purl": "pkg:npm/pkg-""" &
+              $i & """@1.""" & $i & """.0", "hashes": [{"alg": "SHA-256", """ &
+              """"content": """" & repeat("ab", 32) & """"}], "score": 0.""" &
+              $i & """, "licenses": ["MIT", "Apache-2.0"], "desc": "café """ &
+              """\"quoted\" \\ path/to/thing\n"}""")
+  result = """{ "MAGIC" : "dadfedabbadabbed", "CHALK_ID": "X", "SBOM": """ &
+           """{"cyclonedx": {"components": [""" & parts.join(", ") & "]}}}"
+
+template bench(name: string, c: untyped) =
+  var best = initDuration(days = 1)
+  for _ in 0 ..< iterations:
+    let start = getMonoTime()
+    c
+    best = min(best, getMonoTime() - start)
+  echo name.alignLeft(10), ($best.inMilliseconds()).align(8), "ms"
+
+proc main() =
+  let mark = makeMark(20_000)
+  echo "mark size: ", len(mark) div 1024, "KB"
+
+  var oldResult, newResult: ChalkDict
+  bench("stream"):
+    oldResult = unpack[ChalkDict](
+      chalkParseJson(newStringStream(mark)).valueFromJson(""))
+  bench("buffer"):
+    newResult = mark.extractOneChalkJson("")
+  bench("buffer/fs"):
+    discard newStringStream(mark).extractOneChalkJson("")
+
+  doAssert pack(oldResult).boxToJson() == pack(newResult).boxToJson()
+
+main()
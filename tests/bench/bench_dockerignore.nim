@@ -0,0 +1,122 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Compares filtering a synthetic 200k-file context with the pattern list
+## evaluated per path against the compiled matcher, walking the tree the
+## way listContext() does (excluded directories are pruned unless a
+## negation can reach inside). Run with `make benchmarks`.
+
+import std/[
+  monotimes,
+  strutils,
+  tables,
+  times,
+]
+import ../../src/docker/dockerignore
+
+const
+  iterations = 3
+  dirsPerDir = 10
+  filesPerDir = 20
+
+type
+  Tree = Table[string, seq[(string, bool)]]  ## dir -> (child, isDir)
+
+proc perPathIsExcluded(norm: string, patterns: seq[string]): bool =
+  ## What filtering did before patterns were compiled.
+  for pat in patterns:
+    let
+      negate = pat.startsWith('!')
+      p      = (if negate: pat[1 .. ^1] else: pat).strip(chars = {'/'})
+    if p.len == 0:
+      continue
+    var matched = globMatch(norm, p)
+    if not matched:
+      var slash = norm.find('/')
+      while slash > 0:
+        if globMatch(norm[0 ..< slash], p):
+          matched = true
+          break
+        slash = norm.find('/', slash + 1)
+    if matched:
+      result = not negate
+
+proc buildTree(): (Tree, int) =
+  ## 4 levels of 10 directories with 20 files each: 222,220 files.
+  var
+    tree  = initTable[string, seq[(string, bool)]]()
+    files = 0
+  proc fill(dir: string, depth: int) =
+    var children: seq[(string, bool)]
+    for i in 0 ..< filesPerDir:
+      let ext = [".py", ".log", ".md", ".tmp", ".json"][i mod 5]
+      children.add(("file" & $i & ext, false))
+      inc files
+    if depth < 4:
+      for i in 0 ..< dirsPerDir:
+        let name = ["src", "logs", "build", "docs", "vendor",
+                    "node_modules", "test", "lib", "cache", "pkg"][i]
+        children.add((name & $depth, true))
+        fill((if dir == "": "" else: dir & "/") & name & $depth, depth + 1)
+    tree[dir] = children
+  fill("", 0)
+  return (tree, files)
+
+proc patterns(): seq[string] =
+  ## A long ignore file: a few hundred literal rules, some globs and
+  ## negations, roughly what monorepos accumulate.
+  for i in 0 ..< 300:
+    result.add("generated/module" & $i)
+  for i in 0 ..< 50:
+    result.add("*.ext" & $i)
+  result.add(@["node_modules*", "**/*.tmp", "build*/", "!build1/file1.log",
+               "docs*/**/*.md", "!docs*/file0.md", "*/cache*", "vendor0/lib1"])
+
+proc walk(tree: Tree, dir: string, kept: var int,
+          excluded: proc (p: string): bool,
+          reaches: proc (p: string): bool) =
+  for (child, isDir) in tree[dir]:
+    let rel = (if dir == "": child else: dir & "/" & child)
+    if isDir:
+      let ex = excluded(rel)
+      if not ex or reaches(rel):
+        walk(tree, rel, kept, excluded, reaches)
+    elif not excluded(rel):
+      inc kept
+
+template bench(name: string, c: untyped) =
+  var best = initDuration(days = 1)
+  for _ in 0 ..< iterations:
+    let start = getMonoTime()
+    c
+    best = min(best, getMonoTime() - start)
+  echo name.alignLeft(12), ($best.inMilliseconds()).align(8), "ms"
+
+proc main() =
+  let
+    (tree, files) = buildTree()
+    pats          = patterns()
+  echo $files & " files, " & $len(pats) & " patterns"
+
+  # both walks prune the same way, so only the exclusion checks differ
+  let negations = compileDockerignore(pats)
+  var a, b: int
+  bench("per-path"):
+    a = 0
+    tree.walk("", a,
+              proc (p: string): bool = perPathIsExcluded(p, pats),
+              proc (p: string): bool = negations.hasNegationForDir(p))
+  bench("compiled"):
+    b = 0
+    let matcher = compileDockerignore(pats)
+    tree.walk("", b,
+              proc (p: string): bool = matcher.isExcluded(p),
+              proc (p: string): bool = matcher.hasNegationForDir(p))
+  doAssert a == b, $a & " != " & $b
+  echo $a & " files kept"
+
+main()
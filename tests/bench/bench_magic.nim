@@ -0,0 +1,48 @@
+##
+## Copyright (c) 2026, Crash Override, Inc.
+##
+## This file is part of Chalk
+## (see https://crashoverride.com/docs/chalk)
+##
+
+## Compares strutils.find() with the specialized magic scanner on an
+## unmarked binary-like buffer. Run with `make benchmarks`.
+
+import std/[
+  monotimes,
+  random,
+  strutils,
+  times,
+]
+import ../../src/utils/magic
+import ../../src/types
+
+const
+  size       = 256 * 1024 * 1024
+  iterations = 3
+
+template bench(name: string, c: untyped) =
+  var best = initDuration(days = 1)
+  for _ in 0 ..< iterations:
+    let start = getMonoTime()
+    c
+    best = min(best, getMonoTime() - start)
+  let mbps = (size div (1024 * 1024)) * 1000 div max(best.inMilliseconds(), 1)
+  echo name.alignLeft(10), ($best.inMilliseconds()).align(8), "ms",
+       ($mbps).align(8), "MB/s"
+
+proc main() =
+  var
+    r    = initRand(42)
+    data = newString(size)
+  for i in 0 ..< size:
+    data[i] = char(r.rand(255))
+
+  var a, b: int
+  bench("find"):
+    a = data.find(magicUTF8)
+  bench("findMagic"):
+    b = data.findMagic()
+  doAssert a == b and a == -1
+
+main()
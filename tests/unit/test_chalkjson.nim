@@ -1,15 +1,62 @@
 import std/[
   json,
   streams,
+  strutils,
+  tables,
 ]
 import ../../src/chalkjson {.all.}
 import ../../src/[
+  types,
   utils/json,
 ]
 
 template assertEq(a, b: untyped) =
   doAssert a == b, $a & " != " & $b
 
+proc largeMarks() =
+  # larger than the first read, so the buffer is grown and parsed again
+  let
+    big    = """{ "MAGIC" : "dadfedabbadabbed", "big": """" &
+             repeat('x', 3 * chalkJsonChunkSize) & """" }"""
+    stream = newStringStream("prefix " & big & " suffix")
+  stream.setPosition(7)
+  let dict = stream.extractOneChalkJson("")
+  assertEq(len(unpack[string](dict["big"])), 3 * chalkJsonChunkSize)
+  assertEq(stream.getPosition(), 7 + len(big))
+
+  # the first read ends inside a number; it must not be taken as 12345
+  let
+    head     = """{ "MAGIC" : "dadfedabbadabbed", "pad": """"
+    tail     = """", "n": 123456789 }"""
+    cut      = chalkJsonChunkSize - len(head) - len("\", \"n\": 12345")
+    straddle = head & repeat('p', cut) & tail
+  assertEq(straddle[chalkJsonChunkSize - 5 ..< chalkJsonChunkSize], "12345")
+  let other = newStringStream(straddle & "\n" & repeat('\0', 1000))
+  let parsed = other.extractOneChalkJson("")
+  assertEq(unpack[int](parsed["n"]), 123456789)
+  assertEq(other.getPosition(), len(straddle))
+
+proc templateOrder() =
+  # plans are normally compiled from the config; seed them instead
+  templatePlans["report"] = TemplatePlan(order: {"B": 1, "Z": 2}.toTable())
+  for (key, order) in [("A", 10), ("B", 20), ("C", 5), ("Z", 30)]:
+    keyspecOrders[key] = order
+  let dict = ChalkDict()
+  for key in ["A", "B", "C", "Z"]:
+    dict[key] = pack(key)
+
+  # explicit template orders first, then keyspec orders
+  assertEq(dict.orderKeys("report"), @["B", "Z", "C", "A"])
+  assertEq(dict.orderKeys(""), @["C", "A", "B", "Z"])
+  var keys: seq[string]
+  for key, _ in parseJson(dict.toJson("report")):
+    keys.add(key)
+  assertEq(keys, dict.orderKeys("report"))
+
+  clearTemplatePlans()
+  assertEq(len(templatePlans), 0)
+  assertEq(len(keyspecOrders), 0)
+
 proc main() =
   let data = """
 [
@@ -52,4 +99,51 @@ proc main() =
     parseJson(data),
   )
 
+  # buffer parser must agree with the stream parser
+  var endPos: int
+  assertEq(
+    data.parseChalkJsonBox(endPos).boxToJson().parseJson(),
+    parseJson(data),
+  )
+  assertEq(data[0 ..< endPos].strip(), data.strip())
+
+  let escaped = """{"s": "a\"b\\c\/d\n\t\u00e9\u4e2d", "e": ""}"""
+  assertEq(
+    escaped.parseChalkJsonBox(endPos).boxToJson().parseJson(),
+    chalkParseJson(newStringStream(escaped)).valueFromJson("").boxToJson().parseJson(),
+  )
+
+  # mark embedded in other bytes; extraction stops right after the object
+  let
+    mark     = """{ "MAGIC" : "dadfedabbadabbed", "x": [1, 2.5, null] }"""
+    embedded = "prefix " & mark & " suffix"
+    dict     = embedded.extractOneChalkJson("", endPos, start = 7)
+  assertEq(endPos, 7 + len(mark))
+  assertEq(unpack[string](dict["MAGIC"]), "dadfedabbadabbed")
+
+  let stream = newStringStream(embedded)
+  stream.setPosition(7)
+  assertEq(pack(stream.extractOneChalkJson("")).boxToJson(), pack(dict).boxToJson())
+  assertEq(stream.getPosition(), 7 + len(mark))
+
+  # truncated input: needs more data unless it is final, in which case
+  # it is a parse error
+  var raised = false
+  try:
+    discard mark[0 ..< 20].parseChalkJsonBox(endPos, final = false)
+  except CJsonNeedMore:
+    raised = true
+  doAssert raised
+  raised = false
+  try:
+    discard mark[0 ..< 20].parseChalkJsonBox(endPos)
+  except CJsonNeedMore:
+    doAssert false
+  except CJsonError:
+    raised = true
+  doAssert raised
+
+  largeMarks()
+  templateOrder()
+
 main()
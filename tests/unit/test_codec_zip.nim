@@ -0,0 +1,92 @@
+## Unit tests for reusing nested archive scans in `src/plugins/codecZip.nim`.
+
+import std/[
+  options,
+  os,
+  tables,
+]
+import ../../src/plugins/codecZip {.all.}
+import ../../src/[
+  run_management,
+  types,
+]
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc withInner(test: proc(path: string)) =
+  let path = getTempDir() / ("chalk-inner-" & $getCurrentProcessId() & ".zip")
+  writeFile(path, "PK inner")
+  try:
+    test(path)
+  finally:
+    removeFile(path)
+    scannedZips.clear()
+    rememberZips = false
+
+proc scanned(path: string): ChalkObj =
+  result = newChalk(fsRef = path,
+                    cache = ZipCache(tmpDir: "/tmp/extracted", origD: "/tmp/extracted/contents"))
+  result.marked              = true
+  result.cachedUnchalkedHash = "abc"
+
+template inNested(code: untyped) =
+  discard pushCollectionCtx()
+  try:
+    code
+  finally:
+    popCollectionCtx()
+
+proc test_reuse_once() =
+  # extract subscan of the outer archive remembers the inner one and the
+  # insert pass over the same directory takes it over exactly once
+  commandName = "insert"
+  withInner(proc(path: string) =
+    rememberZips = true
+    inNested:
+      path.scanned().rememberScannedZip()
+    let found = path.takeScannedZip()
+    doAssert found.isSome()
+    assertEq(found.get().marked, true)
+    assertEq(found.get().unchalkedHash, "abc")
+    assertEq(found.get().cache.tmpDir, "/tmp/extracted")
+    doAssert path.takeScannedZip().isNone()
+  )
+
+proc test_modified() =
+  # inner archive changed between the extract subscan and the command pass
+  commandName = "insert"
+  withInner(proc(path: string) =
+    rememberZips = true
+    inNested:
+      path.scanned().rememberScannedZip()
+    writeFile(path, "PK inner, but modified")
+    doAssert path.takeScannedZip().isNone()
+    assertEq(len(scannedZips), 0)
+  )
+
+proc test_not_remembered() =
+  withInner(proc(path: string) =
+    # no command pass follows
+    commandName  = "extract"
+    rememberZips = false
+    inNested:
+      path.scanned().rememberScannedZip()
+    assertEq(len(scannedZips), 0)
+    # top level artifacts are never scanned twice
+    commandName  = "insert"
+    rememberZips = true
+    path.scanned().rememberScannedZip()
+    assertEq(len(scannedZips), 0)
+    # extract itself never reuses
+    inNested:
+      path.scanned().rememberScannedZip()
+    commandName = "extract"
+    doAssert path.takeScannedZip().isNone()
+  )
+
+when isMainModule:
+  test_reuse_once()
+  test_modified()
+  test_not_remembered()
+  echo "test_codec_zip: all tests passed"
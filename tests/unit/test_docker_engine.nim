@@ -0,0 +1,156 @@
+## Unit tests for the Docker Engine API client in `src/docker/engine.nim`.
+##
+## A fake daemon thread listens on a unix socket and answers each accepted
+## connection with a scripted list of raw HTTP responses, after which it
+## closes the connection. That is enough to exercise response framing
+## (content-length, chunked, connection close), keep-alive reuse and the
+## reconnect after the daemon drops an idle connection.
+
+import std/[
+  nativesockets,
+  net,
+  os,
+  strutils,
+  typedthreads,
+]
+import ../../src/docker/engine {.all.}
+import ../../src/utils/json
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+type
+  FakeDaemon = object
+    server:        Socket
+    conversations: seq[seq[string]]
+    requests:      seq[string]
+    connections:   int
+
+proc serve(daemon: ptr FakeDaemon) {.thread.} =
+  {.cast(gcsafe).}:
+    for conversation in daemon.conversations:
+      var client: Socket
+      daemon.server.accept(client)
+      daemon.connections += 1
+      for response in conversation:
+        let line = client.recvLine()
+        if line == "":
+          break
+        daemon.requests.add(line)
+        var length = 0
+        while true:
+          let header = client.recvLine()
+          if header in ["", "\r\n"]:
+            break
+          if header.toLower().startsWith("content-length:"):
+            length = parseInt(header.split(":")[1].strip())
+        if length > 0:
+          discard client.recv(length)
+        client.send(response)
+      client.close()
+
+proc withFakeDaemon(conversations: seq[seq[string]],
+                    test: proc(engine: DockerEngine)): FakeDaemon =
+  let path = getTempDir() / ("chalk-engine-" & $getCurrentProcessId() & ".sock")
+  removeFile(path)
+  result.server = newSocket(AF_UNIX, SOCK_STREAM, IPPROTO_IP)
+  result.server.bindUnix(path)
+  result.server.listen()
+  result.conversations = conversations
+  var thread: Thread[ptr FakeDaemon]
+  createThread(thread, serve, addr result)
+  let engine = newDockerEngine(path)
+  try:
+    test(engine)
+  finally:
+    engine.close()
+    joinThread(thread)
+    result.server.close()
+    removeFile(path)
+
+proc ok(body: string, extra = ""): string =
+  return (
+    "HTTP/1.1 200 OK\r\n" &
+    "Content-Type: application/json\r\n" &
+    extra &
+    "Content-Length: " & $len(body) & "\r\n\r\n" &
+    body
+  )
+
+proc chunked(parts: seq[string]): string =
+  result = (
+    "HTTP/1.1 200 OK\r\n" &
+    "Content-Type: application/json\r\n" &
+    "Transfer-Encoding: chunked\r\n\r\n"
+  )
+  for part in parts:
+    result &= toHex(len(part), 4) & "\r\n" & part & "\r\n"
+  result &= "0\r\n\r\n"
+
+proc test_persistent_connection() =
+  let notFound = """{"message":"No such image: missing:latest"}"""
+  let daemon = withFakeDaemon(@[@[
+    ok("""{"Version":"24.0.6","ApiVersion":"1.43"}"""),
+    chunked(@["""{"Id":"sha256:abc",""", """"Os":"linux"}"""]),
+    "HTTP/1.1 404 Not Found\r\nContent-Length: " & $len(notFound) & "\r\n\r\n" & notFound,
+  ]], proc(engine: DockerEngine) =
+    assertEq(engine.version(){"Version"}.getStr(), "24.0.6")
+    let image = engine.inspect("image", "alpine:3")
+    assertEq(image{"Id"}.getStr(), "sha256:abc")
+    assertEq(image{"Os"}.getStr(), "linux")
+    var raised = false
+    try:
+      discard engine.inspect("image", "missing")
+    except EngineResponseError:
+      raised = true
+      doAssert "No such image" in getCurrentExceptionMsg(), getCurrentExceptionMsg()
+      doAssert "404" in getCurrentExceptionMsg(), getCurrentExceptionMsg()
+    doAssert raised, "expected EngineResponseError for 404"
+  )
+  assertEq(daemon.connections, 1)
+  assertEq(daemon.requests, @[
+    "GET /version HTTP/1.1",
+    "GET /images/alpine:3/json HTTP/1.1",
+    "GET /images/missing/json HTTP/1.1",
+  ])
+
+proc test_reconnect_after_close() =
+  let daemon = withFakeDaemon(@[
+    # daemon drops kept-alive connection after first response
+    @[ok("""[{"Id":"sha256:aaa"},{"Id":"sha256:bbb"}]""")],
+    @[
+      "HTTP/1.1 201 Created\r\nContent-Length: 0\r\n\r\n",
+      ok("""[{"Untagged":"localhost:5000/foo:bar"}]""", extra = "Connection: close\r\n"),
+    ],
+    @["HTTP/1.1 204 No Content\r\n\r\n"],
+  ], proc(engine: DockerEngine) =
+    assertEq(engine.listIds("image"), @["sha256:aaa", "sha256:bbb"])
+    engine.tag("sha256:aaa", "localhost:5000/foo:bar")
+    engine.removeImage("localhost:5000/foo:bar")
+    # connection: close requires new connection
+    discard engine.request("DELETE", "/containers/foo")
+  )
+  assertEq(daemon.connections, 3)
+  assertEq(daemon.requests, @[
+    "GET /images/json HTTP/1.1",
+    "POST /images/sha256:aaa/tag?repo=localhost%3A5000%2Ffoo&tag=bar HTTP/1.1",
+    "DELETE /images/localhost:5000/foo:bar HTTP/1.1",
+    "DELETE /containers/foo HTTP/1.1",
+  ])
+
+proc test_split_repo_tag() =
+  assertEq(splitRepoTag("foo"), (repo: "foo", tag: ""))
+  assertEq(splitRepoTag("foo:bar"), (repo: "foo", tag: "bar"))
+  assertEq(splitRepoTag("localhost:5000/foo"), (repo: "localhost:5000/foo", tag: ""))
+  assertEq(splitRepoTag("localhost:5000/foo:bar"), (repo: "localhost:5000/foo", tag: "bar"))
+
+proc test_escape_path() =
+  assertEq(escapePath("registry:5000/a/b:c@sha256:00"), "registry:5000/a/b:c@sha256:00")
+  assertEq(escapePath("a b?c"), "a%20b%3Fc")
+
+when isMainModule:
+  test_persistent_connection()
+  test_reconnect_after_close()
+  test_split_repo_tag()
+  test_escape_path()
+  echo "test_docker_engine: all tests passed"
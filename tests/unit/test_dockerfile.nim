@@ -0,0 +1,101 @@
+## Unit tests for the Dockerfile lexer and parse cache in
+## `src/docker/dockerfile.nim`.
+
+import std/[
+  options,
+  streams,
+  tables,
+  unicode,
+]
+import ../../src/types
+import ../../src/docker/dockerfile {.all.}
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc lex(s: string, escape = Rune('\\')): seq[LineToken] =
+  let ctx = DockerParse(currentEscape: escape)
+  return ctx.lexSubableLine(DockerStatement(), s)
+
+proc kinds(toks: seq[LineToken]): seq[LineTokenType] =
+  for tok in toks:
+    result.add(tok.kind)
+
+proc test_words_and_flags() =
+  let toks = lex("--from=build /src/$NAME dst")
+  assertEq(toks.kinds(), @[ltWord, ltOther, ltWord, ltSpace, ltWord, ltSpace, ltWord])
+  assertEq(toks[0].contents, @["--from"])
+  assertEq(toks[2].contents, @["build"])
+  assertEq(toks[4].contents, @["/src/"])
+  assertEq(toks[4].varSubs[0].name, "NAME")
+  assertEq(toks[6].contents, @["dst"])
+
+proc test_quoted() =
+  let toks = lex("\"a \\\"b\\\" ${X:-déf} c\" 'x\\ty'")
+  assertEq(toks.kinds(), @[ltQuoted, ltSpace, ltQuoted])
+  assertEq(toks[0].contents, @["a \"b\" ", " c"])
+  assertEq(toks[0].varSubs[0].name, "X")
+  doAssert toks[0].varSubs[0].minus
+  assertEq(toks[0].varSubs[0].default.get().contents, @["déf"])
+  doAssert toks[0].usedEscape
+  assertEq(toks[2].contents, @["x\ty"])
+  assertEq(toks[2].quoteType, some(Rune('\'')))
+
+proc test_unicode() =
+  # non-breaking space is whitespace, other non-ascii is part of words
+  let toks = lex("grüße\u00A0wörld $äb")
+  assertEq(toks.kinds(), @[ltWord, ltSpace, ltWord, ltSpace, ltWord])
+  assertEq(toks[0].contents, @["grüße"])
+  assertEq(toks[1].contents, @["\u00A0"])
+  assertEq(toks[2].contents, @["wörld"])
+  assertEq(toks[4].varSubs[0].name, "äb")
+  # offsets are in bytes
+  assertEq(toks[2].startix, len("grüße\u00A0"))
+
+proc test_escape() =
+  assertEq(lex("a\\ b")[0].contents, @["a b"])
+  assertEq(lex("a` b", escape = Rune('`'))[0].contents, @["a b"])
+  # trailing escape and unterminated input do not read past the line
+  assertEq(lex("a\\")[0].contents, @["a"])
+  let sub = lex("${FOO:-")[0].varSubs[0]
+  assertEq(sub.error, "Unterminated ${")
+  assertEq(lex("\"abc")[0].error, "Unterminated string")
+
+proc test_top_level_command() =
+  assertEq(topLevelCmdParse("  run   echo  hi "), ("RUN", "echo  hi "))
+  assertEq(topLevelCmdParse("from\u00A0alpine"), ("FROM", "alpine"))
+  assertEq(topLevelCmdParse("USER"), ("USER", ""))
+
+proc imageFor(dockerfile: string, args: Table[string, string]): (DockerParse, string) =
+  var errors: seq[string]
+  let (parse, cmds) = newStringStream(dockerfile).parseAndEval(args, errors)
+  for obj in cmds:
+    if obj of FromInfo:
+      return (parse, parse.evalOrReturnEmptyString(FromInfo(obj).image, errors))
+
+proc test_parse_cache() =
+  let dockerfile = "ARG BASE=alpine\nFROM ${BASE}\nENV A=1\n"
+  let
+    (first,  a) = imageFor(dockerfile, initTable[string, string]())
+    (second, b) = imageFor(dockerfile, {"BASE": "debian"}.toTable())
+    (third,  c) = imageFor(dockerfile, initTable[string, string]())
+  assertEq(a, "alpine")
+  assertEq(b, "debian")
+  assertEq(c, "alpine")
+  doAssert first == second and second == third, "parse was not reused"
+  # previous evaluation's build args do not leak into the next one
+  doAssert "BASE" notin third.inArgs
+  for tok in first.tokens:
+    if tok.kind == tltCommand and tok.cmd.name == "FROM":
+      doAssert tok.cmd.lexed.isSome(), "FROM was not lexed"
+  let (other, _) = imageFor(dockerfile & "\n", initTable[string, string]())
+  doAssert other != first, "different content reused parse"
+
+when isMainModule:
+  test_words_and_flags()
+  test_quoted()
+  test_unicode()
+  test_escape()
+  test_top_level_command()
+  test_parse_cache()
+  echo "test_dockerfile: all tests passed"
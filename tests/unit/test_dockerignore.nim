@@ -0,0 +1,126 @@
+import std/[
+  os,
+  strutils,
+]
+import ../../src/docker/dockerignore
+
+template check(cond: untyped) =
+  doAssert cond, "failed: " & astToStr(cond)
+
+## ---------------------------------------------------------------------------
+## Reference implementations: the per-path evaluation the compiled matcher
+## replaces, trying every pattern against the path and all its ancestors.
+
+proc referenceIsExcluded(relPath: string, patterns: seq[string]): bool =
+  let norm = relPath.replace('\\', '/')
+  for pat in patterns:
+    let
+      negate = pat.startsWith('!')
+      p      = (if negate: pat[1 .. ^1] else: pat).strip(chars = {'/'})
+    if p.len == 0:
+      continue
+    var matched = globMatch(norm, p)
+    if not matched:
+      var slash = norm.find('/')
+      while slash > 0:
+        if globMatch(norm[0 ..< slash], p):
+          matched = true
+          break
+        slash = norm.find('/', slash + 1)
+    if matched:
+      result = not negate
+
+proc referenceHasNegationForDir(norm: string, patterns: seq[string]): bool =
+  for pat in patterns:
+    if not pat.startsWith('!'):
+      continue
+    let p = pat[1 .. ^1].strip(chars = {'/'})
+    if p.len == 0:
+      continue
+    if '/' notin p:
+      if globMatch(norm, p):
+        return true
+    elif "**" in p:
+      return true
+    let normDepth = norm.count('/') + 1
+    var
+      slashes = 0
+      idx     = 0
+    while idx < p.len:
+      if p[idx] == '/':
+        inc slashes
+        if slashes == normDepth:
+          break
+      inc idx
+    if slashes == normDepth and globMatch(norm, p[0 ..< idx]):
+      return true
+  return false
+
+const
+  paths = [
+    "app.py", "README.md", "logs", "logs/debug.log", "logs/temp.tmp",
+    "logs/sub/deep.log", "a/logs/debug.log", "node_modules",
+    "node_modules/pkg/index.js", "src/main.py", "src/test/main_test.py",
+    "build/out/bin", "docs/a.md", "docs/x/y/z.md", ".git/HEAD",
+    "a//b", "/abs/path", "logs_app/important.log", "x.log",
+  ]
+  patternSets = [
+    @["logs/", "!logs/*.log"],
+    @["node_modules", ".git", "build", "*.md", "!README.md"],
+    @["**/*.log", "!logs/debug.log", "logs"],
+    @["*", "!src", "!src/**"],
+    @["src/*/main_test.py", "docs/*/*/z.md", "a/b"],
+    @["logs_*/", "!logs_*/important.log"],
+    @["[a-c]*", "!a/[!x]*/debug.log", "a\\/b"],
+    @["docs", "!docs/x", "docs/x/y"],
+    @["/app.py/", "!", "/", "x.?og"],
+    @["logs", "logs", "!logs", "logs/sub"],
+  ]
+
+## ---------------------------------------------------------------------------
+## The compiled matcher must agree with per-path evaluation, including
+## last-match-wins across literal and glob patterns.
+
+proc testMatchesReference() =
+  for patterns in patternSets:
+    let matcher = compileDockerignore(patterns)
+    for path in paths:
+      doAssert matcher.isExcluded(path) == referenceIsExcluded(path, patterns),
+        "isExcluded mismatch for " & path & " with " & $patterns
+      doAssert matcher.hasNegationForDir(path) == referenceHasNegationForDir(path, patterns),
+        "hasNegationForDir mismatch for " & path & " with " & $patterns
+
+proc testLastMatchWins() =
+  let matcher = compileDockerignore(@["*.log", "!debug.log", "debug.*"])
+  check matcher.isExcluded("debug.log")
+  check matcher.isExcluded("app.log")
+  check not matcher.isExcluded("app.txt")
+  check not compileDockerignore(@["debug.*", "!debug.log"]).isExcluded("debug.log")
+  check not compileDockerignore(@[]).isExcluded("anything")
+  check not compileDockerignore(@["logs/"]).hasNegationForDir("logs")
+
+## ---------------------------------------------------------------------------
+## readDockerignorePatterns prefers <Dockerfile>.dockerignore next to the
+## Dockerfile over the context root .dockerignore.
+
+proc testReadDockerignorePatterns() =
+  let tmpDir = getTempDir() / "test_dockerignore_" & $getCurrentProcessId()
+  createDir(tmpDir / "ctx")
+  createDir(tmpDir / "df")
+  defer:
+    removeDir(tmpDir)
+  writeFile(tmpDir / "ctx" / ".dockerignore", "# comment\n\n/logs/\n!/logs/*.log\n")
+  check readDockerignorePatterns(tmpDir / "ctx") == @["logs/", "!logs/*.log"]
+  writeFile(tmpDir / "df" / "Dockerfile", "FROM scratch\n")
+  check readDockerignorePatterns(tmpDir / "ctx", tmpDir / "df" / "Dockerfile") ==
+        @["logs/", "!logs/*.log"]
+  writeFile(tmpDir / "df" / "Dockerfile.dockerignore", "secrets\n")
+  check readDockerignorePatterns(tmpDir / "ctx", tmpDir / "df" / "Dockerfile") == @["secrets"]
+  check readDockerignorePatterns(tmpDir / "df") == newSeq[string]()
+
+proc main() =
+  testMatchesReference()
+  testLastMatchWins()
+  testReadDockerignorePatterns()
+
+main()
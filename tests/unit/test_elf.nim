@@ -0,0 +1,65 @@
+## Unit tests for range tracking and unchalked hashing in `src/plugins/elf.nim`.
+##
+## The test binary itself is used as the ELF fixture.
+
+import std/[
+  os,
+  strutils,
+]
+import ../../src/plugins/elf {.all.}
+import ../../src/utils/file_string_stream
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc names(items: seq[RootRef]): seq[string] =
+  for item in items:
+    result.add(ElfElement(item).name)
+
+proc test_intersector() =
+  let ranges = NewIntersector()
+  ranges.insert(100, 50, ElfElement(name: "late"))
+  ranges.insert(0,   10, ElfElement(name: "head"))
+  ranges.insert(0,  200, ElfElement(name: "all"))
+  ranges.insert(40,  20, ElfElement(name: "middle"))
+  assertEq(ranges.intersect(0, 1).names(), @["head", "all"])
+  assertEq(ranges.intersect(10, 30).names(), @["all"])
+  assertEq(ranges.intersect(50, 60).names(), @["all", "middle", "late"])
+  assertEq(ranges.intersect(150, 100).names(), @["all"])
+  assertEq(ranges.intersect(200, 10).names(), newSeq[string]())
+  assertEq(ranges.highest(), 200'u64)
+
+proc loadElf(data: string): ElfFile =
+  result = newElfFileFromData(newLoadedFileStringStream(data))
+  doAssert result.parse()
+
+proc checkUnchalked(data: string) =
+  # hash computed without touching the file is what unchalk() writes
+  let elf  = loadElf(data)
+  let hash = elf.getUnchalkedHash()
+  assertEq(elf.fileData.readAll(), data)
+  doAssert elf.unchalk()
+  let unchalked = loadElf(elf.fileData.readAll())
+  doAssert unchalked.hasBeenUnchalked
+  let (section, _, _) = unchalked.getChalkSectionData()
+  assertEq(section.toHex(), hash.toUpperAscii())
+
+proc test_unchalked_hash() =
+  let original = readFile(getAppFilename())
+  # no chalk section yet so one is inserted
+  checkUnchalked(original)
+  let elf = loadElf(original)
+  doAssert elf.insertOrSetChalkSection(SH_NAME_CHALKMARK, "{ \"MAGIC\": \"dadfedabbadabbed\" }")
+  # the edited file is parsed again so its headers are current
+  doAssert elf.chalkSectionHeader != nil
+  let (section, _, _) = elf.getChalkSectionData()
+  assertEq(section, "{ \"MAGIC\": \"dadfedabbadabbed\" }")
+  let marked = elf.fileData.readAll()
+  doAssert loadElf(marked).chalkSectionHeader != nil
+  # existing chalk section is replaced
+  checkUnchalked(marked)
+
+when isMainModule:
+  test_intersector()
+  test_unchalked_hash()
+  echo "test_elf: all tests passed"
@@ -45,6 +45,60 @@ proc global() =
     doAssert(stream != nil)
   doAssert(stream == nil)
 
+proc adaptive() =
+  let testCache = newFDCache(size = 1, maxSize = 4)
+  for f in ["one", "two"]:
+    testCache.withFileStream(f, mode = fmRead, strict = true):
+      discard
+  doAssert(testCache.stats.evictions == 1)
+  doAssert("one" notin testCache)
+
+  # reopening an evicted file grows the cache instead of evicting again
+  testCache.withFileStream("one", mode = fmRead, strict = true):
+    discard
+  doAssert(testCache.stats.reopens == 1)
+  # reopened paths are no longer remembered as evicted
+  doAssert(len(testCache.evicted) == 0)
+  doAssert(testCache.size == 2)
+  doAssert(len(testCache) == 2)
+  doAssert(testCache.stats.evictions == 1)
+  testCache.withFileStream("two", mode = fmRead, strict = true):
+    discard
+  doAssert(testCache.stats.hits == 1)
+  doAssert(testCache.bytes == 2 * fdBufferSize)
+
+  # pinned streams are kept over more recently used ones
+  testCache.pinFileStream("one")
+  testCache.withFileStream("three", mode = fmRead, strict = true):
+    discard
+  doAssert("one" in testCache)
+  doAssert("two" notin testCache)
+
+  # memory limit takes precedence over size
+  testCache.limitMemory(fdBufferSize)
+  doAssert(len(testCache) == 1)
+  doAssert("one" in testCache)
+  testCache.unpinFileStream("one")
+  doAssert(testCache.stats.evictions == 3)
+
+proc clamped() =
+  # same as the global cache, with a soft limit common in containers
+  let limit = fdCacheLimit(65536)
+  doAssert(limit == fdSelectLimit div 2)
+  doAssert(fdCacheLimit(100) == 50)
+  let testCache = newFDCache(size = limit, maxSize = limit)
+  testCache.limitSize(50)
+  doAssert(testCache.size == 50)
+  doAssert(testCache.maxSize == limit)
+  # neither configuring nor growing goes past the ceiling
+  testCache.limitSize(100_000)
+  doAssert(testCache.size == limit)
+  testCache.limitSize(50)
+  for _ in 0 ..< 20:
+    testCache.grow()
+  doAssert(testCache.size == limit)
+  doAssert(fdCache.maxSize <= fdSelectLimit div 2)
+
 proc main =
   const files = ["one", "two", "three"]
 
@@ -53,6 +107,8 @@ proc main =
 
   try:
     withCache()
+    adaptive()
+    clamped()
     global()
   finally:
     for f in files:
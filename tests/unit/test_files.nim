@@ -0,0 +1,75 @@
+## Unit tests for replacing file contents in `src/utils/files.nim`.
+
+import std/[
+  os,
+  posix,
+  strutils,
+]
+import ../../src/utils/files
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc withFile(contents: string, test: proc(path: string)) =
+  let path = getTempDir() / ("chalk-files-" & $getCurrentProcessId() & ".bin")
+  writeFile(path, contents)
+  try:
+    test(path)
+  finally:
+    removeFile(path)
+
+proc tmpFilesNextTo(path: string): seq[string] =
+  for file in walkFiles(path.parentDir() / (tmpFilePrefix & "*" & tmpFileSuffix)):
+    result.add(file)
+
+proc test_segments() =
+  let big = repeat("0123456789abcdef", 200_000)
+  withFile("head" & big & "tail", proc(path: string) =
+    discard chmod(cstring(path), 0o750)
+    doAssert path.replaceFileSegments([
+      fileBytes("new"),
+      fileRange(4, len(big)),
+      fileBytes("!"),
+      fileRange(4 + len(big)),
+    ])
+    assertEq(readFile(path), "new" & big & "!tail")
+    var info: Stat
+    doAssert stat(cstring(path), info) == 0
+    assertEq(info.st_mode and 0o777, 0o750)
+    assertEq(path.tmpFilesNextTo(), newSeq[string]())
+  )
+
+proc test_out_of_range() =
+  withFile("short", proc(path: string) =
+    doAssert not path.replaceFileSegments([fileRange(2, 10)])
+    # original is left alone and nothing is left behind
+    assertEq(readFile(path), "short")
+    assertEq(path.tmpFilesNextTo(), newSeq[string]())
+  )
+
+proc test_contents() =
+  withFile("old", proc(path: string) =
+    doAssert path.replaceFileContents("new contents")
+    assertEq(readFile(path), "new contents")
+  )
+
+proc test_prefix() =
+  withFile("HDR:" & repeat('x', 100), proc(path: string) =
+    # same length is written in place
+    let inode = getFileInfo(path).id
+    doAssert path.replaceFilePrefix("hdr!", 4)
+    assertEq(readFile(path), "hdr!" & repeat('x', 100))
+    assertEq(getFileInfo(path).id, inode)
+    # otherwise the rest of the file is moved
+    doAssert path.replaceFilePrefix("longer header:", 4)
+    assertEq(readFile(path), "longer header:" & repeat('x', 100))
+    doAssert path.replaceFilePrefix("h", 14)
+    assertEq(readFile(path), "h" & repeat('x', 100))
+  )
+
+when isMainModule:
+  test_segments()
+  test_out_of_range()
+  test_contents()
+  test_prefix()
+  echo "test_files: all tests passed"
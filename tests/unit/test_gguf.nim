@@ -14,6 +14,8 @@
 ##     replace, before and after remove.
 ##   - alignment-padding recompute: data section start moves to the
 ##     correct aligned offset after KV section size changes.
+##   - setChalkPadded: re-marks keep the data offset so only the
+##     header bytes change, padding is not part of the payload or hash.
 
 import std/strutils
 import ../../src/utils/gguf
@@ -207,6 +209,39 @@ proc testAlignmentRecompute() =
   doAssert (m2.len mod 64) == 0,
     "post-remove length " & $m2.len & " not aligned to 64"
 
+proc testSetChalkPaddedInPlace() =
+  let kvs  = kvString("general.architecture", "llama")
+  let f    = ggufFile(version = 3, tensorCount = 0, kvs = kvs) & "TENSORS"
+  let p0   = parseGguf(f)
+  doAssert p0 != nil
+  let baseline = p0.unchalkedHash()
+
+  # first mark has to move the data and reserves room after it
+  assertEq(p0.setChalkPadded("{\"v\":1}", 256), cgOk)
+  let m1  = p0.getMutatedBytes()
+  let off = p0.dataOffset()
+  doAssert off > f.len - len("TENSORS") + 256
+  assertEq(off mod 32, 0)
+  assertEq(m1[off .. ^1], "TENSORS")
+  assertEq(p0.getHeaderBytes(), m1[0 ..< off])
+
+  # later marks, shorter or longer, stay within the reserved room
+  let p1 = parseGguf(m1)
+  doAssert p1 != nil
+  assertEq(p1.getChalkPayload(), "{\"v\":1}")
+  assertEq(p1.unchalkedHash(), baseline)
+  for mark in ["{}", "{\"v\":\"" & repeat('x', 200) & "\"}"]:
+    assertEq(p1.setChalkPadded(mark, 256), cgOk)
+    assertEq(p1.dataOffset(), off)
+    let p2 = parseGguf(p1.getMutatedBytes())
+    doAssert p2 != nil
+    assertEq(p2.getChalkPayload(), mark)
+    assertEq(p2.unchalkedHash(), baseline)
+
+  # removing drops the padding with the pair
+  assertEq(p1.removeChalk(), cgOk)
+  assertEq(p1.getMutatedBytes(), f)
+
 proc main() =
   testParseRejections()
   testParseEmpty()
@@ -216,5 +251,6 @@ proc main() =
   testRemoveChalk()
   testUnchalkedHashInvariance()
   testAlignmentRecompute()
+  testSetChalkPaddedInPlace()
 
 main()
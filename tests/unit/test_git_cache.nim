@@ -0,0 +1,91 @@
+## Unit tests for repo fingerprinting in `src/utils/git_cache.nim`,
+## run against hand-made git dirs.
+
+import std/[
+  os,
+]
+import ../../src/utils/git_cache {.all.}
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+const
+  commitA = "1111111111111111111111111111111111111111"
+  commitB = "2222222222222222222222222222222222222222"
+
+proc withRepo(test: proc(root: string)) =
+  let root = getTempDir() / ("chalk-git-cache-" & $getCurrentProcessId())
+  removeDir(root)
+  createDir(root / ".git" / "refs" / "heads")
+  try:
+    test(root)
+  finally:
+    removeDir(root)
+
+proc test_loose_ref() =
+  withRepo(proc(root: string) =
+    writeFile(root / ".git" / "HEAD", "ref: refs/heads/main\n")
+    writeFile(root / ".git" / "refs" / "heads" / "main", commitA & "\n")
+    let (gitDir, commonDir) = root.gitDirsFor()
+    assertEq(gitDir, root / ".git")
+    assertEq(commonDir, root / ".git")
+    assertEq(resolveRef(gitDir, commonDir, "HEAD"), commitA)
+  )
+
+proc test_packed_ref() =
+  withRepo(proc(root: string) =
+    writeFile(root / ".git" / "HEAD", "ref: refs/heads/main\n")
+    writeFile(root / ".git" / "packed-refs",
+              "# pack-refs with: peeled fully-peeled sorted\n" &
+              commitB & " refs/heads/other\n" &
+              commitA & " refs/heads/main\n")
+    let (gitDir, commonDir) = root.gitDirsFor()
+    assertEq(resolveRef(gitDir, commonDir, "HEAD"), commitA)
+    assertEq(resolveRef(gitDir, commonDir, "refs/heads/missing"), "")
+  )
+
+proc test_detached_and_invalid() =
+  withRepo(proc(root: string) =
+    writeFile(root / ".git" / "HEAD", commitB & "\n")
+    let (gitDir, commonDir) = root.gitDirsFor()
+    assertEq(resolveRef(gitDir, commonDir, "HEAD"), commitB)
+    # unborn branch
+    writeFile(root / ".git" / "HEAD", "ref: refs/heads/main\n")
+    assertEq(resolveRef(gitDir, commonDir, "HEAD"), "")
+    # symbolic ref loop
+    writeFile(root / ".git" / "refs" / "heads" / "main", "ref: refs/heads/main\n")
+    assertEq(resolveRef(gitDir, commonDir, "HEAD"), "")
+  )
+
+proc test_linked_worktree() =
+  withRepo(proc(root: string) =
+    let
+      worktree = root / "wt"
+      gitDir   = root / ".git" / "worktrees" / "wt"
+    createDir(worktree)
+    createDir(gitDir)
+    writeFile(worktree / ".git", "gitdir: ../.git/worktrees/wt\n")
+    writeFile(gitDir / "commondir", "../..\n")
+    writeFile(gitDir / "HEAD", "ref: refs/heads/feature\n")
+    writeFile(root / ".git" / "refs" / "heads" / "feature", commitB & "\n")
+    let dirs = worktree.gitDirsFor()
+    assertEq(dirs.gitDir, gitDir)
+    assertEq(dirs.commonDir, root / ".git")
+    assertEq(resolveRef(dirs.gitDir, dirs.commonDir, "HEAD"), commitB)
+  )
+
+proc test_not_a_repo() =
+  withRepo(proc(root: string) =
+    assertEq((root / "nope").gitDirsFor(), (gitDir: "", commonDir: ""))
+    createDir(root / "bad")
+    writeFile(root / "bad" / ".git", "garbage")
+    assertEq((root / "bad").gitDirsFor(), (gitDir: "", commonDir: ""))
+  )
+
+when isMainModule:
+  test_loose_ref()
+  test_packed_ref()
+  test_detached_and_invalid()
+  test_linked_worktree()
+  test_not_a_repo()
+  echo "test_git_cache: all tests passed"
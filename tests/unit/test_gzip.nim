@@ -0,0 +1,51 @@
+import std/[
+  os,
+  osproc,
+  random,
+]
+import ../../src/utils/gzip
+
+template check(cond: untyped) =
+  doAssert cond, "failed: " & astToStr(cond)
+
+proc roundTrip(data: string, threads: int, chunk = 4096): string =
+  let path = getTempDir() / "test_gzip_" & $getCurrentProcessId() & ".gz"
+  defer:
+    if fileExists(path): removeFile(path)
+  let gz = newParallelGzWriter(path, threads = threads)
+  var i = 0
+  while i < len(data):
+    let n = min(chunk, len(data) - i)
+    gz.write(data[i ..< i + n])
+    i += n
+  gz.close()
+  check gz.written == getFileSize(path)
+  let (output, rc) = execCmdEx("gzip -dc " & path)
+  check rc == 0
+  return output
+
+proc main() =
+  var r = initRand(7)
+  # compressible and incompressible data, spanning many blocks and
+  # ending both on and off a block boundary
+  var text, noise: string
+  while len(text) < 5 * gzBlockSize + 123:
+    text.add("chalk mark " & $r.rand(100) & "\n")
+  for _ in 0 ..< 3 * gzBlockSize:
+    noise.add(char(r.rand(255)))
+
+  for threads in [1, 4]:
+    check roundTrip("", threads) == ""
+    check roundTrip("x", threads) == "x"
+    check roundTrip(text, threads) == text
+    check roundTrip(noise, threads, chunk = 100_000) == noise
+
+  # abort leaves no threads behind and can be called after close
+  let path = getTempDir() / "test_gzip_abort_" & $getCurrentProcessId() & ".gz"
+  defer: removeFile(path)
+  let gz = newParallelGzWriter(path, threads = 2)
+  gz.write(text)
+  gz.abort()
+  gz.abort()
+
+main()
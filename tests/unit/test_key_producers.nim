@@ -0,0 +1,38 @@
+import ../../src/[
+  plugin_api,
+  types,
+]
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc cheap(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  pack("cheap")
+
+proc expensive(self: Plugin, objs: seq[ChalkObj]): Box {.cdecl.} =
+  pack("expensive")
+
+proc artifact(self: Plugin, obj: ChalkObj, ins: bool): Box {.cdecl.} =
+  pack("artifact")
+
+proc main() =
+  let plugin = Plugin(name: "test", enabled: true)
+  plugin.produceKey("_EXPENSIVE", RunTimeHostKeyCb(expensive), kcExpensive)
+  plugin.produceKey("_CHEAP",     RunTimeHostKeyCb(cheap),     kcCheap)
+  plugin.produceKey("_MODERATE",  RunTimeHostKeyCb(cheap))
+  plugin.produceKey("_ARTIFACT",  RunTimeArtifactKeyCb(artifact))
+
+  var keys = newSeq[string]()
+  for producer in plugin.getKeyProducers(kpRunTimeHost):
+    keys.add(producer.key)
+  assertEq(keys, @["_CHEAP", "_MODERATE", "_EXPENSIVE"])
+
+  doAssert plugin.hasKeyProducers(kpRunTimeArtifact)
+  doAssert not plugin.hasKeyProducers(kpChalkTimeHost)
+  assertEq(plugin.getKeyProducers(kpRunTimeArtifact)[0].rtArt(plugin, nil, false),
+           pack("artifact"))
+
+  # disabled plugins are nil and registration is a no-op
+  discard Plugin(nil).produceKey("_CHEAP", RunTimeHostKeyCb(cheap))
+
+main()
@@ -0,0 +1,79 @@
+import std/[
+  os,
+  strutils,
+]
+import ../../src/utils/magic {.all.}
+import ../../src/types
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc naiveFind(s: string, start = 0): int =
+  s.find(magicUTF8, start)
+
+proc testFindMagic() =
+  assertEq(findMagic(""), -1)
+  assertEq(findMagic(magicUTF8), 0)
+  assertEq(findMagic(magicUTF8[0 .. ^2]), -1)
+  assertEq(findMagic("x" & magicUTF8), 1)
+  assertEq(findMagic(magicUTF8 & magicUTF8, 1), len(magicUTF8))
+  # near misses drawn from the magic's own alphabet
+  for s in [
+    "dadfedabbadabbedd",
+    "ddadfedabbadabbe" & magicUTF8,
+    "dadfedabbadabbe" & "d" & "abbed",
+    repeat("dabbed", 40) & magicUTF8 & "ab",
+    repeat('\0', 1000) & "dadfedab" & magicUTF8,
+  ]:
+    for start in [0, 1, 7, 16]:
+      assertEq(findMagic(s, start), naiveFind(s, start))
+
+proc testFindJsonStart() =
+  for prefix in [
+    "{\"MAGIC\":\"",
+    "{ \"MAGIC\" : \"",
+    "junk{   \"MAGIC\"   :   \"",
+  ]:
+    let s = prefix & magicUTF8 & "\"}"
+    assertEq(s.findJsonStart(s.findMagic()), prefix.find('{'))
+  for prefix in [
+    "\"MAGIC\":\"",
+    "{\"MAGIX\":\"",
+    "{\"MAGIC\" \"",
+    "{\"MAGIC\":",
+  ]:
+    let s = prefix & magicUTF8
+    assertEq(s.findJsonStart(s.findMagic()), -1)
+
+proc testFindMagicInFile() =
+  let path = getTempDir() / "chalk-test-magic.bin"
+  defer: removeFile(path)
+  writeFile(path, "")
+  assertEq(path.findMagicInFile(), -1)
+  let data = repeat('\xff', 100_000) & emptyMark & repeat('\x01', 10)
+  writeFile(path, data)
+  assertEq(path.findMagicInFile(), data.find(magicUTF8))
+  assertEq(path.findMagicInFile(start = 100_100), -1)
+  # errors are not mistaken for a file without a mark
+  doAssertRaises(OSError):
+    discard findMagicInFile(path & ".missing")
+
+proc testFindMagicInStream() =
+  let path = getTempDir() / "chalk-test-magic-stream.bin"
+  defer: removeFile(path)
+  # straddles the first chunk boundary
+  let
+    at   = magicChunkSize - 5
+    data = repeat('\xff', at) & magicUTF8 & repeat('\x01', 10)
+  writeFile(path, data)
+  assertEq(path.findMagicInStream(0), at)
+  assertEq(path.findMagicInStream(at), at)
+  assertEq(path.findMagicInStream(at + 1), -1)
+
+proc main() =
+  testFindMagic()
+  testFindJsonStart()
+  testFindMagicInFile()
+  testFindMagicInStream()
+
+main()
@@ -0,0 +1,32 @@
+import ../../src/normalize
+import ../../src/types
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, repr(a) & " != " & repr(b)
+
+proc main() =
+  when system.cpuEndian == littleEndian:
+    let
+      inner = ChalkDict()
+      dict  = ChalkDict()
+    inner["x"] = pack(@[pack("ab"), Box(kind: MkObj)])
+    # keys are written sorted, not in insertion order
+    dict["b"] = pack(true)
+    dict["a"] = pack(1)
+    dict["c"] = pack(inner)
+
+    assertEq(
+      binEncodeItem(pack(dict)),
+      "\x05\x03\x00\x00\x00" &
+        "\x01\x01\x00\x00\x00a" & "\x02\x01\x00\x00\x00\x00\x00\x00\x00" &
+        "\x01\x01\x00\x00\x00b" & "\x03\x01" &
+        "\x01\x01\x00\x00\x00c" &
+          "\x05\x01\x00\x00\x00" &
+          "\x01\x01\x00\x00\x00x" &
+            "\x04\x02\x00\x00\x00" &
+            "\x01\x02\x00\x00\x00ab" &
+            "\x07",
+    )
+    assertEq(binEncodeItem(pack(false)), "\x03\x00")
+
+main()
@@ -0,0 +1,65 @@
+import std/[
+  os,
+  typedthreads,
+]
+import ../../src/utils/[
+  chalkdict,
+  perf,
+  times,
+]
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc recordFromWorker(n: int) {.thread.} =
+  for i in 0 ..< n:
+    recordPerfTiming("worker", "test.upload", initDuration(microseconds = 1))
+
+proc concurrent() =
+  # workers record timings at the same time without losing any
+  clearPerfTimings()
+  var threads = newSeq[Thread[int]](4)
+  for t in threads.mitems():
+    createThread(t, recordFromWorker, 1000)
+  joinThreads(threads)
+  let timing = getPerfTiming("worker", "test.upload")
+  assertEq(timing.count, 4000)
+  assertEq(timing.total, initDuration(microseconds = 4000))
+  clearPerfTimings()
+
+proc main() =
+  clearPerfTimings()
+
+  for i in 0 ..< 3:
+    withPerfTiming("plugin", "test.run_time_host"):
+      sleep(1)
+  recordPerfTiming("plugin", "test.run_time_host", initDuration(milliseconds = 50))
+
+  # timings are recorded even when the block raises
+  try:
+    withPerfTiming("sink", "failing"):
+      raise newException(ValueError, "boom")
+  except ValueError:
+    discard
+
+  let timing = getPerfTiming("plugin", "test.run_time_host")
+  assertEq(timing.count, 4)
+  assertEq(timing.max, initDuration(milliseconds = 50))
+  doAssert timing.total >= initDuration(milliseconds = 53)
+  assertEq(getPerfTiming("sink", "failing").count, 1)
+  doAssert getPerfTiming("sink", "missing") == nil
+  doAssert getPerfTiming("missing", "missing") == nil
+
+  let
+    timings = getPerfTimings()
+    plugins = unpack[ChalkDict](timings["plugin"])
+    entry   = unpack[ChalkDict](plugins["test.run_time_host"])
+  assertEq(unpack[int](entry["count"]), 4)
+  assertEq(unpack[int](entry["max_us"]), 50_000)
+
+  clearPerfTimings()
+  assertEq(len(getPerfTimings()), 0)
+
+  concurrent()
+
+main()
@@ -17,7 +17,11 @@
 
 import std/[
   httpclient,
+  locks,
+  net,
+  os,
   strutils,
+  typedthreads,
 ]
 import ../../src/utils/uri
 import ../../src/docker/registry {.all.}
@@ -259,6 +263,109 @@ proc test_chunk_target_final_idempotent() =
   assertEq(digestPairs($second), 1)
   assertEq($first, $second)
 
+# ---------------------------------------------------------------------------
+# Concurrent uploads read chunks straight from the blob file, or from memory
+# for streams which are not plain files, with the same inclusive bounds as
+# FileStringStream slicing.
+# ---------------------------------------------------------------------------
+proc test_read_chunk_file_and_memory() =
+  let path = getTempDir() / "test_blob_chunk_" & $getCurrentProcessId()
+  writeFile(path, "0123456789")
+  defer: removeFile(path)
+  var f: File
+  doAssert f.open(path)
+  defer: f.close()
+  let
+    fromFile   = BlobUploadJob(path: path, size: 10)
+    fromMemory = BlobUploadJob(data: "0123456789", size: 10)
+  assertEq(fromFile.readChunk(f, 0, 3), "0123")
+  assertEq(fromFile.readChunk(f, 7, 9), "789")
+  assertEq(fromMemory.readChunk(f, 4, 6), "456")
+
+# ---------------------------------------------------------------------------
+# Every queued job is taken by exactly one worker, and a failing upload is
+# reported on its job instead of taking down the worker (here nothing listens
+# on the upload location so every connection is refused).
+# ---------------------------------------------------------------------------
+proc test_upload_workers_drain_queue() =
+  var jobs = newSeq[BlobUploadJob](5)
+  for i, job in jobs.mpairs():
+    job.layer      = sampleLayer
+    job.location   = parseUri("http://127.0.0.1:1/v2/test/blobs/uploads/" & $i)
+    job.data       = "blob " & $i
+    job.size       = len(job.data)
+    job.chunkSize  = 2
+    job.timeout    = 1000
+    job.verifyMode = CVerifyNone
+  var
+    queue   = BlobUploadQueue(
+      jobs: cast[ptr UncheckedArray[BlobUploadJob]](addr jobs[0]),
+      len:  len(jobs),
+    )
+    threads = newSeq[Thread[ptr BlobUploadQueue]](3)
+  initLock(queue.lock)
+  for t in threads.mitems():
+    createThread(t, blobUploadWorker, addr queue)
+  joinThreads(threads)
+  deinitLock(queue.lock)
+  assertEq(queue.next, len(jobs) + len(threads))
+  for job in jobs:
+    doAssert job.error != "", "expected upload to an unreachable registry to fail"
+    assertEq(job.digest, "")
+    assertEq(len(job.log), 1)
+    doAssert not job.expired
+
+# ---------------------------------------------------------------------------
+# A registry rejecting the session with 401 (token expired mid upload) marks
+# the job so that the main thread restarts the upload with a fresh token.
+# ---------------------------------------------------------------------------
+proc rejectOnce(server: Socket) {.thread.} =
+  let client = server.accept()
+  discard client.recvLine()
+  client.send("HTTP/1.1 401 Unauthorized\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+  client.close()
+
+proc test_upload_expired_session() =
+  let server = newSocket()
+  server.setSockOpt(OptReuseAddr, true)
+  server.bindAddr(Port(0), "127.0.0.1")
+  server.listen()
+  let port = server.getLocalAddr()[1]
+  var t: Thread[Socket]
+  createThread(t, rejectOnce, server)
+  var job = BlobUploadJob(
+    layer:      sampleLayer,
+    location:   parseUri("http://127.0.0.1:" & $port & "/v2/test/blobs/uploads/1"),
+    data:       "blob",
+    size:       4,
+    chunkSize:  4,
+    timeout:    1000,
+    verifyMode: CVerifyNone,
+  )
+  let client = newBlobUploadClient(job)
+  try:
+    assertRaisesMsg("401"):
+      job.uploadChunks(client)
+  finally:
+    client.close()
+    joinThread(t)
+    server.close()
+  doAssert job.expired
+
+# ---------------------------------------------------------------------------
+# Blobs already in the registry are described as the registry reports them.
+# ---------------------------------------------------------------------------
+proc test_existing_blob_from_head() =
+  let response = Response(status: "200 OK", headers: newHttpHeaders())
+  response.headers["Content-Length"] = "1234"
+  response.headers["Content-Type"]   = "application/vnd.oci.image.layer.v1.tar+gzip"
+  let blob = sampleLayer.existingBlob(response)
+  assertEq(blob.size, 1234)
+  assertEq(blob.mediaType, "application/vnd.oci.image.layer.v1.tar+gzip")
+  assertEq(blob.digest, "sha256:" & sampleLayer.digest)
+  assertRaisesMsg("missing Content-Length"):
+    discard sampleLayer.existingBlob(Response(status: "200 OK", headers: newHttpHeaders()))
+
 when isMainModule:
   test_advancing_range()
   discard test_stale_2xx_latches_trust()
@@ -273,4 +380,8 @@ when isMainModule:
   test_chunk_target_intermediate_is_bare_patch()
   test_chunk_target_final_is_put_with_digest()
   test_chunk_target_final_idempotent()
+  test_read_chunk_file_and_memory()
+  test_upload_workers_drain_queue()
+  test_upload_expired_session()
+  test_existing_blob_from_head()
   echo "test_registry_put_file_stream: all tests passed"
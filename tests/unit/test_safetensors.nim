@@ -13,6 +13,8 @@
 ##     intact but no chalk key.
 ##   - unchalkedHash invariance: same hash before mark and after
 ##     mark with payloads of different lengths.
+##   - setChalkPadded: re-marks keep header_size so only the header
+##     bytes change, padding is not part of the hash.
 
 import std/strutils
 import ../../src/utils/safetensors
@@ -152,6 +154,38 @@ proc testHashWithoutChalkEqualsFileHash() =
   for c in h:
     doAssert c in "0123456789abcdef"
 
+proc testSetChalkPaddedInPlace() =
+  let header = "{\"__metadata__\":{\"format\":\"pt\"},\"t\":{}}"
+  let f      = stFile(header) & "TENSORS"
+  let p0     = parseSafetensors(f)
+  doAssert p0 != nil
+  let baseline = p0.unchalkedHash()
+
+  # first mark has to move the data and reserves room after it
+  assertEq(p0.setChalkPadded("{\"v\":1}", 256), cstOk)
+  let m1  = p0.getMutatedBytes()
+  let off = p0.dataOffset()
+  doAssert off > 8 + header.len + 256
+  assertEq(off mod 8, 0)
+  assertEq(m1[off .. ^1], "TENSORS")
+  assertEq(p0.getHeaderBytes(), m1[0 ..< off])
+
+  # later marks, shorter or longer, stay within the reserved room
+  let p1 = parseSafetensors(m1)
+  doAssert p1 != nil
+  assertEq(p1.unchalkedHash(), baseline)
+  for mark in ["{}", "{\"v\":\"" & repeat('x', 200) & "\"}"]:
+    assertEq(p1.setChalkPadded(mark, 256), cstOk)
+    assertEq(p1.dataOffset(), off)
+    let p2 = parseSafetensors(p1.getMutatedBytes())
+    doAssert p2 != nil
+    assertEq(p2.getChalkPayload(), mark)
+    assertEq(p2.unchalkedHash(), baseline)
+
+  # removing drops the padding with the pair
+  assertEq(p1.removeChalk(), cstOk)
+  assertEq(p1.getMutatedBytes(), f)
+
 proc main() =
   testParseTruncated()
   testParseValidEmpty()
@@ -163,5 +197,6 @@ proc main() =
   testRemoveChalk()
   testUnchalkedHashInvariance()
   testHashWithoutChalkEqualsFileHash()
+  testSetChalkPaddedInPlace()
 
 main()
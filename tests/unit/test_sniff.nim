@@ -0,0 +1,47 @@
+## Unit tests for file classification in `src/utils/sniff.nim`.
+
+import ../../src/types
+import ../../src/utils/sniff
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc test_magic() =
+  assertEq(sniffHead("\x7fELF\x02\x01\x01\x00\x00"), {skElf})
+  assertEq(sniffHead("\xcf\xfa\xed\xfe\x07\x00\x00\x01"), {skMacho})
+  assertEq(sniffHead("\xca\xfe\xba\xbe\x00\x00\x00\x02"), {skMacho})
+  assertEq(sniffHead("PK\x03\x04\x14\x00\x00\x00\x08\x00\xff"), {skZip})
+  assertEq(sniffHead("GGUF\x03\x00\x00\x00\xff"), {skGguf})
+
+proc test_text() =
+  assertEq(sniffHead("#!/bin/sh\necho hi\n"), {skShebang, skText})
+  assertEq(sniffHead("print('héllo')\n"), {skText})
+  # empty files are text as far as the source codec is concerned
+  assertEq(sniffHead(""), {skText})
+  # ascii magic followed by text is both
+  assertEq(sniffHead("PK is not a zip\n"), {skZip, skText})
+  assertEq(sniffHead("\x89PNG\r\n\x1a\n"), {})
+  # only the prefix seemsToBeUtf8() looks at matters
+  var late = newString(300)
+  for i in 0 ..< len(late):
+    late[i] = 'a'
+  late[299] = '\xff'
+  assertEq(sniffHead(late), {skText})
+
+proc test_handles() =
+  let
+    plain = Plugin(name: "plain")
+    elf   = Plugin(name: "elf", sniffKinds: {skElf})
+    src   = Plugin(name: "src", sniffKinds: {skShebang, skText})
+  doAssert plain.handlesSniffed({})
+  doAssert elf.handlesSniffed({skElf})
+  doAssert not elf.handlesSniffed({skText})
+  doAssert not elf.handlesSniffed({})
+  doAssert src.handlesSniffed({skShebang, skText})
+  doAssert not src.handlesSniffed({skMacho})
+
+when isMainModule:
+  test_magic()
+  test_text()
+  test_handles()
+  echo "test_sniff: all tests passed"
@@ -0,0 +1,96 @@
+## Unit tests for background shell commands in `src/utils/subproc.nim`.
+
+import std/[
+  monotimes,
+  os,
+  strutils,
+  tempfiles,
+  times,
+]
+import ../../src/utils/subproc
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc waitAll(cmds: seq[ShellCmd], killAfter = initDuration(seconds = 30)): Duration =
+  let start = getMonoTime()
+  var left = cmds
+  while len(left) > 0:
+    if getMonoTime() - start > killAfter:
+      for cmd in left:
+        cmd.killShellCmd()
+    let finished = waitShellCmds(left, 100)
+    var still: seq[ShellCmd]
+    for cmd in left:
+      if cmd notin finished:
+        still.add(cmd)
+    left = still
+  return getMonoTime() - start
+
+proc test_output_and_exit_code() =
+  let
+    ok   = startShellCmd("echo out; echo err >&2")
+    fail = startShellCmd("printf partial; exit 3")
+  discard waitAll(@[ok, fail])
+  assertEq(ok.output, "out\nerr\n")
+  assertEq(ok.exitCode, 0)
+  assertEq(fail.output, "partial")
+  assertEq(fail.exitCode, 3)
+
+proc test_large_output() =
+  # more than a pipe buffer so the command blocks unless it is drained
+  let cmd = startShellCmd("head -c 1000000 /dev/zero")
+  discard waitAll(@[cmd])
+  assertEq(len(cmd.output), 1_000_000)
+  assertEq(cmd.exitCode, 0)
+
+proc test_spool() =
+  let (spool, path) = createTempFile("chalk-test-subproc-", ".out")
+  try:
+    let cmd = startShellCmd("head -c 3000000 /dev/zero; echo done", spool = spool)
+    discard waitAll(@[cmd])
+    spool.close()
+    # nothing is kept in memory
+    assertEq(cmd.output, "")
+    assertEq(cmd.outputLen, 3_000_005)
+    assertEq(getFileSize(path), 3_000_005)
+    doAssert readFile(path).endsWith("\0done\n")
+    assertEq(cmd.error, "")
+  finally:
+    removeFile(path)
+
+proc test_concurrent() =
+  let took = waitAll(@[
+    startShellCmd("sleep 1"),
+    startShellCmd("sleep 1"),
+    startShellCmd("sleep 1"),
+  ])
+  doAssert took < initDuration(milliseconds = 2500), "commands did not overlap: " & $took
+
+proc test_kill() =
+  # the whole process group is killed, including what the shell started
+  let cmd = startShellCmd("echo started; sleep 30; echo never")
+  let took = waitAll(@[cmd], killAfter = initDuration(milliseconds = 300))
+  doAssert took < initDuration(seconds = 10), "command was not killed: " & $took
+  doAssert cmd.output.startsWith("started")
+  doAssert "never" notin cmd.output
+  assertEq(cmd.exitCode, 137)
+
+proc test_kill_detached() =
+  # a descendant in its own session survives the kill and keeps the
+  # output open, which must not keep the command from finishing
+  if findExe("setsid") == "":
+    return
+  let cmd = startShellCmd("setsid sleep 5 & sleep 30")
+  let took = waitAll(@[cmd], killAfter = initDuration(milliseconds = 300))
+  doAssert took < initDuration(seconds = 3), "waited for detached output: " & $took
+  assertEq(cmd.exitCode, 137)
+
+when isMainModule:
+  test_output_and_exit_code()
+  test_large_output()
+  test_spool()
+  test_concurrent()
+  test_kill()
+  test_kill_detached()
+  echo "test_subproc: all tests passed"
@@ -2,6 +2,7 @@ import std/[
   os,
   osproc,
   strutils,
+  times,
 ]
 import ../../src/docker/tar
 import ../equivalency/dockerignore/check_nim
@@ -614,6 +615,84 @@ proc testPathBoundaries() =
   check fileExists(extractDir / "foo\nbar.txt")
 
 
+## ---------------------------------------------------------------------------
+## testMultiBlockArchive
+##
+## Archives big enough to be split over several compression blocks must
+## still extract byte for byte, regardless of the number of threads.
+
+proc testMultiBlockArchive() =
+  let tmpDir  = getTempDir() / "test_tar_multiblock_" & $getCurrentProcessId()
+  let outPath = getTempDir() / "test_multiblock_" & $getCurrentProcessId() & ".tar.gz"
+  createDir(tmpDir)
+  defer:
+    removeDir(tmpDir)
+    if fileExists(outPath): removeFile(outPath)
+  var big = ""
+  for i in 0 ..< 200_000:
+    big.add($i & "\n")
+  writeFile(tmpDir / "big.txt", big)
+  writeFile(tmpDir / "small.txt", "hi\n")
+  for threads in [1, 3]:
+    discard writeTarGz(
+      outPath     = outPath,
+      contextPath = tmpDir,
+      patterns    = @[],
+      threads     = threads,
+    )
+    let (gzOut, gzRc) = execCmdEx("gzip -t " & outPath)
+    check gzRc == 0
+    check gzOut == ""
+    let (content, rc) = execCmdEx("tar xOf " & outPath & " big.txt")
+    check rc == 0
+    check content == big
+
+## ---------------------------------------------------------------------------
+## testListContext
+##
+## listContext() applies the same exclusions as writeTarGz() and records
+## the stat data the context archive cache fingerprints.
+
+proc testListContext() =
+  let tmpDir = getTempDir() / "test_tar_list_" & $getCurrentProcessId()
+  createDir(tmpDir / "logs")
+  createDir(tmpDir / "src")
+  writeFile(tmpDir / "app.py",             "print('hello')\n")
+  writeFile(tmpDir / "logs" / "debug.log", "debug\n")
+  writeFile(tmpDir / "logs" / "temp.tmp",  "scratch\n")
+  writeFile(tmpDir / "src" / "lib.py",     "x = 1\n")
+  createSymlink("app.py", tmpDir / "link.py")
+  defer:
+    removeDir(tmpDir)
+
+  let entries = listContext(tmpDir, @["logs/", "!logs/*.log"])
+  var paths: seq[string]
+  for e in entries:
+    paths.add(e.path)
+    case e.kind
+    of pcFile:
+      check e.size == getFileSize(tmpDir / e.path)
+      check e.mtime == getLastModificationTime(tmpDir / e.path).toUnix()
+    of pcLinkToFile:
+      check e.target == "app.py"
+    else:
+      discard
+  check "app.py" in paths
+  check "logs/debug.log" in paths
+  check "logs/temp.tmp" notin paths
+  check "src/lib.py" in paths
+  check "link.py" in paths
+
+  ## listing is deterministic, so unchanged contexts fingerprint the same
+  check listContext(tmpDir, @["logs/", "!logs/*.log"]) == entries
+
+  var raised = false
+  try:
+    discard listContext(tmpDir, @["["])
+  except ValueError:
+    raised = true
+  check raised
+
 proc main() =
   testGlobMatch()
   runEquivalencyTests()
@@ -629,5 +708,7 @@ proc main() =
   testNonRegularFiles()
   testSizeThreshold()
   testPathBoundaries()
+  testMultiBlockArchive()
+  testListContext()
 
 main()
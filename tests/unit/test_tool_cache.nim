@@ -0,0 +1,152 @@
+## Unit tests for tree digests and locking in `src/utils/tool_cache.nim`.
+
+import std/[
+  os,
+  posix,
+  strutils,
+  tables,
+  times,
+]
+import ../../src/utils/tool_cache {.all.}
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+proc withTree(test: proc(root: string)) =
+  let root = getTempDir() / ("chalk-tool-cache-" & $getCurrentProcessId())
+  removeDir(root)
+  createDir(root / "src")
+  createDir(root / ".git" / "refs" / "heads")
+  createDir(root / ".git" / "objects")
+  writeFile(root / "src" / "main.py", "print('hi')\n")
+  writeFile(root / "README", "readme\n")
+  writeFile(root / ".git" / "HEAD", "ref: refs/heads/main\n")
+  writeFile(root / ".git" / "refs" / "heads" / "main", repeat('1', 40) & "\n")
+  try:
+    test(root)
+  finally:
+    removeDir(root)
+
+proc digest(root: string): string =
+  treeDigests.clear()
+  return root.hashTree()
+
+proc test_tree_digest() =
+  withTree(proc(root: string) =
+    let first = root.digest()
+    assertEq(root.digest(), first)
+    # mtimes do not matter
+    writeFile(root / "README", "readme\n")
+    assertEq(root.digest(), first)
+    # git objects and index do not matter, refs do
+    writeFile(root / ".git" / "objects" / "ab", "object")
+    writeFile(root / ".git" / "index", "index")
+    assertEq(root.digest(), first)
+    writeFile(root / ".git" / "refs" / "heads" / "main", repeat('2', 40) & "\n")
+    let moved = root.digest()
+    doAssert moved != first
+    # contents and names do
+    writeFile(root / "src" / "main.py", "print('bye')\n")
+    let edited = root.digest()
+    doAssert edited != moved
+    moveFile(root / "README", root / "README.md")
+    doAssert root.digest() != edited
+  )
+
+proc test_file_digest() =
+  withTree(proc(root: string) =
+    let first = (root / "README").digest()
+    writeFile(root / "README", "changed\n")
+    doAssert (root / "README").digest() != first
+  )
+
+proc test_tree_index() =
+  withTree(proc(root: string) =
+    let index = root & ".index.json"
+    defer: removeFile(index)
+    treeDigests.clear()
+    let first = root.hashTree(indexPath = index)
+    doAssert fileExists(index)
+    # same size and mtime on the same inode, so the indexed hash is reused
+    let
+      path  = root / "src" / "main.py"
+      mtime = getLastModificationTime(path)
+    writeFile(path, "print('no')\n")
+    setLastModificationTime(path, mtime)
+    treeDigests.clear()
+    assertEq(root.hashTree(indexPath = index), first)
+    # without the index the contents are hashed
+    doAssert root.digest() != first
+  )
+
+proc test_forget_tree_digests() =
+  withTree(proc(root: string) =
+    let
+      other = root / "src"
+      first = root.digest()
+    discard other.hashTree()
+    writeFile(root / "README", "chalked\n")
+    # memoized until a file under the tree is written
+    assertEq(root.hashTree(), first)
+    forgetTreeDigests(root / "README")
+    doAssert root notin treeDigests
+    doAssert other in treeDigests
+    doAssert root.hashTree() != first
+  )
+
+proc test_arg_identity() =
+  let tmp = getTempDir() / ("chalk-tool-arg-" & $getCurrentProcessId() & ".txt")
+  writeFile(tmp, "[.]git(/|$)")
+  try:
+    let other = getTempDir() / ("chalk-tool-arg-other-" & $getCurrentProcessId() & ".txt")
+    writeFile(other, "[.]git(/|$)")
+    try:
+      # same contents under a different random name is the same argument
+      assertEq(tmp.argIdentity(), other.argIdentity())
+      doAssert tmp.argIdentity().startsWith("tmp:")
+    finally:
+      removeFile(other)
+  finally:
+    removeFile(tmp)
+  assertEq("--json".argIdentity(), "--json")
+  assertEq("relative/path".argIdentity(), "relative/path")
+
+proc test_lock() =
+  let key = "test-" & $getCurrentProcessId()
+  let path = getTempDir() / (key & ".lock")
+  let fd = open(cstring(path), O_CREAT or O_RDWR, S_IRUSR or S_IWUSR)
+  try:
+    doAssert flock(fd, LOCK_EX or LOCK_NB) == 0
+    # a second open file description cannot take it until released
+    let other = open(cstring(path), O_RDWR)
+    doAssert flock(other, LOCK_EX or LOCK_NB) != 0
+    discard flock(fd, LOCK_UN)
+    doAssert flock(other, LOCK_EX or LOCK_NB) == 0
+    discard close(other)
+  finally:
+    discard close(fd)
+    removeFile(path)
+
+proc test_touch() =
+  # using a result does not make it look freshly produced
+  let path = getTempDir() / ("chalk-tool-result-" & $getCurrentProcessId() & ".json")
+  writeFile(path, "{}")
+  try:
+    let produced = getTime() - initDuration(days = 2)
+    setLastModificationTime(path, produced)
+    path.touch()
+    let info = getFileInfo(path)
+    assertEq(info.lastWriteTime.toUnix(), produced.toUnix())
+    doAssert info.lastUsed() > produced
+  finally:
+    removeFile(path)
+
+when isMainModule:
+  test_tree_digest()
+  test_file_digest()
+  test_tree_index()
+  test_forget_tree_digests()
+  test_arg_identity()
+  test_lock()
+  test_touch()
+  echo "test_tool_cache: all tests passed"
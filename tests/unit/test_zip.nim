@@ -0,0 +1,104 @@
+## Unit tests for raw ZIP records in `src/utils/zip.nim`.
+
+import std/[
+  options,
+  os,
+  strutils,
+  tables,
+  times,
+]
+import pkg/zippy/ziparchives
+import ../../src/utils/zip
+
+template assertEq(a, b: untyped) =
+  doAssert a == b, $a & " != " & $b
+
+const mode = {fpUserRead, fpUserWrite, fpGroupRead, fpOthersRead}
+
+proc buildZip(files: openArray[(string, string)], comment = ""): string =
+  var central = ""
+  for (name, data) in files:
+    let record = newZipRecord(name, data, mode, getTime())
+    central &= ZipEntry(central: record.central).withOffset(len(result))
+    result  &= record.local
+  let offset = len(result)
+  result &= central & zipEndOfCentralDirectory(len(files), len(central), offset, comment)
+
+proc withZip(contents: string, test: proc(path: string)) =
+  let path = getTempDir() / ("chalk-zip-" & $getCurrentProcessId() & ".zip")
+  writeFile(path, contents)
+  try:
+    test(path)
+  finally:
+    removeFile(path)
+
+proc readEntries(path: string): Table[string, string] =
+  let reader = openZipArchive(path)
+  try:
+    for name in reader.walkFiles():
+      result[name] = reader.extractFile(name)
+  finally:
+    reader.close()
+
+proc test_records() =
+  let big = repeat("chalk ", 10_000)
+  withZip(buildZip({"a.txt": "hello", "dir/b.bin": big}, comment = "c"), proc(path: string) =
+    let entries = path.readEntries()
+    assertEq(entries["a.txt"], "hello")
+    assertEq(entries["dir/b.bin"], big)
+    let dir = readZipDirectory(path).get()
+    assertEq(dir.comment, "c")
+    assertEq(len(dir.entries), 2)
+    assertEq(dir.entries[0].name, "a.txt")
+    assertEq(dir.entries[0].offset, 0)
+    assertEq(dir.entries[1].offset, dir.entries[0].recordLen)
+  )
+
+proc test_copy_records() =
+  # records copied as is into a new archive with a new entry in front
+  withZip(buildZip({"a.txt": "hello", "b.txt": "world"}), proc(path: string) =
+    let
+      orig   = readFile(path)
+      dir    = readZipDirectory(path).get()
+      record = newZipRecord("chalk.json", "{}", mode, getTime())
+    var
+      archive = record.local
+      central = ZipEntry(central: record.central).withOffset(0)
+    for entry in dir.entries:
+      central &= entry.withOffset(len(archive))
+      archive &= orig[entry.offset ..< entry.offset + entry.recordLen]
+    let offset = len(archive)
+    archive &= central & zipEndOfCentralDirectory(3, len(central), offset, "")
+    writeFile(path, archive)
+    let entries = path.readEntries()
+    assertEq(entries["chalk.json"], "{}")
+    assertEq(entries["a.txt"], "hello")
+    assertEq(entries["b.txt"], "world")
+  )
+
+proc test_unsupported() =
+  # not a zip
+  withZip("PK nothing here", proc(path: string) =
+    doAssert readZipDirectory(path).isNone()
+  )
+  # self extracting stub before the first entry
+  let archive = buildZip({"a.txt": "hello"})
+  withZip("#!/bin/sh\n" & archive, proc(path: string) =
+    doAssert readZipDirectory(path).isNone()
+  )
+  # encrypted entries
+  var encrypted = archive
+  let at = encrypted.find("PK\x01\x02")
+  encrypted[at + 8] = char(byte(encrypted[at + 8]) or 1)
+  withZip(encrypted, proc(path: string) =
+    doAssert readZipDirectory(path).isNone()
+  )
+  doAssert fitsZip32(10, 1000)
+  doAssert not fitsZip32(0xffff, 1000)
+  doAssert not fitsZip32(10, 0xffffffff)
+
+when isMainModule:
+  test_records()
+  test_copy_records()
+  test_unsupported()
+  echo "test_zip: all tests passed"